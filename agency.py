@@ -7,11 +7,18 @@ from nb_image_agent import nb_image_agent
 from qa_agent import qa_agent
 from export_agent import export_agent
 from workflow.structured_send_message import StructuredSendMessage
+from workflow.usage_hooks import attach_usage_hooks
 
 import asyncio
+import json
+import os
+import sys
 
 load_dotenv()
 
+# The agency's route prefix, as main.py registers it
+AGENCY_NAME = "my-agency"
+
 # do not remove this method, it is used in the main.py file to deploy the agency (it has to be a method)
 def create_agency(load_threads_callback=None):
     """
@@ -26,6 +33,9 @@ def create_agency(load_threads_callback=None):
     6. QA Agent → NB Image Agent (if retry): Request regeneration
     7. Export Agent → User: Deliver final image with URLs
     """
+    # Charge every agent's LLM calls to the request's cost record (monitoring/accounting.py)
+    attach_usage_hooks(brief_agent, art_direction_agent, nb_image_agent, qa_agent, export_agent)
+
     agency = Agency(
         brief_agent,
         communication_flows=[
@@ -45,7 +55,77 @@ def create_agency(load_threads_callback=None):
 
     return agency
 
+def create_app():
+    """
+    The agency's FastAPI app plus the service routes: delivered images
+    (/images, /archives), deterministic mode (/pipeline), /metrics and
+    /costs/report, with a trace per incoming request.
+
+    main.py belongs to the deployment system and serves the agency endpoints
+    only; serve this factory by import string instead, which also allows
+    several uvicorn workers:
+        python agency.py --serve
+        uvicorn agency:create_app --factory --host 0.0.0.0 --port 8080 --workers 4
+    """
+    from agency_swarm.integrations.fastapi import run_fastapi
+
+    from delivery.http import router as delivery_router
+    from monitoring.http import InFlightMiddleware, router as metrics_router
+    from monitoring.tracing import TraceMiddleware
+    from workflow.http import router as pipeline_router
+
+    app = run_fastapi(
+        agencies={AGENCY_NAME: create_agency},
+        port=int(os.getenv("PORT", "8080")),
+        enable_logging=True,
+        return_app=True,
+    )
+    # Serve delivered images from the local blob store next to the agency endpoints
+    app.include_router(delivery_router)
+    # Deterministic mode: the same stage graph run without LLM relay turns
+    app.include_router(pipeline_router)
+    # Prometheus metrics (merged across uvicorn workers) and cost reports
+    app.include_router(metrics_router)
+    # Agency requests in flight (athar_pipelines_in_flight{mode="agency"})
+    app.add_middleware(InFlightMiddleware, path_prefix=f"/{AGENCY_NAME}/get_response")
+    # One trace per incoming request; an incoming traceparent header is continued
+    app.add_middleware(TraceMiddleware)
+    return app
+
+def serve():
+    """Serve create_app() with WEB_CONCURRENCY uvicorn workers (default 1) on PORT (default 8080)."""
+    import uvicorn
+
+    uvicorn.run(
+        "agency:create_app",
+        factory=True,
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8080")),
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )
+
+def run_pipeline(user_input, aspect_ratio="", theme=""):
+    """
+    Deterministic mode: run the agency's stage graph directly, validating every
+    handoff against the same contracts and consulting an LLM only for ambiguous
+    briefs and retry rewrites (see workflow/pipeline.py).
+    """
+    from workflow.pipeline import get_pipeline_engine
+
+    return get_pipeline_engine().run(user_input, aspect_ratio=aspect_ratio, theme=theme)
+
 if __name__ == "__main__":
+    # python agency.py --serve: the agency endpoints plus the service routes (see create_app)
+    if len(sys.argv) > 1 and sys.argv[1] == "--serve":
+        serve()
+        sys.exit(0)
+
+    # python agency.py --pipeline "Create an image of solitude in the desert at sunset"
+    if len(sys.argv) > 2 and sys.argv[1] == "--pipeline":
+        run = run_pipeline(" ".join(sys.argv[2:]))
+        print(json.dumps(run.to_dict(), indent=2, ensure_ascii=False))
+        sys.exit(0 if run.delivery else 1)
+
     agency = create_agency()
 
     # test 1 message
@@ -2,11 +2,16 @@ from agency_swarm.tools import BaseTool
 from pydantic import Field
 import json
 
+from monitoring.tracing import traced_tool
+from workflow.artifacts import PROMPT_PACKAGE, store_artifact
+from workflow.prompt_templates import Brief, render_variants
+
 
 class GeneratePromptTool(BaseTool):
     """
     Convert creative brief into a complete Nano Banana Pro prompt.
-    Generates prompt, negative_prompt, and style parameters optimized for Athar-style imagery.
+    Generates prompt, negative_prompt, and style parameters optimized for Athar-style imagery,
+    optionally as several palette/composition variants for fan-out generation.
     """
     
     theme: str = Field(
@@ -44,126 +49,59 @@ class GeneratePromptTool(BaseTool):
         description="Any additional custom instructions from the user"
     )
 
+    template: str = Field(
+        default="athar",
+        description="Named prompt template: 'athar' (default), 'athar_minimal' or 'athar_typography' (negative space for Arabic calligraphy)"
+    )
+    
+    num_variants: int = Field(
+        default=1,
+        ge=1,
+        le=16,
+        description="Number of prompt variants (palette/composition permutations) to return for fan-out generation"
+    )
+
+    @traced_tool
     def run(self):
         """
         Generate a complete image generation prompt based on the creative brief.
-        Returns formatted prompt parameters ready for Nano Banana Pro.
+        Returns formatted prompt parameters ready for Nano Banana Pro; with
+        num_variants > 1, also a "variants" list whose first entry is the main prompt.
         """
         
-        # Step 1: Build the main prompt using Athar template
-        prompt = self._build_main_prompt()
-        
-        # Step 2: Build the negative prompt
-        negative_prompt = self._build_negative_prompt()
+        # Step 1: Collect the brief fields the templates render
+        brief = Brief(
+            theme=self.theme,
+            mood=self.mood,
+            palette=self.palette,
+            visual_elements=self.visual_elements,
+            tone=self.tone,
+            aspect_ratio=self.aspect_ratio,
+            custom_instructions=self.custom_instructions,
+        )
+        
+        # Step 2: Render the main prompt (and variants) from the precompiled template
+        try:
+            variants = render_variants(brief, self.num_variants, self.template)
+        except ValueError as e:
+            return self._format_output({"error": str(e)})
         
         # Step 3: Compile complete output
-        output = {
-            "prompt": prompt,
-            "negative_prompt": negative_prompt,
-            "aspect_ratio": self.aspect_ratio,
-            "style": "cinematic-premium",
-            "quality": "premium",
-            "theme": self.theme,
-            "palette": self.palette
-        }
-        
-        # Step 4: Format for output
+        output = dict(variants[0])
+        if self.num_variants > 1:
+            output["variants"] = [
+                {key: variant[key] for key in ("prompt", "negative_prompt", "palette", "composition")}
+                for variant in variants
+            ]
+        
+        # Step 4: Store the package so the handoff can carry its artifact ID only
+        artifact_id = store_artifact(PROMPT_PACKAGE, output)
+        if artifact_id:
+            output["artifact_id"] = artifact_id
+        
+        # Step 5: Format for output
         return self._format_output(output)
     
-    def _build_main_prompt(self):
-        """
-        Build the main prompt using the Athar-style template.
-        """
-        # Core Athar prompt structure
-        prompt_parts = [
-            "A cinematic minimalistic artwork inspired by Athar."
-        ]
-        
-        # Add theme
-        if self.theme:
-            prompt_parts.append(f"Theme: {self.theme}.")
-        
-        # Add mood
-        if self.mood:
-            prompt_parts.append(f"Mood: {self.mood}.")
-        
-        # Add palette
-        if self.palette:
-            prompt_parts.append(f"Palette: {self.palette}.")
-        
-        # Add visual elements/metaphor
-        if self.visual_elements:
-            prompt_parts.append(f"Visual Metaphor: {self.visual_elements}.")
-        
-        # Add composition guidelines
-        composition = [
-            "Composition:",
-            "  Soft foreground subject with gentle depth.",
-            "  Background atmospheric texture with paper grain and cinematic lighting."
-        ]
-        prompt_parts.append("\n".join(composition))
-        
-        # Add tone
-        if self.tone:
-            prompt_parts.append(f"Tone: {self.tone}.")
-        
-        # Add technical directives
-        prompt_parts.append("Avoid: messy textures, chaotic shapes, distorted Arabic text.")
-        
-        # Add aspect ratio directive
-        prompt_parts.append(f"--ar {self.aspect_ratio}")
-        
-        # Add style directive
-        prompt_parts.append("--style cinematic-premium")
-        
-        # Add custom instructions if provided
-        if self.custom_instructions:
-            prompt_parts.append(f"Additional: {self.custom_instructions}")
-        
-        # Join all parts
-        return "\n".join(prompt_parts)
-    
-    def _build_negative_prompt(self):
-        """
-        Build comprehensive negative prompt to avoid common issues.
-        """
-        negative_elements = [
-            # Quality issues
-            "messy textures",
-            "chaotic shapes",
-            "low quality",
-            "blurry",
-            "pixelated",
-            "distorted",
-            
-            # Text issues
-            "distorted Arabic text",
-            "illegible text",
-            "wrong font",
-            "text artifacts",
-            
-            # Style issues
-            "oversaturated",
-            "harsh lighting",
-            "neon colors",
-            "artificial",
-            
-            # Composition issues
-            "cluttered",
-            "busy composition",
-            "multiple subjects",
-            "distracting elements",
-            
-            # Technical issues
-            "watermark",
-            "signature",
-            "frame",
-            "border",
-            "text overlay"
-        ]
-        
-        return ", ".join(negative_elements)
-    
     def _format_output(self, output):
         """
         Format the output as pure JSON for downstream agent consumption.
@@ -180,6 +118,7 @@ if __name__ == "__main__":
         palette="warm earth tones, soft golden light",
         visual_elements="lone figure, vast landscape, atmospheric depth",
         tone="poetic, cinematic, meditative",
-        aspect_ratio="16:9"
+        aspect_ratio="16:9",
+        num_variants=3
     )
     print(tool.run())
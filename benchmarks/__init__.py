@@ -0,0 +1,5 @@
+"""
+Offline benchmarks and local service stand-ins for the Athar Image Designer agency.
+
+Run from the repository root, e.g. ``python -m benchmarks.bench_drive_export``.
+"""
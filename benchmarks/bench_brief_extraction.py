@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark lexicon matching for ExtractBriefTool on long Athar excerpts.
+
+Compares the legacy approach (one ``keyword in text`` substring scan per
+keyword, per category) with the compiled n-gram matcher from
+workflow.lexicon, and counts the labels the substring scan reports that the
+word-boundary matcher rejects (false positives such as "sand" in "thousand").
+Arabic excerpts, which the legacy scan cannot match at all, are timed with the
+labels they resolve to.
+
+Usage:
+    python -m benchmarks.bench_brief_extraction --excerpt-kb 4 16 64 --repeat 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from workflow.lexicon import Lexicon, get_lexicon
+
+ATHAR_SENTENCES = [
+    "A lone figure walks across the dunes as the last light of sunset spills over the horizon.",
+    "The old door of the mosque stands open, and the silence inside feels older than memory.",
+    "Thousands of footsteps have worn the stone threshold smooth, yet the courtyard remains still.",
+    "Between the mountains and the sea, the caravan pauses to contemplate the endless sky.",
+    "Her voice carried the nostalgia of a forgotten city, gentle and melancholic.",
+    "Golden rays fall through the arches, drawing long shadows on the clay walls.",
+    "Many travellers passed through this valley, each leaving a trace of hope in the sand.",
+    "The river bends quietly under the indigo twilight, reflecting the first stars.",
+    "He prays alone at dawn, his silhouette sharp against the pale horizon.",
+    "Time dissolves in the desert; only the wind remembers the names of those who came before.",
+]
+
+ATHAR_SENTENCES_AR = [
+    "يمشي رجلٌ وحيدٌ بين الكثبانِ بينما يتسلّلُ آخرُ ضوءِ الغروبِ فوقَ الأفق.",
+    "بابُ المسجدِ القديمُ مفتوحٌ، والصمتُ في الداخلِ أقدمُ من الذاكرة.",
+    "بين الجبالِ والبحرِ تتوقّفُ القافلةُ لتتأمّلَ السماءَ الممتدّة.",
+    "حمل صوتُها حنينَ مدينةٍ منسيّة، رقيقًا وحزينًا.",
+    "تسقطُ أشعّةٌ ذهبيّةٌ عبرَ الأقواسِ فترسمُ ظلالًا طويلةً على جدرانِ الطين.",
+    "ينحني النهرُ بهدوءٍ تحتَ الشفقِ النيليّ، عاكسًا أولى النجوم.",
+    "يصلّي وحدَه عند الفجر، وهيئتُه حادّةٌ على الأفقِ الشاحب.",
+    "يذوبُ الزمنُ في الصحراء؛ ولا تتذكّرُ الريحُ إلّا أسماءَ من مرّوا.",
+]
+
+
+def make_excerpt(size_bytes: int, seed: int = 7, sentences: list[str] = ATHAR_SENTENCES) -> str:
+    rng = random.Random(seed)
+    parts, length = [], 0
+    while length < size_bytes:
+        sentence = rng.choice(sentences)
+        parts.append(sentence)
+        length += len(sentence.encode("utf-8")) + 1
+    return " ".join(parts)
+
+
+def legacy_match(lexicon: Lexicon, text: str) -> dict[str, list[str]]:
+    """The previous behaviour: substring scans over the lowercased input."""
+    text = text.lower()
+    return {
+        category: [label for label, keywords in labels.items() if any(keyword in text for keyword in keywords)]
+        for category, labels in lexicon.categories.items()
+    }
+
+
+def _time(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--excerpt-kb", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    source = get_lexicon()
+    lexicon = Lexicon(source.categories, source.version, source.translations)
+    compile_ms = (time.perf_counter() - start) * 1000
+    keyword_count = sum(
+        len(keywords)
+        for categories in (lexicon.categories, *lexicon.translations.values())
+        for labels in categories.values()
+        for keywords in labels.values()
+    )
+
+    print("=" * 78)
+    print(f"BRIEF EXTRACTION BENCHMARK | keywords={keyword_count} | compile={compile_ms:.2f} ms | repeat={args.repeat}")
+    print("=" * 78)
+    print(f"{'excerpt':>9} | {'legacy scan':>12} | {'compiled':>12} | {'speedup':>7} | false positives removed")
+    for kb in args.excerpt_kb:
+        text = make_excerpt(kb * 1024)
+        legacy_seconds = _time(lambda: legacy_match(lexicon, text), args.repeat)
+        compiled_seconds = _time(lambda: lexicon.match(text), args.repeat)
+
+        legacy = legacy_match(lexicon, text)
+        compiled = lexicon.match(text)
+        removed = sorted(
+            f"{category}:{label}"
+            for category, labels in legacy.items()
+            for label in labels
+            if label not in compiled.get(category)
+        )
+        print(
+            f"{kb:>6} KB | {legacy_seconds * 1000:>9.3f} ms | {compiled_seconds * 1000:>9.3f} ms | "
+            f"{legacy_seconds / compiled_seconds:>6.2f}x | {', '.join(removed) or '-'}"
+        )
+
+    print("-" * 78)
+    print(f"{'arabic':>9} | {'compiled':>12} | labels resolved (legacy scan resolves none)")
+    for kb in args.excerpt_kb:
+        text = make_excerpt(kb * 1024, sentences=ATHAR_SENTENCES_AR)
+        compiled_seconds = _time(lambda: lexicon.match(text), args.repeat)
+        labels = sum(len(labels) for labels in lexicon.match(text).labels.values())
+        print(f"{kb:>6} KB | {compiled_seconds * 1000:>9.3f} ms | {labels}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
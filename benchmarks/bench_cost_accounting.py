@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Show what each request costs and what the accounting costs the request.
+
+Runs workflow.pipeline.PipelineEngine (no judge, local export backend) against
+the KIE stand-in for a set of briefs across themes and aspect ratios; some
+runs' first images fail QA, so their records include the retry's credits,
+downloads and QA CPU time. Each run's accounting record (monitoring.accounting)
+is the one its pipeline_delivered event carries; the records are saved to a
+scratch ledger (COST_LEDGER_PATH) and reported grouped by theme and aspect
+ratio, as ``python -m monitoring.accounting`` would.
+
+Also times record_kie / record_llm / record_cpu / record_transfer inside a
+trace, the per-call overhead the instrumented tools pay.
+
+Usage:
+    python -m benchmarks.bench_cost_accounting --kie-seconds 0.5 --calls 50000
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from benchmarks.kie_standin import KieStandinServer
+
+# (brief, theme, aspect ratio, images QA rejects first)
+RUNS = (
+    ("Create an image of solitude in the desert at sunset, a lone figure in golden light.", "solitude", "16:9", 0),
+    ("A quiet mosque courtyard at dawn, soft mist over the fountain, calm and reverent.", "spirituality", "1:1", 0),
+    ("A family sharing dinner on a rooftop at dusk, warm lanterns, laughter and steam.", "family", "4:5", 1),
+    ("A lone lighthouse on a stormy coast at night, beam cutting through rain.", "solitude", "9:16", 2),
+    ("Prayer beads resting on an open book by a window, morning light, still and intimate.", "spirituality", "1:1", 1),
+    ("Children flying kites over green hills in spring, bright sky, joyful movement.", "family", "16:9", 0),
+)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kie-seconds", type=float, default=0.5, help="Stand-in generation time per task")
+    parser.add_argument("--calls", type=int, default=50000, help="record_* calls timed per function")
+    args = parser.parse_args()
+
+    kie = KieStandinServer(generation_seconds=args.kie_seconds).start()
+    with tempfile.TemporaryDirectory() as directory:
+        # Point the tools and stores at the stand-in and scratch state before they are imported.
+        os.environ.update(
+            KIE_API_BASE=kie.api_base,
+            KIE_API_KEY=kie.api_key,
+            ATHAR_STATE_DIR=directory,
+            ARTIFACT_STORE_PATH=os.path.join(directory, "artifacts.sqlite3"),
+            REUSE_INDEX_PATH=os.path.join(directory, "reuse_index.sqlite3"),
+            RETRY_LEDGER_PATH=os.path.join(directory, "retry_ledger.sqlite3"),
+            COST_LEDGER_PATH=os.path.join(directory, "costs.sqlite3"),
+            BLOB_STORE_DIR=os.path.join(directory, "blobs"),
+            EXPORT_BACKEND="local",
+            EXPORT_LOCAL_DIR=os.path.join(directory, "exports"),
+        )
+        from monitoring import accounting, tracing
+        from workflow.pipeline import PipelineEngine
+
+        engine = PipelineEngine()
+
+        print("=" * 112)
+        print(f"COST ACCOUNTING | KIE stand-in {args.kie_seconds:g}s/task | {len(RUNS)} requests")
+        print("=" * 112)
+        print(f"{'theme':<13} | {'ratio':<5} | {'status':<9} | {'USD':>8} | {'images':>6} | {'credits':>7} | "
+              f"{'LLM calls':>9} | {'CPU s':>6} | {'KB':>7} | {'seconds':>7} | CPU by stage")
+        for brief, theme, aspect_ratio, blurry in RUNS:
+            kie.fail_next(blurry)
+            # The tools print progress lines; keep the table readable.
+            with contextlib.redirect_stdout(io.StringIO()):
+                run = engine.run(brief, aspect_ratio=aspect_ratio, theme=theme)
+            cost = run.cost or {}
+            stages = " ".join(f"{stage}={seconds:.3f}" for stage, seconds in cost.get("cpu_seconds", {}).items())
+            kilobytes = (cost.get("download_bytes", 0) + cost.get("bytes_sent", 0) + cost.get("bytes_received", 0)) / 1024
+            print(
+                f"{theme:<13} | {aspect_ratio:<5} | {cost.get('status', run.state):<9} | {cost.get('usd', {}).get('total', 0):>8.4f} | "
+                f"{cost.get('kie_images', 0):>6} | {cost.get('kie_credits', 0):>7g} | {cost.get('llm_calls', 0):>9} | "
+                f"{cost.get('cpu_seconds_total', 0):>6.3f} | {kilobytes:>7.0f} | {cost.get('seconds', 0):>7.2f} | {stages}"
+            )
+
+        print()
+        print("Report by theme and aspect ratio")
+        print(accounting.format_report(accounting.cost_report(("theme", "aspect_ratio"), days=1), ("theme", "aspect_ratio")))
+        print()
+        print("Report by theme")
+        print(accounting.format_report(accounting.cost_report(("theme",), days=1), ("theme",)))
+
+        print()
+        print(f"{'call (inside a trace)':<24} | {'ns/call':>8}")
+        calls = {
+            "record_kie": lambda: accounting.record_kie(images=1),
+            "record_llm": lambda: accounting.record_llm("bench_agent", 1, 1200, 300),
+            "record_cpu": lambda: accounting.record_cpu("qa", 0.01),
+            "record_transfer": lambda: accounting.record_transfer(downloaded=4096),
+        }
+        with tracing.span("bench.request"):
+            accounting.open_request(theme="bench")
+            for label, call in calls.items():
+                start = time.perf_counter()
+                for _ in range(args.calls):
+                    call()
+                print(f"{label:<24} | {(time.perf_counter() - start) / args.calls * 1e9:>8.0f}")
+            accounting.close_request("bench", theme="bench")
+    kie.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark Drive export throughput (files/second) against the local Drive stand-in.
+
+Compares the legacy per-file path (upload, then a separate permission call, one
+file at a time) with delivery.drive_export.export_many (concurrent uploads plus
+batched permissions), with and without a publicly shared target folder.
+
+Usage:
+    python -m benchmarks.bench_drive_export --files 40 --latency-ms 25
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from io import BytesIO
+
+from PIL import Image
+
+from benchmarks.drive_standin import DriveStandinServer
+
+
+def _make_png(seed: int, size: int = 256) -> bytes:
+    image = Image.new("RGB", (size, size), ((seed * 37) % 256, (seed * 91) % 256, (seed * 53) % 256))
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--latency-ms", type=float, default=25.0, help="Simulated per-request latency")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    server = DriveStandinServer(latency_seconds=args.latency_ms / 1000).start()
+    os.environ["GDRIVE_API_ROOT"] = server.root_url
+    os.environ.pop("GOOGLE_SERVICE_ACCOUNT_JSON", None)
+
+    # Import after the environment points at the stand-in.
+    from delivery import drive_client
+    from delivery.drive_export import (
+        PUBLIC_READ_PERMISSION,
+        ExportItem,
+        download_image,
+        export_many,
+        upload_bytes,
+    )
+
+    drive_client.reset_drive_factory()
+    service = drive_client.get_drive_service()
+    private_folder = service.files().create(body={"name": "private", "mimeType": "application/vnd.google-apps.folder"}).execute()["id"]
+    public_folder = service.files().create(body={"name": "public", "mimeType": "application/vnd.google-apps.folder"}).execute()["id"]
+    service.permissions().create(fileId=public_folder, body=PUBLIC_READ_PERMISSION).execute()
+
+    items = [
+        ExportItem(image_url=server.add_image(f"img_{i}.png", _make_png(i)), filename=f"athar_bench_{i}.png")
+        for i in range(args.files)
+    ]
+
+    print("=" * 70)
+    print(f"DRIVE EXPORT BENCHMARK | files={args.files} | latency={args.latency_ms}ms | workers={args.workers}")
+    print("=" * 70)
+
+    # Legacy: sequential upload + per-file permission call.
+    requests_before = server.state.request_count
+    start = time.monotonic()
+    for item in items:
+        file_info = upload_bytes(download_image(item.image_url), item.filename, private_folder)
+        service.permissions().create(fileId=file_info["id"], body=PUBLIC_READ_PERMISSION).execute()
+    duration = time.monotonic() - start
+    print(f"sequential + per-file permission : {args.files / duration:8.2f} files/s "
+          f"({server.state.request_count - requests_before} HTTP requests)")
+
+    for label, folder in (("concurrent + batch permissions  ", private_folder),
+                          ("concurrent + inherited (public) ", public_folder)):
+        requests_before = server.state.request_count
+        report = export_many(items, folder, max_workers=args.workers, optimize=False, derivatives=False)
+        failed = sum(1 for r in report.results if not r.ok)
+        print(f"{label}: {report.files_per_second:8.2f} files/s "
+              f"({server.state.request_count - requests_before} HTTP requests, failed={failed})")
+
+    server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
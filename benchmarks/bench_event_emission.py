@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Measure what emit_event() costs the calling thread, synchronous vs buffered.
+
+Attaches a log handler that blocks for --handler-ms per line (a slow disk, a
+full pipe, a log shipper) to the "athar.monitoring" logger, then emits a mix of
+events shaped like a request's: KIE poll attempts (sampled at their
+EVENT_SAMPLE_RATES rate when buffered), stage transitions and a few task events.
+
+Reports per mode the caller-side latency of one emit_event() call (median,
+p99, max) and the wall-clock time of the whole burst, then the buffer's
+counters: events written, sampled out and dropped because the ring buffer
+(--buffer) filled faster than the handler drained it.
+
+Usage:
+    python -m benchmarks.bench_event_emission --events 2000 --handler-ms 0.5 --buffer 4096
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import statistics
+import time
+
+import monitoring
+
+
+class SlowHandler(logging.Handler):
+    """Blocks for a fixed time per record, like a handler doing slow I/O."""
+
+    def __init__(self, seconds: float):
+        super().__init__()
+        self.seconds = seconds
+        self.count = 0
+
+    def emit(self, record):
+        self.format(record)
+        time.sleep(self.seconds)
+        self.count += 1
+
+
+def request_events(count: int):
+    """(event, level, payload) tuples in the proportions of a request's events."""
+    for number in range(count):
+        if number % 10 == 9:
+            yield "pipeline_stage", "info", {"stage": "qa", "next": "export", "seconds": 0.8}
+        elif number % 50 == 49:
+            yield "kie_task_completed", "info", {"task_id": f"task-{number}", "duration": 41.2, "attempts": 6}
+        else:
+            yield "kie_poll_attempt", "info", {"task_id": f"task-{number // 10}", "attempt": number % 10, "status": "processing"}
+
+
+def measure(events: int) -> tuple[list[float], float]:
+    latencies = []
+    start = time.perf_counter()
+    for name, level, payload in request_events(events):
+        call = time.perf_counter()
+        monitoring.emit_event(name, level=level, **payload)
+        latencies.append(time.perf_counter() - call)
+    return latencies, time.perf_counter() - start
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=2000, help="Events emitted per mode")
+    parser.add_argument("--handler-ms", type=float, default=0.5, help="Time the log handler blocks per line")
+    parser.add_argument("--buffer", type=int, default=monitoring.EVENT_BUFFER_SIZE, help="Ring buffer capacity")
+    args = parser.parse_args()
+
+    handler = SlowHandler(args.handler_ms / 1000)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    monitoring.logger.addHandler(handler)
+    monitoring.logger.setLevel(logging.INFO)
+    monitoring.logger.propagate = False
+
+    print("=" * 92)
+    print(f"EVENT EMISSION | handler blocks {args.handler_ms:g} ms/line | {args.events} events | buffer {args.buffer}")
+    print("=" * 92)
+    print(f"{'mode':<9} | {'median µs':>9} | {'p99 µs':>8} | {'max µs':>8} | {'burst s':>7} | {'written':>7} | {'sampled out':>11} | {'dropped':>7}")
+
+    rows = []
+    for mode in ("sync", "buffered"):
+        monitoring.EVENT_ASYNC = mode == "buffered"
+        monitoring._buffer = monitoring.EventBuffer(capacity=args.buffer)
+        handler.count = 0
+        latencies, seconds = measure(args.events)
+        monitoring.flush_events(timeout=args.events * args.handler_ms / 1000 + 10)
+        stats = monitoring.event_stats()
+        latencies_us = sorted(value * 1e6 for value in latencies)
+        p99 = latencies_us[min(len(latencies_us) - 1, int(len(latencies_us) * 0.99))]
+        sampled = stats["sampled_out"] if mode == "buffered" else 0
+        dropped = stats["dropped"] if mode == "buffered" else 0
+        rows.append((mode, stats))
+        print(
+            f"{mode:<9} | {statistics.median(latencies_us):>9.1f} | {p99:>8.1f} | {latencies_us[-1]:>8.1f} | "
+            f"{seconds:>7.3f} | {handler.count:>7} | {sampled:>11} | {dropped:>7}"
+        )
+
+    stats = rows[-1][1]
+    if stats["dropped_by_event"]:
+        print(f"dropped by event: {stats['dropped_by_event']}")
+    print(f"sampled out by event: {stats['sampled_out_by_event']} (rates: {monitoring.EVENT_SAMPLE_RATES})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
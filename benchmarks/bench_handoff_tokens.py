@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Estimate LLM tokens per pipeline with handoffs inlined vs passed by reference.
+
+Replays one pipeline (art direction -> NB image -> QA -> export, with QA -> NB
+retries) as the agents' threads would see it. Every handoff message, tool call
+and tool result is appended to the threads that receive it, and every LLM turn
+re-reads its agent's whole thread (input tokens); handoff messages and tool-call
+arguments are written by the model (output tokens). The two modes differ only
+in what the agents write: the full prompt package / image result, or their
+artifact IDs. Tool results are identical in both modes.
+
+Handoffs go through the real contracts (validate_payload) and the reference
+mode through the real artifact store, whose own per-pipeline tally of tokens
+not sent (ArtifactStore.pipeline_savings) is reported next to the estimate.
+Tokens are estimated at about four characters per token.
+
+Usage:
+    python -m benchmarks.bench_handoff_tokens --variants 1 4 --retries 0 1 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import tempfile
+from collections import defaultdict
+
+
+class Threads:
+    """Token accounting over the agents' threads."""
+
+    def __init__(self, estimate_tokens):
+        self.estimate_tokens = estimate_tokens
+        self.threads: dict[str, int] = defaultdict(int)
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def turn(self, agent: str) -> None:
+        self.input_tokens += self.threads[agent]
+
+    def write(self, agent: str, payload, *readers: str) -> None:
+        """The agent writes payload (tool call or handoff); it lands in its thread and the readers'."""
+        tokens = self.estimate_tokens(payload if isinstance(payload, str) else json.dumps(payload))
+        self.output_tokens += tokens
+        for name in {agent, *readers}:
+            self.threads[name] += tokens
+
+    def read(self, agent: str, payload) -> None:
+        """A tool result lands in the agent's thread."""
+        self.threads[agent] += self.estimate_tokens(payload if isinstance(payload, str) else json.dumps(payload))
+
+
+def run_pipeline(variants: int, retries: int, by_reference: bool, request: int) -> tuple[Threads, dict]:
+    from workflow.artifacts import IMAGE_RESULT, PROMPT_PACKAGE, estimate_tokens, get_artifact_store, resolve_artifact
+    from workflow.contracts import validate_payload
+    from workflow.prompt_templates import Brief, render_variants
+
+    store = get_artifact_store()
+    threads = Threads(estimate_tokens)
+    brief = Brief(
+        theme="solitude and contemplation",
+        mood="serene, contemplative",
+        palette="warm earth tones, soft golden light",
+        visual_elements="lone figure, vast landscape, atmospheric depth",
+        tone="poetic, cinematic, meditative",
+        aspect_ratio="4:5",
+        # A distinct request, so its (content-addressed) artifacts are its own.
+        custom_instructions=f"Reference brief #{request}",
+    )
+
+    def handoff(sender: str, recipient: str, envelope: dict) -> None:
+        message = json.dumps(envelope)
+        validate_payload(sender, recipient, message)
+        threads.write(sender, {"recipient_agent": recipient, "message": message}, recipient)
+
+    # Art direction: one tool call, then the handoff to NB
+    rendered = render_variants(brief, variants)
+    package = dict(rendered[0])
+    if variants > 1:
+        package["variants"] = [
+            {key: variant[key] for key in ("prompt", "negative_prompt", "palette", "composition")}
+            for variant in rendered
+        ]
+    prompt_id = store.put(PROMPT_PACKAGE, package)
+    threads.turn("art_direction_agent")
+    threads.write("art_direction_agent", {key: getattr(brief, key) for key in ("theme", "mood", "palette", "visual_elements", "tone", "aspect_ratio")})
+    threads.read("art_direction_agent", {**package, "artifact_id": prompt_id})
+    threads.turn("art_direction_agent")
+    handoff(
+        "art_direction_agent",
+        "nb_image_agent",
+        {"agent": "art_direction_agent", "status": "ok", "handoff": {"target_agent": "nb_image_agent", "action": "generate_image"},
+         **({"artifact_id": prompt_id} if by_reference else {"prompt_package": package})},
+    )
+
+    image_ids = []
+    for attempt in range(retries + 1):
+        # NB: generate every variant, hand the first image to QA
+        threads.turn("nb_image_agent")
+        results = []
+        for index, variant in enumerate(package.get("variants") or [package]):
+            if by_reference:
+                resolve_artifact(prompt_id, PROMPT_PACKAGE)
+                threads.write("nb_image_agent", {"prompt_artifact_id": prompt_id, "variant": index})
+            else:
+                threads.write("nb_image_agent", {"prompt": variant["prompt"], "negative_prompt": variant["negative_prompt"], "aspect_ratio": brief.aspect_ratio})
+            result = {
+                "request_id": "5d0c8e2f9a7b4c1e8f3a6b2d9c4e7f10",
+                "task_id": f"task-{attempt}-{index}",
+                "poll_duration_seconds": 41.7,
+                "attempts": 9,
+                "image_url": f"https://tempfile.aiquickdraw.com/images/athar-{attempt}-{index}.png",
+                "seed": str(184467 + attempt * 10 + index),
+                "prompt_used": variant["prompt"],
+                "aspect_ratio": brief.aspect_ratio,
+                "all_image_urls": [f"https://tempfile.aiquickdraw.com/images/athar-{attempt}-{index}.png"],
+                "style": "cinematic-premium",
+            }
+            result_id = store.put(IMAGE_RESULT, result, parent_id=prompt_id)
+            threads.read("nb_image_agent", {"success": True, **result, "num_images": 1, "artifact_id": result_id})
+            results.append((result_id, result))
+        threads.turn("nb_image_agent")
+        image_id, image_result = results[0]
+        handoff(
+            "nb_image_agent",
+            "qa_agent",
+            {"agent": "nb_image_agent", "status": "ok", "handoff": {"target_agent": "qa_agent", "action": "validate_image"},
+             **({"artifact_id": image_id} if by_reference else {"image_result": image_result})},
+        )
+
+        # QA: validate, then retry or pass to export
+        threads.turn("qa_agent")
+        if by_reference:
+            resolve_artifact(image_id, IMAGE_RESULT)
+            threads.write("qa_agent", {"image_artifact_id": image_id})
+        else:
+            threads.write("qa_agent", {"image_url": image_result["image_url"], "expected_aspect_ratio": brief.aspect_ratio, "request_id": image_result["request_id"]})
+        passed = attempt == retries
+        validation = {
+            "approved": passed,
+            "status": "pass" if passed else "retry",
+            "passed_checks": ["Aspect ratio", "Resolution"] + (["Image quality"] if passed else []),
+            "failed_checks": [] if passed else ["Image quality"],
+            "issues": [] if passed else ["Image appears blurry (sharpness variance 212)"],
+            "warnings": [],
+            "image_info": {"width": 1024, "height": 1280, "actual_ratio": "1024:1280", "format": "PNG", "mode": "RGB"},
+            "recommendation": "Image quality is excellent, proceed to export" if passed else "Generate new image with corrections",
+        }
+        threads.read("qa_agent", validation)
+        threads.turn("qa_agent")
+        target = "export_agent" if passed else "nb_image_agent"
+        envelope = {"agent": "qa_agent", "status": validation["status"], "validation": validation,
+                    "handoff": {"target_agent": target, "action": "export" if passed else "regenerate"}}
+        if by_reference:
+            envelope["image_artifact_id"] = image_id
+        else:
+            envelope["handoff"]["notes"] = json.dumps({key: image_result[key] for key in ("image_url", "seed", "prompt_used")})
+        handoff("qa_agent", target, envelope)
+        image_ids.append(image_id)
+
+    # Export: upload, then the final delivery (identical in both modes)
+    threads.turn("export_agent")
+    if by_reference:
+        resolve_artifact(image_ids[-1], IMAGE_RESULT)
+        threads.write("export_agent", {"image_artifact_id": image_ids[-1], "filename": "athar_20261019_120000.png", "theme": "desert solitude"})
+    else:
+        threads.write("export_agent", {"image_url": image_result["image_url"], "filename": "athar_20261019_120000.png", "theme": "desert solitude", "prompt_used": image_result["prompt_used"]})
+    upload = {"success": True, "file_id": "1AbC", "view_url": "https://drive.google.com/file/d/1AbC/view", "download_url": "https://drive.google.com/uc?id=1AbC&export=download"}
+    threads.read("export_agent", {**upload, **{key: image_result[key] for key in ("image_url", "seed", "aspect_ratio", "prompt_used")}})
+    threads.turn("export_agent")
+    threads.write("export_agent", {"agent": "export_agent", "status": "delivered", "delivery": {**upload, "prompt_used": image_result["prompt_used"]}})
+    return threads, store.pipeline_savings(*image_ids)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--variants", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--retries", type=int, nargs="+", default=[0, 1, 2])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Point the store at a scratch database before it is first used.
+        os.environ["ARTIFACT_STORE_PATH"] = os.path.join(directory, "artifacts.sqlite3")
+
+        print("=" * 96)
+        print("HANDOFF TOKENS PER PIPELINE | inline payloads vs artifact references | ~4 chars/token")
+        print("=" * 96)
+        print(
+            f"{'variants':>8} | {'retries':>7} | {'inline in/out':>15} | {'by ref in/out':>15} | {'saved in/out':>15}"
+            f" | {'saved':>6} | store tally"
+        )
+        for variants in args.variants:
+            for retries in args.retries:
+                request = variants * 100 + retries
+                inline, _ = run_pipeline(variants, retries, by_reference=False, request=request)
+                reference, tally = run_pipeline(variants, retries, by_reference=True, request=request)
+                saved_in = inline.input_tokens - reference.input_tokens
+                saved_out = inline.output_tokens - reference.output_tokens
+                total = inline.input_tokens + inline.output_tokens
+                print(
+                    f"{variants:>8} | {retries:>7} | {inline.input_tokens:>7,}/{inline.output_tokens:<7,}"
+                    f" | {reference.input_tokens:>7,}/{reference.output_tokens:<7,}"
+                    f" | {saved_in:>7,}/{saved_out:<7,} | {(saved_in + saved_out) / total:>6.0%}"
+                    f" | {tally['tokens_saved']:,} tokens in {tally['references']} references"
+                )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
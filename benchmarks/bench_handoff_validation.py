@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Benchmark handoff contract validation in StructuredSendMessage.
+
+For one representative payload per HANDOFF_SCHEMAS pair, compares the previous
+path (parse the tool arguments, json.loads the message again, then
+model_validate the dict) with the current one (parse the tool arguments, then
+validate the message straight from its JSON text with the pair's cached
+validator), and reports handoffs per second.
+
+Usage:
+    python -m benchmarks.bench_handoff_validation --repeat 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+
+from workflow.contracts import HANDOFF_SCHEMAS, validate_payload
+from workflow.prompt_templates import Brief, render_variants
+
+BRIEF = Brief(
+    theme="solitude and contemplation",
+    mood="serene, contemplative",
+    palette="warm earth tones, soft golden light",
+    visual_elements="lone figure, vast landscape, atmospheric depth",
+    tone="poetic, cinematic, meditative",
+    aspect_ratio="4:5",
+)
+
+IMAGE_URLS = [f"https://tempfile.aiquickdraw.com/images/athar-{number}.png" for number in range(4)]
+REQUEST_ID = "5d0c8e2f9a7b4c1e8f3a6b2d9c4e7f10"
+
+
+def _prompt_package() -> dict:
+    variants = render_variants(BRIEF, 4)
+    package = dict(variants[0])
+    package["variants"] = [
+        {key: variant[key] for key in ("prompt", "negative_prompt", "palette", "composition")} for variant in variants
+    ]
+    return package
+
+
+def _validation(status: str, failed_checks: list[str]) -> dict:
+    return {
+        "approved": status != "retry",
+        "status": status,
+        "passed_checks": ["resolution", "aspect_ratio", "format", "sharpness", "exposure"][len(failed_checks):],
+        "failed_checks": failed_checks,
+        "warnings": [],
+        "issues": [f"{check} below threshold" for check in failed_checks],
+        "recommendation": "regenerate with the same prompt" if failed_checks else "proceed to export",
+        "image_info": {"width": 1024, "height": 1280, "format": "PNG", "mode": "RGB", "size_bytes": 1843200},
+    }
+
+
+PAYLOADS: dict[tuple[str, str], dict] = {
+    ("brief_agent", "art_direction_agent"): {
+        "agent": "brief_agent",
+        "status": "ok",
+        "brief": {
+            "theme": BRIEF.theme,
+            "mood": BRIEF.mood,
+            "tone": BRIEF.tone,
+            "palette": BRIEF.palette,
+            "visual_elements": BRIEF.visual_elements,
+            "keywords": "solitude, desert, dusk, figure",
+            "aspect_ratio": BRIEF.aspect_ratio,
+            "style": "cinematic-premium",
+            "original_input": "A lone figure in a vast desert at dusk, quiet and contemplative, portrait format.",
+        },
+        "handoff": {"target_agent": "art_direction_agent", "action": "generate_prompt"},
+    },
+    ("art_direction_agent", "nb_image_agent"): {
+        "agent": "art_direction_agent",
+        "status": "ok",
+        "prompt_package": _prompt_package(),
+        "handoff": {"target_agent": "nb_image_agent", "action": "generate_image"},
+    },
+    ("nb_image_agent", "qa_agent"): {
+        "agent": "nb_image_agent",
+        "status": "ok",
+        "image_result": {
+            "request_id": REQUEST_ID,
+            "task_id": "task-7f3c2a",
+            "image_url": IMAGE_URLS[0],
+            "all_image_urls": IMAGE_URLS,
+            "seed": "184467",
+            "prompt_used": _prompt_package()["prompt"],
+            "aspect_ratio": BRIEF.aspect_ratio,
+            "style": "cinematic-premium",
+            "poll_duration_seconds": 41.7,
+            "attempts": 9,
+        },
+        "handoff": {"target_agent": "qa_agent", "action": "validate_image"},
+    },
+    ("qa_agent", "export_agent"): {
+        "agent": "qa_agent",
+        "status": "pass",
+        "validation": _validation("pass", []),
+        "handoff": {"target_agent": "export_agent", "action": "upload"},
+    },
+    ("qa_agent", "nb_image_agent"): {
+        "agent": "qa_agent",
+        "status": "retry",
+        "validation": _validation("retry", ["sharpness", "exposure"]),
+        "handoff": {"target_agent": "nb_image_agent", "action": "regenerate"},
+    },
+}
+
+
+def legacy_handoff(sender: str, arguments: str) -> None:
+    """The previous path: arguments parsed, message parsed again, dict validated."""
+    args = json.loads(arguments)
+    schema = HANDOFF_SCHEMAS[(sender, args["recipient_agent"])]
+    schema.model_validate(json.loads(args["message"]))
+
+
+def handoff(sender: str, arguments: str) -> None:
+    args = json.loads(arguments)
+    validate_payload(sender, args["recipient_agent"], args["message"])
+
+
+def _rate(func, repeat: int, rounds: int = 5) -> float:
+    """Handoffs per second over the fastest of several rounds (the box may be noisy)."""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return repeat / best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+
+    print("=" * 72)
+    print(f"HANDOFF VALIDATION BENCHMARK | repeat={args.repeat}")
+    print("=" * 72)
+    print(f"{'handoff':<54} | {'bytes':>6} | {'legacy/s':>9} | {'direct/s':>9} | speedup")
+    for (sender, recipient), payload in PAYLOADS.items():
+        arguments = json.dumps({"recipient_agent": recipient, "message": json.dumps(payload)})
+        envelope = validate_payload(sender, recipient, json.dumps(payload))
+        assert envelope == HANDOFF_SCHEMAS[(sender, recipient)].model_validate(payload)
+
+        legacy_rate = _rate(lambda: legacy_handoff(sender, arguments), args.repeat)
+        direct_rate = _rate(lambda: handoff(sender, arguments), args.repeat)
+        label = f"{sender} -> {recipient} ({type(envelope).__name__})"
+        print(
+            f"{label:<54} | {len(arguments):>6} | {legacy_rate:>9,.0f} | {direct_rate:>9,.0f}"
+            f" | {direct_rate / legacy_rate:>6.2f}x"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
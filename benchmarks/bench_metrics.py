@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Measure the metrics registry: update cost, and scrapes across worker processes.
+
+First times the hot-path updates (counter inc, histogram observe, timer) in
+this process. Then starts --workers processes the way uvicorn does (forked
+from a parent that already imported the metrics), each recording --updates
+QA verdicts and download latencies; half of them stay alive holding a pipeline
+in flight, the others exit. A scrape from the parent must report every
+worker's counters and histograms (exited ones included) and only the live
+workers' gauge.
+
+Reports the update costs, what a per-process registry would have shown for the
+same scrape, what the merged scrape shows, and the scrape (render) time.
+
+Usage:
+    python -m benchmarks.bench_metrics --workers 4 --updates 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+
+
+def worker(updates: int, stay_alive: bool, ready, release) -> None:
+    from monitoring import metrics
+
+    for number in range(updates):
+        metrics.QA_VERDICTS.inc(status="pass" if number % 4 else "retry")
+        metrics.DOWNLOAD_SECONDS.observe((number % 100) / 100, source="remote")
+    if stay_alive:
+        with metrics.PIPELINES_IN_FLIGHT.track_inprogress(mode="pipeline"):
+            metrics.REGISTRY.write_snapshot()
+            ready.set()
+            release.wait(60)
+    else:
+        metrics.REGISTRY.write_snapshot()
+        ready.set()
+
+
+def sample(text: str, name: str) -> float:
+    """Sum of a metric's samples in an exposition (0 when absent)."""
+    pattern = re.compile(rf"^{re.escape(name)}(?:{{[^}}]*}})? (\S+)$", re.MULTILINE)
+    return sum(float(value) for value in pattern.findall(text))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4, help="Worker processes")
+    parser.add_argument("--updates", type=int, default=20000, help="Updates per worker and metric")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["METRICS_DIR"] = directory
+        from monitoring import metrics
+
+        print("=" * 80)
+        print(f"METRICS | {args.workers} worker processes x {args.updates} updates")
+        print("=" * 80)
+        scratch = metrics.Registry(directory=os.path.join(directory, "scratch"))
+        counter = metrics.Counter("bench_total", "bench", labels=("status",), registry=scratch)
+        histogram = metrics.Histogram("bench_seconds", "bench", labels=("source",), registry=scratch)
+        timings = {
+            "counter.inc": lambda: counter.inc(status="pass"),
+            "histogram.observe": lambda: histogram.observe(0.42, source="remote"),
+            "histogram.time": lambda: histogram.time(source="remote").__enter__().__exit__(None, None, None),
+        }
+        for label, update in timings.items():
+            start = time.perf_counter()
+            for _ in range(100000):
+                update()
+            print(f"{label:<18} {(time.perf_counter() - start) / 100000 * 1e9:>7.0f} ns/update")
+
+        # Uvicorn forks its workers from a parent that imported the app (and so the metrics).
+        # The parent's own verdict must be counted once, not once per forked worker.
+        metrics.QA_VERDICTS.inc(status="pass")
+        context = multiprocessing.get_context("fork")
+        release = context.Event()
+        processes, ready = [], []
+        for number in range(args.workers):
+            event = context.Event()
+            process = context.Process(target=worker, args=(args.updates, number % 2 == 0, event, release))
+            process.start()
+            processes.append(process)
+            ready.append(event)
+        for event in ready:
+            event.wait(60)
+        for number, process in enumerate(processes):
+            if number % 2:
+                process.join()
+
+        live = (args.workers + 1) // 2
+        start = time.perf_counter()
+        text = metrics.REGISTRY.render()
+        scrape = time.perf_counter() - start
+        per_process = args.updates  # What one worker's own registry would have reported.
+        print()
+        print(f"{'metric':<38} | {'one worker':>10} | {'merged':>10} | {'expected':>10}")
+        rows = (
+            ("athar_qa_verdicts_total", per_process, args.workers * args.updates + 1),
+            ("athar_download_seconds_count", per_process, args.workers * args.updates),
+            ("athar_pipelines_in_flight", 1, live),
+        )
+        for name, one, expected in rows:
+            print(f"{name:<38} | {one:>10g} | {sample(text, name):>10g} | {expected:>10g}")
+        snapshots = sum(name.endswith(".json") for name in os.listdir(directory))
+        print(f"scrape: {len(text.splitlines())} lines from {snapshots} snapshots in {scrape * 1000:.1f} ms")
+
+        release.set()
+        for process in processes:
+            process.join()
+        text = metrics.REGISTRY.render()
+        print(f"after every worker exited: pipelines_in_flight={sample(text, 'athar_pipelines_in_flight'):g}, "
+              f"qa_verdicts_total={sample(text, 'athar_qa_verdicts_total'):g}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
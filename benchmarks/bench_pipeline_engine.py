@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Compare end-to-end latency and LLM cost: deterministic pipeline vs agency.
+
+Runs workflow.pipeline.PipelineEngine for real (the five tools, contract
+validation, local export backend) against the KIE stand-in, for a clear brief,
+an ambiguous brief (judge consulted) and a brief whose first image fails QA
+(one retry, judge rewrites the prompt). The judge is a stand-in that answers
+after one model turn (--turn-seconds) and reports estimated tokens.
+
+The agency runs the same tools, plus two LLM turns per agent visit (tool call,
+then handoff): 10 turns for a clean run, 4 more per retry. Its latency is
+estimated as the engine's tool time plus those turns; its tokens as every
+turn re-reading the agent's instructions and tool schemas plus the handoff
+thread replay of bench_handoff_tokens (by reference, the agency's current
+mode). Both are lower bounds: reasoning tokens and the sender's closing turn
+after a nested handoff are not counted. KIE credits and storage are the same
+in both modes and left out of the cost.
+
+Usage:
+    python -m benchmarks.bench_pipeline_engine --runs 3 --turn-seconds 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.kie_standin import KieStandinServer
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CLEAR_BRIEF = (
+    "Create an image of solitude in the desert at sunset. A lone figure contemplates the vast expanse, "
+    "bathed in golden light, peaceful and meditative."
+)
+AMBIGUOUS_BRIEF = "Something for the launch of the new chapter, the one about coming home."
+
+# (name, request, leading blurry images)
+SCENARIOS = (
+    ("clear brief", CLEAR_BRIEF, 0),
+    ("ambiguous brief", AMBIGUOUS_BRIEF, 0),
+    ("QA retry", CLEAR_BRIEF, 1),
+)
+
+AGENT_TOOLS = {
+    "brief_agent": ("brief_agent.tools.ExtractBriefTool",),
+    "art_direction_agent": ("art_direction_agent.tools.GeneratePromptTool",),
+    "nb_image_agent": ("nb_image_agent.tools.KieNanoBananaTool", "nb_image_agent.tools.FindReusableImageTool"),
+    "qa_agent": ("qa_agent.tools.ValidateImageTool",),
+    "export_agent": (
+        "export_agent.tools.GDriveUploadTool",
+        "export_agent.tools.GDriveBatchUploadTool",
+        "export_agent.tools.ExportStatusTool",
+    ),
+}
+
+
+def context_tokens(estimate_tokens) -> dict[str, int]:
+    """Tokens every turn of each agent re-reads: instructions plus tool schemas."""
+    import importlib
+
+    shared = (ROOT / "shared_instructions.md").read_text()
+    tokens = {}
+    for agent, modules in AGENT_TOOLS.items():
+        schemas = []
+        for module in modules:
+            tool = getattr(importlib.import_module(module), module.rsplit(".", 1)[1])
+            schemas.append(json.dumps(tool.model_json_schema()))
+        instructions = (ROOT / agent / "instructions.md").read_text()
+        tokens[agent] = estimate_tokens(shared + instructions + "".join(schemas))
+    return tokens
+
+
+def agency_estimate(run, tool_seconds: float, turn_seconds: float, context: dict[str, int], request: int) -> dict:
+    """Latency and tokens of the same request through the agency."""
+    from benchmarks.bench_handoff_tokens import run_pipeline
+    from brief_agent.tools.ExtractBriefTool import ExtractBriefTool
+    from workflow.artifacts import estimate_tokens
+
+    retries = run.generations - 1
+    threads, _ = run_pipeline(1, retries, by_reference=True, request=request)
+
+    # The brief stage (not part of the handoff replay): the request, the tool
+    # call and result, then the handoff, which the art director also reads.
+    brief = ExtractBriefTool(user_input=run.user_input).run()
+    call = estimate_tokens(json.dumps({"user_input": run.user_input}))
+    message = estimate_tokens(json.dumps({"agent": "brief_agent", "status": "ok", "brief": json.loads(brief)}))
+    request_tokens = estimate_tokens(run.user_input)
+    brief_input = request_tokens + (request_tokens + call + estimate_tokens(brief)) + 2 * message
+    brief_output = call + message
+
+    visits = {"brief_agent": 1, "art_direction_agent": 1, "nb_image_agent": 1 + retries, "qa_agent": 1 + retries, "export_agent": 1}
+    turns = 2 * sum(visits.values())
+    fixed = sum(2 * count * context[agent] for agent, count in visits.items())
+    return {
+        "turns": turns,
+        "seconds": tool_seconds + turns * turn_seconds,
+        "input_tokens": threads.input_tokens + brief_input + fixed,
+        "output_tokens": threads.output_tokens + brief_output,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="Runs per scenario (the median is reported)")
+    parser.add_argument("--turn-seconds", type=float, default=4.0, help="Latency of one LLM turn")
+    parser.add_argument("--kie-seconds", type=float, default=0.0, help="Stand-in generation time per image")
+    parser.add_argument("--input-price", type=float, default=1.25, help="USD per 1M input tokens")
+    parser.add_argument("--output-price", type=float, default=10.0, help="USD per 1M output tokens")
+    args = parser.parse_args()
+
+    kie = KieStandinServer(generation_seconds=args.kie_seconds).start()
+    with tempfile.TemporaryDirectory() as directory:
+        # Point the tools and stores at the stand-in and scratch state before they are imported.
+        os.environ.update(
+            KIE_API_BASE=kie.api_base,
+            KIE_API_KEY=kie.api_key,
+            ATHAR_STATE_DIR=directory,
+            ARTIFACT_STORE_PATH=os.path.join(directory, "artifacts.sqlite3"),
+            REUSE_INDEX_PATH=os.path.join(directory, "reuse_index.sqlite3"),
+            EXPORT_BACKEND="local",
+            EXPORT_LOCAL_DIR=os.path.join(directory, "exports"),
+        )
+        from workflow.artifacts import estimate_tokens
+        from workflow.pipeline import DELIVERED, PipelineEngine, PipelineJudge
+
+        class StandinJudge(PipelineJudge):
+            """Answers like the judge model would, after one model turn."""
+
+            def __init__(self):
+                self.model = "standin"
+
+            def _ask(self, instructions, payload):
+                time.sleep(args.turn_seconds)
+                if "extracted_brief" in payload:
+                    answer = {
+                        "theme": "homecoming, new chapter",
+                        "mood": "hopeful, quiet",
+                        "tone": "poetic, cinematic",
+                        "palette": "warm dawn light, muted ochre",
+                        "visual_elements": "open doorway, path home, first light",
+                    }
+                else:
+                    answer = {
+                        "prompt": f"{payload['prompt']} Crisp focus, fine detail throughout.",
+                        "negative_prompt": f"{payload['negative_prompt']}, blur, soft focus",
+                    }
+                usage = {
+                    "calls": 1,
+                    "input_tokens": estimate_tokens(instructions + json.dumps(payload)),
+                    "output_tokens": estimate_tokens(json.dumps(answer)),
+                    "seconds": args.turn_seconds,
+                }
+                return answer, usage
+
+        engine = PipelineEngine(judge=StandinJudge())
+        context = context_tokens(estimate_tokens)
+
+        def run_quietly(request: str):
+            # The tools print progress lines; keep the table readable.
+            with contextlib.redirect_stdout(io.StringIO()):
+                return engine.run(request)
+
+        # Warm up imports, connections and the transcoder pool outside the measurements.
+        run_quietly(CLEAR_BRIEF)
+
+        def cost(input_tokens: int, output_tokens: int) -> float:
+            return (input_tokens * args.input_price + output_tokens * args.output_price) / 1e6
+
+        print("=" * 118)
+        print(
+            f"PIPELINE ENGINE vs AGENCY | turn={args.turn_seconds:g}s | KIE stand-in {args.kie_seconds:g}s/image"
+            f" | ${args.input_price:g}/${args.output_price:g} per 1M tokens in/out | median of {args.runs}"
+        )
+        print("=" * 118)
+        print(
+            f"{'scenario':<16} | {'images':>6} | {'engine s':>8} | {'agency s':>8} | {'speedup':>7} | "
+            f"{'LLM calls':>9} | {'engine tok in/out':>17} | {'agency tok in/out':>17} | {'engine $':>8} | {'agency $':>8}"
+        )
+        for number, (name, request, blurry) in enumerate(SCENARIOS):
+            rows = []
+            for attempt in range(args.runs):
+                kie.fail_next(blurry)
+                run = run_quietly(request)
+                if run.state != DELIVERED:
+                    print(f"{name}: run failed: {run.error}")
+                    return 1
+                tool_seconds = run.seconds - run.llm_seconds
+                agency = agency_estimate(run, tool_seconds, args.turn_seconds, context, request=number * 100 + attempt)
+                rows.append((run, agency))
+            run, agency = sorted(rows, key=lambda row: row[0].seconds)[len(rows) // 2]
+            engine_cost = cost(run.llm_input_tokens, run.llm_output_tokens)
+            agency_cost = cost(agency["input_tokens"], agency["output_tokens"])
+            print(
+                f"{name:<16} | {run.generations:>6} | {run.seconds:>8.2f} | {agency['seconds']:>8.2f}"
+                f" | {agency['seconds'] / run.seconds:>6.1f}x | {run.llm_calls:>4} / {agency['turns']:<2}"
+                f" | {run.llm_input_tokens:>8,}/{run.llm_output_tokens:<8,} | {agency['input_tokens']:>8,}/{agency['output_tokens']:<8,}"
+                f" | {engine_cost:>8.4f} | {agency_cost:>8.4f}"
+            )
+            print(f"{'':<16}   stages: " + ", ".join(f"{stage['stage']} {stage['seconds']:.2f}s" for stage in run.stages))
+    kie.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark prompt package generation for the Art Direction Agent.
+
+Compares the legacy GeneratePromptTool builder (list appends plus a re-joined
+negative prompt on every call, one call per variant) with the precompiled
+templates in workflow.prompt_templates expanding one brief into N variants in a
+single render_variants() call, and reports variants per second.
+
+Usage:
+    python -m benchmarks.bench_prompt_variants --variants 1 4 16 --repeat 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+from workflow.prompt_templates import COMPOSITIONS, Brief, render_variants
+
+BRIEF = Brief(
+    theme="solitude and contemplation",
+    mood="serene, contemplative",
+    palette="warm earth tones, soft golden light",
+    visual_elements="lone figure, vast landscape, atmospheric depth",
+    tone="poetic, cinematic, meditative",
+    aspect_ratio="4:5",
+    custom_instructions="keep the figure small in the frame",
+)
+
+_NEGATIVE_ELEMENTS = [
+    "messy textures", "chaotic shapes", "low quality", "blurry", "pixelated", "distorted",
+    "distorted Arabic text", "illegible text", "wrong font", "text artifacts",
+    "oversaturated", "harsh lighting", "neon colors", "artificial",
+    "cluttered", "busy composition", "multiple subjects", "distracting elements",
+    "watermark", "signature", "frame", "border", "text overlay",
+]
+
+
+def legacy_package(brief: Brief, palette: str, composition_lines: list[str]) -> dict:
+    """The pre-template builder: list appends and a negative prompt joined per call."""
+    prompt_parts = ["A cinematic minimalistic artwork inspired by Athar."]
+    if brief.theme:
+        prompt_parts.append(f"Theme: {brief.theme}.")
+    if brief.mood:
+        prompt_parts.append(f"Mood: {brief.mood}.")
+    if palette:
+        prompt_parts.append(f"Palette: {palette}.")
+    if brief.visual_elements:
+        prompt_parts.append(f"Visual Metaphor: {brief.visual_elements}.")
+    prompt_parts.append("\n".join(["Composition:", *composition_lines]))
+    if brief.tone:
+        prompt_parts.append(f"Tone: {brief.tone}.")
+    prompt_parts.append("Avoid: messy textures, chaotic shapes, distorted Arabic text.")
+    prompt_parts.append(f"--ar {brief.aspect_ratio}")
+    prompt_parts.append("--style cinematic-premium")
+    if brief.custom_instructions:
+        prompt_parts.append(f"Additional: {brief.custom_instructions}")
+    negative_elements = list(_NEGATIVE_ELEMENTS)
+    return {
+        "prompt": "\n".join(prompt_parts),
+        "negative_prompt": ", ".join(negative_elements),
+        "aspect_ratio": brief.aspect_ratio,
+        "style": "cinematic-premium",
+        "quality": "premium",
+        "theme": brief.theme,
+        "palette": palette,
+    }
+
+
+def legacy_variants(brief: Brief, count: int, combos: list[tuple[str, list[str]]]) -> list[dict]:
+    return [legacy_package(brief, palette, lines) for palette, lines in combos[:count]]
+
+
+def _rate(func, repeat: int, count: int, rounds: int = 5) -> float:
+    """Variants per second over the fastest of several rounds (the box may be noisy)."""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return repeat * count / best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--variants", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    print("=" * 72)
+    print(f"PROMPT VARIANT BENCHMARK | templates precompiled | repeat={args.repeat}")
+    print("=" * 72)
+    print(f"{'variants':>8} | {'legacy (variants/s)':>20} | {'templates (variants/s)':>22} | speedup")
+    for count in args.variants:
+        # Same palette/composition pairs for both, so the prompts are identical.
+        reference = render_variants(BRIEF, count)
+        combos = [
+            (variant["palette"], COMPOSITIONS[variant["composition"]].split("\n")[1:]) for variant in reference
+        ]
+        assert [v["prompt"] for v in legacy_variants(BRIEF, count, combos)] == [v["prompt"] for v in reference]
+
+        legacy_rate = _rate(lambda: legacy_variants(BRIEF, count, combos), args.repeat, len(reference))
+        template_rate = _rate(lambda: render_variants(BRIEF, count), args.repeat, len(reference))
+        print(f"{len(reference):>8} | {legacy_rate:>20,.0f} | {template_rate:>22,.0f} | {template_rate / legacy_rate:>6.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Compare the QA retry controller with the regenerate-only loop it replaced.
+
+Runs workflow.pipeline.PipelineEngine (no judge, local export backend) against
+the KIE stand-in for four requests: a clean image, an off-ratio image (the
+controller crops it locally), a blurry first image from a task that returned a
+sharp second candidate (the controller validates the candidate) and a prompt
+whose images all come back blurry (the controller stops at the budget).
+
+The baseline policy regenerates on every retry, up to two regenerations, as
+the engine did before. Reports per request and policy the outcome, the KIE
+generations (and credits at KIE_CREDITS_PER_IMAGE per image), the images QA
+judged and the wall-clock time.
+
+Usage:
+    python -m benchmarks.bench_retry_controller --kie-seconds 3 --images-per-task 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+
+from benchmarks.kie_standin import BLURRY, OFF_RATIO, KieStandinServer
+
+CLEAR_BRIEF = (
+    "Create an image of solitude in the desert at sunset. A lone figure contemplates the vast expanse, "
+    "bathed in golden light, peaceful and meditative."
+)
+
+# (name, defective leading tasks, defect, every candidate of a task defective)
+SCENARIOS = (
+    ("clean", 0, BLURRY, False),
+    ("off-ratio", 1, OFF_RATIO, False),
+    ("blurry + candidate", 1, BLURRY, False),
+    ("always blurry", 100, BLURRY, True),
+)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kie-seconds", type=float, default=3.0, help="Stand-in generation time per task")
+    parser.add_argument("--images-per-task", type=int, default=2, help="Candidates each stand-in task returns")
+    args = parser.parse_args()
+
+    kie = KieStandinServer(generation_seconds=args.kie_seconds, images_per_task=args.images_per_task).start()
+    with tempfile.TemporaryDirectory() as directory:
+        # Point the tools and stores at the stand-in and scratch state before they are imported.
+        os.environ.update(
+            KIE_API_BASE=kie.api_base,
+            KIE_API_KEY=kie.api_key,
+            ATHAR_STATE_DIR=directory,
+            ARTIFACT_STORE_PATH=os.path.join(directory, "artifacts.sqlite3"),
+            REUSE_INDEX_PATH=os.path.join(directory, "reuse_index.sqlite3"),
+            RETRY_LEDGER_PATH=os.path.join(directory, "retry_ledger.sqlite3"),
+            BLOB_STORE_DIR=os.path.join(directory, "blobs"),
+            EXPORT_BACKEND="local",
+            EXPORT_LOCAL_DIR=os.path.join(directory, "exports"),
+        )
+        import workflow.retry as retry
+        from workflow.pipeline import PipelineEngine
+
+        class RegenerateOnly(retry.RetryController):
+            """The previous loop: every retry regenerates, up to two regenerations."""
+
+            def _decide(self, record, validation, candidates, repairable):
+                if len(record.generations) > 2:
+                    return self._stop(f"{len(record.generations)} generations used", validation)
+                return retry.RetryDecision(retry.REGENERATE, "QA asked for a retry")
+
+        policies = {
+            "regenerate only": RegenerateOnly(ledger=retry.RetryLedger()),
+            "controller": retry.RetryController(ledger=retry.RetryLedger()),
+        }
+        engine = PipelineEngine()
+
+        def run_quietly():
+            # The tools print progress lines; keep the table readable.
+            with contextlib.redirect_stdout(io.StringIO()):
+                return engine.run(CLEAR_BRIEF)
+
+        # Warm up imports and the transcoder pool outside the measurements.
+        retry._controller = policies["controller"]
+        run_quietly()
+
+        budget = policies["controller"].budget
+        print("=" * 114)
+        print(
+            f"QA RETRY CONTROLLER | KIE stand-in {args.kie_seconds:g}s/task, {args.images_per_task} image(s)/task"
+            f" | budget {budget.max_attempts} attempts, {budget.max_seconds:g}s, {budget.max_credits:g} credits"
+        )
+        print("=" * 114)
+        print(f"{'request':<20} | {'policy':<16} | {'outcome':<30} | {'generations':>11} | {'credits':>7} | {'QA images':>9} | {'seconds':>7}")
+        for name, count, defect, all_images in SCENARIOS:
+            for label, controller in policies.items():
+                retry._controller = controller
+                kie.fail_next(count, defect, all_images)
+                run = run_quietly()
+                outcome = run.state if run.error is None else f"{run.state}: {run.error['type']}"
+                actions = ", ".join(attempt["action"] for attempt in run.attempts)
+                credits = run.attempts[-1]["credits_spent"] if run.attempts else 0
+                print(
+                    f"{name:<20} | {label:<16} | {outcome:<30} | {run.generations:>11} | {credits:>7g}"
+                    f" | {len(run.attempts):>9} | {run.seconds:>7.2f}"
+                )
+                print(f"{'':<20}   actions: {actions}")
+    kie.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark reuse-index lookups (workflow.reuse_index) at scale.
+
+Fills a fresh index with synthetic briefs (lexicon words mixed with a large
+random vocabulary, so band keys are as diverse as real traffic), then queries
+it with reworded copies of stored briefs (words reordered, one dropped, one
+stopword phrase added) and with unrelated briefs, and reports build time,
+lookup latency percentiles and how many reworded briefs found their original.
+
+Usage:
+    python -m benchmarks.bench_reuse_index --entries 100000 --queries 500
+    python -m benchmarks.bench_reuse_index --entries 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from workflow.lexicon import get_lexicon
+from workflow.reuse_index import ReuseIndex
+
+VOCABULARY_SIZE = 50_000
+BUILD_BATCH = 5_000
+
+
+def _lexicon_words() -> dict[str, list[str]]:
+    lexicon = get_lexicon()
+    return {
+        category: [keyword for keywords in labels.values() for keyword in keywords]
+        for category, labels in lexicon.categories.items()
+    }
+
+
+class BriefFactory:
+    def __init__(self, seed: int = 11):
+        self.rng = random.Random(seed)
+        self.words = _lexicon_words()
+        self.vocabulary = [f"{self._syllables()}" for _ in range(VOCABULARY_SIZE)]
+
+    def _syllables(self) -> str:
+        return "".join(self.rng.choice("bdfgklmnrstvz") + self.rng.choice("aeiou") for _ in range(4))
+
+    def brief(self) -> dict[str, str]:
+        rng = self.rng
+        return {
+            "theme": " ".join([rng.choice(self.words["theme"]), *rng.sample(self.vocabulary, 3)]),
+            "mood": rng.choice(self.words["mood"]),
+            "palette": " ".join([rng.choice(self.words["palette"]), rng.choice(self.vocabulary)]),
+            "visual_elements": ", ".join([*rng.sample(self.words["visual_elements"], 2), *rng.sample(self.vocabulary, 2)]),
+        }
+
+    def reword(self, brief: dict[str, str]) -> dict[str, str]:
+        """Same brief, different wording: shuffled words, one dropped, filler added."""
+        rng = self.rng
+        theme = brief["theme"].split()
+        rng.shuffle(theme)
+        theme.pop(rng.randrange(len(theme)))
+        elements = brief["visual_elements"].split(", ")
+        rng.shuffle(elements)
+        return {
+            "theme": "the " + " in the ".join(theme),
+            "mood": brief["mood"],
+            "palette": brief["palette"],
+            "visual_elements": ", ".join(elements),
+        }
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--threshold", type=float, default=0.6)
+    args = parser.parse_args()
+
+    factory = BriefFactory()
+    with tempfile.TemporaryDirectory() as directory:
+        index = ReuseIndex(os.path.join(directory, "reuse.sqlite3"))
+        stored: list[dict[str, str]] = []
+
+        start = time.perf_counter()
+        for offset in range(0, args.entries, BUILD_BATCH):
+            batch = []
+            for number in range(offset, min(offset + BUILD_BATCH, args.entries)):
+                brief = factory.brief()
+                if len(stored) < args.queries:
+                    stored.append(brief)
+                batch.append((brief, {"file_id": f"file-{number}", "view_url": f"https://example.invalid/{number}"}))
+            index.add_many(batch)
+        build_seconds = time.perf_counter() - start
+        size_mb = sum(
+            os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)
+        ) / (1024 * 1024)
+
+        reworded_latency, unrelated_latency, found = [], [], 0
+        for number, brief in enumerate(stored):
+            query = factory.reword(brief)
+            start = time.perf_counter()
+            candidates = index.query(query, threshold=args.threshold, limit=3)
+            reworded_latency.append((time.perf_counter() - start) * 1000)
+            found += any(candidate.delivery["file_id"] == f"file-{number}" for candidate in candidates)
+
+            start = time.perf_counter()
+            index.query(factory.brief(), threshold=args.threshold, limit=3)
+            unrelated_latency.append((time.perf_counter() - start) * 1000)
+
+    print("=" * 72)
+    print(f"REUSE INDEX BENCHMARK | entries={args.entries:,} | queries={len(stored)} | threshold={args.threshold}")
+    print("=" * 72)
+    print(f"build: {build_seconds:.1f} s ({args.entries / build_seconds:,.0f} entries/s) | on disk: {size_mb:,.0f} MiB")
+    for label, latencies in (("reworded", reworded_latency), ("unrelated", unrelated_latency)):
+        print(
+            f"{label:>9} lookups: p50 {statistics.median(latencies):.2f} ms | p95 {_percentile(latencies, 0.95):.2f} ms"
+            f" | p99 {_percentile(latencies, 0.99):.2f} ms"
+        )
+    print(f"reworded briefs that found their original: {found}/{len(stored)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Measure the export latency speculative uploads hide behind QA.
+
+Runs ValidateImageTool followed (on a pass) by GDriveUploadTool on the s3
+backend against the S3 stand-in, with images served by the KIE stand-in,
+sequentially and with speculation (delivery.speculative) on. Two scenarios: the
+image passes QA at once, and a first image fails QA (its staged upload is
+wasted) before the regenerated one passes.
+
+Between QA's verdict and the export call the agency spends LLM turns (QA's
+handoff, the Export Agent's tool call), which staging also overlaps; the
+deterministic pipeline spends none. Each gap in --handoff-seconds is measured.
+Regeneration after a retry takes --generation-seconds in both modes.
+
+Reports the median time from the start of QA to the delivered export, the
+export call alone, and the speculation counters: commit rate, export seconds
+hidden behind QA and upload bytes wasted.
+
+Usage:
+    python -m benchmarks.bench_speculative_export --runs 5 --latency-ms 40 --handoff-seconds 0 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.kie_standin import KieStandinServer
+from benchmarks.s3_standin import S3StandinServer
+
+# (name, images QA sees: False = sharp, True = blurry)
+SCENARIOS = (
+    ("pass first", (False,)),
+    ("retry, then pass", (True, False)),
+)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Runs per scenario and mode (the median is reported)")
+    parser.add_argument("--latency-ms", type=float, default=40.0, help="S3 stand-in latency per request")
+    parser.add_argument("--handoff-seconds", type=float, nargs="+", default=[0.0, 8.0], help="Gaps between QA's verdict and the export call")
+    parser.add_argument("--generation-seconds", type=float, default=5.0, help="Regeneration time after a QA retry")
+    parser.add_argument("--aspect-ratio", default="4:5")
+    args = parser.parse_args()
+
+    kie = KieStandinServer().start()
+    s3 = S3StandinServer(latency_seconds=args.latency_ms / 1000).start()
+    with tempfile.TemporaryDirectory() as directory:
+        # Point the tools and stores at the stand-ins and scratch state before they are imported.
+        os.environ.update(
+            ATHAR_STATE_DIR=directory,
+            ARTIFACT_STORE_PATH=os.path.join(directory, "artifacts.sqlite3"),
+            REUSE_INDEX_PATH=os.path.join(directory, "reuse_index.sqlite3"),
+            EXPORT_BACKEND="s3",
+            S3_ENDPOINT_URL=s3.endpoint_url,
+            S3_BUCKET=s3.bucket,
+            S3_ACCESS_KEY_ID="standin",
+            S3_SECRET_ACCESS_KEY="standin",
+        )
+        from delivery.speculative import speculation_stats
+        from export_agent.tools.GDriveUploadTool import GDriveUploadTool
+        from qa_agent.tools.ValidateImageTool import ValidateImageTool
+
+        def image_url(blurry: bool) -> str:
+            kie.fail_next(int(blurry))
+            task_id = kie.create_task({"aspect_ratio": args.aspect_ratio})
+            return f"{kie.root_url}images/{task_id}.png"
+
+        def deliver(images: tuple[bool, ...], speculative: bool, number: int, handoff: float = 0.0) -> tuple[float, float]:
+            """QA every image until one passes, then export it. Returns (total, export) seconds."""
+            urls = [image_url(blurry) for blurry in images]
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for url in urls:
+                    validation = json.loads(
+                        ValidateImageTool(
+                            image_url=url,
+                            expected_aspect_ratio=args.aspect_ratio,
+                            speculative_export=speculative,
+                            request_id=f"bench-{number}",
+                        ).run()
+                    )
+                    if validation["status"] != "retry":
+                        break
+                    time.sleep(args.generation_seconds)
+                time.sleep(handoff)
+                export_start = time.perf_counter()
+                result = json.loads(GDriveUploadTool(image_url=url, filename=f"athar_{number:04d}.png", theme="desert solitude").run())
+            end = time.perf_counter()
+            if not result.get("success"):
+                raise RuntimeError(f"Export failed: {result}")
+            return end - start, end - export_start
+
+        # Warm up imports, connections and the transcoder pool outside the measurements.
+        deliver((False,), speculative=False, number=0)
+        deliver((False,), speculative=True, number=1)
+        time.sleep(0.5)
+        baseline = speculation_stats()
+
+        print("=" * 104)
+        print(
+            f"SPECULATIVE EXPORT | s3 stand-in {args.latency_ms:g} ms/request"
+            f" | regeneration {args.generation_seconds:g}s | median of {args.runs}"
+        )
+        print("=" * 104)
+        print(
+            f"{'scenario':<18} | {'handoff':>7} | {'QA+export seq':>13} | {'QA+export spec':>14} | "
+            f"{'export seq':>10} | {'export spec':>11} | {'saved':>6}"
+        )
+        number = 2
+        for name, images in SCENARIOS:
+            for handoff in args.handoff_seconds:
+                timings = {False: [], True: []}
+                for _ in range(args.runs):
+                    for speculative in (False, True):
+                        timings[speculative].append(deliver(images, speculative, number, handoff))
+                        number += 1
+                sequential = [statistics.median(values) for values in zip(*timings[False])]
+                speculative = [statistics.median(values) for values in zip(*timings[True])]
+                print(
+                    f"{name:<18} | {handoff:>6g}s | {sequential[0]:>12.3f}s | {speculative[0]:>13.3f}s | "
+                    f"{sequential[1]:>9.3f}s | {speculative[1]:>10.3f}s | {sequential[0] - speculative[0]:>+5.2f}s"
+                )
+
+        # Discarded speculations are cleaned up in the background.
+        time.sleep(1.0)
+        stats = speculation_stats()
+        committed = stats["committed"] - baseline["committed"]
+        settled = committed + sum(stats[key] - baseline[key] for key in ("discarded", "failed"))
+        staged = stats["bytes_staged"] - baseline["bytes_staged"]
+        wasted = stats["bytes_wasted"] - baseline["bytes_wasted"]
+        print(
+            f"speculations: {settled} settled, {committed} committed ({committed / settled:.0%})"
+            f" | export time hidden behind QA {stats['seconds_hidden'] - baseline['seconds_hidden']:.2f}s"
+            f" | staged {staged / 1e6:.1f} MB, wasted {wasted / 1e6:.1f} MB ({wasted / staged:.0%})"
+        )
+        leftovers = [key for key in s3.objects if "/_staging/" in key]
+        print(f"staged objects left in the bucket: {len(leftovers)}")
+    kie.stop()
+    s3.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Compare export throughput across storage backends.
+
+Runs the same batch of images through delivery.storage.export_bytes for the
+Drive stand-in, a local directory and the S3 stand-in, with identical simulated
+network latency for the two remote backends. Optimization and derivatives are
+off by default so the numbers measure storage, not encoding.
+
+Usage:
+    python -m benchmarks.bench_storage_backends --files 40 --latency-ms 25 --workers 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image
+
+from benchmarks.drive_standin import DriveStandinServer
+from benchmarks.s3_standin import S3StandinServer
+
+
+def _make_png(seed: int, size: int) -> bytes:
+    image = Image.effect_noise((size, size), 40 + seed % 20).convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--size", type=int, default=512, help="Edge length of the generated test images")
+    parser.add_argument("--latency-ms", type=float, default=25.0, help="Simulated per-request latency (remote backends)")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--optimize", action="store_true", help="Include format optimization and derivatives")
+    args = parser.parse_args()
+
+    state_dir = tempfile.mkdtemp(prefix="athar-bench-")
+    drive = DriveStandinServer(latency_seconds=args.latency_ms / 1000).start()
+    s3 = S3StandinServer(latency_seconds=args.latency_ms / 1000).start()
+    os.environ.update({
+        "ATHAR_STATE_DIR": state_dir,
+        "GDRIVE_API_ROOT": drive.root_url,
+        "EXPORT_LOCAL_DIR": os.path.join(state_dir, "exports"),
+        "S3_ENDPOINT_URL": s3.endpoint_url,
+        "S3_BUCKET": s3.bucket,
+        "S3_ACCESS_KEY_ID": "bench",
+        "S3_SECRET_ACCESS_KEY": "bench-secret",
+    })
+    os.environ.pop("GOOGLE_SERVICE_ACCOUNT_JSON", None)
+
+    # Import after the environment points at the stand-ins.
+    from delivery import drive_client
+    from delivery.storage import export_bytes, get_backend
+
+    drive_client.reset_drive_factory()
+    folder = drive_client.get_drive_service().files().create(
+        body={"name": "bench", "mimeType": "application/vnd.google-apps.folder"}
+    ).execute()["id"]
+
+    images = [_make_png(i, args.size) for i in range(args.files)]
+    total_mb = sum(len(image) for image in images) / 1e6
+
+    print("=" * 70)
+    print(f"STORAGE BACKEND BENCHMARK | files={args.files} ({total_mb:.1f} MB) | "
+          f"latency={args.latency_ms}ms | workers={args.workers}")
+    print("=" * 70)
+
+    for name, target in (("gdrive", folder), ("local", "bench"), ("s3", "bench")):
+        backend = get_backend(name)
+
+        def _export(index: int):
+            return export_bytes(
+                backend,
+                images[index],
+                f"athar_bench_{index}.png",
+                target,
+                deduplicate=False,
+                optimize=args.optimize,
+                derivatives=args.optimize,
+            )
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            results = list(pool.map(_export, range(args.files)))
+        duration = time.monotonic() - start
+        uploaded_mb = sum(r.bytes_uploaded for r in results) / 1e6
+        print(f"{name:<7}: {args.files / duration:8.2f} files/s | {uploaded_mb / duration:7.2f} MB/s uploaded")
+
+    drive.stop()
+    s3.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
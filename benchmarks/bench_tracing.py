@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Measure what request tracing costs and show where one request spends its time.
+
+Runs workflow.pipeline.PipelineEngine (no judge, local export backend) against
+the KIE stand-in with each span exporter: none (spans tracked, not exported),
+file (OTLP/JSON lines) and otlp (posted to the collector stand-in). Every
+other run's first image fails QA, so the traces include a retry.
+
+Reports per exporter the median request time, the spans per request and the
+cost of one span (open, close, queue for export) measured in isolation, then
+the span tree of one retried request as the collector received it: duration,
+share of the request and the attributes recorded on each span.
+
+Usage:
+    python -m benchmarks.bench_tracing --runs 3 --kie-seconds 1
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.kie_standin import KieStandinServer
+from benchmarks.otlp_standin import OtlpStandinServer
+
+CLEAR_BRIEF = (
+    "Create an image of solitude in the desert at sunset. A lone figure contemplates the vast expanse, "
+    "bathed in golden light, peaceful and meditative."
+)
+
+# Attributes worth a column in the span tree (the rest are in the exported spans).
+SHOWN_ATTRIBUTES = (
+    "tool.args_bytes",
+    "tool.result_bytes",
+    "handoff.payload_bytes",
+    "kie.attempts",
+    "download.bytes",
+    "qa.status",
+    "qa.retry_action",
+    "http.response.status_code",
+    "pipeline.generations",
+)
+
+
+def attribute_values(span: dict) -> dict:
+    values = {}
+    for attribute in span.get("attributes", []):
+        value = next(iter(attribute["value"].values()))
+        values[attribute["key"]] = value
+    return values
+
+
+def file_spans(path: str) -> list[dict]:
+    """Spans of every export request the file exporter wrote."""
+    with open(path, encoding="utf-8") as handle:
+        return [
+            span
+            for line in handle
+            for resource in json.loads(line)["resourceSpans"]
+            for scope in resource["scopeSpans"]
+            for span in scope["spans"]
+        ]
+
+
+def print_tree(spans: list[dict]) -> None:
+    children: dict[str, list[dict]] = {}
+    for span in spans:
+        children.setdefault(span.get("parentSpanId", ""), []).append(span)
+    ids = {span["spanId"] for span in spans}
+    roots = [span for span in spans if span.get("parentSpanId", "") not in ids]
+    total = sum(int(root["endTimeUnixNano"]) - int(root["startTimeUnixNano"]) for root in roots) or 1
+
+    def walk(span: dict, depth: int) -> None:
+        duration = int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])
+        values = attribute_values(span)
+        shown = " ".join(f"{key.split('.', 1)[1]}={values[key]}" for key in SHOWN_ATTRIBUTES if key in values)
+        if span.get("status", {}).get("code") == 2:
+            shown += f" ERROR({span['status'].get('message', '')})"
+        name = ("  " * depth + span["name"])[:44]
+        print(f"{name:<44} | {duration / 1e6:>9.1f} | {duration / total:>5.0%} | {shown}")
+        for child in sorted(children.get(span["spanId"], []), key=lambda item: int(item["startTimeUnixNano"])):
+            walk(child, depth + 1)
+
+    for root in roots:
+        walk(root, 0)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="Runs per exporter (the median is reported)")
+    parser.add_argument("--kie-seconds", type=float, default=1.0, help="Stand-in generation time per task")
+    parser.add_argument("--spans", type=int, default=20000, help="Spans timed in isolation per exporter")
+    args = parser.parse_args()
+
+    kie = KieStandinServer(generation_seconds=args.kie_seconds).start()
+    collector = OtlpStandinServer().start()
+    with tempfile.TemporaryDirectory() as directory:
+        # Point the tools and stores at the stand-ins and scratch state before they are imported.
+        os.environ.update(
+            KIE_API_BASE=kie.api_base,
+            KIE_API_KEY=kie.api_key,
+            ATHAR_STATE_DIR=directory,
+            ARTIFACT_STORE_PATH=os.path.join(directory, "artifacts.sqlite3"),
+            REUSE_INDEX_PATH=os.path.join(directory, "reuse_index.sqlite3"),
+            RETRY_LEDGER_PATH=os.path.join(directory, "retry_ledger.sqlite3"),
+            BLOB_STORE_DIR=os.path.join(directory, "blobs"),
+            EXPORT_BACKEND="local",
+            EXPORT_LOCAL_DIR=os.path.join(directory, "exports"),
+        )
+        from monitoring import tracing
+        from workflow.pipeline import DELIVERED, PipelineEngine
+
+        trace_file = os.path.join(directory, "traces.jsonl")
+        exporters = {
+            "none": lambda: None,
+            "file": lambda: tracing.BatchSpanProcessor(tracing.FileSpanExporter(trace_file)),
+            "otlp": lambda: tracing.BatchSpanProcessor(tracing.OtlpHttpSpanExporter(collector.endpoint_url)),
+        }
+        engine = PipelineEngine()
+
+        def run_quietly(blurry: int):
+            kie.fail_next(blurry)
+            # The tools print progress lines; keep the table readable.
+            with contextlib.redirect_stdout(io.StringIO()):
+                return engine.run(CLEAR_BRIEF)
+
+        # Warm up imports, connections and the transcoder pool outside the measurements.
+        tracing.set_span_processor(None)
+        run_quietly(0)
+
+        print("=" * 96)
+        print(f"REQUEST TRACING | KIE stand-in {args.kie_seconds:g}s/task | median of {args.runs} runs per exporter")
+        print("=" * 96)
+        print(f"{'exporter':<8} | {'request s':>9} | {'spans/request':>13} | {'µs/span':>7} | {'exported':>8} | {'dropped':>7} | {'failed':>6}")
+        last_trace_id = ""
+        for name, build in exporters.items():
+            processor = build()
+            tracing.set_span_processor(processor)
+
+            start = time.perf_counter()
+            for _ in range(args.spans):
+                with tracing.span("bench.empty", **{"bench.attribute": 1}):
+                    pass
+            per_span = (time.perf_counter() - start) / args.spans * 1e6
+            if processor is not None:
+                processor.flush()
+
+            seconds, span_counts = [], []
+            for number in range(args.runs):
+                with tracing.span("bench.request") as root:
+                    run = run_quietly(number % 2)
+                if run.state != DELIVERED:
+                    print(f"{name}: run failed: {run.error}")
+                    return 1
+                seconds.append(run.seconds)
+                if processor is None:
+                    continue
+                processor.flush()
+                exported = collector.spans if name == "otlp" else file_spans(trace_file)
+                # Less the bench.request wrapper.
+                span_counts.append(sum(1 for span in exported if span["traceId"] == root.trace_id) - 1)
+                if name == "otlp" and number % 2:
+                    last_trace_id = root.trace_id
+            spans_per_request = f"{statistics.median(span_counts):g}" if span_counts else "-"
+            counts = (processor.exported, processor.dropped, processor.failed) if processor else ("-", "-", "-")
+            print(
+                f"{name:<8} | {statistics.median(seconds):>9.3f} | {spans_per_request:>13} | {per_span:>7.1f} | "
+                f"{counts[0]:>8} | {counts[1]:>7} | {counts[2]:>6}"
+            )
+        tracing.set_span_processor(None)
+
+        trace = [span for span in collector.traces().get(last_trace_id, []) if span["name"] != "bench.request"]
+        print()
+        print(f"Span tree of one retried request (trace {last_trace_id}, {len(trace)} spans, otlp exporter)")
+        print(f"{'span':<44} | {'ms':>9} | {'share':>5} | attributes")
+        print_tree(trace)
+    kie.stop()
+    collector.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,347 @@
+"""
+In-memory Google Drive v3 stand-in for offline benchmarks.
+
+Implements the subset of the Drive API the delivery layer uses: resumable and
+multipart uploads, metadata-only file creation, renames and moves, deletion,
+folder queries, permissions and the batch endpoint. It also serves generated
+test images under ``/images/<name>`` so a benchmark can exercise the full
+download + upload path without network access.
+
+Point the delivery layer at it with ``GDRIVE_API_ROOT=<server.root_url>``.
+"""
+
+from __future__ import annotations
+
+import email.parser
+import email.policy
+import itertools
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class DriveState:
+    """Thread-safe in-memory storage for the stand-in."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files: dict[str, dict] = {}
+        self.contents: dict[str, bytes] = {}
+        self.permissions: dict[str, list[dict]] = {}
+        self.sessions: dict[str, dict] = {}
+        self.images: dict[str, bytes] = {}
+        self.injected_errors: list[tuple[int, str]] = []
+        self.request_count = 0
+        self._ids = itertools.count(1)
+
+    def new_id(self) -> str:
+        return f"standin{next(self._ids):08d}"
+
+    def create_file(self, metadata: dict, content: bytes | None = None) -> dict:
+        with self.lock:
+            file_id = metadata.get("id") or self.new_id()
+            if file_id in self.files:
+                raise FileExistsError(file_id)
+            resource = {
+                "id": file_id,
+                "name": metadata.get("name", "untitled"),
+                "mimeType": metadata.get("mimeType", "application/octet-stream"),
+                "parents": metadata.get("parents", []),
+                "appProperties": metadata.get("appProperties", {}),
+                "createdTime": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+                "webViewLink": f"https://drive.google.com/file/d/{file_id}/view",
+                "webContentLink": f"https://drive.google.com/uc?id={file_id}&export=download",
+            }
+            if content is not None:
+                resource["size"] = str(len(content))
+                self.contents[file_id] = content
+            self.files[file_id] = resource
+            self.permissions.setdefault(file_id, [])
+            return resource
+
+
+class DriveStandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "DriveStandinServer"
+
+    def log_message(self, format, *args):  # noqa: A002 - signature from BaseHTTPRequestHandler
+        return
+
+    # -- plumbing -----------------------------------------------------------------
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status: int, body: bytes = b"", content_type: str = "application/json", headers: dict | None = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_json(self, status: int, payload: dict, headers: dict | None = None):
+        self._send(status, json.dumps(payload).encode(), headers=headers)
+
+    def _handle(self):
+        state = self.server.state
+        with state.lock:
+            state.request_count += 1
+        if self.server.latency_seconds:
+            time.sleep(self.server.latency_seconds)
+
+        parts = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        body = self._read_body()
+        try:
+            status, payload, headers, raw = self.server.dispatch(self.command, parts.path, query, self.headers, body)
+        except FileExistsError as exc:
+            status, headers, raw = 409, None, None
+            payload = {"error": {"code": 409, "message": f"A file already exists with the provided ID {exc}"}}
+        if raw is not None:
+            self._send(status, raw[0], content_type=raw[1], headers=headers)
+        else:
+            self._send_json(status, payload, headers=headers)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = _handle
+
+
+class DriveStandinServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server implementing the Drive stand-in.
+
+    Args:
+        port: Port to bind on 127.0.0.1 (0 picks a free port).
+        latency_seconds: Artificial per-request latency to mimic network round trips.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency_seconds: float = 0.0):
+        super().__init__(("127.0.0.1", port), DriveStandinHandler)
+        self.state = DriveState()
+        self.latency_seconds = latency_seconds
+        self._thread: threading.Thread | None = None
+
+    @property
+    def root_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+    def start(self) -> "DriveStandinServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def inject_upload_errors(self, count: int, status: int = 403, reason: str = "userRateLimitExceeded") -> None:
+        """Fail the next ``count`` upload session starts with a Drive-style error."""
+        with self.state.lock:
+            self.state.injected_errors.extend([(status, reason)] * count)
+
+    def add_image(self, name: str, data: bytes) -> str:
+        self.state.images[name] = data
+        return f"{self.root_url}images/{name}"
+
+    # -- routing --------------------------------------------------------------------
+
+    def dispatch(self, method: str, path: str, query: dict, headers, body: bytes):
+        """
+        Route one request. Returns (status, json_payload, extra_headers, raw) where
+        raw is an optional (bytes, content_type) tuple for non-JSON responses.
+        """
+        state = self.state
+
+        if path.startswith("/images/") and method in {"GET", "HEAD"}:
+            data = state.images.get(path[len("/images/"):])
+            if data is None:
+                return 404, {"error": "not found"}, None, None
+            match = re.fullmatch(r"bytes=(\d+)-", headers.get("Range", ""))
+            if match:
+                start = int(match.group(1))
+                content_range = f"bytes {start}-{len(data) - 1}/{len(data)}"
+                return 206, None, {"Content-Range": content_range}, (data[start:], "image/png")
+            return 200, None, None, (data, "image/png")
+
+        if path == "/upload/drive/v3/files" and method == "POST":
+            with state.lock:
+                injected = state.injected_errors.pop(0) if state.injected_errors else None
+            if injected:
+                status, reason = injected
+                error = {"code": status, "message": reason, "errors": [{"domain": "usageLimits", "reason": reason}]}
+                return status, {"error": error}, {"Retry-After": "1"} if status == 429 else None, None
+            upload_type = query.get("uploadType")
+            if upload_type == "resumable":
+                session_id = uuid.uuid4().hex
+                metadata = json.loads(body or b"{}")
+                with state.lock:
+                    state.sessions[session_id] = {"metadata": metadata, "data": bytearray()}
+                location = f"{self.root_url}upload/drive/v3/files?uploadType=resumable&upload_id={session_id}"
+                return 200, {}, {"Location": location}, None
+            if upload_type == "multipart":
+                metadata, content = _parse_related(headers.get("Content-Type", ""), body)
+                return 200, state.create_file(metadata, content), None, None
+            return 400, {"error": "unsupported uploadType"}, None, None
+
+        if path == "/upload/drive/v3/files" and method == "PUT":
+            return self._resumable_chunk(query.get("upload_id", ""), headers, body)
+
+        if path == "/batch/drive/v3" and method == "POST":
+            return self._batch(headers, body)
+
+        return self.dispatch_api(method, path, query, body)
+
+    def dispatch_api(self, method: str, path: str, query: dict, body: bytes):
+        """Route a plain (non-upload, non-batch) Drive v3 call."""
+        state = self.state
+
+        if path == "/drive/v3/files" and method == "POST":
+            return 200, state.create_file(json.loads(body or b"{}")), None, None
+
+        if path == "/drive/v3/files/generateIds" and method == "GET":
+            with state.lock:
+                ids = [f"reserved{state.new_id()}" for _ in range(int(query.get("count", 10)))]
+            return 200, {"kind": "drive#generatedIds", "space": "drive", "ids": ids}, None, None
+
+        if path == "/drive/v3/files" and method == "GET":
+            matches = [f for f in list(state.files.values()) if _matches_query(f, query.get("q", ""))]
+            page_size = int(query.get("pageSize", 100))
+            return 200, {"files": matches[:page_size]}, None, None
+
+        match = re.fullmatch(r"/drive/v3/files/([^/]+)/permissions", path)
+        if match:
+            file_id = match.group(1)
+            if file_id not in state.permissions:
+                return 404, {"error": {"code": 404, "message": "File not found"}}, None, None
+            if method == "GET":
+                return 200, {"permissions": list(state.permissions[file_id])}, None, None
+            if method == "POST":
+                permission = dict(json.loads(body or b"{}"), id=uuid.uuid4().hex[:12])
+                with state.lock:
+                    state.permissions[file_id].append(permission)
+                return 200, permission, None, None
+
+        match = re.fullmatch(r"/drive/v3/files/([^/]+)", path)
+        if match and method in {"GET", "PATCH", "DELETE"}:
+            resource = state.files.get(match.group(1))
+            if resource is None:
+                return 404, {"error": {"code": 404, "message": "File not found"}}, None, None
+            if method == "PATCH":
+                update = json.loads(body or b"{}")
+                removed = set(query.get("removeParents", "").split(",")) - {""}
+                added = [parent for parent in query.get("addParents", "").split(",") if parent]
+                with state.lock:
+                    resource["name"] = update.get("name", resource["name"])
+                    resource["appProperties"] = {**resource["appProperties"], **update.get("appProperties", {})}
+                    resource["parents"] = [p for p in resource["parents"] if p not in removed] + added
+                return 200, resource, None, None
+            if method == "DELETE":
+                with state.lock:
+                    state.files.pop(resource["id"], None)
+                    state.contents.pop(resource["id"], None)
+                    state.permissions.pop(resource["id"], None)
+                return 204, None, None, (b"", "application/json")
+            return 200, resource, None, None
+
+        return 404, {"error": {"code": 404, "message": f"Unsupported route {method} {path}"}}, None, None
+
+    def _resumable_chunk(self, session_id: str, headers, body: bytes):
+        state = self.state
+        with state.lock:
+            session = state.sessions.get(session_id)
+        if session is None:
+            return 404, {"error": {"code": 404, "message": "Upload session not found"}}, None, None
+
+        content_range = headers.get("Content-Range", "")
+        match = re.fullmatch(r"bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)", content_range.strip())
+        total = match.group(3) if match else "*"
+        data = session["data"]
+
+        if match and match.group(1) is not None:
+            offset = int(match.group(1))
+            if offset != len(data):
+                return 400, {"error": {"code": 400, "message": "Unexpected offset"}}, None, None
+            data.extend(body)
+
+        if total != "*" and len(data) >= int(total):
+            with state.lock:
+                state.sessions.pop(session_id, None)
+            return 200, state.create_file(session["metadata"], bytes(data)), None, None
+
+        extra = {"Range": f"bytes=0-{len(data) - 1}"} if data else {}
+        return 308, {}, extra, None
+
+    def _batch(self, headers, body: bytes):
+        content_type = headers.get("Content-Type", "")
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body
+        )
+        boundary = f"batch_{uuid.uuid4().hex}"
+        chunks = []
+        for part in message.iter_parts():
+            content_id = (part.get("Content-ID") or "").strip("<>")
+            request_text = part.get_payload(decode=True) or b""
+            head, _, part_body = request_text.replace(b"\r\n", b"\n").partition(b"\n\n")
+            request_line = head.splitlines()[0].decode()
+            method, url = request_line.split(" ")[:2]
+            url_parts = urlsplit(url)
+            query = {k: v[-1] for k, v in parse_qs(url_parts.query).items()}
+            status, payload, _, _ = self.dispatch_api(method, url_parts.path, query, part_body.strip())
+            response_body = json.dumps(payload)
+            chunks.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} OK\r\n"
+                "Content-Type: application/json; charset=UTF-8\r\n"
+                f"Content-Length: {len(response_body)}\r\n\r\n"
+                f"{response_body}\r\n"
+            )
+        chunks.append(f"--{boundary}--\r\n")
+        return 200, None, None, ("".join(chunks).encode(), f"multipart/mixed; boundary={boundary}")
+
+
+def _matches_query(resource: dict, q: str) -> bool:
+    """Evaluate the conjunctive subset of the Drive query language the delivery layer uses."""
+    for key, value in re.findall(r"appProperties has \{ key='([^']*)' and value='([^']*)' \}", q):
+        if resource.get("appProperties", {}).get(key) != value:
+            return False
+    for parent in re.findall(r"'([^']*)' in parents", q):
+        if parent not in resource.get("parents", []):
+            return False
+    for field_name, value in re.findall(r"\b(name|mimeType) = '([^']*)'", q):
+        if resource.get(field_name) != value:
+            return False
+    if "trashed = true" in q:
+        return False
+    return True
+
+
+def _parse_related(content_type: str, body: bytes) -> tuple[dict, bytes]:
+    """Split a multipart/related upload into (metadata, content)."""
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body
+    )
+    parts = list(message.iter_parts())
+    metadata = json.loads(parts[0].get_payload(decode=True) or b"{}")
+    content = parts[1].get_payload(decode=True) if len(parts) > 1 else b""
+    return metadata, content
+
+
+if __name__ == "__main__":
+    server = DriveStandinServer(port=8765).start()
+    print(f"Drive stand-in listening on {server.root_url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
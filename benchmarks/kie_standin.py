@@ -0,0 +1,188 @@
+"""
+KIE playground API stand-in for offline benchmarks.
+
+Implements the two endpoints KieNanoBananaTool uses (``POST
+/playground/createTask`` and ``GET /playground/recordInfo``) and serves the
+generated images under ``/images/<task_id>.png``. Tasks complete after
+``generation_seconds``; images are noise at 1024 px wide in the requested
+aspect ratio (different for every task), sharp enough to pass
+ValidateImageTool, except for the first ``blurry_tasks`` tasks, whose
+low-contrast images QA sends back for a retry. fail_next() can also make the
+next tasks' images off-ratio (8% too tall). With ``images_per_task`` above one,
+a task returns further candidates under ``/images/<task_id>-<n>.png``, sharp
+unless fail_next() was asked to spoil every image of a task.
+
+Point the tool at it with ``KIE_API_BASE=<server.api_base>``.
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlsplit
+
+from PIL import Image
+
+IMAGE_WIDTH = 1024
+
+BLURRY = "blurry"
+OFF_RATIO = "off_ratio"
+# Height factor of off-ratio images, beyond ValidateImageTool's 5% tolerance.
+OFF_RATIO_STRETCH = 1.08
+
+
+def render_image(aspect_ratio: str, blurry: bool, stretch: float = 1.0) -> bytes:
+    """PNG noise image (per-channel sigma 50, or 8 when blurry) in the given ratio, height times stretch."""
+    width, height = (int(part) for part in aspect_ratio.split(":"))
+    size = (IMAGE_WIDTH, round(IMAGE_WIDTH * height / width * stretch))
+    sigma = 8 if blurry else 50
+    bands = [Image.effect_noise(size, sigma) for _ in range(3)]
+    buffer = BytesIO()
+    Image.merge("RGB", bands).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class KieStandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "KieStandinServer"
+
+    def log_message(self, format, *args):  # noqa: A002 - signature from BaseHTTPRequestHandler
+        return
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, payload: dict, status: int = 200):
+        self._send(status, json.dumps(payload).encode())
+
+    def do_POST(self):
+        parts = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if parts.path != "/api/v1/playground/createTask":
+            return self._send_json({"success": False, "message": "not found"}, 404)
+        if self.headers.get("Authorization", "") != f"Bearer {self.server.api_key}":
+            return self._send_json({"success": False, "message": "unauthorized"}, 401)
+        task_id = self.server.create_task(json.loads(body or b"{}"))
+        self._send_json({"success": True, "data": {"taskId": task_id}})
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path.startswith("/images/"):
+            name = parts.path[len("/images/"):].removesuffix(".png")
+            task_id, index = (name, "0") if name in self.server.tasks else name.rpartition("-")[::2]
+            task = self.server.tasks.get(task_id)
+            if task is None or not index.isdigit() or int(index) >= self.server.images_per_task:
+                return self._send_json({"error": "not found"}, 404)
+            return self._send(200, self.server.image(task, int(index)), "image/png")
+        if parts.path != "/api/v1/playground/recordInfo":
+            return self._send_json({"success": False, "message": "not found"}, 404)
+        task_id = parse_qs(parts.query).get("taskId", [""])[-1]
+        self._send_json({"success": True, "data": self.server.record_info(task_id)})
+
+
+class KieStandinServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server implementing the KIE stand-in.
+
+    Args:
+        generation_seconds: Time from task creation to completion.
+        blurry_tasks: Number of leading tasks that produce a blurry image.
+        api_key: Bearer token createTask expects.
+        images_per_task: Images each task returns; only the first has the task's defect
+            unless fail_next() says otherwise.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        port: int = 0,
+        generation_seconds: float = 0.0,
+        blurry_tasks: int = 0,
+        api_key: str = "standin",
+        images_per_task: int = 1,
+    ):
+        super().__init__(("127.0.0.1", port), KieStandinHandler)
+        self.generation_seconds = generation_seconds
+        self.blurry_tasks = blurry_tasks
+        self.defect = BLURRY
+        self.defect_all_images = False
+        self.api_key = api_key
+        self.images_per_task = images_per_task
+        self.tasks: dict[str, dict] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def root_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+    @property
+    def api_base(self) -> str:
+        return f"{self.root_url}api/v1"
+
+    def start(self) -> "KieStandinServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def fail_next(self, count: int, defect: str = BLURRY, all_images: bool = False) -> None:
+        """Make the next ``count`` tasks produce a blurry (or off-ratio) first image, or only such images."""
+        with self._lock:
+            self.blurry_tasks = count
+            self.defect = defect
+            self.defect_all_images = all_images
+
+    def create_task(self, payload: dict) -> str:
+        with self._lock:
+            number = next(self._ids)
+            defective = self.blurry_tasks > 0
+            self.blurry_tasks -= defective
+            defect = self.defect if defective else None
+            all_images = self.defect_all_images
+        task_id = f"standin-{number:06d}"
+        self.tasks[task_id] = {
+            "prompt": payload.get("prompt", ""),
+            "aspect_ratio": payload.get("aspect_ratio", "1:1"),
+            "defect": defect,
+            "defect_all_images": all_images,
+            "seed": 100000 + number,
+            "created_at": time.monotonic(),
+        }
+        return task_id
+
+    def image(self, task: dict, index: int = 0) -> bytes:
+        with self._lock:
+            images = task.setdefault("images", {})
+            if index not in images:
+                defect = task["defect"] if index == 0 or task["defect_all_images"] else None
+                stretch = OFF_RATIO_STRETCH if defect == OFF_RATIO else 1.0
+                images[index] = render_image(task["aspect_ratio"], defect == BLURRY, stretch)
+            return images[index]
+
+    def record_info(self, task_id: str) -> dict:
+        task = self.tasks.get(task_id)
+        if task is None:
+            return {"status": "failed"}
+        if time.monotonic() - task["created_at"] < self.generation_seconds:
+            return {"status": "processing"}
+        return {
+            "status": "completed",
+            "seed": task["seed"],
+            "prompt": task["prompt"],
+            "images": [
+                {"url": f"{self.root_url}images/{task_id}{f'-{index}' if index else ''}.png"}
+                for index in range(self.images_per_task)
+            ],
+        }
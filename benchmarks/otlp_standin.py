@@ -0,0 +1,105 @@
+"""
+In-memory OTLP/HTTP collector stand-in for offline benchmarks.
+
+Accepts ``POST /v1/traces`` with an OTLP ExportTraceServiceRequest in the JSON
+encoding (what monitoring.tracing sends with ``TRACE_EXPORTER=otlp``) and keeps
+the spans it carries. Protobuf bodies are rejected with 415.
+
+Point the exporter at it with ``OTEL_EXPORTER_OTLP_ENDPOINT=<server.endpoint_url>``.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class OtlpStandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "OtlpStandinServer"
+
+    def log_message(self, format, *args):  # noqa: A002 - signature from BaseHTTPRequestHandler
+        return
+
+    def _send(self, status: int, body: bytes = b"{}"):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):  # noqa: N802 - BaseHTTPRequestHandler naming
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if self.path.split("?")[0] != "/v1/traces":
+            return self._send(404, b'{"error": "unknown path"}')
+        if not self.headers.get("Content-Type", "").startswith("application/json"):
+            return self._send(415, b'{"error": "only the JSON encoding is supported"}')
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return self._send(400, b'{"error": "invalid JSON"}')
+
+        spans = [
+            span
+            for resource in request.get("resourceSpans", [])
+            for scope in resource.get("scopeSpans", [])
+            for span in scope.get("spans", [])
+        ]
+        with self.server.lock:
+            self.server.export_count += 1
+            self.server.spans.extend(spans)
+        self._send(200)
+
+
+class OtlpStandinServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server collecting exported spans in memory.
+
+    Args:
+        port: Port to bind on 127.0.0.1 (0 picks a free port).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port: int = 0):
+        super().__init__(("127.0.0.1", port), OtlpStandinHandler)
+        self.lock = threading.Lock()
+        self.spans: list[dict] = []
+        self.export_count = 0
+        self._thread: threading.Thread | None = None
+
+    @property
+    def endpoint_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def traces(self) -> dict[str, list[dict]]:
+        """Collected spans grouped by trace ID."""
+        grouped: dict[str, list[dict]] = defaultdict(list)
+        with self.lock:
+            for span in self.spans:
+                grouped[span["traceId"]].append(span)
+        return dict(grouped)
+
+    def start(self) -> "OtlpStandinServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    server = OtlpStandinServer(port=4318).start()
+    print(f"OTLP stand-in listening on {server.endpoint_url}/v1/traces (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(f"{len(server.spans)} spans in {len(server.traces())} traces")
+        server.stop()
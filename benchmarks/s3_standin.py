@@ -0,0 +1,154 @@
+"""
+In-memory S3-compatible stand-in (MinIO-style) for offline benchmarks.
+
+Implements path-style PUT (plain and copy), GET, HEAD and DELETE object calls. Requests must carry a
+SigV4 Authorization header or presigned query parameters; signatures are not
+verified, only their presence and credential scope.
+
+Point the s3 backend at it with ``S3_ENDPOINT_URL=<server.endpoint_url>``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+class S3StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "S3StandinServer"
+
+    def log_message(self, format, *args):  # noqa: A002 - signature from BaseHTTPRequestHandler
+        return
+
+    def _send(self, status: int, body: bytes = b"", headers: dict | None = None):
+        self.send_response(status)
+        headers = {"Content-Type": "application/xml", **(headers or {})}
+        headers.setdefault("Content-Length", str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _error(self, status: int, code: str):
+        self._send(status, f"<Error><Code>{code}</Code></Error>".encode())
+
+    def _authorized(self, query: dict) -> bool:
+        auth = self.headers.get("Authorization", "")
+        if auth.startswith("AWS4-HMAC-SHA256 Credential=") and "/s3/aws4_request" in auth:
+            return True
+        return query.get("X-Amz-Algorithm") == "AWS4-HMAC-SHA256" and "X-Amz-Signature" in query
+
+    def _handle(self):
+        state = self.server
+        with state.lock:
+            state.request_count += 1
+        if state.latency_seconds:
+            time.sleep(state.latency_seconds)
+
+        parts = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if not self._authorized(query):
+            return self._error(403, "AccessDenied")
+
+        bucket, _, key = unquote(parts.path).lstrip("/").partition("/")
+        if bucket != state.bucket or not key:
+            return self._error(404, "NoSuchBucket")
+
+        if self.command == "DELETE":
+            with state.lock:
+                state.objects.pop(key, None)
+            return self._send(204)
+
+        copy_source = self.headers.get("x-amz-copy-source")
+        if self.command == "PUT" and copy_source:
+            source_bucket, _, source_key = unquote(copy_source).lstrip("/").partition("/")
+            with state.lock:
+                source = state.objects.get(source_key) if source_bucket == state.bucket else None
+                if source is not None:
+                    state.objects[key] = dict(source)
+                    if self.headers.get("x-amz-metadata-directive") == "REPLACE":
+                        state.objects[key]["content_type"] = self.headers.get("Content-Type", source["content_type"])
+                        state.objects[key]["meta"] = {
+                            k: v for k, v in self.headers.items() if k.lower().startswith("x-amz-meta-")
+                        }
+            if source is None:
+                return self._error(404, "NoSuchKey")
+            body = f"<CopyObjectResult><ETag>\"{source['etag']}\"</ETag></CopyObjectResult>".encode()
+            return self._send(200, body)
+
+        if self.command == "PUT":
+            etag = hashlib.md5(body).hexdigest()
+            meta = {k: v for k, v in self.headers.items() if k.lower().startswith("x-amz-meta-")}
+            with state.lock:
+                state.objects[key] = {
+                    "data": body,
+                    "etag": etag,
+                    "content_type": self.headers.get("Content-Type", "application/octet-stream"),
+                    "meta": meta,
+                }
+            return self._send(200, headers={"ETag": f'"{etag}"'})
+
+        obj = state.objects.get(key)
+        if obj is None:
+            return self._error(404, "NoSuchKey")
+        headers = {
+            "Content-Type": obj["content_type"],
+            "ETag": f'"{obj["etag"]}"',
+            "Content-Length": str(len(obj["data"])),
+            **obj["meta"],
+        }
+        self._send(200, obj["data"], headers)
+
+    do_GET = do_PUT = do_HEAD = do_DELETE = _handle
+
+
+class S3StandinServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server implementing the S3 stand-in for one bucket.
+
+    Args:
+        bucket: Bucket name accepted by the server.
+        port: Port to bind on 127.0.0.1 (0 picks a free port).
+        latency_seconds: Artificial per-request latency to mimic network round trips.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, bucket: str = "athar", port: int = 0, latency_seconds: float = 0.0):
+        super().__init__(("127.0.0.1", port), S3StandinHandler)
+        self.bucket = bucket
+        self.latency_seconds = latency_seconds
+        self.lock = threading.Lock()
+        self.objects: dict[str, dict] = {}
+        self.request_count = 0
+        self._thread: threading.Thread | None = None
+
+    @property
+    def endpoint_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> "S3StandinServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    server = S3StandinServer(port=9000).start()
+    print(f"S3 stand-in listening on {server.endpoint_url} (bucket '{server.bucket}', Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
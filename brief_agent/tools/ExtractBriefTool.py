@@ -3,11 +3,17 @@ from pydantic import Field
 import json
 import re
 
+from monitoring.tracing import traced_tool
+from workflow.arabic import ARABIC_STOPWORDS, normalize_arabic, strip_marks
+from workflow.lexicon import get_lexicon
+
 
 class ExtractBriefTool(BaseTool):
     """
     Extract creative brief elements from user input or Athar text excerpts.
     Identifies theme, tone, mood, palette, visual metaphors, and keywords for image generation.
+    Lexicon keywords come from workflow/lexicon.json and are matched in a single pass;
+    Arabic excerpts are normalized and matched against the Arabic lexicon with the same labels.
     """
     
     user_input: str = Field(
@@ -20,21 +26,25 @@ class ExtractBriefTool(BaseTool):
         description="Additional context about the Athar brand, style, or project requirements"
     )
 
+    @traced_tool
     def run(self):
         """
         Analyze the input text and extract creative brief components.
         Returns a structured JSON brief with all extracted elements.
         """
         
-        # Step 1: Extract core elements
-        theme = self._extract_theme()
-        mood = self._extract_mood()
-        tone = self._extract_tone()
-        palette = self._extract_palette()
-        visual_elements = self._extract_visual_elements()
+        # Step 1: Match every lexicon keyword in a single pass over the input
+        matches = get_lexicon().match(self.user_input)
+        
+        # Step 2: Extract core elements
+        theme = self._extract_theme(matches)
+        mood = self._extract_mood(matches)
+        tone = self._extract_tone(matches)
+        palette = self._extract_palette(matches)
+        visual_elements = self._extract_visual_elements(matches)
         keywords = self._extract_keywords()
         
-        # Step 2: Build brief dictionary
+        # Step 3: Build brief dictionary
         brief = {
             "theme": theme,
             "mood": mood,
@@ -45,35 +55,14 @@ class ExtractBriefTool(BaseTool):
             "original_input": self.user_input[:200] + "..." if len(self.user_input) > 200 else self.user_input
         }
         
-        # Step 3: Format output
+        # Step 4: Format output
         return self._format_brief(brief)
     
-    def _extract_theme(self):
+    def _extract_theme(self, matches):
         """
         Extract the main theme or subject matter from the input.
         """
-        input_lower = self.user_input.lower()
-        
-        # Theme patterns to look for
-        theme_patterns = {
-            "solitude": ["solitude", "alone", "isolation", "lonely", "solitary"],
-            "contemplation": ["contemplate", "reflection", "thinking", "meditation", "mindful"],
-            "journey": ["journey", "travel", "path", "voyage", "expedition"],
-            "nature": ["nature", "natural", "landscape", "wilderness", "outdoors"],
-            "spirituality": ["spiritual", "divine", "sacred", "prayer", "faith"],
-            "time": ["time", "moment", "ephemeral", "fleeting", "eternal"],
-            "memory": ["memory", "nostalgia", "remembrance", "past", "forgotten"],
-            "human_connection": ["connection", "relationship", "together", "unity", "bond"],
-            "struggle": ["struggle", "challenge", "difficulty", "hardship", "adversity"],
-            "hope": ["hope", "aspiration", "dream", "wish", "optimism"],
-            "silence": ["silence", "quiet", "stillness", "peace", "calm"],
-            "identity": ["identity", "self", "who am i", "belonging", "roots"]
-        }
-        
-        detected_themes = []
-        for theme, keywords in theme_patterns.items():
-            if any(keyword in input_lower for keyword in keywords):
-                detected_themes.append(theme.replace("_", " "))
+        detected_themes = [theme.replace("_", " ") for theme in matches.get("theme")]
         
         if detected_themes:
             return ", ".join(detected_themes[:2])  # Return top 2 themes
@@ -84,49 +73,23 @@ class ExtractBriefTool(BaseTool):
         else:
             return "minimalist expression"
     
-    def _extract_mood(self):
+    def _extract_mood(self, matches):
         """
         Extract the emotional mood from the input.
         """
-        input_lower = self.user_input.lower()
-        
-        mood_patterns = {
-            "melancholic": ["sad", "melancholy", "sorrow", "grief", "wistful", "longing"],
-            "serene": ["calm", "peaceful", "tranquil", "serene", "gentle", "quiet"],
-            "contemplative": ["thoughtful", "pensive", "reflective", "meditative"],
-            "nostalgic": ["nostalgic", "reminiscent", "bygone", "memory", "remember"],
-            "hopeful": ["hopeful", "optimistic", "bright", "uplifting", "positive"],
-            "mysterious": ["mysterious", "enigmatic", "unknown", "shadowy", "obscure"],
-            "dramatic": ["dramatic", "intense", "powerful", "striking", "bold"],
-            "intimate": ["intimate", "personal", "close", "private", "tender"]
-        }
-        
-        for mood, keywords in mood_patterns.items():
-            if any(keyword in input_lower for keyword in keywords):
-                return mood
+        moods = matches.get("mood")
+        if moods:
+            return moods[0]
         
         # Default based on Athar style
         return "serene, contemplative"
     
-    def _extract_tone(self):
+    def _extract_tone(self, matches):
         """
         Extract the artistic tone from the input.
         """
         # Athar is known for poetic, cinematic, and meditative tones
-        input_lower = self.user_input.lower()
-        
-        tone_keywords = {
-            "poetic": ["poetry", "poetic", "lyrical", "verse", "metaphor"],
-            "cinematic": ["cinematic", "visual", "frame", "scene", "shot"],
-            "meditative": ["meditative", "zen", "mindful", "still", "quiet"],
-            "dramatic": ["dramatic", "intense", "powerful", "emotional"],
-            "minimalist": ["minimal", "simple", "clean", "sparse", "essential"]
-        }
-        
-        detected_tones = []
-        for tone, keywords in tone_keywords.items():
-            if any(keyword in input_lower for keyword in keywords):
-                detected_tones.append(tone)
+        detected_tones = matches.get("tone")
         
         if detected_tones:
             return ", ".join(detected_tones[:2])
@@ -134,28 +97,11 @@ class ExtractBriefTool(BaseTool):
         # Default Athar tone
         return "poetic, cinematic, meditative"
     
-    def _extract_palette(self):
+    def _extract_palette(self, matches):
         """
         Extract or infer color palette from the input.
         """
-        input_lower = self.user_input.lower()
-        
-        # Color keywords
-        color_mentions = []
-        color_keywords = {
-            "warm earth tones": ["earth", "sand", "desert", "clay", "ochre", "terracotta"],
-            "cool blues": ["blue", "azure", "cerulean", "navy", "indigo"],
-            "golden light": ["gold", "golden", "amber", "honey", "sunlit"],
-            "muted pastels": ["pastel", "soft", "muted", "pale", "gentle"],
-            "deep shadows": ["shadow", "dark", "noir", "charcoal", "midnight"],
-            "warm neutrals": ["beige", "cream", "ivory", "neutral", "taupe"],
-            "sunset tones": ["sunset", "dusk", "twilight", "orange", "pink"],
-            "monochromatic": ["monochrome", "black and white", "grayscale"]
-        }
-        
-        for palette, keywords in color_keywords.items():
-            if any(keyword in input_lower for keyword in keywords):
-                color_mentions.append(palette)
+        color_mentions = matches.get("palette")
         
         if color_mentions:
             return ", ".join(color_mentions[:2])
@@ -163,29 +109,11 @@ class ExtractBriefTool(BaseTool):
         # Default Athar palette
         return "warm earth tones, soft golden light"
     
-    def _extract_visual_elements(self):
+    def _extract_visual_elements(self, matches):
         """
         Extract visual elements or metaphors from the input.
         """
-        input_lower = self.user_input.lower()
-        
-        element_patterns = {
-            "lone figure": ["person", "figure", "silhouette", "man", "woman", "human"],
-            "vast landscape": ["landscape", "horizon", "expanse", "vast", "endless"],
-            "desert": ["desert", "dunes", "sand", "arid"],
-            "water": ["water", "sea", "ocean", "river", "waves"],
-            "mountains": ["mountain", "peak", "summit", "ridge"],
-            "sky": ["sky", "clouds", "heavens", "firmament"],
-            "light rays": ["light", "rays", "beam", "glow", "radiance"],
-            "archway": ["arch", "door", "doorway", "gate", "portal"],
-            "shadows": ["shadow", "shade", "silhouette", "darkness"],
-            "texture": ["texture", "grain", "pattern", "surface"]
-        }
-        
-        detected_elements = []
-        for element, keywords in element_patterns.items():
-            if any(keyword in input_lower for keyword in keywords):
-                detected_elements.append(element)
+        detected_elements = matches.get("visual_elements")
         
         if detected_elements:
             return ", ".join(detected_elements[:3])
@@ -206,11 +134,11 @@ class ExtractBriefTool(BaseTool):
             "that", "these", "those", "i", "you", "he", "she", "it", "we", "they"
         }
         
-        # Extract words
-        words = re.findall(r'\b[a-zA-Z]{4,}\b', self.user_input.lower())
+        # Extract words (Arabic words without diacritics or tatweel)
+        words = re.findall(r'\b[a-zA-Z]{4,}\b|[ء-ي]{3,}', strip_marks(self.user_input.lower()))
         
         # Filter stopwords and get unique keywords
-        keywords = [w for w in words if w not in stopwords]
+        keywords = [w for w in words if w not in stopwords and normalize_arabic(w) not in ARABIC_STOPWORDS]
         unique_keywords = list(dict.fromkeys(keywords))  # Preserve order
         
         return ", ".join(unique_keywords[:10])
@@ -220,7 +148,7 @@ class ExtractBriefTool(BaseTool):
         Format the brief as pure JSON for downstream agent consumption.
         CRITICAL: Returns ONLY JSON - no prose, no headers.
         """
-        return json.dumps(brief, indent=2)
+        return json.dumps(brief, indent=2, ensure_ascii=False)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,3 @@
+"""
+Delivery utilities (storage clients and export helpers) for the Athar Image Designer agency.
+"""
@@ -0,0 +1,110 @@
+"""
+Streaming ZIP archives of delivered images.
+
+stream_zip() yields a ZIP archive chunk by chunk while reading blobs from the
+local store, so an archive of any size is produced with one chunk in memory.
+Entries are STORED (images are already compressed) and, because the output is
+not seekable, zipfile writes each entry's CRC and sizes in a trailing data
+descriptor; ZIP64 records are used automatically for large entries/archives.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+import zipfile
+from dataclasses import dataclass
+from pathlib import PurePosixPath
+from typing import Iterable, Iterator
+
+from .blob_store import COPY_CHUNK_SIZE, BlobStore, get_blob_store
+
+MANIFEST_NAME = "manifest.json"
+
+
+@dataclass
+class ArchiveEntry:
+    """One blob to include, under a path inside the archive."""
+
+    path: str
+    sha256: str
+
+
+class _ChunkSink:
+    """Write-only, non-seekable file object that hands written bytes back to the generator."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._offset = 0
+
+    def write(self, data) -> int:
+        if data:
+            self._chunks.append(bytes(data))
+            self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def unique_paths(names: Iterable[str]) -> list[str]:
+    """
+    Archive-safe, unique entry paths: directories are dropped and repeated names
+    get a numeric suffix ("a.webp", "a_2.webp").
+    """
+    seen: set[str] = set()
+    paths = []
+    for name in names:
+        base = PurePosixPath(name.replace("\\", "/")).name or "image"
+        candidate, counter = base, 1
+        while candidate in seen or candidate == MANIFEST_NAME:
+            counter += 1
+            stem, suffix = PurePosixPath(base).stem, PurePosixPath(base).suffix
+            candidate = f"{stem}_{counter}{suffix}"
+        seen.add(candidate)
+        paths.append(candidate)
+    return paths
+
+
+def stream_zip(entries: list[ArchiveEntry], manifest: dict, store: BlobStore | None = None) -> Iterator[bytes]:
+    """
+    Yield a ZIP archive holding manifest.json followed by every entry's blob.
+
+    Entries must exist in the store; callers filter missing blobs first so the
+    manifest can report them.
+    """
+    sink = _ChunkSink()
+    for _ in _write_zip(sink, entries, manifest, store or get_blob_store()):
+        data = sink.drain()
+        if data:
+            yield data
+    # Central directory, written when the archive is closed.
+    yield sink.drain()
+
+
+def _write_zip(sink: _ChunkSink, entries: list[ArchiveEntry], manifest: dict, store: BlobStore) -> Iterator[None]:
+    """Write the archive into sink, pausing whenever buffered bytes should be sent."""
+    date_time = time.localtime()[:6]
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        archive.writestr(zipfile.ZipInfo(MANIFEST_NAME, date_time), json.dumps(manifest, indent=2, ensure_ascii=False))
+        yield
+
+        for entry in entries:
+            path = store.path_for(entry.sha256)
+            info = zipfile.ZipInfo(entry.path, date_time)
+            info.compress_type = zipfile.ZIP_STORED
+            info.file_size = path.stat().st_size
+            with open(path, "rb") as blob, archive.open(info, mode="w") as member:
+                while chunk := blob.read(COPY_CHUNK_SIZE):
+                    member.write(chunk)
+                    yield
+            # Data descriptor.
+            yield
@@ -0,0 +1,182 @@
+"""
+Local content-addressed store of delivered images.
+
+Every image the export path delivers is also kept on local disk under the
+SHA-256 of its bytes (``<BLOB_STORE_DIR>/ab/abcdef...``), so internal consumers
+can fetch it from the agency's own HTTP server (see delivery.http) instead of
+going through Drive. Blobs are immutable: the hash is the strong ETag and a
+blob is written at most once.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from .dedupe import STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", os.path.join(STATE_DIR, "blobs"))
+# Base URL of the HTTP server (`python agency.py --serve`); delivered images are
+# served under <base>/images/<sha256>.
+EXPORT_HTTP_BASE_URL = os.getenv("EXPORT_HTTP_BASE_URL", "http://localhost:8080")
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+_SHA256_RE = re.compile(r"[0-9a-f]{64}")
+
+# Leading bytes of the formats the export path produces.
+_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", 0, "image/png"),
+    (b"\xff\xd8\xff", 0, "image/jpeg"),
+    (b"GIF8", 0, "image/gif"),
+    (b"WEBP", 8, "image/webp"),
+    (b"ftypavif", 4, "image/avif"),
+)
+
+
+def is_sha256(value: str) -> bool:
+    return bool(_SHA256_RE.fullmatch(value))
+
+
+def sniff_mime_type(header: bytes) -> str:
+    """MIME type from the first bytes of an image (octet-stream if unknown)."""
+    for signature, offset, mime_type in _SIGNATURES:
+        if header[offset:offset + len(signature)] == signature:
+            return mime_type
+    return "application/octet-stream"
+
+
+def blob_url(sha256: str) -> str:
+    """URL of a blob on the agency's HTTP server."""
+    return f"{EXPORT_HTTP_BASE_URL.rstrip('/')}/images/{sha256}"
+
+
+class BlobStore:
+    """
+    SHA-256 addressed files below one root directory. Writes go to a temporary
+    file on the same filesystem and are renamed into place, so readers never see
+    a partial blob and concurrent writers of the same content are harmless.
+    """
+
+    def __init__(self, root: str = BLOB_STORE_DIR):
+        self.root = Path(root)
+
+    def path_for(self, sha256: str) -> Path:
+        if not is_sha256(sha256):
+            raise ValueError(f"Not a SHA-256 hex digest: {sha256!r}")
+        return self.root / sha256[:2] / sha256
+
+    def exists(self, sha256: str) -> bool:
+        return is_sha256(sha256) and self.path_for(sha256).is_file()
+
+    def put(self, data: bytes) -> str:
+        """Store bytes and return their SHA-256."""
+        sha256 = hashlib.sha256(data).hexdigest()
+        if not self.exists(sha256):
+            self._commit(sha256, lambda tmp: tmp.write(data))
+        return sha256
+
+    def put_file(self, source: BinaryIO) -> str:
+        """
+        Store the rest of a file object, hashing while copying, and return the
+        SHA-256. The file position is restored afterwards.
+        """
+        position = source.tell()
+        digest = hashlib.sha256()
+        directory = self.root / "tmp"
+        directory.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as tmp:
+            while chunk := source.read(COPY_CHUNK_SIZE):
+                digest.update(chunk)
+                tmp.write(chunk)
+        source.seek(position)
+        sha256 = digest.hexdigest()
+        path = self.path_for(sha256)
+        if path.is_file():
+            os.unlink(tmp.name)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp.name, path)
+        return sha256
+
+    def _commit(self, sha256: str, write) -> None:
+        path = self.path_for(sha256)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=path.parent, prefix=".", delete=False) as tmp:
+            write(tmp)
+        os.replace(tmp.name, path)
+
+    def open(self, sha256: str) -> Optional[BinaryIO]:
+        """Open a blob for reading, or return None if it is not stored."""
+        try:
+            return open(self.path_for(sha256), "rb")
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def mime_type(self, sha256: str) -> str:
+        with open(self.path_for(sha256), "rb") as blob:
+            return sniff_mime_type(blob.read(16))
+
+
+_store: BlobStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    """Return the process-wide BlobStore."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = BlobStore()
+    return _store
+
+
+def keep_local_copy(image: bytes | BinaryIO) -> str:
+    """
+    Store a delivered image (bytes or a seekable file object) in the blob store
+    and return its SHA-256, or "" if the local copy could not be written. The
+    local copy is best effort and never fails an export.
+    """
+    store = get_blob_store()
+    try:
+        return store.put(image) if isinstance(image, bytes) else store.put_file(image)
+    except OSError as exc:
+        logger.warning("Could not keep local copy of delivered image | error=%s", exc)
+        return ""
+
+
+def local_url(sha256: str) -> Optional[str]:
+    """Served URL of a stored blob, or None when it is not in the local store."""
+    if sha256 and get_blob_store().exists(sha256):
+        return blob_url(sha256)
+    return None
+
+
+def open_local_blob(url: str) -> Optional[BinaryIO]:
+    """
+    Open the blob a blob_url() points at, or return None for any other URL (or
+    a blob not stored here). Lets the process read images it stored itself,
+    such as QA's local repairs, without a round trip through its HTTP server.
+    """
+    prefix = blob_url("")
+    if not url.startswith(prefix):
+        return None
+    return get_blob_store().open(url[len(prefix):])
+
+
+def read_local_blob(url: str) -> Optional[bytes]:
+    """Bytes of the blob a blob_url() points at, or None (see open_local_blob)."""
+    blob = open_local_blob(url)
+    if blob is None:
+        return None
+    with blob:
+        return blob.read()
@@ -0,0 +1,287 @@
+"""
+Content-hash deduplication for Drive exports.
+
+Every uploaded file is stamped with the SHA-256 of its bytes, and with the
+root folder it was exported under, in Drive ``appProperties``. A local SQLite index maps (hash, folder) to the Drive file and
+source URL to hash, so re-exports of the same image (user re-runs, cache hits,
+retries after a timeout where the upload actually succeeded) return the existing
+file instead of creating a duplicate. A local hit is confirmed with one
+files.get, and forgotten when the file was trashed or deleted in the meantime.
+When the local index misses, Drive itself
+is queried by appProperty before uploading, scoped to the folder (or, for
+sharded layouts, to the root stamp) so a hit never comes from another root.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from googleapiclient.errors import HttpError
+
+from .drive_client import get_drive_service
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.getenv("ATHAR_STATE_DIR", ".athar")
+CONTENT_INDEX_PATH = os.getenv("EXPORT_CONTENT_INDEX_PATH", os.path.join(STATE_DIR, "content_index.sqlite3"))
+
+HASH_PROPERTY = "athar_sha256"
+
+# Root folder (dedupe scope) a file was exported under. Sharded layouts spread a
+# root's files over sub-folders, so the Drive query filters on this stamp.
+ROOT_PROPERTY = "athar_root"
+
+# Derivatives carry their master's hash under a separate key so the Drive
+# dedupe query only ever matches masters.
+DERIVATIVE_PROPERTY = "athar_derivative_of"
+
+# API calls an upload costs that a dedupe hit avoids: session start, media PUT
+# and the permission grant.
+UPLOAD_API_CALLS = 3
+
+
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@dataclass
+class ExistingFile:
+    """A previously exported file with identical content."""
+
+    file_id: str
+    name: str
+    folder_id: str
+    sha256: str
+    source: str  # "local_index" or "drive_query"
+    blob_sha256: str = ""  # Local copy of the delivered bytes (delivery.blob_store)
+
+    def to_file_info(self) -> dict:
+        return {"id": self.file_id, "name": self.name}
+
+
+class ContentIndex:
+    """
+    Local hash -> Drive file index with cumulative savings counters.
+    """
+
+    def __init__(self, path: str = CONTENT_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " sha256 TEXT NOT NULL, folder_id TEXT NOT NULL, file_id TEXT NOT NULL,"
+                " name TEXT NOT NULL, size INTEGER NOT NULL, created_at REAL NOT NULL,"
+                " blob_sha256 TEXT NOT NULL DEFAULT '', PRIMARY KEY (sha256, folder_id))"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(files)")}
+            if "blob_sha256" not in columns:
+                self._conn.execute("ALTER TABLE files ADD COLUMN blob_sha256 TEXT NOT NULL DEFAULT ''")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sources (url TEXT PRIMARY KEY, sha256 TEXT NOT NULL, size INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS derivatives (sha256 TEXT NOT NULL, folder_id TEXT NOT NULL,"
+                " links TEXT NOT NULL, PRIMARY KEY (sha256, folder_id))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS savings (id INTEGER PRIMARY KEY CHECK (id = 1),"
+                " hits INTEGER NOT NULL, bytes_saved INTEGER NOT NULL, api_calls_saved INTEGER NOT NULL)"
+            )
+            self._conn.execute("INSERT OR IGNORE INTO savings VALUES (1, 0, 0, 0)")
+
+    def lookup(self, sha256: str, folder_id: str) -> Optional[ExistingFile]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT file_id, name, blob_sha256 FROM files WHERE sha256 = ? AND folder_id = ?",
+                (sha256, folder_id),
+            ).fetchone()
+        if row is None:
+            return None
+        return ExistingFile(
+            file_id=row[0],
+            name=row[1],
+            folder_id=folder_id,
+            sha256=sha256,
+            source="local_index",
+            blob_sha256=row[2],
+        )
+
+    def source_hash(self, url: str) -> Optional[tuple[str, int]]:
+        """Return (sha256, size) for a source URL seen before."""
+        with self._lock:
+            row = self._conn.execute("SELECT sha256, size FROM sources WHERE url = ?", (url,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def record_source(self, url: str, sha256: str, size: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)", (url, sha256, size))
+
+    def record_file(
+        self, sha256: str, folder_id: str, file_id: str, name: str, size: int, blob_sha256: str = ""
+    ) -> None:
+        """The exported file for a source hash; size is the stored file's (after optimization)."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (sha256, folder_id, file_id, name, size, created_at, blob_sha256)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (sha256, folder_id, file_id, name, size, time.time(), blob_sha256),
+            )
+
+    def record_derivatives(self, sha256: str, folder_id: str, links: list[dict]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO derivatives VALUES (?, ?, ?)",
+                (sha256, folder_id, json.dumps(links)),
+            )
+
+    def forget(self, sha256: str, folder_id: str) -> None:
+        """Drop the file (and its derivatives) recorded for this hash in the folder."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM files WHERE sha256 = ? AND folder_id = ?", (sha256, folder_id))
+            self._conn.execute("DELETE FROM derivatives WHERE sha256 = ? AND folder_id = ?", (sha256, folder_id))
+
+    def derivatives(self, sha256: str, folder_id: str) -> list[dict]:
+        """Derivative links exported earlier with the file of this hash."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT links FROM derivatives WHERE sha256 = ? AND folder_id = ?", (sha256, folder_id)
+            ).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def record_savings(self, bytes_saved: int, api_calls_saved: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE savings SET hits = hits + 1, bytes_saved = bytes_saved + ?,"
+                " api_calls_saved = api_calls_saved + ? WHERE id = 1",
+                (bytes_saved, api_calls_saved),
+            )
+
+    def savings(self) -> dict:
+        with self._lock:
+            hits, bytes_saved, api_calls_saved = self._conn.execute(
+                "SELECT hits, bytes_saved, api_calls_saved FROM savings WHERE id = 1"
+            ).fetchone()
+        return {"hits": hits, "bytes_saved": bytes_saved, "api_calls_saved": api_calls_saved}
+
+
+_index: ContentIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_content_index() -> ContentIndex:
+    """Return the process-wide ContentIndex."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ContentIndex()
+    return _index
+
+
+def find_in_drive(sha256: str, folder_id: str, any_parent: bool = False) -> Optional[ExistingFile]:
+    """
+    Ask Drive for a non-trashed file in the folder stamped with this hash. With
+    any_parent, folder_id is a sharded root: instead of the parents clause the
+    file must carry folder_id's root stamp, so files in its sub-folders match
+    and files the service account can read under other roots do not.
+    """
+    query = f"appProperties has {{ key='{HASH_PROPERTY}' and value='{sha256}' }}"
+    if any_parent:
+        query += f" and appProperties has {{ key='{ROOT_PROPERTY}' and value='{folder_id}' }}"
+    else:
+        query += f" and '{folder_id}' in parents"
+    query += " and trashed = false"
+    response = get_drive_service().files().list(
+        q=query,
+        fields="files(id, name)",
+        pageSize=1,
+        spaces="drive",
+    ).execute()
+    files = response.get("files", [])
+    if not files:
+        return None
+    return ExistingFile(
+        file_id=files[0]["id"],
+        name=files[0].get("name", ""),
+        folder_id=folder_id,
+        sha256=sha256,
+        source="drive_query",
+    )
+
+
+def drive_file_alive(file_id: str) -> bool:
+    """
+    Whether the Drive file still exists outside the trash. Errors other than
+    404 are raised, since they say nothing about the file.
+    """
+    try:
+        info = get_drive_service().files().get(fileId=file_id, fields="id,trashed").execute()
+    except HttpError as exc:
+        if exc.resp.status == 404:
+            return False
+        raise
+    return not info.get("trashed", False)
+
+
+def find_existing(
+    sha256: str,
+    folder_id: str,
+    index: Optional[ContentIndex] = None,
+    any_parent: bool = False,
+) -> Optional[ExistingFile]:
+    """
+    Return an already exported file with this content in the folder, checking the
+    local index first and Drive second. Drive hits are written back to the index;
+    index hits whose file was trashed or deleted are dropped from it.
+    Pass any_parent when folder_id is a sharded root (see delivery.folders).
+    """
+    index = index or get_content_index()
+    existing = index.lookup(sha256, folder_id)
+    if existing is not None:
+        try:
+            alive = drive_file_alive(existing.file_id)
+        except Exception as exc:
+            # Drive unreachable: the index is the best answer there is.
+            logger.warning("Could not confirm indexed file | file_id=%s | error=%s", existing.file_id, exc)
+            return existing
+        if alive:
+            return existing
+        logger.info("Indexed file is gone; forgetting it | sha256=%s | file_id=%s", sha256, existing.file_id)
+        index.forget(sha256, folder_id)
+
+    try:
+        existing = find_in_drive(sha256, folder_id, any_parent)
+    except Exception as exc:
+        logger.warning("Drive dedupe query failed; uploading | sha256=%s | error=%s", sha256, exc)
+        return None
+
+    if existing is not None:
+        index.record_file(sha256, folder_id, existing.file_id, existing.name, 0)
+    return existing
+
+
+def hash_properties(sha256: str, root_folder_id: str = "") -> dict:
+    """appProperties stamp for a file with the given content hash, exported under root_folder_id."""
+    properties = {HASH_PROPERTY: sha256}
+    if root_folder_id:
+        properties[ROOT_PROPERTY] = root_folder_id
+    return properties
+
+
+def derivative_properties(sha256: str) -> dict:
+    """appProperties stamp for a derivative of the master with the given hash."""
+    return {DERIVATIVE_PROPERTY: sha256}
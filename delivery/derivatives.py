@@ -0,0 +1,151 @@
+"""
+Multi-size derivatives generated from a single decode.
+
+Alongside the full-size master, consumers get smaller renditions (e.g. a web
+version and a thumbnail) in one or more formats. The source is decoded once and
+each size is reduced from the previous, larger level rather than from the
+original, so every step works on as few pixels as possible. Generation is CPU
+bound and runs on the shared process pool.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from dataclasses import dataclass
+from io import BytesIO
+
+from PIL import Image
+
+from monitoring import emit_event
+from monitoring.accounting import record_cpu
+
+from .transcode import FORMAT_EXTENSIONS, QUALITY_LADDERS, encode_image, get_process_pool, normalize_image
+
+logger = logging.getLogger(__name__)
+
+# "label:longest_edge" pairs and the formats each size is encoded to.
+EXPORT_DERIVATIVE_SIZES = os.getenv("EXPORT_DERIVATIVE_SIZES", "web:1600,thumb:400")
+EXPORT_DERIVATIVE_FORMATS = os.getenv("EXPORT_DERIVATIVE_FORMATS", "webp")
+
+DERIVATIVE_QUALITY = {"webp": 80, "avif": 60, "jpeg": 85}
+
+# Lets resize() shrink by whole factors first (reduce()) before the Lanczos pass.
+REDUCING_GAP = 3.0
+
+
+@dataclass(frozen=True)
+class DerivativeSpec:
+    """One requested rendition: a size label, its longest edge and a format."""
+
+    name: str
+    max_edge: int
+    format: str
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}_{self.format}"
+
+    def filename_for(self, filename: str) -> str:
+        stem = filename.rsplit(".", 1)[0] if "." in filename else filename
+        return f"{stem}_{self.name}.{FORMAT_EXTENSIONS[self.format]}"
+
+
+@dataclass
+class Derivative:
+    """An encoded rendition."""
+
+    spec: DerivativeSpec
+    data: bytes
+    width: int
+    height: int
+
+
+@dataclass
+class DerivativeBatch:
+    """All renditions of one image plus the CPU time spent producing them."""
+
+    derivatives: list[Derivative]
+    cpu_seconds: float
+    wall_seconds: float = 0.0
+
+
+def configured_specs(sizes: str = EXPORT_DERIVATIVE_SIZES, formats: str = EXPORT_DERIVATIVE_FORMATS) -> tuple[DerivativeSpec, ...]:
+    """
+    Parse "label:edge" sizes and a format list into the sizes x formats product,
+    largest size first. Malformed entries and unknown formats are skipped.
+    """
+    parsed_sizes = []
+    for entry in (part.strip() for part in sizes.split(",")):
+        label, _, edge = entry.partition(":")
+        if label and edge.isdigit() and int(edge) > 0:
+            parsed_sizes.append((label, int(edge)))
+    parsed_formats = []
+    for name in (part.strip().lower() for part in formats.split(",")):
+        name = "jpeg" if name == "jpg" else name
+        if name in QUALITY_LADDERS:
+            parsed_formats.append(name)
+    parsed_sizes.sort(key=lambda size: size[1], reverse=True)
+    return tuple(DerivativeSpec(label, edge, fmt) for label, edge in parsed_sizes for fmt in parsed_formats)
+
+
+def _fit(size: tuple[int, int], max_edge: int) -> tuple[int, int]:
+    width, height = size
+    scale = min(1.0, max_edge / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def generate_derivatives(data: bytes, specs: tuple[DerivativeSpec, ...]) -> DerivativeBatch:
+    """
+    Decode once and produce every spec, reducing successively from the largest
+    size down. Runs in the calling process; returns the process CPU time used.
+    """
+    cpu_start = time.process_time()
+    with Image.open(BytesIO(data)) as source:
+        current = normalize_image(source)
+
+    derivatives = []
+    for spec in sorted(specs, key=lambda s: s.max_edge, reverse=True):
+        target = _fit(current.size, spec.max_edge)
+        if target != current.size:
+            current = current.resize(target, Image.LANCZOS, reducing_gap=REDUCING_GAP)
+        image = current
+        if spec.format == "jpeg" and image.mode == "RGBA":
+            image = image.convert("RGB")
+        encoded = encode_image(image, spec.format, DERIVATIVE_QUALITY[spec.format])
+        derivatives.append(Derivative(spec=spec, data=encoded, width=image.width, height=image.height))
+
+    return DerivativeBatch(derivatives=derivatives, cpu_seconds=time.process_time() - cpu_start)
+
+
+def _log_batch(batch: DerivativeBatch, filename: str) -> None:
+    record_cpu("derivatives", batch.cpu_seconds)
+    emit_event(
+        "export_derivatives_generated",
+        filename=filename,
+        count=len(batch.derivatives),
+        bytes_out=sum(len(d.data) for d in batch.derivatives),
+        cpu_seconds=round(batch.cpu_seconds, 3),
+        wall_seconds=round(batch.wall_seconds, 3),
+    )
+
+
+def build_derivatives(data: bytes, filename: str = "", specs: tuple[DerivativeSpec, ...] = ()) -> DerivativeBatch:
+    """
+    Generate derivatives on the shared process pool (blocking the calling thread).
+    Returns an empty batch when none are configured or generation fails.
+    """
+    specs = specs or configured_specs()
+    if not specs:
+        return DerivativeBatch(derivatives=[], cpu_seconds=0.0)
+    start = time.monotonic()
+    try:
+        batch = get_process_pool().submit(generate_derivatives, data, specs).result()
+    except Exception as exc:
+        logger.warning("Derivative generation failed | filename=%s | error=%s", filename, exc)
+        return DerivativeBatch(derivatives=[], cpu_seconds=0.0)
+    batch.wall_seconds = time.monotonic() - start
+    _log_batch(batch, filename)
+    return batch
+
@@ -0,0 +1,206 @@
+"""
+Process-wide Google Drive client factory.
+
+Building a Drive service is expensive: the service account JSON has to be parsed,
+credentials minted, the discovery document loaded and parsed, and an OAuth token
+fetched. This module does that work once per process and hands out one service
+object per thread (httplib2 transports are not thread-safe), sharing a single set
+of credentials whose token is refreshed proactively before it expires.
+"""
+
+from __future__ import annotations
+
+import copy
+import datetime
+import json
+import logging
+import os
+import threading
+from typing import Any
+
+import google_auth_httplib2
+from google.auth.credentials import AnonymousCredentials, Credentials
+from google.auth.transport.requests import AuthorizedSession, Request
+from google.oauth2 import service_account
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+
+from monitoring.tracing import TracedHttp, TracedRequestsMixin
+
+logger = logging.getLogger(__name__)
+
+DRIVE_SCOPES = ["https://www.googleapis.com/auth/drive.file"]
+DEFAULT_API_ROOT = "https://www.googleapis.com/"
+
+# Refresh the shared token this many seconds before it expires so no request
+# ever pays for a refresh (or races another thread doing one).
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv("GDRIVE_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+HTTP_TIMEOUT_SECONDS = int(os.getenv("GDRIVE_HTTP_TIMEOUT_SECONDS", "60"))
+
+
+class DriveConfigurationError(RuntimeError):
+    """Raised when the Drive service account configuration cannot be loaded."""
+
+
+class TracedAuthorizedSession(TracedRequestsMixin, AuthorizedSession):
+    """AuthorizedSession whose requests are spans of the active trace (monitoring.tracing)."""
+
+
+def load_service_account_info(raw_value: str | None) -> dict:
+    """
+    Parse GOOGLE_SERVICE_ACCOUNT_JSON, which may hold inline JSON or a file path.
+
+    Raises:
+        DriveConfigurationError: If the value is missing or not valid JSON.
+    """
+    if not raw_value:
+        raise DriveConfigurationError("GOOGLE_SERVICE_ACCOUNT_JSON is not set")
+
+    try:
+        return json.loads(raw_value)
+    except json.JSONDecodeError:
+        pass
+
+    if os.path.exists(raw_value):
+        with open(raw_value, "r") as handle:
+            try:
+                return json.load(handle)
+            except json.JSONDecodeError as exc:
+                raise DriveConfigurationError(f"Invalid service account file: {exc}") from exc
+
+    raise DriveConfigurationError("Invalid GOOGLE_SERVICE_ACCOUNT_JSON format")
+
+
+class DriveClientFactory:
+    """
+    Thread-safe factory for Drive v3 service objects.
+
+    Args:
+        service_account_json: Inline JSON or path to the service account key.
+        api_root: Optional root URL override (e.g. a local Drive stand-in). When
+            set without credentials, requests are sent unauthenticated.
+    """
+
+    def __init__(self, service_account_json: str | None, api_root: str | None = None):
+        self.api_root = api_root
+        self.credentials = self._build_credentials(service_account_json, api_root)
+        self._discovery_doc = self._load_discovery_doc(api_root)
+        self._refresh_lock = threading.Lock()
+        self._local = threading.local()
+
+    @staticmethod
+    def _build_credentials(service_account_json: str | None, api_root: str | None) -> Credentials:
+        if not service_account_json and api_root:
+            return AnonymousCredentials()
+        info = load_service_account_info(service_account_json)
+        return service_account.Credentials.from_service_account_info(info, scopes=DRIVE_SCOPES)
+
+    @staticmethod
+    def _load_discovery_doc(api_root: str | None) -> dict[str, Any]:
+        # The discovery document ships with google-api-python-client; parse it once.
+        raw_doc = get_static_doc("drive", "v3")
+        if raw_doc is None:
+            raise DriveConfigurationError("Static Drive v3 discovery document is unavailable")
+        doc = json.loads(raw_doc)
+        if api_root:
+            doc["rootUrl"] = api_root.rstrip("/") + "/"
+        return doc
+
+    def _token_is_fresh(self) -> bool:
+        credentials = self.credentials
+        if isinstance(credentials, AnonymousCredentials):
+            return True
+        if not credentials.token:
+            return False
+        expiry = credentials.expiry
+        if expiry is None:
+            return True
+        # google-auth stores expiry as a naive UTC datetime.
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return (expiry - now).total_seconds() > TOKEN_REFRESH_MARGIN_SECONDS
+
+    def ensure_token(self) -> None:
+        """
+        Refresh the shared OAuth token if it is missing or close to expiry.
+        Only one thread performs the refresh; the others reuse its result.
+        """
+        if self._token_is_fresh():
+            return
+        with self._refresh_lock:
+            if self._token_is_fresh():
+                return
+            self.credentials.refresh(Request())
+            logger.info("Drive access token refreshed | expiry=%s", self.credentials.expiry)
+
+    def get_service(self):
+        """
+        Return the Drive service bound to the calling thread, building it on first use.
+        """
+        self.ensure_token()
+        service = getattr(self._local, "service", None)
+        if service is None:
+            http = google_auth_httplib2.AuthorizedHttp(
+                self.credentials,
+                http=TracedHttp(timeout=HTTP_TIMEOUT_SECONDS),
+            )
+            # build_from_document mutates method descriptions while wiring resources,
+            # so each thread works on its own copy of the parsed document.
+            service = build_from_document(copy.deepcopy(self._discovery_doc), http=http)
+            self._local.service = service
+        return service
+
+    @property
+    def upload_root(self) -> str:
+        """Root URL for raw media endpoints (``<root>upload/drive/v3/files``)."""
+        return self._discovery_doc.get("rootUrl", DEFAULT_API_ROOT)
+
+    def get_authorized_session(self) -> AuthorizedSession:
+        """
+        Return a requests session bound to the calling thread that signs requests
+        with the shared credentials. Used for raw resumable-upload traffic.
+        """
+        self.ensure_token()
+        session = getattr(self._local, "authorized_session", None)
+        if session is None:
+            session = TracedAuthorizedSession(self.credentials)
+            self._local.authorized_session = session
+        return session
+
+
+_factory: DriveClientFactory | None = None
+_factory_lock = threading.Lock()
+
+
+def get_drive_factory() -> DriveClientFactory:
+    """
+    Return the process-wide DriveClientFactory, creating it from the environment.
+
+    Raises:
+        DriveConfigurationError: If the service account configuration is invalid.
+    """
+    global _factory
+    if _factory is None:
+        with _factory_lock:
+            if _factory is None:
+                _factory = DriveClientFactory(
+                    os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON"),
+                    api_root=os.getenv("GDRIVE_API_ROOT"),
+                )
+    return _factory
+
+
+def get_drive_service():
+    """
+    Return a ready-to-use Drive v3 service for the calling thread.
+    """
+    return get_drive_factory().get_service()
+
+
+def reset_drive_factory() -> None:
+    """
+    Drop the cached factory (e.g. after rotating credentials). Threads build a new
+    service from the next factory on their following call.
+    """
+    global _factory
+    with _factory_lock:
+        _factory = None
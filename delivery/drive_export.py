@@ -0,0 +1,510 @@
+"""
+Google Drive export operations shared by the export tools.
+
+Covers single and multi-file uploads: media uploads run concurrently on a bounded
+thread pool (each worker uses its own thread-bound Drive service), and public read
+permissions are granted through Drive's batch endpoint, or skipped entirely when
+the target folder already shares "anyone with the link" by inheritance.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Optional
+
+import requests
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
+
+from monitoring.metrics import DRIVE_UPLOAD_SECONDS
+from monitoring.tracing import download_span
+
+from .blob_store import keep_local_copy, local_url, read_local_blob
+from .dedupe import (
+    UPLOAD_API_CALLS,
+    derivative_properties,
+    find_existing,
+    get_content_index,
+    hash_properties,
+    sha256_hex,
+)
+from .drive_client import get_drive_service
+from .derivatives import DerivativeBatch, DerivativeSpec, build_derivatives
+from .transcode import optimize_image
+
+logger = logging.getLogger(__name__)
+
+FILE_FIELDS = "id, name, parents, webViewLink, webContentLink"
+
+# Drive rejects batches with more than 100 calls.
+MAX_BATCH_SIZE = 100
+
+# IDs reserved per files.generateIds call.
+ID_POOL_REFILL_SIZE = 20
+
+# How long a folder's "public by inheritance" lookup stays valid.
+FOLDER_PERMISSION_TTL_SECONDS = 600
+
+PUBLIC_READ_PERMISSION = {"type": "anyone", "role": "reader"}
+
+MIME_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "gif": "image/gif",
+    "webp": "image/webp",
+    "avif": "image/avif",
+    "bmp": "image/bmp",
+    "svg": "image/svg+xml",
+}
+
+
+def mime_type_for(filename: str) -> str:
+    """
+    Determine MIME type from file extension (defaults to PNG).
+    """
+    extension = filename.lower().split(".")[-1]
+    return MIME_TYPES.get(extension, "image/png")
+
+
+def view_url(file_id: str) -> str:
+    return f"https://drive.google.com/file/d/{file_id}/view"
+
+
+def download_url(file_id: str) -> str:
+    return f"https://drive.google.com/uc?id={file_id}&export=download"
+
+
+@dataclass
+class ExportItem:
+    """One image to export."""
+
+    image_url: str
+    filename: str
+
+
+@dataclass
+class ExportResult:
+    """Outcome of exporting one ExportItem."""
+
+    item: ExportItem
+    file_info: Optional[dict] = None
+    public: bool = False
+    error: Optional[str] = None
+    bytes_uploaded: int = 0
+    deduplicated: bool = False
+    bytes_saved: int = 0
+    derivatives: list[dict] = field(default_factory=list)
+    blob_sha256: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return self.file_info is not None and self.error is None
+
+    def to_dict(self) -> dict:
+        if not self.ok:
+            return {
+                "success": False,
+                "image_url": self.item.image_url,
+                "filename": self.item.filename,
+                "error": self.error or "Unknown export error",
+            }
+        file_id = self.file_info.get("id", "")
+        return {
+            "success": True,
+            "file_id": file_id,
+            "filename": self.file_info.get("name", self.item.filename),
+            "gdrive_view_url": self.file_info.get("webViewLink", view_url(file_id)),
+            "gdrive_download_url": self.file_info.get("webContentLink", download_url(file_id)),
+            "local_url": local_url(self.blob_sha256),
+            "public": self.public,
+            "deduplicated": self.deduplicated,
+            "derivatives": self.derivatives,
+        }
+
+
+@dataclass
+class BatchExportReport:
+    """Aggregate outcome of export_many()."""
+
+    results: list[ExportResult] = field(default_factory=list)
+    permission_calls: int = 0
+    permissions_inherited: bool = False
+    duration_seconds: float = 0.0
+
+    @property
+    def files_per_second(self) -> float:
+        if not self.duration_seconds:
+            return 0.0
+        return sum(1 for r in self.results if r.ok) / self.duration_seconds
+
+
+class DriveIdPool:
+    """
+    Pool of Drive file IDs reserved with files.generateIds, so a file's URLs are
+    known before its upload starts. Refilled in batches to amortise the call.
+    """
+
+    def __init__(self, refill_size: int = ID_POOL_REFILL_SIZE):
+        self.refill_size = refill_size
+        self._ids: list[str] = []
+        self._lock = threading.Lock()
+
+    def reserve(self) -> str:
+        with self._lock:
+            if not self._ids:
+                response = get_drive_service().files().generateIds(
+                    count=self.refill_size,
+                    space="drive",
+                    type="files",
+                ).execute()
+                self._ids.extend(response.get("ids", []))
+                if not self._ids:
+                    raise RuntimeError("Drive returned no pre-allocated file IDs")
+            return self._ids.pop()
+
+
+_id_pool = DriveIdPool()
+
+
+def reserve_file_id() -> str:
+    """Reserve one Drive file ID from the process-wide pool."""
+    return _id_pool.reserve()
+
+
+_folder_public_cache: dict[str, tuple[bool, float]] = {}
+_folder_public_lock = threading.Lock()
+
+
+def folder_grants_public_read(folder_id: str) -> bool:
+    """
+    Return True when the folder itself is shared with "anyone" as reader, in which
+    case every file uploaded into it inherits public read access.
+    """
+    now = time.monotonic()
+    with _folder_public_lock:
+        cached = _folder_public_cache.get(folder_id)
+    if cached and now - cached[1] < FOLDER_PERMISSION_TTL_SECONDS:
+        return cached[0]
+
+    try:
+        response = get_drive_service().permissions().list(
+            fileId=folder_id,
+            fields="permissions(type, role)",
+        ).execute()
+        is_public = any(
+            perm.get("type") == "anyone" and perm.get("role") in {"reader", "commenter", "writer"}
+            for perm in response.get("permissions", [])
+        )
+    except Exception as exc:
+        # The service account may not be allowed to read folder permissions;
+        # fall back to granting per file.
+        logger.warning("Could not inspect folder permissions | folder_id=%s | error=%s", folder_id, exc)
+        is_public = False
+
+    with _folder_public_lock:
+        _folder_public_cache[folder_id] = (is_public, now)
+    return is_public
+
+
+def ensure_public(file_id: str, folder_id: str) -> bool:
+    """
+    Make one file publicly readable unless it already inherits that from its folder.
+    Returns True if the file is public afterwards.
+    """
+    if folder_grants_public_read(folder_id):
+        return True
+    return grant_public_read([file_id]).get(file_id, False)
+
+
+def download_image(image_url: str, timeout: int = 60) -> bytes:
+    """
+    Download image bytes, raising requests exceptions on failure. Images in the
+    local blob store are read from disk.
+    """
+    with download_span(image_url) as current:
+        content = read_local_blob(image_url)
+        current.set_attribute("download.local", content is not None)
+        if content is None:
+            response = requests.get(image_url, timeout=timeout)
+            response.raise_for_status()
+            content_type = response.headers.get("content-type", "")
+            if not content_type.startswith("image/"):
+                logger.warning("Unexpected Content-Type while downloading | url=%s | type=%s", image_url, content_type)
+            content = response.content
+        current.set_attribute("download.bytes", len(content))
+        return content
+
+
+def upload_bytes(
+    image_bytes: bytes,
+    filename: str,
+    folder_id: str,
+    app_properties: Optional[dict] = None,
+    file_id: Optional[str] = None,
+) -> dict:
+    """
+    Upload image bytes to Drive using the calling thread's service, optionally
+    under a pre-allocated file ID. Returns the created file resource (its
+    "parents" name the folder actually used, see delivery.folders.in_live_folder).
+    """
+    # Imported here: delivery.folders builds on this module.
+    from .folders import in_live_folder
+
+    def create(parent_id: str) -> dict:
+        media = MediaIoBaseUpload(
+            BytesIO(image_bytes),
+            mimetype=mime_type_for(filename),
+            resumable=True,
+        )
+        metadata = {"name": filename, "parents": [parent_id]}
+        if app_properties:
+            metadata["appProperties"] = app_properties
+        if file_id:
+            metadata["id"] = file_id
+        with DRIVE_UPLOAD_SECONDS.time(method="multipart"):
+            return get_drive_service().files().create(
+                body=metadata,
+                media_body=media,
+                fields=FILE_FIELDS,
+            ).execute()
+
+    return in_live_folder(folder_id, create)
+
+
+def move_file(
+    file_id: str, filename: str, from_folder_id: str, to_folder_id: str, app_properties: Optional[dict] = None
+) -> dict:
+    """Rename a file and move it between folders (optionally stamping appProperties) in one metadata call."""
+    from .folders import in_live_folder
+
+    body = {"name": filename}
+    if app_properties:
+        body["appProperties"] = app_properties
+    return in_live_folder(
+        to_folder_id,
+        lambda parent_id: get_drive_service().files().update(
+            fileId=file_id,
+            body=body,
+            addParents=parent_id,
+            removeParents=from_folder_id,
+            fields=FILE_FIELDS,
+        ).execute(),
+    )
+
+
+def delete_file(file_id: str) -> None:
+    get_drive_service().files().delete(fileId=file_id).execute()
+
+
+def grant_public_read(file_ids: list[str]) -> dict[str, bool]:
+    """
+    Grant "anyone with the link" read access to many files using batch requests.
+    Returns a mapping of file_id -> success.
+    """
+    outcome: dict[str, bool] = {}
+    service = get_drive_service()
+
+    for start in range(0, len(file_ids), MAX_BATCH_SIZE):
+        chunk = file_ids[start:start + MAX_BATCH_SIZE]
+
+        def _callback(request_id, _response, exception):
+            outcome[request_id] = exception is None
+            if exception is not None:
+                logger.warning("Batch permission grant failed | file_id=%s | error=%s", request_id, exception)
+
+        batch = service.new_batch_http_request(callback=_callback)
+        for file_id in chunk:
+            batch.add(
+                service.permissions().create(fileId=file_id, body=PUBLIC_READ_PERMISSION, fields="id"),
+                request_id=file_id,
+            )
+        try:
+            batch.execute()
+        except Exception as exc:
+            logger.error("Batch permission request failed | size=%s | error=%s", len(chunk), exc)
+            for file_id in chunk:
+                outcome.setdefault(file_id, False)
+
+    return outcome
+
+
+def derivative_link(spec: DerivativeSpec, file_id: str, width: Optional[int] = None, height: Optional[int] = None) -> dict:
+    """Delivery-facing description of one derivative file."""
+    return {
+        "name": spec.name,
+        "format": spec.format,
+        "max_edge": spec.max_edge,
+        "width": width,
+        "height": height,
+        "file_id": file_id,
+        "view_url": view_url(file_id),
+        "download_url": download_url(file_id),
+    }
+
+
+def upload_derivatives(
+    batch: DerivativeBatch,
+    filename: str,
+    folder_id: str,
+    app_properties: Optional[dict] = None,
+    file_ids: Optional[dict[str, str]] = None,
+    max_workers: int = 4,
+) -> list[dict]:
+    """
+    Upload every derivative concurrently (under pre-allocated IDs when given,
+    keyed by DerivativeSpec.key) and make them public in one batch.
+    Returns derivative_link() dicts for the files that were stored.
+    """
+    file_ids = file_ids or {}
+    if not batch.derivatives:
+        return []
+
+    def _upload(derivative):
+        reserved = file_ids.get(derivative.spec.key)
+        try:
+            return upload_bytes(
+                derivative.data,
+                derivative.spec.filename_for(filename),
+                folder_id,
+                app_properties,
+                file_id=reserved,
+            )
+        except HttpError as exc:
+            if reserved and exc.resp.status == 409:
+                # Created by an earlier attempt under the same reserved ID.
+                return {"id": reserved}
+            logger.warning("Derivative upload failed | key=%s | error=%s", derivative.spec.key, exc)
+        except Exception as exc:
+            logger.warning("Derivative upload failed | key=%s | error=%s", derivative.spec.key, exc)
+        return None
+
+    workers = max(1, min(max_workers, len(batch.derivatives)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="drive-derivatives") as pool:
+        uploaded = list(pool.map(_upload, batch.derivatives))
+
+    links = [
+        derivative_link(derivative.spec, info["id"], derivative.width, derivative.height)
+        for derivative, info in zip(batch.derivatives, uploaded)
+        if info
+    ]
+    if links and not folder_grants_public_read(folder_id):
+        grant_public_read([link["file_id"] for link in links])
+    return links
+
+
+def _export_one(
+    item: ExportItem,
+    folder_id: str,
+    optimize: bool = True,
+    derivatives: bool = True,
+    dedupe_scope: str = "",
+) -> ExportResult:
+    try:
+        image_bytes = download_image(item.image_url)
+    except requests.exceptions.RequestException as exc:
+        return ExportResult(item=item, error=f"Failed to download image: {exc}")
+
+    index = get_content_index()
+    sha256 = sha256_hex(image_bytes)
+    index.record_source(item.image_url, sha256, len(image_bytes))
+    # Sharded exports dedupe across the whole root folder, not just today's shard.
+    scope = dedupe_scope or folder_id
+    existing = find_existing(sha256, scope, index, any_parent=scope != folder_id)
+    if existing is not None:
+        index.record_savings(len(image_bytes), UPLOAD_API_CALLS)
+        return ExportResult(
+            item=item,
+            file_info=existing.to_file_info(),
+            deduplicated=True,
+            bytes_saved=len(image_bytes),
+            derivatives=index.derivatives(sha256, scope),
+            blob_sha256=existing.blob_sha256,
+        )
+
+    # Files stay stamped with the source hash, so re-exports dedupe before transcoding.
+    filename = item.filename
+    batch = build_derivatives(image_bytes, item.filename) if derivatives else DerivativeBatch([], 0.0)
+    if optimize:
+        optimized = optimize_image(image_bytes, item.filename)
+        image_bytes, filename = optimized.data, optimized.filename_for(item.filename)
+    blob_sha256 = keep_local_copy(image_bytes)
+
+    try:
+        file_info = upload_bytes(image_bytes, filename, folder_id, hash_properties(sha256, scope))
+    except Exception as exc:
+        return ExportResult(item=item, error=f"Failed to upload image to Google Drive: {exc}")
+
+    # A re-created shard folder (see delivery.folders.in_live_folder) replaces folder_id.
+    folder_id = (file_info.get("parents") or [folder_id])[0]
+    index.record_file(
+        sha256, scope, file_info["id"], file_info.get("name", filename), len(image_bytes), blob_sha256
+    )
+    links = upload_derivatives(batch, item.filename, folder_id, derivative_properties(sha256))
+    if links:
+        index.record_derivatives(sha256, scope, links)
+    return ExportResult(
+        item=item,
+        file_info=file_info,
+        bytes_uploaded=len(image_bytes) + sum(len(d.data) for d in batch.derivatives),
+        derivatives=links,
+        blob_sha256=blob_sha256,
+    )
+
+
+def export_many(
+    items: list[ExportItem],
+    folder_id: str,
+    max_workers: int = 4,
+    optimize: bool = True,
+    derivatives: bool = True,
+    dedupe_scope: str = "",
+) -> BatchExportReport:
+    """
+    Download and upload many images concurrently, then make them public with as
+    few Drive round trips as possible.
+
+    Args:
+        items: Images to export.
+        folder_id: Target Drive folder.
+        max_workers: Upper bound on concurrent downloads/uploads.
+        optimize: Re-encode each image to its smallest acceptable format first.
+        derivatives: Also upload the configured smaller renditions of each image.
+        dedupe_scope: Root folder to dedupe against when folder_id is one of its
+            sharded sub-folders (defaults to folder_id).
+    """
+    start = time.monotonic()
+    report = BatchExportReport()
+    if not items:
+        return report
+
+    workers = max(1, min(max_workers, len(items)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="drive-export") as pool:
+        report.results = list(pool.map(
+            lambda item: _export_one(item, folder_id, optimize, derivatives, dedupe_scope), items
+        ))
+
+    # Deduplicated files were made public when they were first exported.
+    uploaded = [r for r in report.results if r.ok and not r.deduplicated]
+    for result in report.results:
+        if result.deduplicated:
+            result.public = True
+    if uploaded:
+        if folder_grants_public_read(folder_id):
+            report.permissions_inherited = True
+            for result in uploaded:
+                result.public = True
+        else:
+            file_ids = [r.file_info["id"] for r in uploaded]
+            granted = grant_public_read(file_ids)
+            report.permission_calls = (len(file_ids) + MAX_BATCH_SIZE - 1) // MAX_BATCH_SIZE
+            for result in uploaded:
+                result.public = granted.get(result.file_info["id"], False)
+
+    report.duration_seconds = time.monotonic() - start
+    return report
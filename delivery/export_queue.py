@@ -0,0 +1,750 @@
+"""
+Durable background Drive export queue.
+
+The export tool reserves a Drive file ID up front (files.generateIds), so the view
+and download URLs are known immediately and can be delivered to the user while
+the actual download + upload runs on background worker threads.
+
+Jobs are persisted in a local SQLite database, so queued and interrupted uploads
+survive a restart and are picked up again by the next process. A claimed job is
+leased to its owner (host and pid); the owner's heartbeat renews the lease, and
+a job is only taken back when its lease has expired or its owner process is
+gone, so a worker starting next to live siblings leaves their uploads alone.
+
+A bounded pool of workers drains the queue; transient failures (Drive rate
+limits, 5xx, network errors) are retried with exponential backoff, and a
+rate-limit response pauses every worker, since Drive quotas are shared by the
+service account. Submissions beyond EXPORT_QUEUE_MAX_PENDING are rejected so
+callers can apply backpressure.
+
+Queue depth, the oldest pending job's age and each attempt's duration are
+exported at ``GET /metrics`` (athar_export_queue_depth,
+athar_export_queue_oldest_job_age_seconds, athar_export_job_seconds), updated
+on enqueue, claim and finish, and by idle workers in between.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from io import BytesIO
+from typing import Optional
+
+import requests
+from googleapiclient.errors import HttpError
+
+from monitoring import emit_event
+from monitoring.metrics import EXPORT_JOB_SECONDS, EXPORT_QUEUE_DEPTH, EXPORT_QUEUE_OLDEST_JOB_AGE
+
+from .blob_store import blob_url, get_blob_store, keep_local_copy, local_url
+from .dedupe import STATE_DIR, derivative_properties, get_content_index, hash_properties
+from .derivatives import DerivativeBatch, DerivativeSpec, build_derivatives, configured_specs
+from .drive_client import get_drive_service
+from .folders import get_folder_resolver, is_missing_folder
+from .drive_export import (
+    FILE_FIELDS,
+    derivative_link,
+    download_url,
+    ensure_public,
+    reserve_file_id,
+    upload_derivatives,
+    view_url,
+)
+from .resumable import DEFAULT_CHUNK_SIZE, StreamingDriveUpload, download_to_spool
+from .transcode import optimize_image
+
+logger = logging.getLogger(__name__)
+
+EXPORT_QUEUE_PATH = os.getenv("EXPORT_QUEUE_PATH", os.path.join(STATE_DIR, "export_queue.sqlite3"))
+EXPORT_QUEUE_WORKERS = int(os.getenv("EXPORT_QUEUE_WORKERS", "2"))
+EXPORT_QUEUE_MAX_PENDING = int(os.getenv("EXPORT_QUEUE_MAX_PENDING", "100"))
+EXPORT_QUEUE_MAX_ATTEMPTS = int(os.getenv("EXPORT_QUEUE_MAX_ATTEMPTS", "5"))
+EXPORT_QUEUE_BACKOFF_SECONDS = float(os.getenv("EXPORT_QUEUE_BACKOFF_SECONDS", "2"))
+EXPORT_QUEUE_LEASE_SECONDS = float(os.getenv("EXPORT_QUEUE_LEASE_SECONDS", "60"))
+MAX_BACKOFF_SECONDS = 300
+
+# Upload latencies kept for the latency percentiles in stats().
+LATENCY_WINDOW = 200
+
+# Idle workers re-check the store at least this often for jobs whose backoff expired.
+POLL_INTERVAL_SECONDS = 1.0
+
+JOB_QUEUED = "queued"
+JOB_UPLOADING = "uploading"
+JOB_UPLOADED = "uploaded"
+JOB_FAILED = "failed"
+
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+
+class ExportQueueFull(RuntimeError):
+    """Raised by ExportQueue.submit when the number of pending jobs is at its limit."""
+
+
+@dataclass
+class ExportJob:
+    """One background upload into a pre-allocated Drive file ID."""
+
+    file_id: str
+    image_url: str
+    filename: str
+    folder_id: str
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+    optimize: bool = True
+    status: str = JOB_QUEUED
+    attempts: int = 0
+    error: Optional[str] = None
+    public: bool = False
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    next_attempt_at: float = 0.0
+    upload_seconds: Optional[float] = None
+    # derivative_link() dicts: reserved IDs while pending, with sizes once uploaded.
+    derivatives: list[dict] = field(default_factory=list)
+    # Sharded root folder_id lives under; the content index is keyed by it.
+    root_folder_id: str = ""
+    # Local copy of the uploaded bytes (delivery.blob_store), set once uploaded.
+    blob_sha256: str = ""
+    # Source image already downloaded into the blob store by the submitter (its
+    # SHA-256), so the job does not fetch image_url again.
+    source_sha256: str = ""
+    # "host:pid" of the process uploading the job, and until when its claim holds.
+    owner: str = ""
+    lease_expires_at: float = 0.0
+
+    @property
+    def dedupe_scope(self) -> str:
+        return self.root_folder_id or self.folder_id
+
+    @property
+    def view_url(self) -> str:
+        return view_url(self.file_id)
+
+    @property
+    def download_url(self) -> str:
+        return download_url(self.file_id)
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["gdrive_view_url"] = self.view_url
+        data["gdrive_download_url"] = self.download_url
+        data["local_url"] = local_url(self.blob_sha256)
+        return data
+
+
+@dataclass
+class RetryDecision:
+    """How a failed attempt should be handled."""
+
+    retryable: bool
+    rate_limited: bool = False
+    retry_after: Optional[float] = None
+
+
+def _error_reasons(exc: HttpError) -> set[str]:
+    try:
+        details = exc.error_details or []
+    except Exception:
+        details = []
+    return {d.get("reason") for d in details if isinstance(d, dict)}
+
+
+def _retry_after(headers) -> Optional[float]:
+    value = (headers or {}).get("retry-after") or (headers or {}).get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def classify_error(exc: Exception) -> RetryDecision:
+    """
+    Decide whether an upload failure is worth retrying. Drive signals quota
+    exhaustion with 429 or with 403 + rateLimitExceeded/userRateLimitExceeded;
+    other 4xx responses (bad folder, revoked access) will not succeed on retry.
+    """
+    status, reasons, headers = None, set(), None
+    if isinstance(exc, HttpError):
+        status, reasons, headers = exc.resp.status, _error_reasons(exc), exc.resp
+        if not reasons and status == 403 and b"ateLimitExceeded" in (exc.content or b""):
+            reasons = {"rateLimitExceeded"}
+    elif isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
+        status, headers = exc.response.status_code, exc.response.headers
+        if status == 403:
+            try:
+                errors = exc.response.json().get("error", {}).get("errors", [])
+            except ValueError:
+                errors = []
+            reasons = {e.get("reason") for e in errors if isinstance(e, dict)}
+    elif isinstance(exc, requests.exceptions.RequestException):
+        return RetryDecision(retryable=True)
+
+    if status is None:
+        # Unknown failures (e.g. a resumable session that expired) are retried.
+        return RetryDecision(retryable=True)
+    if status == 429 or (status == 403 and reasons & RATE_LIMIT_REASONS):
+        return RetryDecision(retryable=True, rate_limited=True, retry_after=_retry_after(headers))
+    if status == 408 or status >= 500:
+        return RetryDecision(retryable=True, retry_after=_retry_after(headers))
+    return RetryDecision(retryable=False)
+
+
+def _is_conflict(exc: Exception) -> bool:
+    if isinstance(exc, HttpError):
+        return exc.resp.status == 409
+    if isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
+        return exc.response.status_code == 409
+    return False
+
+
+def upload_job(job: ExportJob) -> dict:
+    """
+    Download the job's image (from the blob store when the submitter kept it
+    there) and upload it under the reserved file ID. Returns the Drive file
+    resource. Safe to call again after a failure: a lost completion response
+    surfaces as a 409 conflict, which resolves to the file.
+
+    Content dedupe happens at submission, before the file ID is reserved: the
+    reserved URLs are delivered right away, so the job must create that file.
+    """
+    source_url = job.image_url
+    if job.source_sha256 and get_blob_store().exists(job.source_sha256):
+        source_url = blob_url(job.source_sha256)
+    source_file, content_hash, size = download_to_spool(source_url, max_memory=job.chunk_size)
+    index = get_content_index()
+    index.record_source(job.image_url, content_hash, size)
+    filename, stored_size = job.filename, size
+    batch = DerivativeBatch(derivatives=[], cpu_seconds=0.0)
+    if job.derivatives:
+        specs = tuple(DerivativeSpec(link["name"], link["max_edge"], link["format"]) for link in job.derivatives)
+        batch = build_derivatives(source_file.read(), job.filename, specs)
+        source_file.seek(0)
+    if job.optimize:
+        optimized = optimize_image(source_file.read(), job.filename)
+        source_file.seek(0)
+        if optimized.transcoded:
+            source_file.close()
+            source_file = BytesIO(optimized.data)
+            filename, stored_size = optimized.filename_for(job.filename), optimized.bytes_out
+    job.blob_sha256 = keep_local_copy(source_file)
+    try:
+        upload = StreamingDriveUpload(
+            job.image_url,
+            filename,
+            job.folder_id,
+            chunk_size=job.chunk_size,
+            app_properties=hash_properties(content_hash, job.dedupe_scope),
+            source_file=source_file,
+            file_id=job.file_id,
+        )
+        file_info = upload.run()
+    except Exception as exc:
+        if not _is_conflict(exc):
+            raise
+        # An earlier attempt already created the file under this ID.
+        file_info = get_drive_service().files().get(fileId=job.file_id, fields=FILE_FIELDS).execute()
+    finally:
+        source_file.close()
+
+    index.record_file(
+        content_hash, job.dedupe_scope, job.file_id, file_info.get("name", filename), stored_size, job.blob_sha256
+    )
+    if batch.derivatives:
+        reserved = {f"{link['name']}_{link['format']}": link["file_id"] for link in job.derivatives}
+        links = upload_derivatives(
+            batch,
+            job.filename,
+            job.folder_id,
+            derivative_properties(content_hash),
+            file_ids=reserved,
+        )
+        if len(links) < len(batch.derivatives):
+            # Retry the job; files already created resolve through their reserved IDs.
+            raise RuntimeError(f"{len(batch.derivatives) - len(links)} derivative uploads failed")
+        index.record_derivatives(content_hash, job.dedupe_scope, links)
+        job.derivatives = links
+    elif job.derivatives:
+        # Generation failed (already logged); the reserved derivative IDs stay unused.
+        job.derivatives = []
+    return file_info
+
+
+_JOB_COLUMNS = (
+    "file_id", "image_url", "filename", "folder_id", "chunk_size", "optimize", "status", "attempts",
+    "error", "public", "created_at", "updated_at", "next_attempt_at", "upload_seconds", "derivatives",
+    "root_folder_id", "blob_sha256", "source_sha256", "owner", "lease_expires_at",
+)
+
+# Columns added after the first release, with their definitions for ALTER TABLE.
+_ADDED_COLUMNS = {
+    "optimize": "INTEGER NOT NULL DEFAULT 1",
+    "derivatives": "TEXT NOT NULL DEFAULT '[]'",
+    "root_folder_id": "TEXT NOT NULL DEFAULT ''",
+    "blob_sha256": "TEXT NOT NULL DEFAULT ''",
+    "source_sha256": "TEXT NOT NULL DEFAULT ''",
+    "owner": "TEXT NOT NULL DEFAULT ''",
+    "lease_expires_at": "REAL NOT NULL DEFAULT 0",
+}
+
+
+def process_owner() -> str:
+    """Owner tag of this process: "host:pid"."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _owner_alive(owner: str) -> bool:
+    """
+    Whether the owning process still runs. Owners on other hosts cannot be
+    checked and count as alive; their jobs come back when the lease expires.
+    """
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return bool(owner)
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ExportJobStore:
+    """
+    SQLite persistence for export jobs. Claiming a job is a single
+    UPDATE ... RETURNING, so several worker threads (or processes sharing the
+    file) never take the same job. A claim is a lease of lease_seconds that
+    the owner renews with renew_leases().
+    """
+
+    def __init__(self, path: str = EXPORT_QUEUE_PATH, owner: str = "", lease_seconds: float = EXPORT_QUEUE_LEASE_SECONDS):
+        self.path = path
+        self.owner = owner or process_owner()
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " file_id TEXT PRIMARY KEY, image_url TEXT NOT NULL, filename TEXT NOT NULL,"
+                " folder_id TEXT NOT NULL, chunk_size INTEGER NOT NULL, optimize INTEGER NOT NULL DEFAULT 1,"
+                " status TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL, error TEXT, public INTEGER NOT NULL,"
+                " created_at REAL NOT NULL, updated_at REAL NOT NULL,"
+                " next_attempt_at REAL NOT NULL, upload_seconds REAL, derivatives TEXT NOT NULL DEFAULT '[]',"
+                " root_folder_id TEXT NOT NULL DEFAULT '', blob_sha256 TEXT NOT NULL DEFAULT '',"
+                " source_sha256 TEXT NOT NULL DEFAULT '', owner TEXT NOT NULL DEFAULT '',"
+                " lease_expires_at REAL NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, definition in _ADDED_COLUMNS.items():
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, next_attempt_at)")
+
+    @staticmethod
+    def _to_job(row) -> ExportJob:
+        data = dict(zip(_JOB_COLUMNS, row))
+        data["public"] = bool(data["public"])
+        data["optimize"] = bool(data["optimize"])
+        data["derivatives"] = json.loads(data["derivatives"] or "[]")
+        return ExportJob(**data)
+
+    def insert(self, job: ExportJob) -> None:
+        values = asdict(job)
+        values["public"] = int(job.public)
+        values["optimize"] = int(job.optimize)
+        values["derivatives"] = json.dumps(job.derivatives)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(_JOB_COLUMNS)}) VALUES ({', '.join('?' * len(_JOB_COLUMNS))})",
+                [values[column] for column in _JOB_COLUMNS],
+            )
+
+    def get(self, file_id: str) -> Optional[ExportJob]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs WHERE file_id = ?", (file_id,)
+            ).fetchone()
+        return self._to_job(row) if row else None
+
+    def claim_next(self, now: float) -> Optional[ExportJob]:
+        """
+        Lease the oldest due job (queued, or uploading under an expired lease)
+        to this store's owner and return it. One statement, so concurrent
+        claimers in any process serialize on SQLite's write lock.
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                f"UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ?, owner = ?,"
+                f" lease_expires_at = ? WHERE file_id = ("
+                f"  SELECT file_id FROM jobs WHERE (status = ? AND next_attempt_at <= ?)"
+                f"  OR (status = ? AND lease_expires_at < ?) ORDER BY created_at LIMIT 1"
+                f") RETURNING {', '.join(_JOB_COLUMNS)}",
+                (JOB_UPLOADING, time.time(), self.owner, now + self.lease_seconds, JOB_QUEUED, now, JOB_UPLOADING, now),
+            ).fetchone()
+        return self._to_job(row) if row else None
+
+    def renew_leases(self, now: float) -> int:
+        """Extend the leases of every job this owner is uploading."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE status = ? AND owner = ?",
+                (now + self.lease_seconds, JOB_UPLOADING, self.owner),
+            )
+        return cursor.rowcount
+
+    def update(self, file_id: str, **changes) -> None:
+        changes["updated_at"] = time.time()
+        if "public" in changes:
+            changes["public"] = int(changes["public"])
+        if "derivatives" in changes:
+            changes["derivatives"] = json.dumps(changes["derivatives"])
+        assignments = ", ".join(f"{column} = ?" for column in changes)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE file_id = ?", [*changes.values(), file_id])
+
+    def requeue_interrupted(self, now: Optional[float] = None) -> int:
+        """
+        Return jobs left in "uploading" by a crashed process to the queue: those
+        whose lease expired or whose owner no longer runs. Jobs a live worker
+        (in this process or another) is uploading are left alone.
+        """
+        now = time.time() if now is None else now
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT file_id, owner, lease_expires_at FROM jobs WHERE status = ?", (JOB_UPLOADING,)
+            ).fetchall()
+            orphaned = [
+                file_id for file_id, owner, lease_expires_at in rows
+                if lease_expires_at < now or (owner != self.owner and not _owner_alive(owner))
+            ]
+            for file_id in orphaned:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, next_attempt_at = 0, owner = '' WHERE file_id = ? AND status = ?",
+                    (JOB_QUEUED, file_id, JOB_UPLOADING),
+                )
+        return len(orphaned)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (JOB_QUEUED, JOB_UPLOADING)
+            ).fetchone()[0]
+
+    def pending_summary(self) -> tuple[int, Optional[float]]:
+        """Number of queued and uploading jobs, and the creation time of the oldest."""
+        with self._lock:
+            count, oldest = self._conn.execute(
+                "SELECT COUNT(*), MIN(created_at) FROM jobs WHERE status IN (?, ?)", (JOB_QUEUED, JOB_UPLOADING)
+            ).fetchone()
+        return count, oldest
+
+    def next_due_at(self) -> Optional[float]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(next_attempt_at) FROM jobs WHERE status = ?", (JOB_QUEUED,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = self._conn.execute(
+                "SELECT MIN(created_at) FROM jobs WHERE status IN (?, ?)", (JOB_QUEUED, JOB_UPLOADING)
+            ).fetchone()[0]
+            latencies = [
+                row[0] for row in self._conn.execute(
+                    "SELECT upload_seconds FROM jobs WHERE status = ? AND upload_seconds IS NOT NULL"
+                    " ORDER BY updated_at DESC LIMIT ?",
+                    (JOB_UPLOADED, LATENCY_WINDOW),
+                )
+            ]
+        return {"counts": counts, "oldest_created_at": oldest, "latencies": latencies}
+
+
+def _percentile(values: list[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+
+
+class ExportQueue:
+    """
+    Durable queue of ExportJobs drained by a bounded pool of worker threads.
+
+    Args:
+        store: Job persistence (defaults to the SQLite file at EXPORT_QUEUE_PATH).
+        workers: Number of worker threads.
+        max_pending: Queued + in-flight jobs accepted before submit() raises ExportQueueFull.
+        max_attempts: Attempts per job before it is marked failed.
+        backoff_seconds: Base delay for exponential retry backoff.
+    """
+
+    def __init__(
+        self,
+        store: Optional[ExportJobStore] = None,
+        workers: int = EXPORT_QUEUE_WORKERS,
+        max_pending: int = EXPORT_QUEUE_MAX_PENDING,
+        max_attempts: int = EXPORT_QUEUE_MAX_ATTEMPTS,
+        backoff_seconds: float = EXPORT_QUEUE_BACKOFF_SECONDS,
+    ):
+        self.store = store or ExportJobStore()
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self._wakeup = threading.Condition()
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+        # Drive quotas are per service account, so a rate limit pauses every worker.
+        self._paused_until = 0.0
+
+        recovered = self.store.requeue_interrupted()
+        if recovered:
+            logger.info("Re-queued interrupted exports | jobs=%s", recovered)
+        if self.store.pending_count():
+            self._ensure_workers()
+
+    def _ensure_workers(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"export-queue-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            heartbeat = threading.Thread(target=self._heartbeat, name="export-queue-heartbeat", daemon=True)
+            heartbeat.start()
+            self._threads.append(heartbeat)
+
+    def _heartbeat(self) -> None:
+        """Renew this process's leases well before they expire."""
+        while True:
+            time.sleep(max(self.store.lease_seconds / 3, 0.05))
+            try:
+                self.store.renew_leases(time.time())
+            except sqlite3.Error as exc:
+                logger.error("Export queue lease renewal failed | error=%s", exc)
+
+    def _notify(self) -> None:
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def submit(
+        self,
+        image_url: str,
+        filename: str,
+        folder_id: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        optimize: bool = True,
+        derivatives: bool = True,
+        root_folder_id: str = "",
+        source_sha256: str = "",
+    ) -> ExportJob:
+        """
+        Reserve Drive file IDs for the image and each configured derivative and
+        persist the upload job. Returns immediately. root_folder_id names the
+        sharded root when folder_id is one of its sub-folders; source_sha256 the
+        image's bytes in the blob store when the caller already downloaded it.
+
+        Raises:
+            ExportQueueFull: If max_pending jobs are already queued or uploading.
+        """
+        pending = self.store.pending_count()
+        if pending >= self.max_pending:
+            emit_event("export_queue_full", level="warning", depth=pending, max_pending=self.max_pending)
+            raise ExportQueueFull(f"Export queue is full ({pending} pending jobs)")
+
+        job = ExportJob(
+            file_id=reserve_file_id(),
+            image_url=image_url,
+            filename=filename,
+            folder_id=folder_id,
+            chunk_size=chunk_size,
+            optimize=optimize,
+            derivatives=[derivative_link(spec, reserve_file_id()) for spec in configured_specs()] if derivatives else [],
+            root_folder_id=root_folder_id if root_folder_id != folder_id else "",
+            source_sha256=source_sha256,
+        )
+        self.store.insert(job)
+        self._update_metrics()
+        self._ensure_workers()
+        self._notify()
+        emit_event("export_job_queued", file_id=job.file_id, filename=filename, depth=pending + 1)
+        return job
+
+    def status(self, file_id: str) -> Optional[ExportJob]:
+        return self.store.get(file_id)
+
+    def wait(self, file_id: str, timeout: float) -> Optional[ExportJob]:
+        """Block until the job reaches a final state or the timeout expires."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            job = self.status(file_id)
+            if job is None or job.status in {JOB_UPLOADED, JOB_FAILED}:
+                return job
+            time.sleep(0.1)
+        return self.status(file_id)
+
+    def stats(self) -> dict:
+        """
+        Queue metrics: depth (queued + uploading), age of the oldest pending job,
+        upload latency percentiles over recent jobs and job counts by status.
+        """
+        raw = self.store.stats()
+        counts = raw["counts"]
+        latencies = raw["latencies"]
+        oldest = raw["oldest_created_at"]
+        return {
+            "depth": counts.get(JOB_QUEUED, 0) + counts.get(JOB_UPLOADING, 0),
+            "queued": counts.get(JOB_QUEUED, 0),
+            "uploading": counts.get(JOB_UPLOADING, 0),
+            "uploaded": counts.get(JOB_UPLOADED, 0),
+            "failed": counts.get(JOB_FAILED, 0),
+            "oldest_job_age_seconds": round(time.time() - oldest, 1) if oldest else 0.0,
+            "upload_latency_p50_seconds": _percentile(latencies, 0.5),
+            "upload_latency_p95_seconds": _percentile(latencies, 0.95),
+            "paused_for_seconds": round(max(0.0, self._paused_until - time.monotonic()), 1),
+        }
+
+    def _update_metrics(self) -> None:
+        """Set the queue's depth and oldest-job age gauges (monitoring.metrics) from the store."""
+        try:
+            depth, oldest = self.store.pending_summary()
+        except sqlite3.Error as exc:
+            logger.error("Export queue store unavailable | error=%s", exc)
+            return
+        EXPORT_QUEUE_DEPTH.set(depth)
+        EXPORT_QUEUE_OLDEST_JOB_AGE.set(round(time.time() - oldest, 1) if oldest else 0.0)
+
+    def _wait_for_work(self) -> None:
+        # Idle and paused workers keep the oldest job's age current between jobs.
+        self._update_metrics()
+        now = time.time()
+        next_due = self.store.next_due_at()
+        timeout = POLL_INTERVAL_SECONDS
+        if next_due is not None and next_due > now:
+            timeout = min(timeout, next_due - now)
+        timeout = max(timeout, self._paused_until - time.monotonic(), 0.01)
+        with self._wakeup:
+            self._wakeup.wait(timeout)
+
+    def _worker(self) -> None:
+        while True:
+            if time.monotonic() < self._paused_until:
+                self._wait_for_work()
+                continue
+            try:
+                job = self.store.claim_next(time.time())
+            except sqlite3.Error as exc:
+                logger.error("Export queue store unavailable | error=%s", exc)
+                job = None
+            if job is None:
+                self._wait_for_work()
+                continue
+            self._update_metrics()
+            self._process(job)
+            self._update_metrics()
+
+    def _process(self, job: ExportJob) -> None:
+        start = time.monotonic()
+        try:
+            file_info = upload_job(job)
+            public = ensure_public(job.file_id, job.folder_id)
+        except Exception as exc:
+            EXPORT_JOB_SECONDS.observe(time.monotonic() - start, outcome=self._handle_failure(job, exc))
+            return
+
+        duration = round(time.monotonic() - start, 3)
+        EXPORT_JOB_SECONDS.observe(duration, outcome=JOB_UPLOADED)
+        self.store.update(
+            job.file_id,
+            status=JOB_UPLOADED,
+            owner="",
+            filename=file_info.get("name", job.filename),
+            error=None,
+            public=public,
+            upload_seconds=duration,
+            derivatives=job.derivatives,
+            blob_sha256=job.blob_sha256,
+        )
+        emit_event(
+            "export_job_uploaded",
+            file_id=job.file_id,
+            attempts=job.attempts,
+            duration=duration,
+            **self._metric_fields(),
+        )
+
+    def _handle_failure(self, job: ExportJob, exc: Exception) -> str:
+        """Re-queue or fail the job; returns the outcome ("retried" or JOB_FAILED)."""
+        if is_missing_folder(exc, job.folder_id):
+            # The cached shard folder was deleted: resolve it again and retry right away.
+            refreshed = get_folder_resolver().refresh(job.folder_id)
+            if refreshed and refreshed != job.folder_id and job.attempts < self.max_attempts:
+                logger.warning("Export folder is gone; retrying in its replacement | file_id=%s | folder_id=%s",
+                               job.file_id, refreshed)
+                self.store.update(job.file_id, status=JOB_QUEUED, owner="", folder_id=refreshed,
+                                  error=str(exc), next_attempt_at=0)
+                self._notify()
+                return "retried"
+        decision = classify_error(exc)
+        if not decision.retryable or job.attempts >= self.max_attempts:
+            self.store.update(job.file_id, status=JOB_FAILED, owner="", error=str(exc))
+            logger.error("Background export failed | file_id=%s | attempts=%s | error=%s", job.file_id, job.attempts, exc)
+            emit_event(
+                "export_job_failed",
+                level="error",
+                file_id=job.file_id,
+                attempts=job.attempts,
+                retryable=decision.retryable,
+                error=str(exc),
+                **self._metric_fields(),
+            )
+            return JOB_FAILED
+
+        delay = min(self.backoff_seconds * (2 ** (job.attempts - 1)), MAX_BACKOFF_SECONDS)
+        delay = max(delay, decision.retry_after or 0.0) * random.uniform(1.0, 1.25)
+        if decision.rate_limited:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            emit_event("export_queue_rate_limited", level="warning", file_id=job.file_id, pause_seconds=round(delay, 1))
+        self.store.update(job.file_id, status=JOB_QUEUED, owner="", error=str(exc), next_attempt_at=time.time() + delay)
+        logger.warning("Background export retry scheduled | file_id=%s | attempt=%s | delay=%.1fs | error=%s",
+                       job.file_id, job.attempts, delay, exc)
+        return "retried"
+
+    def _metric_fields(self) -> dict:
+        stats = self.stats()
+        return {
+            "queue_depth": stats["depth"],
+            "oldest_job_age_seconds": stats["oldest_job_age_seconds"],
+            "upload_latency_p50_seconds": stats["upload_latency_p50_seconds"],
+            "upload_latency_p95_seconds": stats["upload_latency_p95_seconds"],
+        }
+
+
+_export_queue: ExportQueue | None = None
+_export_queue_lock = threading.Lock()
+
+
+def get_export_queue() -> ExportQueue:
+    """Return the process-wide ExportQueue (resuming any persisted jobs)."""
+    global _export_queue
+    if _export_queue is None:
+        with _export_queue_lock:
+            if _export_queue is None:
+                _export_queue = ExportQueue()
+    return _export_queue
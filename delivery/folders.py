@@ -0,0 +1,293 @@
+"""
+Sharded export folder layout.
+
+Instead of one flat folder, exports are routed into sub-folders rendered from
+EXPORT_FOLDER_LAYOUT (by default year/month/day/theme), which keeps every folder
+small enough for fast listing and parent-scoped queries. For Drive the path is
+resolved to a folder ID by DriveFolderResolver: resolved paths are cached in
+memory and in a small SQLite file, so each folder is looked up with files.list
+at most once, and missing folders are created on demand.
+
+A cached folder can be deleted behind the resolver's back. Drive then answers
+an upload or move into it with 404 "File not found: <folder_id>";
+in_live_folder() recognises that, has the resolver forget the folder's path
+and resolve it again (re-creating what is missing), and retries once in the
+fresh folder.
+
+Concurrent creation is handled at two levels: threads in one process serialise
+on a per-path lock, and after creating a folder the resolver re-lists its
+siblings and converges on the oldest one, removing its own duplicate if another
+process won the race.
+"""
+
+from __future__ import annotations
+
+import datetime
+import logging
+import os
+import re
+import sqlite3
+import threading
+from typing import Callable, Optional, TypeVar
+
+import requests
+from googleapiclient.errors import HttpError
+
+from .dedupe import STATE_DIR
+from .drive_client import get_drive_service
+from .drive_export import PUBLIC_READ_PERMISSION, folder_grants_public_read
+
+logger = logging.getLogger(__name__)
+
+# Placeholders: {year} {month} {day} {theme}. Empty keeps the flat layout.
+EXPORT_FOLDER_LAYOUT = os.getenv("EXPORT_FOLDER_LAYOUT", "{year}/{month}/{day}/{theme}")
+FOLDER_CACHE_PATH = os.getenv("GDRIVE_FOLDER_CACHE_PATH", os.path.join(STATE_DIR, "folders.sqlite3"))
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+MAX_SEGMENT_LENGTH = 60
+
+_UNSAFE_RE = re.compile(r"[^\w-]+", re.UNICODE)
+
+T = TypeVar("T")
+
+
+def slugify(value: str, fallback: str = "untitled") -> str:
+    """Folder-safe slug that keeps non-Latin letters (e.g. Arabic themes)."""
+    slug = _UNSAFE_RE.sub("-", value.strip().lower()).strip("-_")
+    return slug[:MAX_SEGMENT_LENGTH].rstrip("-_") or fallback
+
+
+def shard_path(theme: str = "", when: Optional[datetime.datetime] = None, layout: str = EXPORT_FOLDER_LAYOUT) -> str:
+    """
+    Render the layout for one export, e.g. "2026/10/19/desert-sunset".
+    Returns "" when sharding is disabled.
+    """
+    if not layout:
+        return ""
+    when = when or datetime.datetime.now(datetime.timezone.utc)
+    rendered = layout.format(
+        year=f"{when.year:04d}",
+        month=f"{when.month:02d}",
+        day=f"{when.day:02d}",
+        theme=slugify(theme),
+    )
+    return "/".join(segment for segment in rendered.split("/") if segment)
+
+
+def _escape_query(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("'", "\\'")
+
+
+class FolderCache:
+    """Persistent (root_id, path) -> folder_id map."""
+
+    def __init__(self, path: str = FOLDER_CACHE_PATH):
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS folders (root_id TEXT NOT NULL, path TEXT NOT NULL,"
+                " folder_id TEXT NOT NULL, PRIMARY KEY (root_id, path))"
+            )
+
+    def get(self, root_id: str, path: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT folder_id FROM folders WHERE root_id = ? AND path = ?", (root_id, path)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, root_id: str, path: str, folder_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO folders VALUES (?, ?, ?)", (root_id, path, folder_id))
+
+    def find(self, folder_id: str) -> Optional[tuple[str, str]]:
+        """The (root_id, path) a folder ID is cached under, if any."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT root_id, path FROM folders WHERE folder_id = ? LIMIT 1", (folder_id,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def delete_prefix(self, root_id: str, path: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM folders WHERE root_id = ? AND (path = ? OR path LIKE ?)",
+                (root_id, path, f"{path}/%"),
+            )
+
+
+class DriveFolderResolver:
+    """
+    Resolve "a/b/c" below a root Drive folder to a folder ID, creating missing
+    folders. New folders under a publicly shared parent are shared the same way,
+    so files keep inheriting public read access.
+    """
+
+    def __init__(self, cache: Optional[FolderCache] = None):
+        self.cache = cache or FolderCache()
+        self._memory: dict[tuple[str, str], str] = {}
+        self._locks: dict[tuple[str, str], threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        # Folders found deleted -> the folder their path resolved to afterwards.
+        self._replaced: dict[str, str] = {}
+        self.lookups = 0
+        self.creations = 0
+
+    def _lock_for(self, key: tuple[str, str]) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _cached(self, key: tuple[str, str]) -> Optional[str]:
+        folder_id = self._memory.get(key)
+        if folder_id is None:
+            folder_id = self.cache.get(*key)
+            if folder_id is not None:
+                self._memory[key] = folder_id
+        return folder_id
+
+    def resolve(self, root_id: str, path: str) -> str:
+        """Return the folder ID of path below root_id (root_id itself for "")."""
+        parent_id = root_id
+        walked = []
+        for segment in (s for s in path.split("/") if s):
+            walked.append(segment)
+            key = (root_id, "/".join(walked))
+            folder_id = self._cached(key)
+            if folder_id is None:
+                with self._lock_for(key):
+                    folder_id = self._cached(key)
+                    if folder_id is None:
+                        folder_id = self._find_or_create(parent_id, segment)
+                        self._memory[key] = folder_id
+                        self.cache.put(*key, folder_id)
+            parent_id = folder_id
+        return parent_id
+
+    def invalidate(self, root_id: str, path: str) -> None:
+        """Forget a path and everything below it (e.g. after a folder was deleted)."""
+        for key in [k for k in self._memory if k[0] == root_id and (k[1] == path or k[1].startswith(f"{path}/"))]:
+            self._memory.pop(key, None)
+        self.cache.delete_prefix(root_id, path)
+
+    def replacement(self, folder_id: str) -> str:
+        """The folder that replaced folder_id after it was found deleted (folder_id itself otherwise)."""
+        return self._replaced.get(folder_id, folder_id)
+
+    def refresh(self, folder_id: str) -> Optional[str]:
+        """
+        Resolve again the path a deleted folder was cached under and return the
+        folder it resolves to now, or None when folder_id is not a cached shard.
+        Ancestors may be gone too, so the path is forgotten from its first segment.
+        """
+        if folder_id in self._replaced:
+            return self._replaced[folder_id]
+        key = next((k for k, v in list(self._memory.items()) if v == folder_id), None) or self.cache.find(folder_id)
+        if key is None:
+            return None
+        root_id, path = key
+        self.invalidate(root_id, path.split("/", 1)[0])
+        refreshed = self.resolve(root_id, path)
+        if refreshed != folder_id:
+            self._replaced[folder_id] = refreshed
+        return refreshed
+
+    def _list_children(self, parent_id: str, name: str) -> list[dict]:
+        self.lookups += 1
+        query = (
+            f"name = '{_escape_query(name)}' and '{parent_id}' in parents"
+            f" and mimeType = '{FOLDER_MIME_TYPE}' and trashed = false"
+        )
+        response = get_drive_service().files().list(
+            q=query,
+            fields="files(id, createdTime)",
+            pageSize=10,
+            spaces="drive",
+        ).execute()
+        return sorted(response.get("files", []), key=lambda f: (f.get("createdTime", ""), f["id"]))
+
+    def _find_or_create(self, parent_id: str, name: str) -> str:
+        existing = self._list_children(parent_id, name)
+        if existing:
+            return existing[0]["id"]
+
+        service = get_drive_service()
+        created = service.files().create(
+            body={"name": name, "mimeType": FOLDER_MIME_TYPE, "parents": [parent_id]},
+            fields="id, createdTime",
+        ).execute()
+        self.creations += 1
+
+        # Another process may have created the same folder concurrently; everyone
+        # converges on the oldest one and the losers remove their duplicate.
+        siblings = self._list_children(parent_id, name) or [created]
+        winner = siblings[0]["id"]
+        if winner != created["id"]:
+            logger.info("Folder creation race lost; using existing folder | name=%s | folder_id=%s", name, winner)
+            try:
+                service.files().delete(fileId=created["id"]).execute()
+            except Exception as exc:
+                logger.warning("Could not remove duplicate folder | folder_id=%s | error=%s", created["id"], exc)
+            return winner
+
+        if folder_grants_public_read(parent_id):
+            service.permissions().create(fileId=winner, body=PUBLIC_READ_PERMISSION, fields="id").execute()
+        return winner
+
+
+_resolver: DriveFolderResolver | None = None
+_resolver_lock = threading.Lock()
+
+
+def get_folder_resolver() -> DriveFolderResolver:
+    """Return the process-wide DriveFolderResolver."""
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver = DriveFolderResolver()
+    return _resolver
+
+
+def is_missing_folder(exc: Exception, folder_id: str) -> bool:
+    """Whether a Drive call failed because folder_id no longer exists (404 naming the folder)."""
+    if isinstance(exc, HttpError):
+        status, body = exc.resp.status, (exc.content or b"").decode("utf-8", "replace")
+    elif isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
+        status, body = exc.response.status_code, exc.response.text
+    else:
+        return False
+    return status == 404 and folder_id in body
+
+
+def in_live_folder(folder_id: str, operation: Callable[[str], T]) -> T:
+    """
+    Run operation(folder_id). If Drive reports the folder gone and it is a
+    cached shard, forget it, resolve its path again and retry once there.
+    Folders already found gone are swapped for their replacement up front.
+    """
+    if _resolver is not None:
+        folder_id = _resolver.replacement(folder_id)
+    try:
+        return operation(folder_id)
+    except Exception as exc:
+        if not is_missing_folder(exc, folder_id):
+            raise
+        refreshed = get_folder_resolver().refresh(folder_id)
+        if not refreshed or refreshed == folder_id:
+            raise
+        logger.warning("Cached export folder is gone; retrying in its replacement | folder_id=%s | replacement=%s",
+                       folder_id, refreshed)
+        return operation(refreshed)
+
+
+def resolve_export_folder(root_id: str, theme: str = "", when: Optional[datetime.datetime] = None) -> str:
+    """Drive folder ID an export should be written to under the configured layout."""
+    path = shard_path(theme, when)
+    if not path:
+        return root_id
+    return get_folder_resolver().resolve(root_id, path)
@@ -0,0 +1,204 @@
+"""
+HTTP routes serving delivered images from the local blob store.
+
+agency.create_app() mounts ``router`` on the agency's FastAPI app, so every
+delivered image is also reachable at ``GET /images/<sha256>`` (see
+delivery.blob_store.local_url):
+
+- The SHA-256 is a strong ETag; If-None-Match answers 304 and responses are
+  cacheable forever (blobs are immutable).
+- Single byte ranges (``Range: bytes=a-b``, ``a-`` and ``-n``) answer 206, with
+  If-Range honoured. Multi-range requests get the full body, as RFC 9110 allows.
+- The body is read in chunks in a worker thread. Whole files go through the
+  ASGI ``http.response.pathsend`` extension instead when the server offers it;
+  uvicorn, which serves agency.create_app(), does not, so there every body is
+  read in chunks.
+- The blob lookup (existence, size, MIME sniff) also runs in a worker thread,
+  never on the event loop.
+
+``POST /archives`` takes delivered DeliveryPackages and streams one ZIP of their
+images plus a manifest.json of the packages (see delivery.archive).
+"""
+
+from __future__ import annotations
+
+import datetime
+import re
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+import anyio.to_thread
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.types import Receive, Scope, Send
+
+from workflow.contracts import DeliveryPackage
+
+from .archive import ArchiveEntry, stream_zip, unique_paths
+from .blob_store import get_blob_store, is_sha256
+
+CHUNK_SIZE = 256 * 1024
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+
+router = APIRouter(tags=["delivery"])
+
+
+class RangeNotSatisfiable(Exception):
+    """The requested range lies entirely outside the blob."""
+
+
+def parse_range(header: str, size: int) -> Optional[tuple[int, int]]:
+    """
+    Parse a single-range Range header into (start, end) with end inclusive.
+    Returns None when the header should be ignored (malformed or multi-range).
+
+    Raises:
+        RangeNotSatisfiable: If the range does not overlap the blob.
+    """
+    match = _RANGE_RE.fullmatch(header.replace(" ", ""))
+    if match is None or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """If-None-Match / If-Range comparison (weak comparison, as for If-None-Match)."""
+    if not header:
+        return False
+    candidates = [candidate.strip().removeprefix("W/") for candidate in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+class BlobResponse(Response):
+    """Sends (a range of) a file, through pathsend when the ASGI server supports it."""
+
+    def __init__(self, path: Path, media_type: str, headers: dict, start: int, length: int, status_code: int = 200):
+        super().__init__(status_code=status_code, headers={**headers, "Content-Length": str(length)}, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.length = length
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or self.length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        extensions = scope.get("extensions") or {}
+        if "http.response.pathsend" in extensions and self.status_code == 200:
+            await send({"type": "http.response.pathsend", "path": str(self.path)})
+            return
+
+        file = await anyio.to_thread.run_sync(open, self.path, "rb")
+        try:
+            await anyio.to_thread.run_sync(file.seek, self.start)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await anyio.to_thread.run_sync(file.read, min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise RuntimeError(f"Blob {self.path.name} is shorter than expected")
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        finally:
+            file.close()
+
+
+def _blob_info(sha256: str) -> Optional[tuple[Path, int, str]]:
+    """(path, size, MIME type) of a stored blob, or None. Blocking: filesystem calls."""
+    store = get_blob_store()
+    if not store.exists(sha256):
+        return None
+    path = store.path_for(sha256)
+    try:
+        return path, path.stat().st_size, store.mime_type(sha256)
+    except FileNotFoundError:
+        return None
+
+
+@router.api_route("/images/{sha256}", methods=["GET", "HEAD"])
+async def get_image(sha256: str, request: Request) -> Response:
+    """Serve a delivered image by the SHA-256 of its bytes."""
+    info = await anyio.to_thread.run_sync(_blob_info, sha256) if is_sha256(sha256) else None
+    if info is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    path, size, media_type = info
+    etag = f'"{sha256}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Accept-Ranges": "bytes"}
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            return BlobResponse(path, media_type, headers, start, end - start + 1, status_code=206)
+
+    return BlobResponse(path, media_type, headers, 0, size)
+
+
+class ArchiveRequest(BaseModel):
+    deliveries: list[DeliveryPackage] = Field(..., min_length=1, max_length=500)
+    name: str = Field(default="athar_deliveries", description="Archive filename without extension")
+
+
+def _blob_of(package: DeliveryPackage) -> Optional[str]:
+    """SHA-256 of a package's local copy, taken from its local_url."""
+    if not package.local_url:
+        return None
+    sha256 = package.local_url.rstrip("/").rsplit("/", 1)[-1]
+    return sha256 if get_blob_store().exists(sha256) else None
+
+
+@router.post("/archives")
+def create_archive(request: ArchiveRequest) -> StreamingResponse:
+    """
+    Stream a ZIP of the delivered images (STORED, data descriptors) with a
+    manifest.json of their delivery metadata. Deliveries without a local copy
+    are listed under "missing" in the manifest.
+    """
+    available = [(package, _blob_of(package)) for package in request.deliveries]
+    found = [(package, sha256) for package, sha256 in available if sha256]
+    if not found:
+        raise HTTPException(status_code=404, detail="None of the deliveries has a local copy")
+
+    paths = unique_paths(package.filename for package, _ in found)
+    manifest = {
+        "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "deliveries": [
+            {**package.model_dump(mode="json"), "archive_path": path, "sha256": sha256}
+            for (package, sha256), path in zip(found, paths)
+        ],
+        "missing": [package.model_dump(mode="json") for package, sha256 in available if not sha256],
+    }
+    entries = [ArchiveEntry(path, sha256) for (_, sha256), path in zip(found, paths)]
+    filename = f"{request.name or 'athar_deliveries'}.zip"
+    return StreamingResponse(
+        stream_zip(entries, manifest),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename*=utf-8''{quote(filename)}"},
+    )
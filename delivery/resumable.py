@@ -0,0 +1,430 @@
+"""
+Streaming, resumable Drive uploads.
+
+The image is piped from the source URL straight into a Drive resumable upload
+session in fixed-size chunks, so memory per upload stays bounded to roughly one
+chunk. The session URI and last acknowledged offset are persisted on disk; if the
+process dies mid-upload, the next attempt for the same (url, filename, folder)
+resumes from that offset instead of starting again from zero.
+
+A session's file is removed once the upload completes or fails. Files left by
+a process that died mid-upload are swept once they are older than Drive's
+session lifetime (GDRIVE_UPLOAD_SESSION_SECONDS, one week), when the session
+URI could no longer be resumed anyway.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import tempfile
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator, Optional
+
+import requests
+
+from monitoring.metrics import DRIVE_UPLOAD_SECONDS
+from monitoring.tracing import download_span
+
+from .blob_store import open_local_blob
+from .drive_client import get_drive_factory
+from .drive_export import FILE_FIELDS, mime_type_for
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.getenv("ATHAR_STATE_DIR", ".athar")
+UPLOAD_STATE_DIR = os.getenv("GDRIVE_UPLOAD_STATE_DIR", os.path.join(STATE_DIR, "uploads"))
+# Drive resumable session URIs expire after a week.
+UPLOAD_SESSION_SECONDS = float(os.getenv("GDRIVE_UPLOAD_SESSION_SECONDS", str(7 * 24 * 3600)))
+# How often starting a session also sweeps expired session files (per process).
+UPLOAD_SWEEP_INTERVAL_SECONDS = 3600
+
+# Drive requires every non-final chunk to be a multiple of 256 KiB.
+CHUNK_GRANULARITY = 256 * 1024
+DEFAULT_CHUNK_SIZE = int(os.getenv("GDRIVE_UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+DOWNLOAD_READ_SIZE = 64 * 1024
+MAX_CHUNK_RETRIES = 5
+
+_RANGE_RE = re.compile(r"bytes=0-(\d+)")
+
+
+class ResumableUploadError(RuntimeError):
+    """Raised when a resumable upload cannot be completed."""
+
+
+def normalize_chunk_size(chunk_size: int) -> int:
+    """
+    Round a chunk size down to Drive's 256 KiB granularity (minimum one unit).
+    """
+    return max(CHUNK_GRANULARITY, (chunk_size // CHUNK_GRANULARITY) * CHUNK_GRANULARITY)
+
+
+@dataclass
+class UploadSession:
+    """Persisted state of one resumable upload."""
+
+    key: str
+    session_uri: str
+    offset: int = 0
+
+
+class ResumableSessionStore:
+    """
+    Persists resumable session URIs and acknowledged offsets as small JSON files.
+    """
+
+    def __init__(self, directory: str = UPLOAD_STATE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(image_url: str, filename: str, folder_id: str) -> str:
+        return hashlib.sha256(f"{image_url}\n{filename}\n{folder_id}".encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key: str) -> Optional[UploadSession]:
+        try:
+            with open(self._path(key), "r") as handle:
+                data = json.load(handle)
+        except (OSError, json.JSONDecodeError):
+            return None
+        return UploadSession(key=key, session_uri=data["session_uri"], offset=int(data.get("offset", 0)))
+
+    def save(self, session: UploadSession) -> None:
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = self._path(session.key) + ".tmp"
+            with open(tmp_path, "w") as handle:
+                json.dump({"session_uri": session.session_uri, "offset": session.offset, "updated_at": time.time()}, handle)
+            os.replace(tmp_path, self._path(session.key))
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def sweep(self, max_age: float = UPLOAD_SESSION_SECONDS) -> int:
+        """
+        Remove session files (and interrupted writes) not updated for max_age
+        seconds. Returns how many were removed.
+        """
+        cutoff = time.time() - max_age
+        removed = 0
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return 0
+        for name in names:
+            if not name.endswith((".json", ".json.tmp")):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
+
+
+_sweep_lock = threading.Lock()
+_last_sweep = 0.0
+
+
+def _sweep_if_due(store: ResumableSessionStore) -> None:
+    """Sweep the store's expired session files at most once per UPLOAD_SWEEP_INTERVAL_SECONDS."""
+    global _last_sweep
+    with _sweep_lock:
+        now = time.monotonic()
+        if _last_sweep and now - _last_sweep < UPLOAD_SWEEP_INTERVAL_SECONDS:
+            return
+        _last_sweep = now
+    try:
+        removed = store.sweep()
+    except OSError as exc:
+        logger.warning("Failed to sweep resumable session files | directory=%s | error=%s", store.directory, exc)
+        return
+    if removed:
+        logger.info("Swept expired resumable session files | directory=%s | removed=%s", store.directory, removed)
+
+
+class StreamingDriveUpload:
+    """
+    Pipe an image URL into a Drive resumable upload.
+
+    Args:
+        image_url: Source URL (e.g. the KIE CDN link).
+        filename: Name of the Drive file.
+        folder_id: Target folder.
+        chunk_size: Bytes per upload chunk (rounded to 256 KiB multiples).
+        store: Where session state is persisted.
+        download_timeout: Timeout for the source download.
+        app_properties: Drive appProperties to stamp on the file.
+        source_file: Already downloaded content (e.g. from download_to_spool) to
+            upload instead of streaming from image_url.
+        file_id: Pre-allocated Drive file ID (from files.generateIds) to create
+            the file under.
+    """
+
+    def __init__(
+        self,
+        image_url: str,
+        filename: str,
+        folder_id: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        store: Optional[ResumableSessionStore] = None,
+        download_timeout: int = 60,
+        app_properties: Optional[dict] = None,
+        source_file: Optional[BinaryIO] = None,
+        file_id: Optional[str] = None,
+    ):
+        self.image_url = image_url
+        self.filename = filename
+        self.folder_id = folder_id
+        self.chunk_size = normalize_chunk_size(chunk_size)
+        self.store = store or ResumableSessionStore()
+        self.download_timeout = download_timeout
+        self.app_properties = app_properties or {}
+        self.source_file = source_file
+        self.file_id = file_id
+        self.key = ResumableSessionStore.key_for(image_url, filename, folder_id)
+        self.mime_type = mime_type_for(filename)
+        self.bytes_sent = 0
+        self.resumed_from = 0
+
+    # -- Drive session handling ---------------------------------------------------
+
+    def _session(self) -> requests.Session:
+        return get_drive_factory().get_authorized_session()
+
+    def _start_session(self) -> UploadSession:
+        _sweep_if_due(self.store)
+        factory = get_drive_factory()
+        metadata = {"name": self.filename, "parents": [self.folder_id], "mimeType": self.mime_type}
+        if self.app_properties:
+            metadata["appProperties"] = self.app_properties
+        if self.file_id:
+            metadata["id"] = self.file_id
+        response = self._session().post(
+            f"{factory.upload_root}upload/drive/v3/files",
+            params={"uploadType": "resumable", "fields": FILE_FIELDS},
+            json=metadata,
+            headers={"X-Upload-Content-Type": self.mime_type},
+            timeout=self.download_timeout,
+        )
+        response.raise_for_status()
+        session_uri = response.headers.get("Location")
+        if not session_uri:
+            raise ResumableUploadError("Drive did not return a resumable session URI")
+        session = UploadSession(key=self.key, session_uri=session_uri)
+        self.store.save(session)
+        return session
+
+    def _query_offset(self, session: UploadSession) -> tuple[Optional[int], Optional[dict]]:
+        """
+        Ask Drive how much of the session it has persisted.
+        Returns (offset, None) for an open session, (None, file) if it already
+        completed, and (None, None) if the session expired.
+        """
+        response = self._session().put(
+            session.session_uri,
+            headers={"Content-Range": "bytes */*", "Content-Length": "0"},
+            timeout=self.download_timeout,
+        )
+        if response.status_code in (200, 201):
+            return None, response.json()
+        if response.status_code == 308:
+            return _acknowledged_offset(response), None
+        return None, None
+
+    def _put_chunk(self, session: UploadSession, data: bytes, total: Optional[int]) -> tuple[int, Optional[dict]]:
+        """
+        Send one chunk starting at session.offset. Returns the new acknowledged
+        offset and, for the final chunk, the created file resource.
+        """
+        total_label = str(total) if total is not None else "*"
+        if data:
+            content_range = f"bytes {session.offset}-{session.offset + len(data) - 1}/{total_label}"
+        else:
+            content_range = f"bytes */{total_label}"
+
+        response = self._session().put(
+            session.session_uri,
+            data=data,
+            headers={"Content-Range": content_range, "Content-Length": str(len(data))},
+            timeout=self.download_timeout,
+        )
+        if response.status_code in (200, 201):
+            return session.offset + len(data), response.json()
+        if response.status_code == 308:
+            return _acknowledged_offset(response), None
+        response.raise_for_status()
+        raise ResumableUploadError(f"Unexpected status {response.status_code} from resumable upload")
+
+    # -- Source streaming ------------------------------------------------------------
+
+    def _open_source(self, offset: int) -> Iterator[bytes]:
+        if self.source_file is not None:
+            self.source_file.seek(offset)
+            while True:
+                piece = self.source_file.read(DOWNLOAD_READ_SIZE)
+                if not piece:
+                    return
+                yield piece
+
+        local = open_local_blob(self.image_url)
+        if local is not None:
+            with local:
+                local.seek(offset)
+                while piece := local.read(DOWNLOAD_READ_SIZE):
+                    yield piece
+            return
+
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        response = requests.get(self.image_url, stream=True, timeout=self.download_timeout, headers=headers)
+        response.raise_for_status()
+        content_type = response.headers.get("content-type", "")
+        if not content_type.startswith("image/"):
+            logger.warning("Unexpected Content-Type while streaming | url=%s | type=%s", self.image_url, content_type)
+
+        skip = offset if offset and response.status_code != 206 else 0
+        for piece in response.iter_content(chunk_size=DOWNLOAD_READ_SIZE):
+            if skip:
+                if len(piece) <= skip:
+                    skip -= len(piece)
+                    continue
+                piece = piece[skip:]
+                skip = 0
+            yield piece
+
+    # -- Main loop -----------------------------------------------------------------
+
+    @DRIVE_UPLOAD_SECONDS.time(method="resumable")
+    def run(self) -> dict:
+        """
+        Upload the image and return the created Drive file resource. The
+        session file is removed whether the upload completes or fails.
+
+        Raises:
+            ResumableUploadError: If the upload cannot be completed.
+            requests.exceptions.RequestException: On unrecoverable HTTP errors.
+        """
+        try:
+            return self._run()
+        finally:
+            self.store.delete(self.key)
+
+    def _run(self) -> dict:
+        session = self.store.load(self.key)
+        if session is not None:
+            offset, completed = self._query_offset(session)
+            if completed is not None:
+                return completed
+            if offset is None:
+                logger.info("Resumable session expired; starting over | filename=%s", self.filename)
+                session = None
+            else:
+                session.offset = offset
+                self.resumed_from = offset
+                logger.info("Resuming upload | filename=%s | offset=%s", self.filename, offset)
+
+        if session is None:
+            session = self._start_session()
+
+        buffer = bytearray()
+        buffer_start = session.offset
+        retries = 0
+
+        source = self._open_source(session.offset)
+        exhausted = False
+        while True:
+            # Fill the buffer to one chunk (or until the source ends).
+            while not exhausted and len(buffer) < self.chunk_size:
+                piece = next(source, None)
+                if piece is None:
+                    exhausted = True
+                else:
+                    buffer.extend(piece)
+
+            if exhausted:
+                data, total = bytes(buffer), buffer_start + len(buffer)
+            else:
+                data, total = bytes(buffer[:self.chunk_size]), None
+
+            try:
+                acked, completed = self._put_chunk(session, data, total)
+            except requests.exceptions.RequestException as exc:
+                retries += 1
+                if retries > MAX_CHUNK_RETRIES:
+                    raise
+                logger.warning("Chunk upload failed; re-syncing offset | attempt=%s | error=%s", retries, exc)
+                time.sleep(min(2 ** retries, 30))
+                acked, completed = self._query_offset(session)
+                if completed is None and acked is None:
+                    raise ResumableUploadError("Resumable session expired mid-upload") from exc
+                if completed is None:
+                    acked = max(acked, buffer_start)
+            else:
+                retries = 0
+
+            if completed is not None:
+                self.bytes_sent += len(data)
+                return completed
+
+            # Drop acknowledged bytes; keep any unacknowledged tail for the next PUT.
+            consumed = acked - buffer_start
+            if consumed < 0 or consumed > len(buffer):
+                raise ResumableUploadError(f"Drive acknowledged unexpected offset {acked}")
+            del buffer[:consumed]
+            self.bytes_sent += consumed
+            buffer_start = acked
+            session.offset = acked
+            self.store.save(session)
+
+
+def download_to_spool(image_url: str, timeout: int = 60, max_memory: int = DEFAULT_CHUNK_SIZE) -> tuple[BinaryIO, str, int]:
+    """
+    Stream a download into a spooled temporary file while hashing it. Content up
+    to max_memory stays in memory; anything larger spills to disk.
+
+    Returns:
+        (file positioned at 0, sha256 hex digest, size in bytes)
+    """
+    with download_span(image_url) as current:
+        local = open_local_blob(image_url)
+        current.set_attribute("download.local", local is not None)
+        if local is not None:
+            with local:
+                spooled = _spool(iter(lambda: local.read(DOWNLOAD_READ_SIZE), b""), max_memory)
+        else:
+            response = requests.get(image_url, stream=True, timeout=timeout)
+            response.raise_for_status()
+            spooled = _spool(response.iter_content(chunk_size=DOWNLOAD_READ_SIZE), max_memory)
+        current.set_attribute("download.bytes", spooled[2])
+        return spooled
+
+
+def _spool(pieces: Iterator[bytes], max_memory: int) -> tuple[BinaryIO, str, int]:
+    spool = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    digest = hashlib.sha256()
+    size = 0
+    for piece in pieces:
+        digest.update(piece)
+        spool.write(piece)
+        size += len(piece)
+    spool.seek(0)
+    return spool, digest.hexdigest(), size
+
+
+def _acknowledged_offset(response: requests.Response) -> int:
+    """Parse the Range header of a 308 response into the next byte offset."""
+    match = _RANGE_RE.match(response.headers.get("Range", ""))
+    return int(match.group(1)) + 1 if match else 0
@@ -0,0 +1,207 @@
+"""
+Minimal S3-compatible object client (AWS S3, MinIO, R2, ...).
+
+Only the calls the export path needs are implemented: PUT, server-side COPY,
+DELETE, HEAD and presigned GET URLs, signed with AWS Signature Version 4 over plain ``requests`` so no SDK
+is required. Requests use path-style addressing, which every S3-compatible
+server accepts.
+"""
+
+from __future__ import annotations
+
+import datetime
+import hashlib
+import hmac
+import os
+import threading
+from typing import Optional
+from urllib.parse import quote, urlsplit
+
+import requests
+
+from monitoring.tracing import TracedSession
+
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "")
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID", "")
+S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY", "")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_PUBLIC_BASE_URL = os.getenv("S3_PUBLIC_BASE_URL", "")
+# SigV4 presigned URLs are valid for at most 7 days.
+S3_PRESIGN_SECONDS = min(int(os.getenv("S3_PRESIGN_SECONDS", "604800")), 604800)
+
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+
+
+class S3Error(RuntimeError):
+    """Raised when an S3 request fails or the client is misconfigured."""
+
+
+def _sign(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+
+def _quote_path(path: str) -> str:
+    return quote(path, safe="/-_.~")
+
+
+def _canonical_query(params: dict) -> str:
+    return "&".join(
+        f"{quote(str(k), safe='-_.~')}={quote(str(v), safe='-_.~')}" for k, v in sorted(params.items())
+    )
+
+
+class S3Client:
+    """
+    SigV4-signing client for one bucket.
+
+    Args:
+        endpoint_url: Service endpoint, e.g. "https://s3.eu-west-1.amazonaws.com" or "http://127.0.0.1:9000".
+        bucket: Bucket name.
+        access_key_id / secret_access_key: Credentials.
+        region: Signing region.
+        public_base_url: If set, objects are assumed publicly readable under this
+            base and download URLs are not presigned.
+    """
+
+    def __init__(
+        self,
+        endpoint_url: str = S3_ENDPOINT_URL,
+        bucket: str = S3_BUCKET,
+        access_key_id: str = S3_ACCESS_KEY_ID,
+        secret_access_key: str = S3_SECRET_ACCESS_KEY,
+        region: str = S3_REGION,
+        public_base_url: str = S3_PUBLIC_BASE_URL,
+        timeout: int = 60,
+    ):
+        if not endpoint_url or not bucket:
+            raise S3Error("S3_ENDPOINT_URL and S3_BUCKET must be set for the s3 backend")
+        if not access_key_id or not secret_access_key:
+            raise S3Error("S3_ACCESS_KEY_ID and S3_SECRET_ACCESS_KEY must be set for the s3 backend")
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.host = urlsplit(self.endpoint_url).netloc
+        self.bucket = bucket
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.region = region
+        self.public_base_url = public_base_url.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    # -- signing ------------------------------------------------------------------
+
+    def _signing_key(self, date_stamp: str) -> bytes:
+        key = _sign(f"AWS4{self.secret_access_key}".encode(), date_stamp)
+        for part in (self.region, "s3", "aws4_request"):
+            key = _sign(key, part)
+        return key
+
+    def _object_path(self, key: str) -> str:
+        return _quote_path(f"/{self.bucket}/{key}")
+
+    def _signed_headers(self, method: str, key: str, payload_hash: str, extra: dict, now: datetime.datetime) -> dict:
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        date_stamp = now.strftime("%Y%m%d")
+        headers = {"host": self.host, "x-amz-content-sha256": payload_hash, "x-amz-date": amz_date}
+        headers.update({k.lower(): str(v).strip() for k, v in extra.items()})
+        signed = ";".join(sorted(headers))
+        canonical_headers = "".join(f"{k}:{headers[k]}\n" for k in sorted(headers))
+        canonical_request = "\n".join([method, self._object_path(key), "", canonical_headers, signed, payload_hash])
+        scope = f"{date_stamp}/{self.region}/s3/aws4_request"
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()
+        ])
+        signature = hmac.new(self._signing_key(date_stamp), string_to_sign.encode(), hashlib.sha256).hexdigest()
+        headers["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key_id}/{scope}, SignedHeaders={signed}, Signature={signature}"
+        )
+        del headers["host"]
+        return headers
+
+    def _session(self) -> requests.Session:
+        # One keep-alive session per thread.
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = TracedSession()
+        return session
+
+    # -- operations ---------------------------------------------------------------
+
+    def object_url(self, key: str) -> str:
+        return f"{self.endpoint_url}{self._object_path(key)}"
+
+    def put_object(self, key: str, data: bytes, content_type: str, metadata: Optional[dict] = None) -> str:
+        """Upload one object; returns its ETag."""
+        extra = {"content-type": content_type}
+        for name, value in (metadata or {}).items():
+            extra[f"x-amz-meta-{name.lower()}"] = value
+        headers = self._signed_headers(
+            "PUT", key, hashlib.sha256(data).hexdigest(), extra, datetime.datetime.now(datetime.timezone.utc)
+        )
+        response = self._session().put(self.object_url(key), data=data, headers=headers, timeout=self.timeout)
+        if response.status_code >= 300:
+            raise S3Error(f"PUT {key} failed with {response.status_code}: {response.text[:200]}")
+        return response.headers.get("ETag", "").strip('"')
+
+    def copy_object(
+        self, source_key: str, key: str, content_type: str = "", metadata: Optional[dict] = None
+    ) -> None:
+        """
+        Server-side copy within the bucket. Content type and metadata are kept,
+        unless metadata is given, which replaces both.
+        """
+        extra = {"x-amz-copy-source": _quote_path(f"/{self.bucket}/{source_key}")}
+        if metadata:
+            extra["x-amz-metadata-directive"] = "REPLACE"
+            extra["content-type"] = content_type
+            for name, value in metadata.items():
+                extra[f"x-amz-meta-{name.lower()}"] = value
+        headers = self._signed_headers("PUT", key, EMPTY_SHA256, extra, datetime.datetime.now(datetime.timezone.utc))
+        response = self._session().put(self.object_url(key), headers=headers, timeout=self.timeout)
+        # A copy can fail after the 200 status line went out; S3 then sends an Error document.
+        if response.status_code >= 300 or "<Error>" in response.text:
+            raise S3Error(f"COPY {source_key} -> {key} failed with {response.status_code}: {response.text[:200]}")
+
+    def delete_object(self, key: str) -> None:
+        """Delete one object (deleting a missing key succeeds, as on S3)."""
+        headers = self._signed_headers("DELETE", key, EMPTY_SHA256, {}, datetime.datetime.now(datetime.timezone.utc))
+        response = self._session().delete(self.object_url(key), headers=headers, timeout=self.timeout)
+        if response.status_code >= 300:
+            raise S3Error(f"DELETE {key} failed with {response.status_code}: {response.text[:200]}")
+
+    def head_object(self, key: str) -> Optional[dict]:
+        """Return the object's headers, or None if it does not exist."""
+        headers = self._signed_headers("HEAD", key, EMPTY_SHA256, {}, datetime.datetime.now(datetime.timezone.utc))
+        response = self._session().head(self.object_url(key), headers=headers, timeout=self.timeout)
+        if response.status_code == 404:
+            return None
+        if response.status_code >= 300:
+            raise S3Error(f"HEAD {key} failed with {response.status_code}")
+        return dict(response.headers)
+
+    def presigned_get_url(self, key: str, expires_in: int = S3_PRESIGN_SECONDS) -> str:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        date_stamp = now.strftime("%Y%m%d")
+        scope = f"{date_stamp}/{self.region}/s3/aws4_request"
+        params = {
+            "X-Amz-Algorithm": "AWS4-HMAC-SHA256",
+            "X-Amz-Credential": f"{self.access_key_id}/{scope}",
+            "X-Amz-Date": amz_date,
+            "X-Amz-Expires": str(expires_in),
+            "X-Amz-SignedHeaders": "host",
+        }
+        query = _canonical_query(params)
+        canonical_request = "\n".join(
+            ["GET", self._object_path(key), query, f"host:{self.host}\n", "host", "UNSIGNED-PAYLOAD"]
+        )
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()
+        ])
+        signature = hmac.new(self._signing_key(date_stamp), string_to_sign.encode(), hashlib.sha256).hexdigest()
+        return f"{self.object_url(key)}?{query}&X-Amz-Signature={signature}"
+
+    def download_url(self, key: str) -> str:
+        if self.public_base_url:
+            return f"{self.public_base_url}/{_quote_path(key)}"
+        return self.presigned_get_url(key)
@@ -0,0 +1,533 @@
+"""
+Speculative export: upload while QA is still looking at the image.
+
+Most images pass QA, yet the export (download, derivatives, format
+optimization, upload) only started once QA had finished. With speculation on,
+ValidateImageTool starts a SpeculativeExport as soon as it has the image URL:
+a background worker runs the export pipeline into a staging container
+(EXPORT_STAGING_PATH below the export target) while the checks run. Staged
+objects are never published.
+
+- QA passes: the export tool claims the speculation and commits it, moving the
+  staged master and derivatives into their final container under their final
+  names (a metadata call on Drive, a rename locally, copy + delete on S3),
+  recording them for dedupe and publishing them. If the commit arrives before
+  staging has uploaded anything, staging uploads straight into place instead.
+- QA asks for a retry or fails: the speculation is discarded and its staged
+  objects deleted in the background; their bytes are counted as wasted.
+
+The download starts at once and QA validates the bytes it fetched, so the
+image is downloaded once. Building derivatives and optimizing the master are
+CPU-bound and compete with QA's checks for cores: on a single core
+(EXPORT_SPECULATIVE_OVERLAP, "auto" by default) they, and the upload, wait
+for QA to accept the image (or for the commit), and then overlap the handoff
+to the Export Agent instead of slowing QA down. A discarded image then costs
+one download and no upload at all.
+
+Staging uses the default export options (dedupe, optimization, derivatives)
+and EXPORT_BACKEND; an export asking for something else discards the
+speculation and exports normally, as does a commit that fails.
+
+A reaper thread discards speculations nobody claims within
+EXPORT_SPECULATIVE_TTL_SECONDS, every EXPORT_SPECULATIVE_SWEEP_SECONDS. Every
+staged object is also recorded in a SQLite ledger until it is moved or
+deleted; objects still listed after twice the TTL (their process died, or
+their delete failed) are deleted by the next sweep of any process.
+speculation_stats() reports the commit rate, the export time hidden behind QA
+and the upload bytes wasted on discarded images.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from monitoring import emit_event
+
+from .blob_store import keep_local_copy
+from .dedupe import STATE_DIR, get_content_index, hash_properties, sha256_hex
+from .derivatives import Derivative
+from .drive_export import download_image
+from .storage import (
+    BackendExport,
+    StorageBackend,
+    StoredObject,
+    container_key,
+    find_duplicate,
+    get_backend,
+    prepare_upload,
+    put_derivatives,
+    store_prepared,
+    stored_derivative_link,
+)
+
+logger = logging.getLogger(__name__)
+
+EXPORT_SPECULATIVE = os.getenv("EXPORT_SPECULATIVE", "").lower() in {"1", "true", "yes"}
+EXPORT_STAGING_PATH = os.getenv("EXPORT_STAGING_PATH", "_staging")
+EXPORT_SPECULATIVE_WORKERS = int(os.getenv("EXPORT_SPECULATIVE_WORKERS", "2"))
+EXPORT_SPECULATIVE_TTL_SECONDS = float(os.getenv("EXPORT_SPECULATIVE_TTL_SECONDS", "900"))
+EXPORT_SPECULATIVE_SWEEP_SECONDS = float(os.getenv("EXPORT_SPECULATIVE_SWEEP_SECONDS", "60"))
+EXPORT_STAGING_LEDGER_PATH = os.getenv("EXPORT_STAGING_LEDGER_PATH", os.path.join(STATE_DIR, "staging.sqlite3"))
+# Whether staging's CPU work runs alongside QA's checks ("auto": with more than one core).
+_OVERLAP = os.getenv("EXPORT_SPECULATIVE_OVERLAP", "auto").lower()
+EXPORT_SPECULATIVE_OVERLAP = (os.cpu_count() or 1) > 1 if _OVERLAP == "auto" else _OVERLAP in {"1", "true", "yes"}
+
+# The final filename is only known at commit; staging names the image this way
+# and commit() carries the optimized format's extension over.
+STAGING_FILENAME = "image.png"
+
+
+def _upload_name(filename: str, prepared_name: str) -> str:
+    """filename with the extension prepare_upload() gave the staged master."""
+    if prepared_name == STAGING_FILENAME:
+        return filename
+    stem = filename.rsplit(".", 1)[0] if "." in filename else filename
+    return stem + os.path.splitext(prepared_name)[1]
+
+
+class SpeculationUnavailable(RuntimeError):
+    """Raised by commit() when the staged export cannot become the delivery."""
+
+
+@dataclass
+class StagedExport:
+    """What a speculation left in the staging container (or exported, when the commit was already waiting)."""
+
+    sha256: str
+    container: str
+    location: str
+    data: bytes = b""
+    upload_name: str = ""
+    master: Optional[StoredObject] = None
+    derivatives: list[tuple[Derivative, StoredObject]] = field(default_factory=list)
+    duplicate: bool = False
+    export: Optional[BackendExport] = None
+    seconds: float = 0.0
+
+    @property
+    def bytes_staged(self) -> int:
+        return sum(obj.size for obj in self.objects)
+
+    @property
+    def objects(self) -> list[StoredObject]:
+        return [obj for obj in (self.master, *(obj for _, obj in self.derivatives)) if obj is not None]
+
+
+class SpeculationStats:
+    """Process-wide counters of speculative exports."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = 0
+        self.committed = 0
+        self.discarded = 0
+        self.failed = 0
+        self.bytes_staged = 0
+        self.bytes_wasted = 0
+        self.seconds_hidden = 0.0
+
+    def record(self, **deltas) -> dict:
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+            return self._snapshot()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return self._snapshot()
+
+    def _snapshot(self) -> dict:
+        settled = self.committed + self.discarded + self.failed
+        return {
+            "started": self.started,
+            "committed": self.committed,
+            "discarded": self.discarded,
+            "failed": self.failed,
+            "success_rate": round(self.committed / settled, 3) if settled else None,
+            "bytes_staged": self.bytes_staged,
+            "bytes_wasted": self.bytes_wasted,
+            "seconds_hidden": round(self.seconds_hidden, 3),
+        }
+
+
+_stats = SpeculationStats()
+
+
+def speculation_stats() -> dict:
+    """Outcomes of speculative exports in this process."""
+    return _stats.snapshot()
+
+
+class StagingLedger:
+    """SQLite record of the objects in staging, so uploads nobody settled can be deleted later."""
+
+    def __init__(self, path: str = EXPORT_STAGING_LEDGER_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS staged (backend TEXT NOT NULL, object_id TEXT NOT NULL,"
+                " name TEXT NOT NULL, staged_at REAL NOT NULL, PRIMARY KEY (backend, object_id))"
+            )
+
+    def add(self, objects: Iterable[StoredObject], staged_at: Optional[float] = None) -> None:
+        rows = [(obj.backend, obj.object_id, obj.name, staged_at or time.time()) for obj in objects]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO staged VALUES (?, ?, ?, ?)", rows)
+
+    def remove(self, objects: Iterable[StoredObject]) -> None:
+        rows = [(obj.backend, obj.object_id) for obj in objects]
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM staged WHERE backend = ? AND object_id = ?", rows)
+
+    def staged_before(self, cutoff: float) -> list[tuple[str, str, str]]:
+        """(backend, object_id, name) of the objects staged before cutoff (epoch seconds)."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT backend, object_id, name FROM staged WHERE staged_at < ? ORDER BY staged_at", (cutoff,)
+            ).fetchall()
+
+
+_ledger: Optional[StagingLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_staging_ledger() -> StagingLedger:
+    global _ledger
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                _ledger = StagingLedger()
+    return _ledger
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=EXPORT_SPECULATIVE_WORKERS, thread_name_prefix="export-speculative"
+                )
+    return _executor
+
+
+class SpeculativeExport:
+    """
+    One image exported to staging ahead of its QA verdict.
+
+    Args:
+        backend: Backend the image is staged on (and later committed to).
+        image_url: Source of the image.
+        target: Export root container; empty uses the backend's default.
+        overlap: Stage (optimize and upload) while QA runs, rather than once
+            QA accepts the image.
+    """
+
+    def __init__(self, backend: StorageBackend, image_url: str, target: str = "", overlap: bool = EXPORT_SPECULATIVE_OVERLAP):
+        self.backend = backend
+        self.image_url = image_url
+        self.target = target or backend.default_target()
+        self.overlap = overlap
+        self.started_at = time.monotonic()
+        self._context: Optional[contextvars.Context] = None
+        self._download: Optional[Future] = None
+        self._future: Optional[Future] = None
+        # (filename, shard) once commit() is waiting for staging.
+        self._destination: Optional[tuple[str, str]] = None
+        self._lock = threading.Lock()
+        self._discarded = threading.Event()
+
+    def matches(self, backend: str, target: str) -> bool:
+        """Whether an export to backend / target (empty: the default) can commit this speculation."""
+        return backend == self.backend.name and (target or self.backend.default_target()) == self.target
+
+    def start(self) -> "SpeculativeExport":
+        _stats.record(started=1)
+        # Staging runs in the request's trace, below the span that started it.
+        self._context = contextvars.copy_context()
+        self._download = _get_executor().submit(self._context.copy().run, self._fetch)
+        if self.overlap:
+            self._schedule()
+        return self
+
+    def image_bytes(self) -> bytes:
+        """
+        The image as downloaded for staging (waits for the download).
+
+        Raises:
+            Exception: Whatever the download raised.
+        """
+        return self._download.result()[0]
+
+    def accept(self) -> None:
+        """QA accepted the image: stage it now if staging was waiting for the verdict."""
+        self._schedule()
+
+    def _schedule(self) -> Optional[Future]:
+        """The staging future, submitted on first use; None once discarded."""
+        with self._lock:
+            if self._future is None and not self._discarded.is_set():
+                self._future = _get_executor().submit(self._context.copy().run, self._stage)
+            return self._future
+
+    def _fetch(self) -> tuple[bytes, str, float]:
+        start = time.perf_counter()
+        image_bytes = download_image(self.image_url)
+        sha256 = sha256_hex(image_bytes)
+        get_content_index().record_source(self.image_url, sha256, len(image_bytes))
+        return image_bytes, sha256, time.perf_counter() - start
+
+    def _stage(self) -> StagedExport:
+        start = time.perf_counter()
+        # Submitted after the download, which a worker has therefore already picked up.
+        image_bytes, sha256, download_seconds = self._download.result()
+        container = container_key(self.backend, self.target)
+        location = self.backend.shard_target(self.target, EXPORT_STAGING_PATH)
+        staged = StagedExport(sha256=sha256, container=container, location=location)
+        if get_content_index().lookup(sha256, container) is not None:
+            # Already delivered once; commit() answers with the earlier export.
+            staged.duplicate, staged.data = True, image_bytes
+        elif not self._discarded.is_set():
+            data, upload_name, batch = prepare_upload(image_bytes, STAGING_FILENAME)
+            with self._lock:
+                destination = self._destination
+            if destination is not None:
+                # The export is already waiting: upload straight into place, with no staging and no moves.
+                filename, shard = destination
+                staged.export = store_prepared(
+                    self.backend, sha256, data, _upload_name(filename, upload_name), batch, filename, self.target, shard
+                )
+            # Nothing is uploaded when QA asked for a retry in the meantime.
+            elif not self._discarded.is_set():
+                # A unique prefix keeps concurrent speculations apart in the shared staging container.
+                prefix = f"{uuid.uuid4().hex[:12]}-"
+                staged.data, staged.upload_name = data, upload_name
+                # The hash stamp is added on commit, so dedupe queries never match a staged file.
+                staged.master = self.backend.put(data, prefix + upload_name, location)
+                get_staging_ledger().add([staged.master])
+                staged.derivatives = put_derivatives(self.backend, batch, STAGING_FILENAME, location, sha256, prefix)
+                get_staging_ledger().add(obj for _, obj in staged.derivatives)
+        staged.seconds = download_seconds + time.perf_counter() - start
+        _stats.record(bytes_staged=staged.bytes_staged)
+        return staged
+
+    def commit(self, filename: str, shard: str = "") -> BackendExport:
+        """
+        Wait for staging, then move the staged objects into the shard sub-path of
+        the target, renamed after filename, record them and publish them. If
+        staging had not uploaded yet, it uploads into place directly instead.
+
+        Raises:
+            SpeculationUnavailable: If staging or the move failed; the staged
+                objects are cleaned up and the caller exports normally.
+        """
+        wait_started = time.perf_counter()
+        with self._lock:
+            self._destination = (filename, shard)
+        future = self._schedule()
+        if future is None:
+            raise SpeculationUnavailable("The speculation was discarded")
+        try:
+            staged = future.result()
+        except Exception as exc:
+            self._settle("failed", error=str(exc))
+            raise SpeculationUnavailable(f"Staging failed: {exc}") from exc
+        # Whatever staging time the caller did not spend waiting here ran alongside QA.
+        hidden = max(0.0, staged.seconds - (time.perf_counter() - wait_started))
+
+        if staged.duplicate:
+            duplicate = find_duplicate(self.backend, staged.sha256, self.target, len(staged.data))
+            if duplicate is None:
+                self._settle("failed", error="dedupe entry disappeared")
+                raise SpeculationUnavailable("The earlier export of this image is no longer indexed")
+            self._settle("committed", seconds_hidden=hidden)
+            return duplicate
+        if staged.export is not None:
+            self._settle("committed", seconds_hidden=hidden)
+            return staged.export
+
+        if staged.master is None:
+            self._settle("failed", error="nothing staged")
+            raise SpeculationUnavailable("The speculation was discarded before its upload")
+        upload_name = _upload_name(filename, staged.upload_name)
+        destination = self.backend.shard_target(self.target, shard)
+        try:
+            master = self.backend.move(
+                staged.master, staged.location, destination, upload_name, hash_properties(staged.sha256, self.target)
+            )
+        except Exception as exc:
+            self._cleanup(staged)
+            self._settle("failed", bytes_wasted=staged.bytes_staged, error=str(exc))
+            raise SpeculationUnavailable(f"Moving the staged image failed: {exc}") from exc
+        get_staging_ledger().remove([staged.master])
+        moved = []
+        for derivative, obj in staged.derivatives:
+            try:
+                moved_obj = self.backend.move(obj, staged.location, destination, derivative.spec.filename_for(filename))
+            except Exception as exc:
+                logger.warning("Staged derivative move failed | key=%s | error=%s", derivative.spec.key, exc)
+                self._delete(obj)
+                continue
+            get_staging_ledger().remove([obj])
+            moved.append((derivative, moved_obj))
+
+        index = get_content_index()
+        blob_sha256 = keep_local_copy(staged.data)
+        index.record_file(staged.sha256, staged.container, master.object_id, master.name, master.size, blob_sha256)
+        links = [stored_derivative_link(derivative, obj) for derivative, obj in moved]
+        if links:
+            index.record_derivatives(staged.sha256, staged.container, links)
+        self.backend.publish([master, *(obj for _, obj in moved)], destination)
+        self._settle("committed", seconds_hidden=hidden)
+        return BackendExport(
+            stored=master,
+            bytes_uploaded=master.size + sum(obj.size for _, obj in moved),
+            derivatives=links,
+            blob_sha256=blob_sha256,
+        )
+
+    def discard(self) -> None:
+        """Drop the speculation; staged objects are deleted in the background."""
+        self._discarded.set()
+        with self._lock:
+            future = self._future
+        if future is None:
+            # Staging was waiting for the verdict: only the download ran.
+            self._settle("discarded")
+            return
+        if future.cancel():
+            self._settle("discarded")
+            return
+        # Never block a worker on another worker's staging: queue the cleanup once it is done.
+        future.add_done_callback(lambda _: _get_executor().submit(self._discard_staged))
+
+    def _discard_staged(self) -> None:
+        try:
+            staged = self._future.result()
+        except Exception as exc:
+            self._settle("failed", error=str(exc))
+            return
+        self._cleanup(staged)
+        self._settle("discarded", bytes_wasted=staged.bytes_staged)
+
+    def _cleanup(self, staged: StagedExport) -> None:
+        for obj in staged.objects:
+            self._delete(obj)
+
+    def _delete(self, obj: StoredObject) -> None:
+        try:
+            self.backend.delete(obj)
+        except Exception as exc:
+            # Still in the staging ledger: a later sweep retries it.
+            logger.warning("Staged object left behind | backend=%s | object=%s | error=%s", self.backend.name, obj.object_id, exc)
+            return
+        get_staging_ledger().remove([obj])
+
+    def _settle(self, outcome: str, error: str = "", **deltas) -> None:
+        totals = _stats.record(**{outcome: 1}, **deltas)
+        emit_event(
+            f"export_speculation_{outcome}",
+            level="warning" if outcome == "failed" else "info",
+            backend=self.backend.name,
+            image_url=self.image_url,
+            **({"error": error} if error else {}),
+            **{key: round(value, 3) if isinstance(value, float) else value for key, value in deltas.items()},
+            success_rate=totals["success_rate"],
+            total_bytes_wasted=totals["bytes_wasted"],
+        )
+
+
+_speculations: dict[str, SpeculativeExport] = {}
+_speculations_lock = threading.Lock()
+_reaper: Optional[threading.Thread] = None
+
+
+def speculate(image_url: str, backend: StorageBackend, target: str = "") -> SpeculativeExport:
+    """Start staging image_url (once per URL) and return its speculation."""
+    global _reaper
+    with _speculations_lock:
+        if _reaper is None:
+            _reaper = threading.Thread(target=_reap_forever, name="export-speculative-reaper", daemon=True)
+            _reaper.start()
+        speculation = _speculations.get(image_url)
+        if speculation is None:
+            speculation = _speculations[image_url] = SpeculativeExport(backend, image_url, target).start()
+    return speculation
+
+
+def claim_speculation(image_url: str) -> Optional[SpeculativeExport]:
+    """Take the pending speculation for image_url, if any; the caller commits or discards it."""
+    with _speculations_lock:
+        return _speculations.pop(image_url, None)
+
+
+def accept_speculation(image_url: str) -> None:
+    """QA accepted image_url: let its pending speculation stage the export."""
+    with _speculations_lock:
+        speculation = _speculations.get(image_url)
+    if speculation is not None:
+        speculation.accept()
+
+
+def discard_speculation(image_url: str) -> None:
+    speculation = claim_speculation(image_url)
+    if speculation is not None:
+        speculation.discard()
+
+
+def reap_speculations(ttl_seconds: float = EXPORT_SPECULATIVE_TTL_SECONDS) -> dict:
+    """
+    Discard the speculations nobody claimed within ttl_seconds, and delete the
+    staged objects recorded more than twice that long ago that no process
+    settled. Returns {"expired", "orphans_deleted"}.
+    """
+    now = time.monotonic()
+    with _speculations_lock:
+        expired = [url for url, speculation in _speculations.items() if now - speculation.started_at > ttl_seconds]
+        stale = [_speculations.pop(url) for url in expired]
+    for speculation in stale:
+        speculation.discard()
+
+    ledger = get_staging_ledger()
+    deleted = 0
+    for backend_name, object_id, name in ledger.staged_before(time.time() - 2 * ttl_seconds):
+        try:
+            backend = get_backend(backend_name)
+            obj = backend.describe(object_id, name)
+            backend.delete(obj)
+        except Exception as exc:
+            logger.warning("Orphaned staged object not deleted | backend=%s | object=%s | error=%s", backend_name, object_id, exc)
+            continue
+        ledger.remove([obj])
+        deleted += 1
+    if stale or deleted:
+        emit_event("export_speculation_reaped", expired=len(stale), orphans_deleted=deleted)
+    return {"expired": len(stale), "orphans_deleted": deleted}
+
+
+def _reap_forever() -> None:
+    while True:
+        try:
+            reap_speculations()
+        except Exception as exc:
+            logger.warning("Speculation reaper pass failed | error=%s", exc)
+        time.sleep(EXPORT_SPECULATIVE_SWEEP_SECONDS)
@@ -0,0 +1,533 @@
+"""
+Pluggable export storage backends.
+
+Every backend stores bytes under a name inside an optional target container
+(a Drive folder, a sub-directory, a key prefix) and returns a StoredObject with
+backend-agnostic view and download URLs. Backends addressed by path (local,
+s3) put each object under a directory named after its content hash, so a later
+export with the same filename never overwrites an earlier delivery that the
+content index still points at. export_bytes() runs the shared export
+pipeline on top of any backend: content-hash dedupe, format optimization,
+derivatives and the final upload; find_source_duplicate() answers a repeated
+source URL before it is downloaded again. Stored objects can be moved
+(renamed into another container) and deleted, which delivery.speculative uses
+to commit or discard uploads staged before QA finished.
+
+Backends:
+    gdrive  Google Drive (service account, see delivery.drive_client)
+    local   A directory on the local filesystem (EXPORT_LOCAL_DIR)
+    s3      Any S3-compatible endpoint (see delivery.s3)
+
+The default backend is EXPORT_BACKEND (gdrive unless set); callers may pick
+another per request.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+from googleapiclient.errors import HttpError
+
+from monitoring import emit_event
+
+from .blob_store import keep_local_copy
+from .dedupe import (
+    STATE_DIR,
+    UPLOAD_API_CALLS,
+    ExistingFile,
+    derivative_properties,
+    find_existing,
+    get_content_index,
+    hash_properties,
+    sha256_hex,
+)
+from .derivatives import Derivative, DerivativeBatch, build_derivatives
+from .drive_export import (
+    delete_file,
+    download_image,
+    folder_grants_public_read,
+    grant_public_read,
+    mime_type_for,
+    move_file,
+    upload_bytes,
+)
+from .drive_export import download_url as drive_download_url
+from .drive_export import view_url as drive_view_url
+from .folders import get_folder_resolver
+from .s3 import S3Client, S3Error
+from .transcode import optimize_image
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BACKEND = os.getenv("EXPORT_BACKEND", "gdrive")
+EXPORT_LOCAL_DIR = os.getenv("EXPORT_LOCAL_DIR", os.path.join(STATE_DIR, "exports"))
+EXPORT_LOCAL_BASE_URL = os.getenv("EXPORT_LOCAL_BASE_URL", "")
+EXPORT_S3_PREFIX = os.getenv("EXPORT_S3_PREFIX", "athar/")
+
+_SAFE_SEGMENT_RE = re.compile(r"[^A-Za-z0-9._-]+")
+
+# Hex digits of the content hash naming an object's directory on path-addressed backends.
+CONTENT_KEY_LENGTH = 16
+
+
+def content_segment(sha256: str) -> str:
+    """Directory an object with this content hash is stored under (empty when unknown)."""
+    return sha256[:CONTENT_KEY_LENGTH]
+
+
+class StorageConfigurationError(RuntimeError):
+    """Raised when a backend is unknown or missing its configuration."""
+
+
+@dataclass
+class StoredObject:
+    """An object written to a backend."""
+
+    backend: str
+    object_id: str
+    name: str
+    view_url: str
+    download_url: str
+    size: int = 0
+    # SHA-256 of the stored bytes, when the backend computed it.
+    sha256: str = ""
+
+
+class StorageBackend:
+    """
+    Interface every export backend implements.
+
+    Attributes:
+        name: Identifier used for selection ("gdrive", "local", "s3").
+    """
+
+    name = ""
+
+    def default_target(self) -> str:
+        """Container used when the caller does not name one."""
+        return ""
+
+    def put(self, data: bytes, filename: str, target: str, properties: Optional[dict] = None) -> StoredObject:
+        """Store bytes as filename inside target and return the stored object."""
+        raise NotImplementedError
+
+    def describe(self, object_id: str, name: str) -> StoredObject:
+        """Rebuild a StoredObject for an object stored earlier (e.g. a dedupe hit)."""
+        raise NotImplementedError
+
+    def move(
+        self, obj: StoredObject, source: str, target: str, filename: str, properties: Optional[dict] = None
+    ) -> StoredObject:
+        """Move an object from container source into target under filename, adding properties."""
+        raise NotImplementedError
+
+    def delete(self, obj: StoredObject) -> None:
+        """Delete a stored object (deleting one that is already gone succeeds)."""
+        raise NotImplementedError
+
+    def publish(self, objects: list[StoredObject], target: str) -> None:
+        """Make stored objects readable through their URLs (no-op by default)."""
+
+    def find(self, sha256: str, target: str, sharded: bool = False) -> Optional[ExistingFile]:
+        """
+        An earlier export of this content into target (below it when sharded),
+        from the content index by default.
+        """
+        return get_content_index().lookup(sha256, container_key(self, target))
+
+    def shard_target(self, target: str, path: str) -> str:
+        """Container for the sharded sub-path below target (see delivery.folders)."""
+        return "/".join(part for part in (target.strip("/"), path) if part)
+
+
+class DriveBackend(StorageBackend):
+    """Google Drive: target is a folder ID, objects are Drive file IDs."""
+
+    name = "gdrive"
+
+    def default_target(self) -> str:
+        return os.getenv("GDRIVE_FOLDER_ID", "")
+
+    def _stored(self, info: dict, filename: str, size: int) -> StoredObject:
+        return StoredObject(
+            backend=self.name,
+            object_id=info["id"],
+            name=info.get("name", filename),
+            view_url=info.get("webViewLink", drive_view_url(info["id"])),
+            download_url=info.get("webContentLink", drive_download_url(info["id"])),
+            size=size,
+        )
+
+    def put(self, data: bytes, filename: str, target: str, properties: Optional[dict] = None) -> StoredObject:
+        return self._stored(upload_bytes(data, filename, target, properties), filename, len(data))
+
+    def move(
+        self, obj: StoredObject, source: str, target: str, filename: str, properties: Optional[dict] = None
+    ) -> StoredObject:
+        # One metadata call; the file ID (and so its URLs) does not change.
+        return self._stored(move_file(obj.object_id, filename, source, target, properties), filename, obj.size)
+
+    def delete(self, obj: StoredObject) -> None:
+        try:
+            delete_file(obj.object_id)
+        except HttpError as exc:
+            if exc.resp.status != 404:
+                raise
+
+    def describe(self, object_id: str, name: str) -> StoredObject:
+        return StoredObject(self.name, object_id, name, drive_view_url(object_id), drive_download_url(object_id))
+
+    def shard_target(self, target: str, path: str) -> str:
+        return get_folder_resolver().resolve(target, path) if path else target
+
+    def publish(self, objects: list[StoredObject], target: str) -> None:
+        if objects and not folder_grants_public_read(target):
+            grant_public_read([obj.object_id for obj in objects])
+
+    def find(self, sha256: str, target: str, sharded: bool = False) -> Optional[ExistingFile]:
+        # Confirms index hits are still alive and asks Drive on a miss; files
+        # in a sharded root's sub-folders match through their root stamp.
+        return find_existing(sha256, target, get_content_index(), any_parent=sharded)
+
+
+class LocalBackend(StorageBackend):
+    """
+    A local directory. Objects are paths relative to the root; URLs use
+    EXPORT_LOCAL_BASE_URL when it is set (e.g. a static file server) and
+    file:// URIs otherwise.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str = EXPORT_LOCAL_DIR, base_url: str = EXPORT_LOCAL_BASE_URL):
+        self.root = Path(root).resolve()
+        self.base_url = base_url.rstrip("/")
+
+    def _url(self, object_id: str) -> str:
+        if self.base_url:
+            return f"{self.base_url}/{quote(object_id)}"
+        return (self.root / object_id).as_uri()
+
+    @staticmethod
+    def _object_id(filename: str, target: str, sha256: str = "") -> str:
+        segments = [_SAFE_SEGMENT_RE.sub("_", part) for part in target.split("/") if part not in ("", ".", "..")]
+        if sha256:
+            segments.append(content_segment(sha256))
+        return "/".join([*segments, _SAFE_SEGMENT_RE.sub("_", filename)])
+
+    def put(self, data: bytes, filename: str, target: str, properties: Optional[dict] = None) -> StoredObject:
+        sha256 = sha256_hex(data)
+        object_id = self._object_id(filename, target, sha256)
+        path = self.root / object_id
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        url = self._url(object_id)
+        return StoredObject(self.name, object_id, path.name, url, url, len(data), sha256)
+
+    def move(
+        self, obj: StoredObject, source: str, target: str, filename: str, properties: Optional[dict] = None
+    ) -> StoredObject:
+        source_path = self.root / obj.object_id
+        sha256 = obj.sha256 or sha256_hex(source_path.read_bytes())
+        object_id = self._object_id(filename, target, sha256)
+        path = self.root / object_id
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source_path, path)
+        url = self._url(object_id)
+        return StoredObject(self.name, object_id, path.name, url, url, obj.size, sha256)
+
+    def delete(self, obj: StoredObject) -> None:
+        (self.root / obj.object_id).unlink(missing_ok=True)
+
+    def describe(self, object_id: str, name: str) -> StoredObject:
+        url = self._url(object_id)
+        return StoredObject(self.name, object_id, name, url, url)
+
+
+class S3Backend(StorageBackend):
+    """S3-compatible bucket: target is a key prefix below EXPORT_S3_PREFIX."""
+
+    name = "s3"
+
+    def __init__(self, client: Optional[S3Client] = None, prefix: str = EXPORT_S3_PREFIX):
+        try:
+            self.client = client or S3Client()
+        except S3Error as exc:
+            raise StorageConfigurationError(str(exc)) from exc
+        self.prefix = prefix
+
+    def _key(self, filename: str, target: str, sha256: str = "") -> str:
+        parts = (self.prefix, target, content_segment(sha256), filename)
+        return "/".join(part.strip("/") for part in parts if part.strip("/"))
+
+    def put(self, data: bytes, filename: str, target: str, properties: Optional[dict] = None) -> StoredObject:
+        sha256 = sha256_hex(data)
+        key = self._key(filename, target, sha256)
+        self.client.put_object(key, data, mime_type_for(filename), properties)
+        obj = self.describe(key, filename)
+        obj.size = len(data)
+        obj.sha256 = sha256
+        return obj
+
+    def move(
+        self, obj: StoredObject, source: str, target: str, filename: str, properties: Optional[dict] = None
+    ) -> StoredObject:
+        # S3 has no rename: copy server-side, then drop the source.
+        key = self._key(filename, target, obj.sha256)
+        self.client.copy_object(obj.object_id, key, mime_type_for(filename), properties)
+        try:
+            self.client.delete_object(obj.object_id)
+        except S3Error as exc:
+            logger.warning("Leaving moved object's source behind | key=%s | error=%s", obj.object_id, exc)
+        moved = self.describe(key, filename)
+        moved.size = obj.size
+        moved.sha256 = obj.sha256
+        return moved
+
+    def delete(self, obj: StoredObject) -> None:
+        self.client.delete_object(obj.object_id)
+
+    def describe(self, object_id: str, name: str) -> StoredObject:
+        return StoredObject(
+            self.name,
+            object_id,
+            name,
+            self.client.download_url(object_id),
+            self.client.download_url(object_id),
+        )
+
+
+BACKENDS = {"gdrive": DriveBackend, "local": LocalBackend, "s3": S3Backend}
+
+_backends: dict[str, StorageBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name: str = "") -> StorageBackend:
+    """
+    Return the process-wide instance of a backend (EXPORT_BACKEND when name is empty).
+
+    Raises:
+        StorageConfigurationError: If the backend is unknown or misconfigured.
+    """
+    name = (name or EXPORT_BACKEND).lower()
+    if name not in BACKENDS:
+        raise StorageConfigurationError(f"Unknown storage backend '{name}' (expected one of {', '.join(BACKENDS)})")
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = BACKENDS[name]()
+        return _backends[name]
+
+
+@dataclass
+class BackendExport:
+    """Outcome of export_bytes()."""
+
+    stored: StoredObject
+    deduplicated: bool = False
+    bytes_uploaded: int = 0
+    bytes_saved: int = 0
+    derivatives: list[dict] = field(default_factory=list)
+    blob_sha256: str = ""
+
+
+def stored_derivative_link(derivative: Derivative, obj: StoredObject) -> dict:
+    return {
+        "name": derivative.spec.name,
+        "format": derivative.spec.format,
+        "max_edge": derivative.spec.max_edge,
+        "width": derivative.width,
+        "height": derivative.height,
+        "file_id": obj.object_id,
+        "view_url": obj.view_url,
+        "download_url": obj.download_url,
+    }
+
+
+def container_key(backend: StorageBackend, target: str) -> str:
+    """Dedupe scope of a target. Backends share the content index; the key keeps them apart."""
+    return target if backend.name == "gdrive" else f"{backend.name}:{target}"
+
+
+def find_duplicate(
+    backend: StorageBackend, sha256: str, target: str, size: int, sharded: bool = False
+) -> Optional[BackendExport]:
+    """
+    The earlier export of identical content into target (below it when
+    sharded), or None. A hit records size bytes as saved.
+    """
+    index = get_content_index()
+    container = container_key(backend, target)
+    existing = backend.find(sha256, target, sharded)
+    if existing is None:
+        return None
+    index.record_savings(size, UPLOAD_API_CALLS)
+    totals = index.savings()
+    emit_event(
+        "export_dedupe_hit",
+        backend=backend.name,
+        file_id=existing.file_id,
+        source=existing.source,
+        bytes_saved=size,
+        api_calls_saved=UPLOAD_API_CALLS,
+        total_bytes_saved=totals["bytes_saved"],
+        total_api_calls_saved=totals["api_calls_saved"],
+    )
+    return BackendExport(
+        stored=backend.describe(existing.file_id, existing.name),
+        deduplicated=True,
+        bytes_saved=size,
+        derivatives=index.derivatives(sha256, container),
+        blob_sha256=existing.blob_sha256,
+    )
+
+
+def find_source_duplicate(
+    backend: StorageBackend, source_url: str, target: str = "", sharded: bool = False
+) -> Optional[BackendExport]:
+    """
+    The earlier export of the content source_url served last time, found
+    without downloading it again; a hit saves both the download and the upload.
+    """
+    known = get_content_index().source_hash(source_url)
+    if known is None:
+        return None
+    sha256, size = known
+    return find_duplicate(backend, sha256, target or backend.default_target(), 2 * size, sharded)
+
+
+def prepare_upload(
+    image_bytes: bytes, filename: str, optimize: bool = True, derivatives: bool = True
+) -> tuple[bytes, str, DerivativeBatch]:
+    """
+    Build derivatives from the original, then optimize the master. Returns the
+    master's bytes and filename (its extension follows the chosen format) and
+    the derivatives.
+    """
+    batch = build_derivatives(image_bytes, filename) if derivatives else DerivativeBatch([], 0.0)
+    if not optimize:
+        return image_bytes, filename, batch
+    optimized = optimize_image(image_bytes, filename)
+    return optimized.data, optimized.filename_for(filename), batch
+
+
+def put_derivatives(
+    backend: StorageBackend, batch: DerivativeBatch, filename: str, target: str, sha256: str, prefix: str = ""
+) -> list[tuple[Derivative, StoredObject]]:
+    """Upload derivatives into target (names prefixed with prefix); failed ones are logged and skipped."""
+    stored = []
+    for derivative in batch.derivatives:
+        try:
+            obj = backend.put(
+                derivative.data, prefix + derivative.spec.filename_for(filename), target, derivative_properties(sha256)
+            )
+        except Exception as exc:
+            logger.warning("Derivative upload failed | backend=%s | key=%s | error=%s", backend.name, derivative.spec.key, exc)
+            continue
+        stored.append((derivative, obj))
+    return stored
+
+
+def export_bytes(
+    backend: StorageBackend,
+    image_bytes: bytes,
+    filename: str,
+    target: str = "",
+    source_url: str = "",
+    deduplicate: bool = True,
+    optimize: bool = True,
+    derivatives: bool = True,
+    shard: str = "",
+) -> BackendExport:
+    """
+    Export one image to a backend: dedupe by content hash, build derivatives from
+    the original, optimize the master, upload everything and publish it.
+    Objects are written to the shard sub-path of target (e.g. "2026/10/19/dunes")
+    while dedupe stays scoped to target itself.
+    """
+    target = target or backend.default_target()
+    sha256 = sha256_hex(image_bytes)
+    if source_url:
+        get_content_index().record_source(source_url, sha256, len(image_bytes))
+
+    if deduplicate:
+        duplicate = find_duplicate(backend, sha256, target, len(image_bytes), sharded=bool(shard))
+        if duplicate is not None:
+            return duplicate
+
+    image_bytes, upload_name, batch = prepare_upload(image_bytes, filename, optimize, derivatives)
+    return store_prepared(backend, sha256, image_bytes, upload_name, batch, filename, target, shard)
+
+
+def store_prepared(
+    backend: StorageBackend,
+    sha256: str,
+    data: bytes,
+    upload_name: str,
+    batch: DerivativeBatch,
+    filename: str,
+    target: str,
+    shard: str = "",
+) -> BackendExport:
+    """
+    Upload prepare_upload()'s master (as upload_name) and derivatives into the
+    shard sub-path of target, record them for dedupe under the source's sha256
+    and publish them.
+    """
+    index = get_content_index()
+    container = container_key(backend, target)
+    blob_sha256 = keep_local_copy(data)
+    destination = backend.shard_target(target, shard)
+    stored = backend.put(data, upload_name, destination, hash_properties(sha256, target))
+    index.record_file(sha256, container, stored.object_id, stored.name, len(data), blob_sha256)
+
+    uploaded = put_derivatives(backend, batch, filename, destination, sha256)
+    links = [stored_derivative_link(derivative, obj) for derivative, obj in uploaded]
+    if links:
+        index.record_derivatives(sha256, container, links)
+
+    backend.publish([stored, *(obj for _, obj in uploaded)], destination)
+    return BackendExport(
+        stored=stored,
+        bytes_uploaded=len(data) + sum(len(d.data) for d in batch.derivatives),
+        derivatives=links,
+        blob_sha256=blob_sha256,
+    )
+
+
+def export_urls(
+    backend: StorageBackend,
+    items: list[tuple[str, str]],
+    target: str = "",
+    max_workers: int = 4,
+    **options,
+) -> list[BackendExport | Exception]:
+    """
+    Download and export (image_url, filename) pairs concurrently; with dedupe,
+    a source URL exported before is answered without downloading it. Each entry
+    of the result is a BackendExport or the exception that item raised.
+    """
+    def _one(item):
+        image_url, filename = item
+        try:
+            if options.get("deduplicate", True):
+                duplicate = find_source_duplicate(backend, image_url, target, sharded=bool(options.get("shard")))
+                if duplicate is not None:
+                    return duplicate
+            return export_bytes(backend, download_image(image_url), filename, target, source_url=image_url, **options)
+        except Exception as exc:
+            return exc
+
+    workers = max(1, min(max_workers, len(items) or 1))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"export-{backend.name}") as pool:
+        return list(pool.map(_one, items))
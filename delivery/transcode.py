@@ -0,0 +1,211 @@
+"""
+Export-side image optimization.
+
+KIE returns large PNGs. Before export each image is decoded once and re-encoded
+into the configured target formats (WebP, AVIF when Pillow supports it, and
+progressive JPEG), stepping up each format's quality ladder until the result is
+within EXPORT_TRANSCODE_MIN_PSNR of the original. The smallest passing encoding
+wins; if nothing beats the original's size, the original bytes are kept.
+Re-encoded files carry no EXIF/XMP/ICC metadata.
+
+Encoding is CPU bound, so it runs on a process pool shared by all callers.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional
+
+from PIL import Image, ImageChops, ImageStat, features
+
+from monitoring import emit_event
+from monitoring.accounting import record_cpu
+
+logger = logging.getLogger(__name__)
+
+EXPORT_TRANSCODE_FORMATS = os.getenv("EXPORT_TRANSCODE_FORMATS", "webp,jpeg")
+EXPORT_TRANSCODE_MIN_PSNR = float(os.getenv("EXPORT_TRANSCODE_MIN_PSNR", "40"))
+EXPORT_TRANSCODE_WORKERS = int(os.getenv("EXPORT_TRANSCODE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Images smaller than this are not worth a round trip through the pool.
+MIN_TRANSCODE_BYTES = 32 * 1024
+
+# Qualities tried per format, lowest first; the first one that meets the PSNR
+# threshold is that format's smallest acceptable encoding.
+QUALITY_LADDERS = {
+    "webp": (60, 70, 80, 90),
+    "avif": (45, 55, 65, 80),
+    "jpeg": (70, 80, 88, 94),
+}
+
+FORMAT_EXTENSIONS = {"webp": "webp", "avif": "avif", "jpeg": "jpg", "png": "png"}
+
+
+@dataclass
+class TranscodeResult:
+    """Outcome of optimizing one image."""
+
+    data: bytes
+    format: str
+    bytes_in: int
+    quality: Optional[int] = None
+    psnr: Optional[float] = None
+    # Process CPU time spent choosing the encoding (in the pool worker).
+    cpu_seconds: float = 0.0
+
+    @property
+    def bytes_out(self) -> int:
+        return len(self.data)
+
+    @property
+    def transcoded(self) -> bool:
+        return self.quality is not None
+
+    def filename_for(self, filename: str) -> str:
+        """Swap the filename's extension for the chosen format's."""
+        if not self.transcoded:
+            return filename
+        stem = filename.rsplit(".", 1)[0] if "." in filename else filename
+        return f"{stem}.{FORMAT_EXTENSIONS[self.format]}"
+
+
+def configured_formats(raw: str = EXPORT_TRANSCODE_FORMATS) -> tuple[str, ...]:
+    """
+    Parse a comma separated format list, dropping unknown formats and AVIF when
+    this Pillow build cannot encode it.
+    """
+    formats = []
+    for name in (part.strip().lower() for part in raw.split(",")):
+        name = "jpeg" if name == "jpg" else name
+        if name not in QUALITY_LADDERS:
+            continue
+        if name == "avif" and not features.check("avif"):
+            continue
+        formats.append(name)
+    return tuple(formats)
+
+
+def psnr(reference: Image.Image, candidate: Image.Image) -> float:
+    """Peak signal-to-noise ratio in dB across all bands (inf for identical images)."""
+    stat = ImageStat.Stat(ImageChops.difference(reference, candidate))
+    pixels = stat.count[0]
+    mse = sum(band / pixels for band in stat.sum2) / len(stat.sum2)
+    if mse == 0:
+        return math.inf
+    return 10 * math.log10(255 ** 2 / mse)
+
+
+def encode_image(image: Image.Image, fmt: str, quality: int) -> bytes:
+    buffer = BytesIO()
+    if fmt == "jpeg":
+        image.save(buffer, format="JPEG", quality=quality, progressive=True, optimize=True)
+    elif fmt == "webp":
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, format="AVIF", quality=quality, speed=6)
+    return buffer.getvalue()
+
+
+def normalize_image(image: Image.Image) -> Image.Image:
+    """RGB, or RGBA when the image actually uses transparency; metadata dropped."""
+    has_alpha = "A" in image.getbands() or "transparency" in image.info
+    if has_alpha:
+        rgba = image.convert("RGBA")
+        if rgba.getchannel("A").getextrema() != (255, 255):
+            rgba.info = {}
+            return rgba
+    rgb = image.convert("RGB")
+    rgb.info = {}
+    return rgb
+
+
+def transcode_bytes(
+    data: bytes,
+    formats: tuple[str, ...] = (),
+    min_psnr: float = EXPORT_TRANSCODE_MIN_PSNR,
+) -> TranscodeResult:
+    """
+    Pick the smallest encoding of the image that stays above min_psnr.
+    Runs in the calling process; use optimize_image() to go through the pool.
+    """
+    cpu_start = time.process_time()
+    formats = formats or configured_formats()
+    original = TranscodeResult(data=data, format="png", bytes_in=len(data))
+    with Image.open(BytesIO(data)) as source:
+        original.format = (source.format or "png").lower()
+        reference = normalize_image(source)
+
+    best = original
+    for fmt in formats:
+        if fmt == "jpeg" and reference.mode == "RGBA":
+            continue
+        for quality in QUALITY_LADDERS[fmt]:
+            encoded = encode_image(reference, fmt, quality)
+            if len(encoded) >= best.bytes_out:
+                # Higher qualities only get larger.
+                break
+            with Image.open(BytesIO(encoded)) as decoded:
+                score = psnr(reference, decoded.convert(reference.mode))
+            if score >= min_psnr:
+                best = TranscodeResult(
+                    data=encoded,
+                    format=fmt,
+                    bytes_in=len(data),
+                    quality=quality,
+                    psnr=round(min(score, 99.0), 2),
+                )
+                break
+    best.cpu_seconds = time.process_time() - cpu_start
+    return best
+
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # Spawned workers: the parent runs Drive/HTTP threads that must not be forked.
+                _pool = ProcessPoolExecutor(
+                    max_workers=max(1, EXPORT_TRANSCODE_WORKERS),
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _pool
+
+
+def optimize_image(data: bytes, filename: str = "", formats: tuple[str, ...] = ()) -> TranscodeResult:
+    """
+    Optimize image bytes on the shared process pool and log bytes in vs out.
+    Never raises: on any failure the original bytes are returned unchanged.
+    """
+    if len(data) < MIN_TRANSCODE_BYTES or not (formats or configured_formats()):
+        return TranscodeResult(data=data, format="original", bytes_in=len(data))
+    try:
+        result = get_process_pool().submit(transcode_bytes, data, formats).result()
+    except Exception as exc:
+        logger.warning("Image optimization failed; exporting original | filename=%s | error=%s", filename, exc)
+        return TranscodeResult(data=data, format="original", bytes_in=len(data))
+
+    record_cpu("transcode", result.cpu_seconds)
+    emit_event(
+        "export_transcoded",
+        filename=filename,
+        format=result.format,
+        quality=result.quality,
+        psnr=result.psnr,
+        bytes_in=result.bytes_in,
+        bytes_out=result.bytes_out,
+        ratio=round(result.bytes_out / result.bytes_in, 3) if result.bytes_in else 1.0,
+    )
+    return result
@@ -0,0 +1,60 @@
+from agency_swarm.tools import BaseTool
+from pydantic import Field
+import json
+
+from delivery.blob_store import local_url
+from delivery.export_queue import JOB_FAILED, get_export_queue
+from monitoring.tracing import traced_tool
+
+
+class ExportStatusTool(BaseTool):
+    """
+    Check the status of a background Google Drive upload started by GDriveUploadTool.
+    Returns the upload status ("queued", "uploading", "uploaded" or "failed") for a file ID.
+    """
+
+    file_id: str = Field(
+        ...,
+        description="Pre-allocated Drive file ID returned by GDriveUploadTool"
+    )
+
+    wait_seconds: int = Field(
+        default=0,
+        description="Seconds to wait for the upload to finish before reporting (0 returns immediately, max 120)"
+    )
+
+    @traced_tool
+    def run(self):
+        """
+        Look up the background export job and return its status as pure JSON.
+        """
+        export_queue = get_export_queue()
+        if self.wait_seconds > 0:
+            job = export_queue.wait(self.file_id, timeout=min(self.wait_seconds, 120))
+        else:
+            job = export_queue.status(self.file_id)
+
+        if job is None:
+            return json.dumps({
+                "success": False,
+                "error": f"No background upload found for file ID {self.file_id}"
+            }, indent=2)
+
+        return json.dumps({
+            "success": job.status != JOB_FAILED,
+            "file_id": job.file_id,
+            "filename": job.filename,
+            "upload_status": job.status,
+            "attempts": job.attempts,
+            "public": job.public,
+            "gdrive_view_url": job.view_url,
+            "gdrive_download_url": job.download_url,
+            "local_url": local_url(job.blob_sha256),
+            "error": job.error,
+            "queue": export_queue.stats(),
+        }, indent=2)
+
+
+if __name__ == "__main__":
+    tool = ExportStatusTool(file_id="example-file-id")
+    print(tool.run())
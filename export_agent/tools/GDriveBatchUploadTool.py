@@ -0,0 +1,208 @@
+from agency_swarm.tools import BaseTool
+from pydantic import Field
+import os
+import json
+import time
+from dotenv import load_dotenv
+
+from delivery.blob_store import local_url
+from delivery.drive_export import ExportItem, export_many
+from delivery.folders import resolve_export_folder, shard_path
+from delivery.storage import EXPORT_BACKEND, StorageConfigurationError, export_urls, get_backend
+from monitoring.tracing import traced_tool
+from workflow.artifacts import IMAGE_RESULT, ArtifactNotFoundError, handoff_savings, resolve_artifact
+from workflow.reuse_index import remember_delivery
+
+load_dotenv()
+
+# Google Drive Configuration
+GOOGLE_SERVICE_ACCOUNT_JSON = os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON")
+GDRIVE_FOLDER_ID = os.getenv("GDRIVE_FOLDER_ID")
+
+
+class GDriveBatchUploadTool(BaseTool):
+    """
+    Upload several images to Google Drive in one call.
+    Uploads run concurrently and public permissions are granted with batched Drive requests.
+    Returns shareable view and download URLs for every uploaded file.
+    """
+
+    image_urls: list[str] = Field(
+        default_factory=list,
+        description="URLs of the images to download and upload to Google Drive. Leave empty when image_artifact_ids is given."
+    )
+
+    image_artifact_ids: list[str] = Field(
+        default_factory=list,
+        description="artifact_ids of the validated image results, in place of image_urls (and prompts_used), one per filename"
+    )
+
+    filenames: list[str] = Field(
+        ...,
+        description="Desired filenames, one per image URL and in the same order"
+    )
+
+    folder_id: str = Field(
+        default="",
+        description="Google Drive folder ID to upload to. If not provided, uses GDRIVE_FOLDER_ID from environment"
+    )
+
+    theme: str = Field(
+        default="",
+        description="Shared theme of the images (e.g. 'desert sunset'); exports are filed under date/theme sub-folders per EXPORT_FOLDER_LAYOUT"
+    )
+
+    max_workers: int = Field(
+        default=4,
+        description="Maximum number of concurrent uploads (1-8)"
+    )
+
+    backend: str = Field(
+        default="",
+        description="Storage backend: 'gdrive', 'local' or 's3'. Empty uses EXPORT_BACKEND (default 'gdrive')"
+    )
+
+    optimize: bool = Field(
+        default=True,
+        description="Re-encode each image to the smallest format that stays visually identical before uploading"
+    )
+
+    prompts_used: list[str] = Field(
+        default_factory=list,
+        description="Optional prompts the images were generated from, one per image URL and in the same order; recorded so similar later briefs can reuse these images"
+    )
+
+    @traced_tool
+    def run(self):
+        """
+        Download every image and upload them to Google Drive concurrently.
+        Returns per-file Google Drive URLs and a summary.
+        """
+
+        # Step 1: Validate inputs and environment variables, reading referenced image results
+        if self.image_artifact_ids:
+            try:
+                image_results = [resolve_artifact(artifact_id, IMAGE_RESULT) for artifact_id in self.image_artifact_ids]
+            except ArtifactNotFoundError as e:
+                return self._format_result(None, error=str(e))
+            self.image_urls = [image_result["image_url"] for image_result in image_results]
+            self.prompts_used = [image_result.get("prompt_used", "") for image_result in image_results]
+        if len(self.image_urls) != len(self.filenames):
+            return self._format_result(None, error="image_urls and filenames must have the same length")
+        if self.prompts_used and len(self.prompts_used) != len(self.image_urls):
+            return self._format_result(None, error="prompts_used must have one prompt per image URL")
+
+        backend_name = (self.backend or EXPORT_BACKEND).lower()
+        if backend_name != "gdrive":
+            return self._export_to_backend(backend_name)
+
+        if not GOOGLE_SERVICE_ACCOUNT_JSON:
+            return self._format_result(None, error="GOOGLE_SERVICE_ACCOUNT_JSON not found in environment variables. Please add the service account JSON to your .env file.")
+
+        root_folder_id = self.folder_id or GDRIVE_FOLDER_ID
+        if not root_folder_id:
+            return self._format_result(None, error="No folder_id provided and GDRIVE_FOLDER_ID not found in environment variables.")
+
+        # Step 2: Resolve the date/theme shard once for the whole batch
+        try:
+            target_folder_id = resolve_export_folder(root_folder_id, self.theme)
+        except Exception as e:
+            print(f"Error resolving export folder: {str(e)}")
+            return self._format_result(None, error="Failed to resolve the Google Drive export folder")
+
+        # Step 3: Export all images, deduplicating against the whole root folder
+        items = [ExportItem(image_url=url, filename=name) for url, name in zip(self.image_urls, self.filenames)]
+        report = export_many(
+            items,
+            target_folder_id,
+            max_workers=max(1, min(self.max_workers, 8)),
+            optimize=self.optimize,
+            dedupe_scope=root_folder_id,
+        )
+
+        # Step 4: Format and return results
+        return self._format_result(report)
+
+    def _export_to_backend(self, backend_name):
+        """
+        Export every image through a non-Drive storage backend.
+        """
+        try:
+            backend = get_backend(backend_name)
+        except StorageConfigurationError as e:
+            return self._format_result(None, error=str(e))
+
+        start = time.monotonic()
+        outcomes = export_urls(
+            backend,
+            list(zip(self.image_urls, self.filenames)),
+            self.folder_id,
+            max_workers=max(1, min(self.max_workers, 8)),
+            optimize=self.optimize,
+            shard=shard_path(self.theme),
+        )
+        files = []
+        for (image_url, filename), outcome in zip(zip(self.image_urls, self.filenames), outcomes):
+            if isinstance(outcome, Exception):
+                files.append({"success": False, "image_url": image_url, "filename": filename, "error": str(outcome)})
+                continue
+            files.append({
+                "success": True,
+                "file_id": outcome.stored.object_id,
+                "filename": outcome.stored.name,
+                "view_url": outcome.stored.view_url,
+                "download_url": outcome.stored.download_url,
+                "local_url": local_url(outcome.blob_sha256),
+                "public": True,
+                "deduplicated": outcome.deduplicated,
+                "derivatives": outcome.derivatives,
+            })
+        return self._summarize(files, backend_name, time.monotonic() - start, permissions_inherited=False)
+
+    def _format_result(self, report, error=None):
+        """
+        Format the batch upload result as pure JSON for downstream agent consumption.
+        CRITICAL: Returns ONLY JSON - no prose, no headers.
+        """
+        if error:
+            return json.dumps({"success": False, "error": error}, indent=2)
+
+        files = [result.to_dict() for result in report.results]
+        for entry in files:
+            if entry["success"]:
+                entry["view_url"] = entry["gdrive_view_url"]
+                entry["download_url"] = entry["gdrive_download_url"]
+        return self._summarize(files, "gdrive", report.duration_seconds, report.permissions_inherited)
+
+    def _summarize(self, files, backend, duration_seconds, permissions_inherited):
+        uploaded = sum(1 for f in files if f["success"])
+
+        for image_url, prompt, entry in zip(self.image_urls, self.prompts_used, files):
+            if entry["success"] and prompt:
+                remember_delivery(prompt, {**entry, "image_url": image_url}, theme=self.theme)
+
+        result = {
+            "success": uploaded == len(files),
+            "backend": backend,
+            "uploaded": uploaded,
+            "failed": len(files) - uploaded,
+            "permissions_inherited": permissions_inherited,
+            "duration_seconds": round(duration_seconds, 2),
+            "files": files,
+        }
+        if self.image_artifact_ids:
+            result["handoff_tokens_saved"] = handoff_savings(*self.image_artifact_ids)["tokens_saved"]
+
+        return json.dumps(result, indent=2)
+
+
+if __name__ == "__main__":
+    # Test case - Note: This requires actual credentials and valid image URLs
+    print("GDriveBatchUploadTool test")
+    print("To test this tool, run:")
+    print("tool = GDriveBatchUploadTool(")
+    print("    image_urls=['https://example.com/a.png', 'https://example.com/b.png'],")
+    print("    filenames=['athar_a.png', 'athar_b.png']")
+    print(")")
+    print("print(tool.run())")
+    print("\nMake sure GOOGLE_SERVICE_ACCOUNT_JSON and GDRIVE_FOLDER_ID are set in .env")
@@ -3,12 +3,29 @@ from pydantic import Field
 import os
 import json
 import requests
-from io import BytesIO
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
 from dotenv import load_dotenv
 
+from delivery.blob_store import keep_local_copy, local_url, read_local_blob
+from delivery.dedupe import UPLOAD_API_CALLS, get_content_index, sha256_hex
+from delivery.drive_export import download_url, view_url
+from delivery.export_queue import ExportQueueFull, get_export_queue
+from delivery.folders import shard_path
+from delivery.resumable import DEFAULT_CHUNK_SIZE
+from delivery.speculative import SpeculationUnavailable, claim_speculation
+from delivery.storage import (
+    EXPORT_BACKEND,
+    StorageConfigurationError,
+    export_bytes,
+    find_duplicate,
+    find_source_duplicate,
+    get_backend,
+)
+from monitoring import emit_event
+from monitoring.accounting import close_request, request_is_managed
+from monitoring.tracing import download_span, traced_tool
+from workflow.artifacts import IMAGE_RESULT, ArtifactNotFoundError, pipeline_report, resolve_artifact
+from workflow.reuse_index import remember_delivery
+
 load_dotenv()
 
 # Google Drive Configuration
@@ -18,13 +35,19 @@ GDRIVE_FOLDER_ID = os.getenv("GDRIVE_FOLDER_ID")
 
 class GDriveUploadTool(BaseTool):
     """
-    Upload images to Google Drive using a Service Account.
+    Upload images to Google Drive using a Service Account, or to another storage
+    backend (local directory, S3-compatible bucket) selected per request.
     Returns shareable view and download URLs for the uploaded file.
     """
     
     image_url: str = Field(
-        ...,
-        description="URL of the image to download and upload to Google Drive"
+        default="",
+        description="URL of the image to download and upload to Google Drive. Leave empty when image_artifact_id is given."
+    )
+    
+    image_artifact_id: str = Field(
+        default="",
+        description="artifact_id of the validated image result (from the QA handoff); the image URL and prompt are read from it"
     )
     
     filename: str = Field(
@@ -34,47 +57,252 @@ class GDriveUploadTool(BaseTool):
     
     folder_id: str = Field(
         default="",
-        description="Google Drive folder ID to upload to. If not provided, uses GDRIVE_FOLDER_ID from environment"
+        description="Google Drive folder ID to upload to (or sub-directory / key prefix for the local and s3 backends). If not provided, uses GDRIVE_FOLDER_ID from environment"
+    )
+
+    theme: str = Field(
+        default="",
+        description="Short theme of the image (e.g. 'desert sunset'); exports are filed under date/theme sub-folders of the target folder per EXPORT_FOLDER_LAYOUT"
+    )
+
+    backend: str = Field(
+        default="",
+        description="Storage backend: 'gdrive', 'local' or 's3'. Empty uses EXPORT_BACKEND (default 'gdrive')"
+    )
+
+    chunk_size_mb: int = Field(
+        default=0,
+        description="Resumable upload chunk size in MiB for background uploads (0 uses GDRIVE_UPLOAD_CHUNK_SIZE or 8 MiB)"
+    )
+
+    deduplicate: bool = Field(
+        default=True,
+        description="Return the existing file instead of uploading when identical content is already in the folder"
+    )
+
+    optimize: bool = Field(
+        default=True,
+        description="Re-encode to the smallest format (WebP/AVIF/progressive JPEG) that stays visually identical before uploading; the filename extension follows the chosen format"
+    )
+
+    derivatives: bool = Field(
+        default=True,
+        description="Also upload the configured smaller renditions (e.g. web size and thumbnail) generated from the same decode"
+    )
+
+    background: bool = Field(
+        default=True,
+        description="Reserve the Drive file ID, return its URLs immediately and finish the upload from the background export queue"
+    )
+
+    prompt_used: str = Field(
+        default="",
+        description="The prompt the image was generated from (KieNanoBananaTool's prompt_used); recorded so similar later briefs can reuse this image"
     )
 
+    @traced_tool
     def run(self):
         """
         Download image from URL and upload to Google Drive.
         Returns Google Drive URLs and file information.
         """
+        result = None
+        try:
+            result = self._export()
+            return result
+        finally:
+            # Agency requests end here, delivered or not; the pipeline engine closes
+            # its own record when the run ends
+            if not request_is_managed():
+                self._close_request(result)
+    
+    def _export(self):
+        """
+        The export itself; run() closes the request's cost record around it.
+        """
+        # Step 0: Read the image URL and prompt from the image result when passed by reference
+        if self.image_artifact_id:
+            try:
+                image_result = resolve_artifact(self.image_artifact_id, IMAGE_RESULT)
+            except ArtifactNotFoundError as e:
+                return self._format_result(None, error=str(e))
+            self.image_url = self.image_url or image_result["image_url"]
+            self.prompt_used = self.prompt_used or image_result.get("prompt_used", "")
+        if not self.image_url:
+            return self._format_result(None, error="Provide image_url or image_artifact_id")
         
-        # Step 1: Validate environment variables
-        if not GOOGLE_SERVICE_ACCOUNT_JSON:
-            return self._format_result(None, error="GOOGLE_SERVICE_ACCOUNT_JSON not found in environment variables. Please add the service account JSON to your .env file.")
+        # Step 0b: Finish the upload QA staged for this image while validating it, if any
+        speculation = claim_speculation(self.image_url)
+        if speculation:
+            committed = self._commit_speculation(speculation)
+            if committed:
+                return committed
+        
+        # Step 1: Validate environment variables for Drive, then pick the backend
+        backend_name = (self.backend or EXPORT_BACKEND).lower()
+        if backend_name == "gdrive":
+            if not GOOGLE_SERVICE_ACCOUNT_JSON:
+                return self._format_result(None, error="GOOGLE_SERVICE_ACCOUNT_JSON not found in environment variables. Please add the service account JSON to your .env file.")
+            if not (self.folder_id or GDRIVE_FOLDER_ID):
+                return self._format_result(None, error="No folder_id provided and GDRIVE_FOLDER_ID not found in environment variables.")
+        
+        try:
+            backend = get_backend(backend_name)
+        except StorageConfigurationError as e:
+            return self._format_result(None, error=str(e))
         
-        target_folder_id = self.folder_id or GDRIVE_FOLDER_ID
-        if not target_folder_id:
-            return self._format_result(None, error="No folder_id provided and GDRIVE_FOLDER_ID not found in environment variables.")
+        # Step 1b: Exports are filed under the date/theme shard of the target;
+        # dedupe stays scoped to the target so older shards still match.
+        target = self.folder_id or backend.default_target()
+        shard = shard_path(self.theme)
         
-        # Step 2: Download the image
+        # Step 2: Short-circuit when this source URL was exported before
+        if self.deduplicate:
+            duplicate = find_source_duplicate(backend, self.image_url, target, sharded=bool(shard))
+            if duplicate:
+                return self._backend_result(duplicate, backend_name)
+        
+        # Step 3: Drive uploads finish in the background export queue. Without
+        # dedupe, reserve a file ID right away and let the queue do the download
+        # too; the URLs are deterministic once the ID is known. A full queue falls
+        # through to the inline export below, which throttles the caller.
+        background = self.background and backend_name == "gdrive"
+        if background and not self.deduplicate:
+            queued = self._queue_upload(backend, target, shard)
+            if queued:
+                return queued
+        
+        # Step 4: Download the image
         image_bytes = self._download_image()
         if not image_bytes:
             return self._format_result(None, error="Failed to download image from URL")
-        
         print(f"Image downloaded successfully. Size: {len(image_bytes)} bytes")
         
-        # Step 3: Upload to Google Drive
-        file_info = self._upload_to_gdrive(image_bytes, target_folder_id)
-        if not file_info:
-            return self._format_result(None, error="Failed to upload image to Google Drive")
+        # Step 4b: New content goes to the queue now. The reserved URLs are handed
+        # out before the upload, so dedupe must happen before the reservation; the
+        # job reads the downloaded bytes back from the blob store.
+        deduplicate = self.deduplicate
+        if background and deduplicate:
+            content_hash = sha256_hex(image_bytes)
+            get_content_index().record_source(self.image_url, content_hash, len(image_bytes))
+            duplicate = find_duplicate(backend, content_hash, target, len(image_bytes), sharded=bool(shard))
+            if duplicate:
+                return self._backend_result(duplicate, backend_name)
+            queued = self._queue_upload(backend, target, shard, source_sha256=keep_local_copy(image_bytes))
+            if queued:
+                return queued
+            # The queue is full; the content was just checked
+            deduplicate = False
         
-        # Step 4: Make file publicly accessible
-        if not self._make_public(file_info['id']):
-            print("Warning: Failed to make file publicly accessible. Using default permissions.")
+        # Step 5: Dedupe, build derivatives, optimize, upload and publish inline
+        try:
+            outcome = export_bytes(
+                backend,
+                image_bytes,
+                self.filename,
+                target,
+                source_url=self.image_url,
+                deduplicate=deduplicate,
+                optimize=self.optimize,
+                derivatives=self.derivatives,
+                shard=shard,
+            )
+        except Exception as e:
+            print(f"Error exporting to {backend_name} storage: {str(e)}")
+            return self._format_result(None, error=f"Failed to upload image to {backend_name} storage")
+        
+        print(f"File stored in {backend_name} backend: {outcome.stored.object_id}")
+        return self._backend_result(outcome, backend_name)
+    
+    def _commit_speculation(self, speculation):
+        """
+        Move the upload staged during QA (delivery.speculative) into place instead
+        of exporting again. Returns None, after discarding the speculation when it
+        does not match this export, so the caller exports normally.
+        """
+        backend_name = (self.backend or EXPORT_BACKEND).lower()
+        # Staging ran with the default options into the default backend.
+        defaults = self.deduplicate and self.optimize and self.derivatives
+        if not defaults or not speculation.matches(backend_name, self.folder_id):
+            speculation.discard()
+            return None
         
-        # Step 5: Format and return results
-        return self._format_result(file_info)
+        try:
+            outcome = speculation.commit(self.filename, shard_path(self.theme))
+        except SpeculationUnavailable as e:
+            print(f"{str(e)}; exporting normally")
+            return None
+        
+        print(f"Committed the upload staged during QA: {outcome.stored.object_id}")
+        return self._backend_result(outcome, backend_name)
+    
+    def _backend_result(self, outcome, backend_name):
+        """
+        Format a delivery.storage BackendExport as the tool result.
+        """
+        stored = outcome.stored
+        dedupe = None
+        if outcome.deduplicated:
+            dedupe = {"deduplicated": True, "bytes_saved": outcome.bytes_saved, "api_calls_saved": UPLOAD_API_CALLS}
+        return self._format_result(
+            {"id": stored.object_id, "name": stored.name, "view_url": stored.view_url, "download_url": stored.download_url},
+            dedupe=dedupe,
+            derivatives=outcome.derivatives,
+            backend=backend_name,
+            local=local_url(outcome.blob_sha256),
+        )
+    
+    def _queue_upload(self, backend, target, shard, source_sha256=""):
+        """
+        Submit the upload into the shard of target to the background export
+        queue and return the pre-allocated file's URLs with upload_status
+        "pending". source_sha256 names the already downloaded image in the local
+        blob store. Returns None when the queue is full so the caller exports
+        inline.
+        """
+        try:
+            job = get_export_queue().submit(
+                self.image_url,
+                self.filename,
+                backend.shard_target(target, shard),
+                chunk_size=self._chunk_size(),
+                optimize=self.optimize,
+                derivatives=self.derivatives,
+                root_folder_id=target,
+                source_sha256=source_sha256,
+            )
+        except ExportQueueFull as e:
+            print(f"{str(e)}; uploading inline")
+            return None
+        except Exception as e:
+            print(f"Error reserving Drive file ID: {str(e)}")
+            return self._format_result(None, error="Failed to queue image upload to Google Drive")
+        
+        print(f"Upload queued under pre-allocated file ID {job.file_id}")
+        return self._format_result(
+            {"id": job.file_id, "name": self.filename},
+            upload_status="pending",
+            derivatives=job.derivatives,
+        )
+    
+    def _chunk_size(self):
+        return self.chunk_size_mb * 1024 * 1024 if self.chunk_size_mb > 0 else DEFAULT_CHUNK_SIZE
     
     def _download_image(self):
         """
         Download image from the provided URL.
         Returns image bytes if successful, None otherwise.
         """
+        with download_span(self.image_url) as current:
+            # Images stored by this process (e.g. QA's repairs) are read from disk
+            image_bytes = read_local_blob(self.image_url)
+            current.set_attribute("download.local", image_bytes is not None)
+            if image_bytes is None:
+                image_bytes = self._fetch_image()
+            current.set_attribute("download.bytes", len(image_bytes) if image_bytes else None)
+            return image_bytes
+    
+    def _fetch_image(self):
         try:
             response = requests.get(self.image_url, timeout=60)
             response.raise_for_status()
@@ -93,113 +321,7 @@ class GDriveUploadTool(BaseTool):
             print(f"Error downloading image: {str(e)}")
             return None
     
-    def _upload_to_gdrive(self, image_bytes, folder_id):
-        """
-        Upload image bytes to Google Drive using service account.
-        Returns file information if successful, None otherwise.
-        """
-        try:
-            # Step 1: Parse service account credentials
-            try:
-                credentials_dict = json.loads(GOOGLE_SERVICE_ACCOUNT_JSON)
-            except json.JSONDecodeError:
-                # If it's a file path, try to read from file
-                if os.path.exists(GOOGLE_SERVICE_ACCOUNT_JSON):
-                    with open(GOOGLE_SERVICE_ACCOUNT_JSON, 'r') as f:
-                        credentials_dict = json.load(f)
-                else:
-                    print("Error: Invalid GOOGLE_SERVICE_ACCOUNT_JSON format")
-                    return None
-            
-            # Step 2: Create credentials
-            SCOPES = ['https://www.googleapis.com/auth/drive.file']
-            credentials = service_account.Credentials.from_service_account_info(
-                credentials_dict, scopes=SCOPES
-            )
-            
-            # Step 3: Build Drive service
-            service = build('drive', 'v3', credentials=credentials)
-            
-            # Step 4: Prepare file metadata
-            file_metadata = {
-                'name': self.filename,
-                'parents': [folder_id]
-            }
-            
-            # Step 5: Determine MIME type from filename
-            mime_type = self._get_mime_type(self.filename)
-            
-            # Step 6: Upload file
-            media = MediaIoBaseUpload(
-                BytesIO(image_bytes),
-                mimetype=mime_type,
-                resumable=True
-            )
-            
-            file = service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id, name, webViewLink, webContentLink'
-            ).execute()
-            
-            print(f"File uploaded successfully. File ID: {file.get('id')}")
-            return file
-            
-        except Exception as e:
-            print(f"Error uploading to Google Drive: {str(e)}")
-            return None
-    
-    def _make_public(self, file_id):
-        """
-        Make the uploaded file publicly accessible.
-        Returns True if successful, False otherwise.
-        """
-        try:
-            credentials_dict = json.loads(GOOGLE_SERVICE_ACCOUNT_JSON)
-            SCOPES = ['https://www.googleapis.com/auth/drive.file']
-            credentials = service_account.Credentials.from_service_account_info(
-                credentials_dict, scopes=SCOPES
-            )
-            
-            service = build('drive', 'v3', credentials=credentials)
-            
-            # Create public permission
-            permission = {
-                'type': 'anyone',
-                'role': 'reader'
-            }
-            
-            service.permissions().create(
-                fileId=file_id,
-                body=permission
-            ).execute()
-            
-            print(f"File {file_id} is now publicly accessible")
-            return True
-            
-        except Exception as e:
-            print(f"Error making file public: {str(e)}")
-            return False
-    
-    def _get_mime_type(self, filename):
-        """
-        Determine MIME type from file extension.
-        """
-        extension = filename.lower().split('.')[-1]
-        
-        mime_types = {
-            'png': 'image/png',
-            'jpg': 'image/jpeg',
-            'jpeg': 'image/jpeg',
-            'gif': 'image/gif',
-            'webp': 'image/webp',
-            'bmp': 'image/bmp',
-            'svg': 'image/svg+xml'
-        }
-        
-        return mime_types.get(extension, 'image/png')
-    
-    def _format_result(self, file_info, error=None):
+    def _format_result(self, file_info, error=None, dedupe=None, upload_status="uploaded", derivatives=None, backend="gdrive", local=None):
         """
         Format the upload result as pure JSON for downstream agent consumption.
         CRITICAL: Returns ONLY JSON - no prose, no headers.
@@ -212,17 +334,64 @@ class GDriveUploadTool(BaseTool):
         if not file_info:
             return json.dumps({"success": False, "error": "No file information available"}, indent=2)
         
+        file_id = file_info.get('id', '')
+        view = file_info.get('view_url') or file_info.get('webViewLink') or view_url(file_id)
+        download = file_info.get('download_url') or file_info.get('webContentLink') or download_url(file_id)
         result = {
             "success": True,
-            "file_id": file_info.get('id', ''),
+            "backend": backend,
+            "file_id": file_id,
             "filename": file_info.get('name', self.filename),
-            "gdrive_view_url": file_info.get('webViewLink', f"https://drive.google.com/file/d/{file_info.get('id')}/view"),
-            "gdrive_download_url": file_info.get('webContentLink', f"https://drive.google.com/uc?id={file_info.get('id')}&export=download"),
-            "gdrive_url": file_info.get('webViewLink', f"https://drive.google.com/file/d/{file_info.get('id')}/view")
+            "view_url": view,
+            "download_url": download,
+            "local_url": local
         }
+        if backend == "gdrive":
+            result.update({
+                "gdrive_view_url": view,
+                "gdrive_download_url": download,
+                "gdrive_url": view
+            })
+        result.update({
+            "deduplicated": False,
+            "upload_status": upload_status,
+            "derivatives": derivatives or []
+        })
+        if dedupe:
+            result.update(dedupe)
+        
+        # Generation details for the delivery package, read locally instead of handed off
+        if self.image_artifact_id:
+            report = pipeline_report(self.image_artifact_id)
+            if report:
+                result.update(report)
+                emit_event(
+                    "handoff_references",
+                    artifact_id=self.image_artifact_id,
+                    references=report["handoff_references"],
+                    tokens_saved=report["handoff_tokens_saved"],
+                )
+        
+        if self.prompt_used:
+            remember_delivery(self.prompt_used, {**result, "image_url": self.image_url}, theme=self.theme)
         
         return json.dumps(result, indent=2)
-
+    
+    def _close_request(self, result):
+        """
+        Close the request's cost record: "delivered" with image_delivered, or
+        "failed" with image_delivery_failed when the export returned an error or
+        raised (result is None).
+        """
+        outcome = json.loads(result) if result else {"success": False, "error": "Export raised an exception"}
+        if outcome.get("success"):
+            cost = close_request("delivered", theme=self.theme, aspect_ratio=outcome.get("aspect_ratio", ""))
+            if cost:
+                emit_event("image_delivered", file_id=outcome["file_id"], backend=outcome["backend"], cost=cost)
+        else:
+            cost = close_request("failed", theme=self.theme)
+            if cost:
+                emit_event("image_delivery_failed", level="warning", error=outcome.get("error", ""), cost=cost)
 
 if __name__ == "__main__":
     # Test case - Note: This requires actual credentials and a valid image URL
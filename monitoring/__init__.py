@@ -3,19 +3,206 @@ Minimal monitoring helpers for emitting structured events.
 
 The helpers currently log events locally but provide a single location to plug in
 Sentry, Datadog, or any other alerting pipeline in the future.
+
+emit_event() never does I/O on the caller's thread: it samples the event,
+stamps it with the time and the active trace, and appends it to a bounded
+in-memory ring buffer. A background writer drains the buffer in batches,
+serializes each event and hands it to the "athar.monitoring" logger, so slow
+log handlers (files, pipes, remote shippers) cannot add latency to KIE polls or
+stage transitions. When the buffer is full the oldest event is overwritten and
+counted as dropped; noisy events (EVENT_SAMPLE_RATES, e.g. every KIE poll
+attempt) are kept at their sample rate, and the written line records the rate so
+counts can be re-weighted. Warnings and errors are never sampled out.
+
+Set EVENT_ASYNC=0 to write every event synchronously, unsampled (debugging,
+one-shot scripts).
 """
 
 from __future__ import annotations
 
+import atexit
 import json
 import logging
 import os
-from typing import Any
+import random
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Optional
+
+from .tracing import trace_ids
 
 logger = logging.getLogger("athar.monitoring")
 
 SENTRY_DSN = os.getenv("SENTRY_DSN")
 
+EVENT_ASYNC = os.getenv("EVENT_ASYNC", "1").lower() not in ("0", "false", "no")
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", "4096"))
+EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "256"))
+EVENT_FLUSH_SECONDS = float(os.getenv("EVENT_FLUSH_SECONDS", "0.5"))
+# Comma-separated event=rate pairs; events not listed are always kept.
+EVENT_SAMPLE_RATES = os.getenv("EVENT_SAMPLE_RATES", "kie_poll_attempt=0.1,pipeline_stage=0.25")
+
+LEVELS = {"error": logging.ERROR, "warning": logging.WARNING, "info": logging.INFO}
+
+
+def parse_sample_rates(spec: str) -> dict[str, float]:
+    """{"event": rate} from "event=rate,..." (rates clamped to 0..1, malformed pairs skipped)."""
+    rates = {}
+    for pair in spec.split(","):
+        name, _, rate = pair.partition("=")
+        try:
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            if pair.strip():
+                logger.warning("Ignoring malformed EVENT_SAMPLE_RATES entry %r", pair)
+    return rates
+
+
+class EventBuffer:
+    """
+    Bounded ring buffer of pending events plus the thread that writes them.
+
+    Producers only take a short lock to append; the writer wakes when a batch
+    is ready or every flush_seconds, whichever comes first. The writer is
+    started lazily and restarted after a fork (uvicorn workers), since threads
+    do not survive one.
+    """
+
+    def __init__(self, capacity: int = EVENT_BUFFER_SIZE, batch_size: int = EVENT_BATCH_SIZE,
+                 flush_seconds: float = EVENT_FLUSH_SECONDS, sample_rates: Optional[dict[str, float]] = None):
+        self.capacity = max(1, capacity)
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_seconds
+        self.sample_rates = parse_sample_rates(EVENT_SAMPLE_RATES) if sample_rates is None else sample_rates
+        self.emitted = 0
+        self.written = 0
+        self.write_errors = 0
+        self.dropped: Counter = Counter()
+        self.sampled_out: Counter = Counter()
+        self._events: deque = deque(maxlen=self.capacity)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_pid = 0
+
+    def put(self, event_name: str, level: str, payload: dict) -> None:
+        rate = self.sample_rates.get(event_name, 1.0)
+        if rate < 1.0 and level == "info" and random.random() >= rate:
+            with self._lock:
+                self.sampled_out[event_name] += 1
+            return
+        # Trace IDs live in a context variable: read them here, not on the writer.
+        entry = (time.time(), event_name, level, rate, trace_ids(), payload)
+        with self._lock:
+            self._append(entry)
+            self.emitted += 1
+            pending = len(self._events)
+        if self._writer_pid != os.getpid():
+            self._start_writer()
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Write everything buffered so far; True if done within the timeout."""
+        if self._writer_pid != os.getpid():
+            self._start_writer()
+        done = threading.Event()
+        with self._lock:
+            self._append(done)
+        self._wake.set()
+        return done.wait(timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "emitted": self.emitted,
+                "written": self.written,
+                "pending": sum(1 for entry in self._events if isinstance(entry, tuple)),
+                "dropped": sum(self.dropped.values()),
+                "sampled_out": sum(self.sampled_out.values()),
+                "write_errors": self.write_errors,
+                "dropped_by_event": dict(self.dropped),
+                "sampled_out_by_event": dict(self.sampled_out),
+            }
+
+    def _append(self, entry) -> None:
+        # Caller holds the lock. A full deque overwrites its oldest entry.
+        if len(self._events) == self.capacity:
+            oldest = self._events[0]
+            if isinstance(oldest, tuple):
+                self.dropped[oldest[1]] += 1
+            else:
+                oldest.set()
+        self._events.append(entry)
+
+    def _start_writer(self) -> None:
+        with self._lock:
+            if self._writer_pid == os.getpid():
+                return
+            if self._writer_pid:
+                # Forked: the parent's writer owns whatever was pending at the fork.
+                self._events.clear()
+            self._writer = threading.Thread(target=self._run, name="event-writer", daemon=True)
+            self._writer_pid = os.getpid()
+            self._writer.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            while True:
+                with self._lock:
+                    batch = [self._events.popleft() for _ in range(min(self.batch_size, len(self._events)))]
+                if not batch:
+                    break
+                for entry in batch:
+                    if isinstance(entry, threading.Event):
+                        entry.set()
+                    else:
+                        self._write(entry)
+
+    def _write(self, entry: tuple) -> None:
+        try:
+            write_event(*entry)
+            self.written += 1
+        except Exception:
+            # A bad payload or a failing handler must not stop the writer.
+            self.write_errors += 1
+
+
+def write_event(created: float, event_name: str, level: str, rate: float, ids: dict, payload: dict) -> None:
+    """Serialize one event and log it with the time it was emitted."""
+    levelno = LEVELS.get(level, logging.INFO)
+    if not logger.isEnabledFor(levelno):
+        return
+    line = {"event": event_name, **ids, **payload}
+    if rate < 1.0:
+        line["sample_rate"] = rate
+    record = logger.makeRecord(logger.name, levelno, __file__, 0, json.dumps(line, default=str), None, None)
+    record.created, record.msecs = created, (created % 1) * 1000
+    logger.handle(record)
+
+    # Placeholder for real alerting (Sentry, etc.)
+    if SENTRY_DSN and levelno >= logging.ERROR:
+        # Integration hook - extend when alerting service is available.
+        logger.debug("SENTRY_DSN detected; integrate alerting pipeline as needed.")
+
+
+_buffer: Optional[EventBuffer] = None
+_buffer_lock = threading.Lock()
+
+
+def get_event_buffer() -> EventBuffer:
+    """Return the process-wide event buffer."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = EventBuffer()
+                atexit.register(_buffer.flush, 2.0)
+    return _buffer
+
 
 def emit_event(event_name: str, level: str = "info", **payload: Any) -> None:
     """
@@ -24,18 +211,22 @@ def emit_event(event_name: str, level: str = "info", **payload: Any) -> None:
     Args:
         event_name: Identifier for the event.
         level: Logging level ("info", "warning", "error").
-        payload: Arbitrary JSON-serializable metadata.
-    """
-    log_line = json.dumps({"event": event_name, **payload})
+        payload: Arbitrary JSON-serializable metadata. It is serialized later on
+            the writer thread, so do not mutate it after the call.
 
-    if level == "error":
-        logger.error(log_line)
-    elif level == "warning":
-        logger.warning(log_line)
+    Inside a trace (monitoring.tracing) the line carries its trace_id and span_id.
+    """
+    if EVENT_ASYNC:
+        get_event_buffer().put(event_name, level, payload)
     else:
-        logger.info(log_line)
+        write_event(time.time(), event_name, level, 1.0, trace_ids(), payload)
 
-    # Placeholder for real alerting (Sentry, etc.)
-    if SENTRY_DSN:
-        # Integration hook - extend when alerting service is available.
-        logger.debug("SENTRY_DSN detected; integrate alerting pipeline as needed.")
+
+def flush_events(timeout: float = 5.0) -> bool:
+    """Block until buffered events are written (e.g. before a short-lived process exits)."""
+    return get_event_buffer().flush(timeout) if EVENT_ASYNC else True
+
+
+def event_stats() -> dict:
+    """Emitted, written, pending, dropped and sampled-out event counts of this process."""
+    return get_event_buffer().stats()
@@ -0,0 +1,367 @@
+"""
+Per-request cost and resource accounting.
+
+Answers "what did this image cost?": every request accumulates one
+RequestCost — KIE images and credits, LLM calls and tokens per agent, CPU
+seconds per stage (QA checks and repairs, re-encoding, derivatives) and bytes
+moved (image downloads, HTTP request and response bodies of the traced
+clients) — and the final delivery event carries it, priced in USD.
+
+A request is its trace (monitoring.tracing): the modules doing the work call
+record_kie(), record_llm(), record_cpu() and record_transfer() wherever they
+run, including worker threads that copied the request's context, and the
+amounts land on the record of the active trace. Outside a trace they are
+dropped.
+
+The deterministic pipeline opens its record with open_request() and closes it
+when the run ends (pipeline_delivered / pipeline_failed). In the agency the
+record is created by the first amount recorded in the trace and closed by the
+Export Agent's upload, delivered (image_delivered) or failed
+(image_delivery_failed); LLM turns after the upload (the agents' closing
+replies) are not included. Records nobody closes within COST_OPEN_SECONDS are
+closed as "incomplete", so abandoned requests still show up in the reports.
+
+Closed records are kept in a SQLite ledger (COST_LEDGER_PATH) for reports
+grouped by theme and aspect ratio:
+
+    python -m monitoring.accounting --by theme aspect_ratio --days 7
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Iterable, Optional
+
+from .tracing import current_span
+
+logger = logging.getLogger("athar.accounting")
+
+STATE_DIR = os.getenv("ATHAR_STATE_DIR", ".athar")
+COST_LEDGER_PATH = os.getenv("COST_LEDGER_PATH", os.path.join(STATE_DIR, "cost_ledger.sqlite3"))
+COST_LEDGER_TTL_SECONDS = int(os.getenv("COST_LEDGER_TTL_SECONDS", str(90 * 24 * 3600)))
+COST_OPEN_SECONDS = float(os.getenv("COST_OPEN_SECONDS", "3600"))
+COST_MAX_OPEN = int(os.getenv("COST_MAX_OPEN", "1024"))
+KIE_CREDITS_PER_IMAGE = float(os.getenv("KIE_CREDITS_PER_IMAGE", "18"))
+
+# Prices for the USD estimate; CPU and transfer are free unless configured.
+KIE_USD_PER_CREDIT = float(os.getenv("KIE_USD_PER_CREDIT", "0.005"))
+LLM_USD_PER_MTOK_INPUT = float(os.getenv("LLM_USD_PER_MTOK_INPUT", "1.25"))
+LLM_USD_PER_MTOK_OUTPUT = float(os.getenv("LLM_USD_PER_MTOK_OUTPUT", "10"))
+CPU_USD_PER_HOUR = float(os.getenv("CPU_USD_PER_HOUR", "0"))
+TRANSFER_USD_PER_GB = float(os.getenv("TRANSFER_USD_PER_GB", "0"))
+
+# Columns reports can group by.
+GROUP_COLUMNS = ("theme", "aspect_ratio", "status")
+
+
+@dataclass
+class RequestCost:
+    """Resources one request used."""
+
+    request_id: str
+    started_at: float = field(default_factory=time.time)
+    theme: str = ""
+    aspect_ratio: str = ""
+    # Opened by a caller that also closes it (the pipeline engine).
+    managed: bool = False
+    kie_tasks: int = 0
+    kie_images: int = 0
+    kie_credits: float = 0.0
+    llm_calls: int = 0
+    llm_input_tokens: int = 0
+    llm_output_tokens: int = 0
+    # {agent: {"calls", "input_tokens", "output_tokens"}}
+    llm_by_agent: dict = field(default_factory=dict)
+    # {stage: seconds}
+    cpu_seconds: dict = field(default_factory=dict)
+    download_bytes: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+
+    def usd(self) -> dict:
+        """Estimated cost in USD, per resource and in total."""
+        cost = {
+            "kie": self.kie_credits * KIE_USD_PER_CREDIT,
+            "llm": (self.llm_input_tokens * LLM_USD_PER_MTOK_INPUT + self.llm_output_tokens * LLM_USD_PER_MTOK_OUTPUT) / 1e6,
+            "cpu": sum(self.cpu_seconds.values()) / 3600 * CPU_USD_PER_HOUR,
+            "transfer": (self.download_bytes + self.bytes_sent + self.bytes_received) / 1e9 * TRANSFER_USD_PER_GB,
+        }
+        cost["total"] = sum(cost.values())
+        return {key: round(value, 6) for key, value in cost.items()}
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        del data["managed"]
+        data["cpu_seconds"] = {stage: round(seconds, 3) for stage, seconds in self.cpu_seconds.items()}
+        data["cpu_seconds_total"] = round(sum(self.cpu_seconds.values()), 3)
+        data["seconds"] = round(time.time() - self.started_at, 3)
+        data["usd"] = self.usd()
+        return data
+
+
+class CostLedger:
+    """SQLite-backed closed RequestCosts, for reports."""
+
+    def __init__(self, path: str = COST_LEDGER_PATH, ttl_seconds: int = COST_LEDGER_TTL_SECONDS):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS costs (request_id TEXT PRIMARY KEY, finished_at REAL NOT NULL,"
+                " status TEXT NOT NULL, theme TEXT NOT NULL, aspect_ratio TEXT NOT NULL, seconds REAL NOT NULL,"
+                " kie_images INTEGER NOT NULL, kie_credits REAL NOT NULL, llm_calls INTEGER NOT NULL,"
+                " llm_tokens INTEGER NOT NULL, cpu_seconds REAL NOT NULL, bytes INTEGER NOT NULL,"
+                " usd REAL NOT NULL, record TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS costs_finished ON costs (finished_at)")
+            self._conn.execute("DELETE FROM costs WHERE finished_at < ?", (time.time() - ttl_seconds,))
+
+    def save(self, record: dict) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO costs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    record["request_id"],
+                    time.time(),
+                    record["status"],
+                    record["theme"],
+                    record["aspect_ratio"],
+                    record["seconds"],
+                    record["kie_images"],
+                    record["kie_credits"],
+                    record["llm_calls"],
+                    record["llm_input_tokens"] + record["llm_output_tokens"],
+                    record["cpu_seconds_total"],
+                    record["download_bytes"] + record["bytes_sent"] + record["bytes_received"],
+                    record["usd"]["total"],
+                    json.dumps(record),
+                ),
+            )
+
+    def report(self, group_by: Iterable[str] = ("theme", "aspect_ratio"), since: float = 0.0) -> list[dict]:
+        """Requests, totals and means per group, the most expensive groups first."""
+        columns = [column for column in group_by if column in GROUP_COLUMNS]
+        unknown = set(group_by) - set(columns)
+        if unknown:
+            raise ValueError(f"Cannot group by {sorted(unknown)}; choose from {GROUP_COLUMNS}")
+        keys = ", ".join(columns) or "'all'"
+        query = (
+            f"SELECT {keys}, COUNT(*), SUM(status = 'delivered'), SUM(usd), AVG(usd), MAX(usd), AVG(kie_images),"
+            " AVG(kie_credits), AVG(llm_calls), AVG(llm_tokens), AVG(cpu_seconds), AVG(bytes), AVG(seconds)"
+            f" FROM costs WHERE finished_at >= ? GROUP BY {keys} ORDER BY SUM(usd) DESC"
+        )
+        with self._lock:
+            rows = self._conn.execute(query, (since,)).fetchall()
+        names = ("requests", "delivered", "usd_total", "usd_mean", "usd_max", "kie_images_mean", "kie_credits_mean",
+                 "llm_calls_mean", "llm_tokens_mean", "cpu_seconds_mean", "bytes_mean", "seconds_mean")
+        report = []
+        for row in rows:
+            group = dict(zip(columns, row[:len(columns)]))
+            values = dict(zip(names, row[len(columns) or 1:]))
+            report.append({**group, **{key: round(value or 0, 6) for key, value in values.items()}})
+        return report
+
+
+_open: "OrderedDict[str, RequestCost]" = OrderedDict()
+_open_lock = threading.Lock()
+
+
+def _record(create: bool = True) -> Optional[RequestCost]:
+    """The active trace's record (created on first use). Caller holds _open_lock."""
+    active = current_span()
+    if active is None:
+        return None
+    record = _open.get(active.trace_id)
+    if record is None and create:
+        record = _open[active.trace_id] = RequestCost(request_id=active.trace_id)
+    return record
+
+
+def open_request(request_id: str = "", theme: str = "", aspect_ratio: str = "") -> Optional[RequestCost]:
+    """
+    Start the active trace's record on behalf of a caller that will close it
+    with close_request(). Returns None outside a trace.
+    """
+    expired = _expire()
+    with _open_lock:
+        record = _record()
+        if record is not None:
+            record.managed = True
+            record.request_id = request_id or record.request_id
+            record.theme = theme or record.theme
+            record.aspect_ratio = aspect_ratio or record.aspect_ratio
+    _persist(expired)
+    return record
+
+
+def current_request_id() -> str:
+    """ID of the active trace's request (its record's request_id, else the trace ID); "" outside a trace."""
+    active = current_span()
+    if active is None:
+        return ""
+    with _open_lock:
+        record = _record(create=False)
+        return record.request_id if record else active.trace_id
+
+
+def request_is_managed() -> bool:
+    """Whether the active trace's record is closed by whoever opened it (not by the delivery)."""
+    with _open_lock:
+        record = _record(create=False)
+        return bool(record and record.managed)
+
+
+def close_request(status: str, theme: str = "", aspect_ratio: str = "") -> Optional[dict]:
+    """
+    Close the active trace's record: the accounting dict for the final event,
+    also saved to the ledger. None outside a trace.
+    """
+    active = current_span()
+    if active is None:
+        return None
+    with _open_lock:
+        record = _open.pop(active.trace_id, None) or RequestCost(request_id=active.trace_id)
+    record.theme = theme or record.theme
+    record.aspect_ratio = aspect_ratio or record.aspect_ratio
+    closed = {**record.to_dict(), "status": status}
+    _persist([closed, *_expire()])
+    return closed
+
+
+def record_kie(images: int = 1, tasks: int = 1) -> None:
+    """A finished KIE generation task and the images (and credits) it produced."""
+    with _open_lock:
+        record = _record()
+        if record is not None:
+            record.kie_tasks += tasks
+            record.kie_images += images
+            record.kie_credits += images * KIE_CREDITS_PER_IMAGE
+
+
+def record_llm(agent: str, calls: int = 1, input_tokens: int = 0, output_tokens: int = 0) -> None:
+    """LLM calls an agent (or the pipeline judge) made and their tokens."""
+    with _open_lock:
+        record = _record()
+        if record is None:
+            return
+        record.llm_calls += calls
+        record.llm_input_tokens += input_tokens
+        record.llm_output_tokens += output_tokens
+        usage = record.llm_by_agent.setdefault(agent, {"calls": 0, "input_tokens": 0, "output_tokens": 0})
+        usage["calls"] += calls
+        usage["input_tokens"] += input_tokens
+        usage["output_tokens"] += output_tokens
+
+
+def record_cpu(stage: str, seconds: float) -> None:
+    """CPU time a stage spent on the request (in this process or its worker pool)."""
+    if seconds <= 0:
+        return
+    with _open_lock:
+        record = _record()
+        if record is not None:
+            record.cpu_seconds[stage] = record.cpu_seconds.get(stage, 0.0) + seconds
+
+
+def record_transfer(downloaded: int = 0, sent: int = 0, received: int = 0) -> None:
+    """Bytes of image downloads, and of HTTP request and response bodies."""
+    with _open_lock:
+        record = _record()
+        if record is not None:
+            record.download_bytes += downloaded
+            record.bytes_sent += sent
+            record.bytes_received += received
+
+
+def _expire() -> list[dict]:
+    """Close records open longer than COST_OPEN_SECONDS, or beyond COST_MAX_OPEN, as incomplete."""
+    cutoff = time.time() - COST_OPEN_SECONDS
+    expired = []
+    with _open_lock:
+        while _open:
+            record = next(iter(_open.values()))
+            if record.started_at >= cutoff and len(_open) < COST_MAX_OPEN:
+                break
+            _open.popitem(last=False)
+            expired.append({**record.to_dict(), "status": "incomplete"})
+    return expired
+
+
+def _persist(records: list[dict]) -> None:
+    """Best effort: the accounting must never fail the request it describes."""
+    if not records:
+        return
+    try:
+        ledger = get_cost_ledger()
+        for record in records:
+            ledger.save(record)
+    except (sqlite3.Error, OSError) as exc:
+        logger.warning("Could not record request costs | error=%s", exc)
+
+
+_ledger: Optional[CostLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_cost_ledger() -> CostLedger:
+    """Return the process-wide cost ledger (created on first use)."""
+    global _ledger
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                _ledger = CostLedger()
+    return _ledger
+
+
+def cost_report(group_by: Iterable[str] = ("theme", "aspect_ratio"), days: float = 30.0) -> list[dict]:
+    """Per-group cost report over the last days (see CostLedger.report)."""
+    return get_cost_ledger().report(tuple(group_by), since=time.time() - days * 86400)
+
+
+def format_report(report: list[dict], group_by: Iterable[str]) -> str:
+    """A fixed-width table of a cost report."""
+    columns = [column for column in group_by if column in GROUP_COLUMNS] or ["all"]
+    header = [*columns, "requests", "delivered", "USD total", "USD mean", "USD max", "images", "credits",
+              "LLM calls", "tokens", "CPU s", "MB", "seconds"]
+    lines = [" | ".join(f"{name:>10}" if index >= len(columns) else f"{name:<20}" for index, name in enumerate(header))]
+    for row in report:
+        cells = [f"{str(row.get(column, 'all'))[:20]:<20}" for column in columns]
+        cells += [
+            f"{row['requests']:>10g}",
+            f"{row['delivered']:>10g}",
+            f"{row['usd_total']:>10.4f}",
+            f"{row['usd_mean']:>10.4f}",
+            f"{row['usd_max']:>10.4f}",
+            f"{row['kie_images_mean']:>10.2f}",
+            f"{row['kie_credits_mean']:>10.1f}",
+            f"{row['llm_calls_mean']:>10.1f}",
+            f"{row['llm_tokens_mean']:>10.0f}",
+            f"{row['cpu_seconds_mean']:>10.3f}",
+            f"{row['bytes_mean'] / 1e6:>10.2f}",
+            f"{row['seconds_mean']:>10.1f}",
+        ]
+        lines.append(" | ".join(cells))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Request cost report from the cost ledger (means are per request).")
+    parser.add_argument("--by", nargs="*", default=["theme", "aspect_ratio"], choices=GROUP_COLUMNS)
+    parser.add_argument("--days", type=float, default=30.0, help="Requests finished within this many days")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+    rows = cost_report(args.by, args.days)
+    print(json.dumps(rows, indent=2) if args.json else format_report(rows, args.by))
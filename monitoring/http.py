@@ -0,0 +1,78 @@
+"""
+HTTP routes exposing the service metrics (see monitoring.metrics) and cost
+reports (see monitoring.accounting).
+
+agency.create_app() mounts ``router`` next to the agency endpoints:
+``GET /metrics`` answers in Prometheus' text exposition format, merged across
+every uvicorn worker whichever one serves the scrape. Like the agency
+endpoints, it requires ``Authorization: Bearer $APP_TOKEN`` when APP_TOKEN is
+set (Prometheus sends it with ``authorization: {credentials: ...}`` in the
+scrape config).
+``GET /costs/report?by=theme&by=aspect_ratio&days=7`` returns the per-group
+cost report of the requests closed in the last days, as JSON.
+
+InFlightMiddleware counts the agency's requests in ``pipelines_in_flight``
+(mode="agency") while they run; deterministic runs count themselves.
+"""
+
+from __future__ import annotations
+
+import os
+import secrets
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+
+from .accounting import GROUP_COLUMNS, cost_report
+from .metrics import CONTENT_TYPE, PIPELINES_IN_FLIGHT, REGISTRY
+
+router = APIRouter(tags=["monitoring"])
+
+
+class InFlightMiddleware:
+    """
+    ASGI middleware counting HTTP requests under path_prefix (the agency's
+    get_response endpoints) as agency requests in flight until their response
+    has been sent, streamed responses included.
+    """
+
+    def __init__(self, app, path_prefix: str):
+        self.app = app
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope.get("path", "").startswith(self.path_prefix):
+            return await self.app(scope, receive, send)
+        with PIPELINES_IN_FLIGHT.track_inprogress(mode="agency"):
+            await self.app(scope, receive, send)
+
+
+def _check_token(authorization: str | None) -> None:
+    token = os.getenv("APP_TOKEN")
+    if token and not secrets.compare_digest(authorization or "", f"Bearer {token}"):
+        raise HTTPException(status_code=401, detail="Invalid or missing bearer token")
+
+
+@router.get("/metrics")
+async def metrics(authorization: str | None = Header(None)) -> Response:
+    """All metrics in Prometheus' text format."""
+    _check_token(authorization)
+    # Merging reads every worker's snapshot file; keep the file I/O off the event loop.
+    body = await run_in_threadpool(REGISTRY.render)
+    return Response(body, media_type=CONTENT_TYPE)
+
+
+@router.get("/costs/report")
+async def costs_report(
+    by: list[str] = Query(["theme", "aspect_ratio"]),
+    days: float = Query(30.0, gt=0),
+    authorization: str | None = Header(None),
+) -> dict:
+    """Cost per group (theme, aspect ratio, status) of the requests closed in the last days."""
+    _check_token(authorization)
+    unknown = [column for column in by if column not in GROUP_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot group by {', '.join(unknown)}; use {', '.join(GROUP_COLUMNS)}")
+    report = await run_in_threadpool(cost_report, by, days)
+    return {"group_by": by, "days": days, "groups": report}
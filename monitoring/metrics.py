@@ -0,0 +1,407 @@
+"""
+Process metrics (counters, gauges, histograms) served in Prometheus' text format.
+
+emit_event() lines answer "what happened to this request"; these answer "how
+is the service doing": KIE latency and poll attempts, QA verdicts and CPU time,
+download and Drive upload latency, the background export queue's depth,
+oldest job and job latency, handoff validation failures and requests in flight
+(agency and pipeline). Every metric is defined below, updated in place by the modules that
+own the operation, and exposed at ``GET /metrics`` (monitoring.http).
+
+Updates only touch process memory. ``python agency.py --serve`` runs
+WEB_CONCURRENCY uvicorn worker processes, and a scrape reaches just one of
+them, so each process also writes a snapshot of its metrics to
+METRICS_DIR/<pid>-<start time>.json every METRICS_FLUSH_SECONDS (when something
+changed). A scrape writes its own process's snapshot, then merges all of them:
+
+- counters and histograms are summed over every snapshot, including those of
+  workers that have exited, so totals never go backwards when a worker is
+  recycled; the start time in the file name keeps a worker that reuses a dead
+  worker's pid from overwriting its snapshot;
+- gauges are summed (or maxed, per gauge) over live processes only: a pid that
+  is alive counts only for its most recently started snapshot.
+
+Clear METRICS_DIR when the service is redeployed; its snapshots are only
+meaningful for one deployment.
+"""
+
+from __future__ import annotations
+
+import bisect
+import contextlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Iterable, Optional
+
+logger = logging.getLogger("athar.metrics")
+
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(os.getenv("ATHAR_STATE_DIR", ".athar"), "metrics"))
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+METRICS_PREFIX = "athar_"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+CPU_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+ATTEMPT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metric:
+    """A named metric with a fixed set of label names."""
+
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), registry: Optional["Registry"] = None):
+        self.name = METRICS_PREFIX + name
+        self.help = help
+        self.labels = tuple(labels)
+        self._label_set = frozenset(self.labels)
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        self._registry = registry or REGISTRY
+        self._registry.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if labels.keys() != self._label_set:
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> list:
+        """[[label values, value], ...] in a JSON-friendly form."""
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    """A value that only goes up (a number of events, a total of bytes)."""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self._registry.touch()
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down. mode is how processes are combined:
+    "sum" (e.g. pipelines in flight) or "max".
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), mode: str = "sum",
+                 registry: Optional["Registry"] = None):
+        if mode not in ("sum", "max"):
+            raise ValueError(f"Unknown gauge mode {mode!r}")
+        self.mode = mode
+        super().__init__(name, help, labels, registry)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self._registry.touch()
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+        self._registry.touch()
+
+    @contextlib.contextmanager
+    def track_inprogress(self, **labels):
+        """Count the block as in progress while it runs."""
+        self.inc(1, **labels)
+        try:
+            yield
+        finally:
+            self.dec(1, **labels)
+
+
+class _Timer(contextlib.ContextDecorator):
+    def __init__(self, histogram: "Histogram", labels: dict):
+        self.histogram, self.labels = histogram, labels
+
+    def _recreate_cm(self):
+        # Used as a decorator, each call (possibly concurrent) gets its own start time.
+        return _Timer(self.histogram, self.labels)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Histogram(Metric):
+    """Observations counted into cumulative buckets, with their sum and count."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS,
+                 registry: Optional["Registry"] = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labels, registry)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        # Per-bucket (not cumulative) counts, +Inf last; cumulated when rendered.
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0}
+            state["counts"][index] += 1
+            state["sum"] += value
+        self._registry.touch()
+
+    def time(self, **labels) -> _Timer:
+        """Observe the duration of a block (context manager) or of every call (decorator)."""
+        return _Timer(self, labels)
+
+    def samples(self) -> list:
+        with self._lock:
+            return [[list(key), {"counts": list(state["counts"]), "sum": state["sum"]}] for key, state in self._values.items()]
+
+
+class Registry:
+    """The metrics of this process, with the snapshot files shared between workers."""
+
+    def __init__(self, directory: str = METRICS_DIR, flush_seconds: float = METRICS_FLUSH_SECONDS):
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self.metrics: dict[str, Metric] = {}
+        self.changed = False
+        # Tells this process's snapshot apart from those of earlier processes with the same pid.
+        self.started_at = time.time()
+        self._writer_pid = 0
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            # A forked worker starts from zero: its parent's values are in the parent's snapshot.
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def register(self, metric: Metric) -> None:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def snapshot(self) -> dict:
+        """This process's metrics as written to its snapshot file."""
+        return {
+            "pid": os.getpid(),
+            "started_at": self.started_at,
+            "metrics": {
+                name: {
+                    "type": metric.type,
+                    "mode": getattr(metric, "mode", ""),
+                    "samples": metric.samples(),
+                }
+                for name, metric in self.metrics.items()
+            },
+        }
+
+    def touch(self) -> None:
+        """Mark the metrics changed (called on every update); starts the writer on first use."""
+        self.changed = True
+        if not self._writer_pid:
+            self.start()
+
+    def start(self) -> None:
+        """Start writing snapshots in the background (idempotent, per process)."""
+        if self._writer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._writer_pid == os.getpid():
+                return
+            self._writer_pid = os.getpid()
+            threading.Thread(target=self._run, name="metrics-writer", daemon=True).start()
+
+    def write_snapshot(self) -> None:
+        self.changed = False
+        snapshot = self.snapshot()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{snapshot['pid']}-{int(snapshot['started_at'] * 1000)}.json")
+            temporary = f"{path}.tmp"
+            with open(temporary, "w", encoding="utf-8") as handle:
+                json.dump(snapshot, handle, separators=(",", ":"))
+            os.replace(temporary, path)
+        except OSError as exc:
+            logger.warning("Could not write metrics snapshot | directory=%s | error=%s", self.directory, exc)
+
+    def collect(self) -> dict[str, dict]:
+        """
+        Merge the snapshots of every worker into {name: {label values: value}}.
+        This process's snapshot is written first, so its values are current.
+        """
+        self.write_snapshot()
+        merged: dict[str, dict] = {name: {} for name in self.metrics}
+        snapshots = self._read_snapshots()
+        # A reused pid is alive, but only its latest process is.
+        latest: dict[int, float] = {}
+        for snapshot in snapshots:
+            pid = snapshot.get("pid", 0)
+            latest[pid] = max(latest.get(pid, 0.0), snapshot.get("started_at", 0.0))
+        for snapshot in snapshots:
+            pid = snapshot.get("pid", 0)
+            live = snapshot.get("started_at", 0.0) == latest[pid] and _pid_alive(pid)
+            for name, data in snapshot.get("metrics", {}).items():
+                metric = self.metrics.get(name)
+                if metric is None or data.get("type") != metric.type:
+                    continue
+                if metric.type == "gauge" and not live:
+                    continue
+                values = merged[name]
+                for labels, value in data["samples"]:
+                    key = tuple(labels)
+                    if metric.type == "histogram":
+                        if len(value["counts"]) != len(metric.buckets) + 1:
+                            continue
+                        current = values.setdefault(key, {"counts": [0] * len(value["counts"]), "sum": 0.0})
+                        current["counts"] = [a + b for a, b in zip(current["counts"], value["counts"])]
+                        current["sum"] += value["sum"]
+                    elif metric.type == "gauge" and metric.mode == "max":
+                        values[key] = max(values.get(key, value), value)
+                    else:
+                        values[key] = values.get(key, 0) + value
+        return merged
+
+    def render(self) -> str:
+        """All metrics, merged across workers, in Prometheus' text exposition format."""
+        merged = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {_escape_help(metric.help)}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for key, value in sorted(merged[name].items()):
+                labels = list(zip(metric.labels, key))
+                if metric.type != "histogram":
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip((*metric.buckets, math.inf), value["counts"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + [('le', _number(bound))])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(value['sum'])}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def _read_snapshots(self) -> list[dict]:
+        snapshots = []
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(".json")]
+        except OSError:
+            return snapshots
+        for name in names:
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as handle:
+                    snapshots.append(json.load(handle))
+            except (OSError, ValueError):
+                # Being replaced right now, or left truncated by a crash.
+                continue
+        return snapshots
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_seconds)
+            if self.changed:
+                self.write_snapshot()
+
+    def _after_fork(self) -> None:
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._writer_pid = 0
+        for metric in self.metrics.values():
+            metric._lock = threading.Lock()
+            metric.reset()
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _labels(pairs: list[tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    escaped = (f'{name}="{_escape_label(value)}"' for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = Registry()
+
+
+# -- metrics ------------------------------------------------------------------------------
+
+KIE_CREATE_SECONDS = Histogram("kie_create_seconds", "Time to create a KIE generation task")
+KIE_POLL_SECONDS = Histogram(
+    "kie_poll_seconds", "Time from task creation until KIE reported the task done", labels=("outcome",)
+)
+KIE_POLL_ATTEMPTS = Histogram(
+    "kie_poll_attempts", "Status polls per KIE task", labels=("outcome",), buckets=ATTEMPT_BUCKETS
+)
+QA_VERDICTS = Counter("qa_verdicts_total", "Images judged by QA, by verdict", labels=("status",))
+QA_FAILED_CHECKS = Counter("qa_failed_checks_total", "Failed QA checks, by check", labels=("check",))
+QA_CPU_SECONDS = Histogram("qa_cpu_seconds", "CPU time of QA's checks per image", buckets=CPU_BUCKETS)
+DOWNLOAD_SECONDS = Histogram("download_seconds", "Image download time", labels=("source",))
+DOWNLOAD_BYTES = Counter("download_bytes_total", "Bytes of images downloaded", labels=("source",))
+DRIVE_UPLOAD_SECONDS = Histogram("drive_upload_seconds", "Drive upload time per file", labels=("method",))
+HANDOFF_VALIDATION_FAILURES = Counter(
+    "handoff_validation_failures_total",
+    "Handoff payloads rejected by their contract",
+    labels=("sender", "recipient"),
+)
+# The export queue's store is shared by every worker process, so they all see the same depth and age.
+EXPORT_QUEUE_DEPTH = Gauge("export_queue_depth", "Background export jobs queued or uploading", mode="max")
+EXPORT_QUEUE_OLDEST_JOB_AGE = Gauge(
+    "export_queue_oldest_job_age_seconds", "Age of the oldest queued or uploading background export job", mode="max"
+)
+EXPORT_JOB_SECONDS = Histogram(
+    "export_job_seconds", "Background export attempt time (download and upload), by outcome", labels=("outcome",)
+)
+PIPELINES_IN_FLIGHT = Gauge(
+    "pipelines_in_flight",
+    "Requests in progress: agency requests (mode=agency) and deterministic pipeline runs (mode=pipeline)",
+    labels=("mode",),
+)
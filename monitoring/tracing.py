@@ -0,0 +1,461 @@
+"""
+Request tracing: one trace per incoming request, one span per stage.
+
+emit_event() lines were isolated: nothing tied a handoff, a KIE poll or a Drive
+call to the request it served, so there was no way to tell where a slow request
+spent its time. Every request now gets a trace (TraceMiddleware on
+agency.create_app(), continuing a W3C ``traceparent`` header when the caller
+sends one; the pipeline engine and handoffs outside an HTTP request start their
+own), and the active span travels with the request in a context variable,
+through StructuredSendMessage handoffs, tool runs and HTTP calls:
+
+- ``handoff <sender> -> <recipient>``: a validated handoff and the recipient's
+  turn (its LLM calls and tools), with the payload size;
+- ``tool <Name>``: every tool run, with argument and result sizes;
+- ``llm <model>``: the pipeline judge's calls, with tokens;
+- ``kie.create_task`` / ``kie.poll`` (with attempts), ``download``,
+  ``qa.checks`` / ``qa.repair`` and one CLIENT span per Drive, S3 and resumable
+  upload request (method, URL path, status, bytes).
+
+emit_event() stamps its lines with the active trace and span IDs.
+
+Finished spans are exported in OpenTelemetry's OTLP/JSON encoding by a
+background thread, in batches: TRACE_EXPORTER=file appends one
+ExportTraceServiceRequest per line to TRACE_FILE_PATH (the format of the
+Collector's file exporter), TRACE_EXPORTER=otlp posts them to
+OTEL_EXPORTER_OTLP_ENDPOINT/v1/traces. With the default (none) spans are still
+tracked for correlation but not exported.
+"""
+
+from __future__ import annotations
+
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Iterator, Optional
+from urllib.parse import urlsplit
+
+import httplib2
+import requests
+
+from .metrics import DOWNLOAD_BYTES, DOWNLOAD_SECONDS
+
+logger = logging.getLogger("athar.tracing")
+
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none").lower()
+TRACE_FILE_PATH = os.getenv("TRACE_FILE_PATH", os.path.join(os.getenv("ATHAR_STATE_DIR", ".athar"), "traces.jsonl"))
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318")
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "athar-image-designer")
+TRACE_BATCH_SIZE = int(os.getenv("TRACE_BATCH_SIZE", "256"))
+TRACE_FLUSH_SECONDS = float(os.getenv("TRACE_FLUSH_SECONDS", "2"))
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "8192"))
+
+# OTLP span kinds.
+INTERNAL = 1
+SERVER = 2
+CLIENT = 3
+
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+SCOPE_NAME = "athar.tracing"
+
+
+@dataclass
+class Span:
+    """One timed operation of a trace."""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: str = ""
+    kind: int = INTERNAL
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: int = 0
+    attributes: dict[str, Any] = field(default_factory=dict)
+    status: int = STATUS_UNSET
+    status_message: str = ""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, **attributes: Any) -> None:
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def set_error(self, message: str) -> None:
+        self.status, self.status_message = STATUS_ERROR, message
+
+    @property
+    def seconds(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def traceparent(self) -> str:
+        """W3C trace context header pointing at this span."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": self.status, **({"message": self.status_message} if self.status_message else {})},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+
+def otlp_request(spans: list[Span]) -> dict:
+    """An OTLP ExportTraceServiceRequest (JSON encoding) carrying the spans."""
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": OTEL_SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": SCOPE_NAME}, "spans": [span.to_otlp() for span in spans]}],
+            }
+        ]
+    }
+
+
+class FileSpanExporter:
+    """Appends one OTLP/JSON request per batch to a file."""
+
+    def __init__(self, path: str = TRACE_FILE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans: list[Span]) -> None:
+        line = json.dumps(otlp_request(spans), separators=(",", ":"))
+        with open(self.path, "a", encoding="utf-8") as handle:
+            handle.write(line + "\n")
+
+
+class OtlpHttpSpanExporter:
+    """Posts OTLP/JSON requests to a collector's /v1/traces endpoint."""
+
+    def __init__(self, endpoint: str = OTEL_EXPORTER_OTLP_ENDPOINT, timeout: float = 10.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.timeout = timeout
+        # A plain session: the exporter's own requests are not traced.
+        self._session = requests.Session()
+
+    def export(self, spans: list[Span]) -> None:
+        response = self._session.post(self.url, json=otlp_request(spans), timeout=self.timeout)
+        response.raise_for_status()
+
+
+class BatchSpanProcessor:
+    """
+    Queues finished spans and exports them from a background thread, in
+    batches of up to batch_size or every flush_seconds. Spans that do not fit
+    in the queue are dropped and counted rather than slowing the request.
+    """
+
+    def __init__(self, exporter, batch_size: int = TRACE_BATCH_SIZE, flush_seconds: float = TRACE_FLUSH_SECONDS,
+                 queue_size: int = TRACE_QUEUE_SIZE):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._worker = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._worker.start()
+
+    def on_end(self, span: Span) -> None:
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Export everything queued so far; True if done within the timeout."""
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def _run(self) -> None:
+        while True:
+            batch: list[Span] = []
+            flushed: Optional[threading.Event] = None
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if isinstance(item, threading.Event):
+                    # Everything queued before the flush request is in this batch or already exported.
+                    flushed = item
+                    break
+                batch.append(item)
+            if batch:
+                self._export(batch)
+            if flushed is not None:
+                flushed.set()
+
+    def _export(self, batch: list[Span]) -> None:
+        try:
+            self.exporter.export(batch)
+            self.exported += len(batch)
+        except Exception as exc:
+            self.failed += len(batch)
+            logger.warning("Trace export failed | spans=%d | error=%s", len(batch), exc)
+
+
+def _build_processor() -> Optional[BatchSpanProcessor]:
+    if TRACE_EXPORTER == "file":
+        return BatchSpanProcessor(FileSpanExporter())
+    if TRACE_EXPORTER == "otlp":
+        return BatchSpanProcessor(OtlpHttpSpanExporter())
+    if TRACE_EXPORTER not in ("", "none"):
+        logger.warning("Unknown TRACE_EXPORTER %r; spans are not exported", TRACE_EXPORTER)
+    return None
+
+
+_processor: Optional[BatchSpanProcessor] = None
+_processor_lock = threading.Lock()
+_processor_built = False
+
+
+def get_span_processor() -> Optional[BatchSpanProcessor]:
+    """Return the process-wide processor for TRACE_EXPORTER (None when spans are not exported)."""
+    global _processor, _processor_built
+    if not _processor_built:
+        with _processor_lock:
+            if not _processor_built:
+                _processor = _build_processor()
+                _processor_built = True
+                if _processor is not None:
+                    atexit.register(_processor.flush, 5.0)
+    return _processor
+
+
+def set_span_processor(processor: Optional[BatchSpanProcessor]) -> None:
+    """Replace the process-wide processor (e.g. to export to a collector stand-in)."""
+    global _processor, _processor_built
+    with _processor_lock:
+        _processor, _processor_built = processor, True
+
+
+def flush_traces(timeout: float = 10.0) -> bool:
+    processor = get_span_processor()
+    return processor.flush(timeout) if processor else True
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("athar_current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def trace_ids() -> dict:
+    """{"trace_id", "span_id"} of the active span, or {} outside a trace."""
+    active = _current_span.get()
+    return {"trace_id": active.trace_id, "span_id": active.span_id} if active else {}
+
+
+def parse_traceparent(header: str) -> Optional[tuple[str, str]]:
+    """(trace_id, parent span_id) from a W3C traceparent header, or None if it is malformed."""
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2]
+
+
+@contextmanager
+def span(name: str, kind: int = INTERNAL, traceparent: str = "", **attributes: Any) -> Iterator[Span]:
+    """
+    Time a block as a child of the active span (or as the root of a new trace,
+    continuing traceparent if given). An exception marks the span as failed
+    and propagates.
+    """
+    parent = _current_span.get()
+    remote = parse_traceparent(traceparent) if traceparent and parent is None else None
+    if parent is not None:
+        trace_id, parent_span_id = parent.trace_id, parent.span_id
+    elif remote is not None:
+        trace_id, parent_span_id = remote
+    else:
+        trace_id, parent_span_id = os.urandom(16).hex(), ""
+    current = Span(name=name, trace_id=trace_id, span_id=os.urandom(8).hex(), parent_span_id=parent_span_id, kind=kind)
+    current.set_attributes(**attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as exc:
+        current.set_error(f"{type(exc).__name__}: {exc}")
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end_ns = time.time_ns()
+        processor = get_span_processor()
+        if processor is not None:
+            processor.on_end(current)
+
+
+def traced_tool(run):
+    """Decorator for a tool's run(): one span per call, with argument and result sizes."""
+
+    @functools.wraps(run)
+    def wrapper(self, *args, **kwargs):
+        name = type(self).__name__
+        with span(f"tool {name}", **{"tool.name": name}) as current:
+            try:
+                current.set_attribute("tool.args_bytes", len(self.model_dump_json()))
+            except Exception:
+                pass
+            result = run(self, *args, **kwargs)
+            if isinstance(result, str):
+                current.set_attribute("tool.result_bytes", len(result.encode("utf-8")))
+            return result
+
+    return wrapper
+
+
+def _http_attributes(method: str, url: str) -> dict:
+    parts = urlsplit(url)
+    # The path only: query strings carry signatures and task IDs are in the path anyway.
+    return {"http.method": method.upper(), "server.address": parts.netloc, "url.path": parts.path}
+
+
+@contextmanager
+def http_span(method: str, url: str, request_bytes: Optional[int] = None) -> Iterator[Span]:
+    """CLIENT span of one outgoing HTTP request."""
+    with span(f"{method.upper()} {urlsplit(url).netloc}", kind=CLIENT, **_http_attributes(method, url)) as current:
+        current.set_attribute("http.request.body.size", request_bytes)
+        yield current
+
+
+@contextmanager
+def download_span(url: str) -> Iterator[Span]:
+    """
+    Span of an image download; the caller records download.local and
+    download.bytes, which also feed the download metrics.
+    """
+    parts = urlsplit(url)
+    with span("download", **{"server.address": parts.netloc, "url.path": parts.path}) as current:
+        yield current
+        size = current.attributes.get("download.bytes")
+        if size is not None:
+            source = "local" if current.attributes.get("download.local") else "remote"
+            DOWNLOAD_SECONDS.observe(current.seconds, source=source)
+            DOWNLOAD_BYTES.inc(size, source=source)
+            # Imported here: monitoring.accounting imports this module.
+            from .accounting import record_transfer
+
+            record_transfer(downloaded=size)
+
+
+def _body_size(body: Any) -> Optional[int]:
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    if isinstance(body, str):
+        return len(body.encode("utf-8"))
+    return None
+
+
+def record_response(current: Span, status: int, response_bytes: Optional[int]) -> None:
+    current.set_attributes(**{"http.response.status_code": status, "http.response.body.size": response_bytes})
+    if status >= 400:
+        current.set_error(f"HTTP {status}")
+    # Imported here: monitoring.accounting imports this module.
+    from .accounting import record_transfer
+
+    record_transfer(sent=current.attributes.get("http.request.body.size") or 0, received=response_bytes or 0)
+
+
+class TracedRequestsMixin:
+    """Makes the requests of a requests.Session subclass CLIENT spans of the active trace."""
+
+    def request(self, method, url, *args, **kwargs):
+        with http_span(method, url, _body_size(kwargs.get("data"))) as current:
+            response = super().request(method, url, *args, **kwargs)
+            length = response.headers.get("Content-Length")
+            record_response(current, response.status_code, int(length) if length and length.isdigit() else None)
+            return response
+
+
+class TracedSession(TracedRequestsMixin, requests.Session):
+    """requests.Session whose requests are CLIENT spans of the active trace."""
+
+
+class TracedHttp(httplib2.Http):
+    """httplib2.Http (the Drive API client's transport) whose requests are CLIENT spans."""
+
+    def request(self, uri, method="GET", body=None, headers=None, *args, **kwargs):
+        with http_span(method, uri, _body_size(body)) as current:
+            response, content = super().request(uri, method, body, headers, *args, **kwargs)
+            record_response(current, response.status, len(content) if content is not None else None)
+            return response, content
+
+
+class TraceMiddleware:
+    """
+    ASGI middleware starting a SERVER span (a new trace, or the caller's
+    traceparent) for every HTTP request and returning the trace in a
+    traceparent response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        traceparent = headers.get(b"traceparent", b"").decode("latin-1")
+        method, path = scope.get("method", "GET"), scope.get("path", "")
+        with span(f"{method} {path}", kind=SERVER, traceparent=traceparent,
+                  **{"http.method": method, "url.path": path}) as current:
+
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    record_response(current, message["status"], None)
+                    message = {
+                        **message,
+                        "headers": [*message.get("headers", []), (b"traceparent", current.traceparent().encode())],
+                    }
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace)
@@ -0,0 +1,125 @@
+from agency_swarm.tools import BaseTool
+from pydantic import Field
+import json
+import time
+
+from monitoring.tracing import traced_tool
+from workflow.artifacts import PROMPT_PACKAGE, ArtifactNotFoundError, resolve_artifact
+from workflow.reuse_index import REUSE_SIMILARITY_THRESHOLD, brief_from_prompt, get_reuse_index
+
+
+class FindReusableImageTool(BaseTool):
+    """
+    Look up previously delivered images whose brief resembles this one
+    (MinHash/LSH similarity over theme, mood, palette and visual elements).
+    Call it before KieNanoBananaTool: matches can be offered instantly instead of
+    waiting for a new generation.
+    """
+
+    prompt: str = Field(
+        default="",
+        description="The prompt about to be generated; its Theme/Mood/Palette/Visual Metaphor lines and --ar are used as the brief"
+    )
+
+    prompt_artifact_id: str = Field(
+        default="",
+        description="artifact_id of the Art Direction Agent's prompt package, in place of prompt"
+    )
+
+    theme: str = Field(
+        default="",
+        description="Theme of the brief (overrides the one parsed from the prompt)"
+    )
+
+    mood: str = Field(
+        default="",
+        description="Mood of the brief (overrides the one parsed from the prompt)"
+    )
+
+    palette: str = Field(
+        default="",
+        description="Palette of the brief (overrides the one parsed from the prompt)"
+    )
+
+    visual_elements: str = Field(
+        default="",
+        description="Visual elements of the brief (overrides the ones parsed from the prompt)"
+    )
+
+    aspect_ratio: str = Field(
+        default="",
+        description="Only return images delivered in this aspect ratio (e.g. '16:9'); empty uses the prompt's --ar, if any"
+    )
+
+    min_similarity: float = Field(
+        default=REUSE_SIMILARITY_THRESHOLD,
+        description="Minimum brief similarity (0-1) for an image to be offered"
+    )
+
+    limit: int = Field(
+        default=3,
+        description="Maximum number of candidates to return (1-10)"
+    )
+
+    @traced_tool
+    def run(self):
+        """
+        Query the reuse index and return the closest delivered images.
+        """
+
+        # Step 1: Build the brief from the prompt, explicit fields taking precedence
+        prompt = self.prompt
+        if self.prompt_artifact_id:
+            try:
+                prompt = resolve_artifact(self.prompt_artifact_id, PROMPT_PACKAGE)["prompt"]
+            except ArtifactNotFoundError as e:
+                return json.dumps({"success": False, "error": str(e)}, indent=2)
+        brief = brief_from_prompt(prompt)
+        for field_name in ("theme", "mood", "palette", "visual_elements", "aspect_ratio"):
+            value = getattr(self, field_name)
+            if value:
+                brief[field_name] = value
+        if not any(brief.get(field_name) for field_name in ("theme", "mood", "palette", "visual_elements")):
+            return json.dumps({"success": False, "error": "Provide a prompt or at least one brief field"}, indent=2)
+
+        # Step 2: Query the index
+        start = time.perf_counter()
+        try:
+            candidates = get_reuse_index().query(
+                brief,
+                threshold=min(max(self.min_similarity, 0.0), 1.0),
+                limit=max(1, min(self.limit, 10)),
+                aspect_ratio=brief.get("aspect_ratio", ""),
+            )
+        except Exception as e:
+            print(f"Error querying reuse index: {str(e)}")
+            return json.dumps({"success": False, "error": "Reuse index unavailable"}, indent=2)
+        lookup_ms = (time.perf_counter() - start) * 1000
+
+        # Step 3: Format and return results
+        return self._format_result(candidates, lookup_ms)
+
+    def _format_result(self, candidates, lookup_ms):
+        """
+        Format the candidates as pure JSON for downstream agent consumption.
+        CRITICAL: Returns ONLY JSON - no prose, no headers.
+        """
+        return json.dumps(
+            {
+                "success": True,
+                "count": len(candidates),
+                "lookup_ms": round(lookup_ms, 2),
+                "candidates": [candidate.to_dict() for candidate in candidates],
+            },
+            indent=2,
+            ensure_ascii=False,
+        )
+
+
+if __name__ == "__main__":
+    tool = FindReusableImageTool(
+        theme="solitude in the desert",
+        mood="calm, meditative",
+        palette="warm earth tones, golden light",
+    )
+    print(tool.run())
@@ -14,6 +14,10 @@ from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
 from monitoring import emit_event
+from monitoring.accounting import current_request_id, record_kie
+from monitoring.metrics import KIE_CREATE_SECONDS, KIE_POLL_ATTEMPTS, KIE_POLL_SECONDS
+from monitoring.tracing import TracedSession, span, traced_tool
+from workflow.artifacts import IMAGE_RESULT, PROMPT_PACKAGE, ArtifactNotFoundError, resolve_artifact, store_artifact
 
 load_dotenv()
 
@@ -31,8 +35,18 @@ class KieNanoBananaTool(BaseTool):
     """
     
     prompt: str = Field(
-        ..., 
-        description="The detailed prompt for image generation. Should include theme, mood, composition, and style details."
+        default="",
+        description="The detailed prompt for image generation. Should include theme, mood, composition, and style details. Leave empty when prompt_artifact_id is given."
+    )
+    
+    prompt_artifact_id: str = Field(
+        default="",
+        description="artifact_id of the Art Direction Agent's prompt package; the prompt, negative prompt and aspect ratio are read from it instead of being passed inline"
+    )
+    
+    variant: int = Field(
+        default=0,
+        description="With prompt_artifact_id, the index of the variant to generate from the package's variants list (0 = main prompt)"
     )
     
     aspect_ratio: str = Field(
@@ -80,12 +94,26 @@ class KieNanoBananaTool(BaseTool):
         description="Multiplier applied to poll interval after each attempt"
     )
 
+    request_id: str = Field(
+        default="",
+        description="ID of the user request the image is generated for; copied into the image result so QA charges the request's retry budget. Leave empty to use the active request's ID"
+    )
+
+    @traced_tool
     def run(self):
         """
         Execute the image generation workflow through KIE API.
         Returns the image URL, seed, and generation parameters.
         """
         
+        # Step 0: Read the prompt from the prompt package when it is passed by reference
+        if self.prompt_artifact_id:
+            error = self._load_prompt_package()
+            if error:
+                return self._format_result(None, error=error)
+        if not self.prompt:
+            return self._format_result(None, error="Provide prompt or prompt_artifact_id")
+        
         if not KIE_API_KEY:
             emit_event("kie_missing_api_key", level="error")
             return self._format_result(None, error="KIE_API_KEY not found in environment variables. Please add it to your .env file.")
@@ -93,7 +121,13 @@ class KieNanoBananaTool(BaseTool):
         session = self._build_session()
         
         # Step 1: Create the image generation task
-        task_id = self._create_task(session)
+        with span("kie.create_task", **{"kie.aspect_ratio": self.aspect_ratio, "kie.num_images": self.num_images,
+                                        "kie.prompt_bytes": len(self.prompt.encode("utf-8"))}) as create_span:
+            with KIE_CREATE_SECONDS.time():
+                task_id = self._create_task(session)
+            create_span.set_attribute("kie.task_id", task_id)
+            if not task_id:
+                create_span.set_error("task not created")
         if not task_id:
             return self._format_result(None, error="Failed to create image generation task")
         
@@ -106,7 +140,14 @@ class KieNanoBananaTool(BaseTool):
         )
         
         # Step 2: Poll for task completion
-        task_data, poll_meta = self._poll_task(session, task_id)
+        with span("kie.poll", **{"kie.task_id": task_id}) as poll_span:
+            task_data, poll_meta = self._poll_task(session, task_id)
+            poll_span.set_attribute("kie.attempts", poll_meta.get("attempts"))
+            outcome = "completed" if task_data else "failed"
+            KIE_POLL_SECONDS.observe(poll_meta.get("poll_duration_seconds") or 0, outcome=outcome)
+            KIE_POLL_ATTEMPTS.observe(poll_meta.get("attempts") or 0, outcome=outcome)
+            if not task_data:
+                poll_span.set_error("task failed or timed out")
         if not task_data:
             emit_event(
                 "kie_task_failed",
@@ -116,6 +157,7 @@ class KieNanoBananaTool(BaseTool):
             )
             return self._format_result(None, error=f"Task {task_id} failed or timed out", metadata=poll_meta)
         
+        record_kie(images=len(task_data.get("images") or []))
         emit_event(
             "kie_task_completed",
             task_id=task_id,
@@ -134,11 +176,28 @@ class KieNanoBananaTool(BaseTool):
         # Step 3: Extract and return image information
         return self._format_result(task_data, metadata=poll_meta)
     
+    def _load_prompt_package(self) -> Optional[str]:
+        """
+        Fill prompt, negative_prompt and aspect_ratio from the referenced prompt package.
+        Returns an error message if the package or variant cannot be used.
+        """
+        try:
+            package = resolve_artifact(self.prompt_artifact_id, PROMPT_PACKAGE)
+        except ArtifactNotFoundError as exc:
+            return str(exc)
+        variants = package.get("variants") or [package]
+        if not 0 <= self.variant < len(variants):
+            return f"Prompt package {self.prompt_artifact_id} has no variant {self.variant} ({len(variants)} available)"
+        self.prompt = variants[self.variant]["prompt"]
+        self.negative_prompt = variants[self.variant]["negative_prompt"]
+        self.aspect_ratio = package.get("aspect_ratio") or self.aspect_ratio
+        return None
+    
     def _build_session(self) -> Session:
         """
         Configure a requests Session with retries for transient network issues.
         """
-        session = requests.Session()
+        session = TracedSession()
         retry = Retry(
             total=5,
             backoff_factor=0.5,
@@ -232,12 +291,7 @@ class KieNanoBananaTool(BaseTool):
                 task_data = data.get("data", {})
                 status = task_data.get("status", "")
                 
-                logger.info(
-                    "KIE poll attempt %s | task_id=%s | status=%s",
-                    attempts,
-                    task_id,
-                    status,
-                )
+                emit_event("kie_poll_attempt", task_id=task_id, attempt=attempts, status=status)
                 
                 if status == "completed":
                     return task_data, self._poll_meta(task_id, attempts, start)
@@ -327,6 +381,7 @@ class KieNanoBananaTool(BaseTool):
         
         result = {
             "success": True,
+            "request_id": self.request_id or current_request_id(),
             "task_id": metadata.get("task_id"),
             "poll_duration_seconds": metadata.get("poll_duration_seconds"),
             "attempts": metadata.get("attempts"),
@@ -338,6 +393,19 @@ class KieNanoBananaTool(BaseTool):
             "all_image_urls": [img.get("url") for img in images if img.get("url")]
         }
         
+        # Store the result so the handoff to QA can carry its artifact ID only
+        artifact_id = store_artifact(
+            IMAGE_RESULT,
+            {
+                **{key: value for key, value in result.items() if key not in ("success", "num_images")},
+                "seed": str(result["seed"]),
+                "style": "cinematic-premium",
+            },
+            parent_id=self.prompt_artifact_id,
+        )
+        if artifact_id:
+            result["artifact_id"] = artifact_id
+        
         return json.dumps(result, indent=2)
 
 
@@ -4,6 +4,28 @@ import requests
 from PIL import Image
 from io import BytesIO
 import re
+import sqlite3
+import time
+
+from delivery.blob_store import blob_url, keep_local_copy, read_local_blob
+from delivery.speculative import EXPORT_SPECULATIVE, accept_speculation, discard_speculation, speculate
+from delivery.storage import get_backend
+from monitoring.accounting import current_request_id, record_cpu
+from monitoring.metrics import QA_CPU_SECONDS, QA_FAILED_CHECKS, QA_VERDICTS
+from monitoring.tracing import current_span, download_span, span, traced_tool
+from workflow.artifacts import IMAGE_RESULT, ArtifactNotFoundError, resolve_artifact, store_artifact
+from workflow.retry import (
+    ACCEPT,
+    ALTERNATE,
+    PASSING_STATUSES,
+    REGENERATE,
+    REPAIR,
+    STOP,
+    RetryDecision,
+    get_retry_controller,
+    plan_repair,
+    repair_image,
+)
 
 
 class ValidateImageTool(BaseTool):
@@ -13,13 +35,18 @@ class ValidateImageTool(BaseTool):
     """
     
     image_url: str = Field(
-        ...,
-        description="URL of the image to validate"
+        default="",
+        description="URL of the image to validate. Leave empty when image_artifact_id is given."
     )
     
     expected_aspect_ratio: str = Field(
-        ...,
-        description="Expected aspect ratio (e.g., '16:9', '1:1', '9:16')"
+        default="",
+        description="Expected aspect ratio (e.g., '16:9', '1:1', '9:16'). Leave empty when image_artifact_id is given."
+    )
+    
+    image_artifact_id: str = Field(
+        default="",
+        description="artifact_id of the NB Image Agent's image result; the image URL and expected aspect ratio are read from it"
     )
     
     min_width: int = Field(
@@ -36,26 +63,162 @@ class ValidateImageTool(BaseTool):
         default=0.05,
         description="Tolerance for aspect ratio deviation (0.05 = 5%)"
     )
+    
+    speculative_export: bool = Field(
+        default=EXPORT_SPECULATIVE,
+        description="Upload the image to a staging area while it is validated, so the export of a passing image only moves it into place (discarded on retry or fail). Defaults to EXPORT_SPECULATIVE"
+    )
+    
+    request_id: str = Field(
+        default="",
+        description="ID of the user request the image belongs to (the image result's request_id); all QA attempts of a request share one retry budget. Defaults to the image result's, else the active request's"
+    )
 
+    @traced_tool
     def run(self):
         """
         Perform comprehensive validation on the generated image.
+        Failing images go to the retry controller (workflow.retry), which may
+        repair them locally or pick another image of the same generation before
+        asking for a regeneration, and stops once the request's budget is spent.
         Returns validation status with detailed feedback.
         """
         
-        # Step 1: Download and open the image
-        image = self._download_image()
-        if not image:
+        # Step 0: Read the image URL and aspect ratio from the image result when passed by reference
+        image_result = {}
+        if self.image_artifact_id:
+            try:
+                image_result = resolve_artifact(self.image_artifact_id, IMAGE_RESULT)
+            except ArtifactNotFoundError as e:
+                return self._format_result(
+                    status="fail",
+                    issues=[str(e)],
+                    passed_checks=[],
+                    failed_checks=["Image accessibility"]
+                )
+            self.image_url = self.image_url or image_result["image_url"]
+            self.expected_aspect_ratio = self.expected_aspect_ratio or image_result["aspect_ratio"]
+        if not self.image_url or not self.expected_aspect_ratio:
             return self._format_result(
                 status="fail",
-                issues=["Failed to download or open image"],
+                issues=["Provide image_url and expected_aspect_ratio, or image_artifact_id"],
                 passed_checks=[],
                 failed_checks=["Image accessibility"]
             )
         
-        print(f"Image loaded successfully. Size: {image.size}")
+        generation = {
+            "task_id": image_result.get("task_id") or self.image_url,
+            "images": len(image_result.get("all_image_urls") or []) or 1,
+            "generation_seconds": image_result.get("poll_duration_seconds"),
+        }
+        # The budget belongs to the run, never to the content: a later request for the same brief starts fresh.
+        # Results without a request ID (older handoffs, direct calls) fall back to the active request, then the task.
+        request_id = (
+            self.request_id or image_result.get("request_id") or current_request_id() or generation["task_id"]
+        )
+        candidates = [url for url in image_result.get("all_image_urls") or [] if url != self.image_url]
+        
+        # Validate until an image passes or the controller asks for a regeneration or stops
+        image_url, image, decision = self.image_url, None, None
+        judged = 0
+        while True:
+            # Step 0b: Start the export in the background while the checks run
+            speculation = self._speculate(image_url) if self.speculative_export else None
+            
+            # Step 1: Download and open the image (the speculation's download, when there is one)
+            if image is None:
+                image = self._download_image(image_url, speculation)
+            if not image:
+                self._discard_speculation(image_url)
+                return self._format_result(
+                    status="fail",
+                    issues=["Failed to download or open image"],
+                    passed_checks=[],
+                    failed_checks=["Image accessibility"]
+                )
+            
+            print(f"Image loaded successfully. Size: {image.size}")
+            
+            # Steps 2-3: Run all validation checks and determine the status
+            result = self._validate(image)
+            judged += 1
+            
+            # Step 3b: Let the retry controller pick what follows a failing image
+            plan = None
+            if result["status"] == "retry":
+                plan = plan_repair(image.size, self.expected_aspect_ratio, self.min_width, self.min_height)
+            decision = self._next_action(request_id, {**generation, "image_url": image_url}, result, candidates, plan is not None)
+            if decision is None or decision.action == ACCEPT:
+                if result["status"] in PASSING_STATUSES:
+                    self._accept_speculation(image_url)
+                else:
+                    self._discard_speculation(image_url)
+                break
+            self._discard_speculation(image_url)
+            if decision.action == REPAIR:
+                with span("qa.repair", **{"qa.crop_box": list(plan[0]), "qa.size": list(plan[1])}):
+                    cpu_start = time.thread_time()
+                    repaired = repair_image(image, plan)
+                    record_cpu("qa_repair", time.thread_time() - cpu_start)
+                sha256 = keep_local_copy(repaired)
+                if not sha256:
+                    decision = RetryDecision(REGENERATE, "The repaired image could not be stored")
+                    break
+                print(f"Repaired image locally: {decision.reason}")
+                image_url, image = blob_url(sha256), Image.open(BytesIO(repaired))
+            elif decision.action == ALTERNATE:
+                print(f"Validating an alternate image: {decision.reason}")
+                image_url, image = decision.image_url, None
+            else:
+                break
         
-        # Step 2: Run all validation checks
+        # Step 4: Return formatted result, for the image that was judged last
+        if decision is not None and decision.action == STOP:
+            result["status"] = "fail"
+        extra = {}
+        tool_span = current_span()
+        if tool_span is not None:
+            tool_span.set_attributes(**{
+                "qa.status": result["status"],
+                "qa.images_judged": judged,
+                "qa.retry_action": decision.action if decision else None,
+            })
+        if decision is not None:
+            extra["retry"] = {
+                "request_id": request_id,
+                "action": decision.action,
+                "reason": decision.reason,
+                **({"error": decision.error} if decision.error else {}),
+                **get_retry_controller().summary(request_id),
+            }
+        if image_url != self.image_url:
+            extra["image_url"] = image_url
+            if decision is not None and decision.action == ACCEPT and self.image_artifact_id:
+                # Hand the Export Agent the image that passed, derived from the original result
+                artifact_id = store_artifact(IMAGE_RESULT, {**image_result, "image_url": image_url}, parent_id=self.image_artifact_id)
+                if artifact_id:
+                    extra["image_artifact_id"] = artifact_id
+        return self._format_result(**result, extra=extra)
+
+    def _validate(self, image):
+        """
+        Run the validation checks on an opened image.
+        Returns the keyword arguments of _format_result.
+        """
+        with span("qa.checks", **{"image.width": image.width, "image.height": image.height}) as checks_span:
+            # thread_time: the CPU this check used, whatever else the process runs meanwhile.
+            cpu_start = time.thread_time()
+            result = self._run_checks(image)
+            cpu_seconds = time.thread_time() - cpu_start
+            QA_CPU_SECONDS.observe(cpu_seconds)
+            record_cpu("qa", cpu_seconds)
+            QA_VERDICTS.inc(status=result["status"])
+            for check in result["failed_checks"]:
+                QA_FAILED_CHECKS.inc(check=check)
+            checks_span.set_attributes(**{"qa.status": result["status"], "qa.failed_checks": result["failed_checks"]})
+            return result
+
+    def _run_checks(self, image):
         passed_checks = []
         failed_checks = []
         issues = []
@@ -97,7 +260,7 @@ class ValidateImageTool(BaseTool):
         if not color_check["passed"]:
             warnings.append(color_check["message"])
         
-        # Step 3: Determine overall status
+        # Determine overall status
         if failed_checks:
             status = "retry"
         elif warnings:
@@ -105,32 +268,81 @@ class ValidateImageTool(BaseTool):
         else:
             status = "pass"
         
-        # Step 4: Return formatted result
-        return self._format_result(
-            status=status,
-            issues=issues,
-            warnings=warnings,
-            passed_checks=passed_checks,
-            failed_checks=failed_checks,
-            image_info={
+        return {
+            "status": status,
+            "issues": issues,
+            "warnings": warnings,
+            "passed_checks": passed_checks,
+            "failed_checks": failed_checks,
+            "image_info": {
                 "width": image.width,
                 "height": image.height,
                 "actual_ratio": f"{image.width}:{image.height}",
                 "format": image.format,
                 "mode": image.mode
             }
-        )
-    
-    def _download_image(self):
+        }
+
+    def _next_action(self, request_id, image, result, candidates, repairable):
+        """
+        Record the verdict with the retry controller and return its decision,
+        or None (the verdict stands as is) if the retry ledger is unavailable.
+        """
+        try:
+            return get_retry_controller().next_action(request_id, image, result, candidates, repairable)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Retry controller unavailable: {str(e)}")
+            return None
+
+    def _speculate(self, image_url):
+        """
+        Stage the export of this image on the default backend (delivery.speculative);
+        the Export Agent's upload commits it if the image passes.
+        """
+        try:
+            return speculate(image_url, get_backend())
+        except Exception as e:
+            print(f"Speculative export not started: {str(e)}")
+            return None
+
+    def _accept_speculation(self, image_url):
+        if self.speculative_export:
+            accept_speculation(image_url)
+
+    def _discard_speculation(self, image_url):
+        if self.speculative_export:
+            discard_speculation(image_url)
+
+    def _speculation_bytes(self, speculation):
+        """The image as the speculation downloaded it, or None to download it here."""
+        if speculation is None:
+            return None
+        try:
+            return speculation.image_bytes()
+        except Exception as e:
+            print(f"Speculative download failed, downloading again: {str(e)}")
+            return None
+
+    def _download_image(self, image_url, speculation=None):
         """
-        Download and open image from URL.
+        Download and open image from URL (images stored locally, such as repairs, are read from disk,
+        and a speculative export's download is reused).
         Returns PIL Image object if successful, None otherwise.
         """
         try:
-            response = requests.get(self.image_url, timeout=60)
-            response.raise_for_status()
+            with download_span(image_url) as current:
+                content = read_local_blob(image_url)
+                current.set_attribute("download.local", content is not None)
+                if content is None:
+                    content = self._speculation_bytes(speculation)
+                    current.set_attribute("download.speculative", content is not None)
+                if content is None:
+                    response = requests.get(image_url, timeout=60)
+                    response.raise_for_status()
+                    content = response.content
+                current.set_attribute("download.bytes", len(content))
             
-            image = Image.open(BytesIO(response.content))
+            image = Image.open(BytesIO(content))
             return image
             
         except requests.exceptions.RequestException as e:
@@ -312,7 +524,7 @@ class ValidateImageTool(BaseTool):
                 "message": "Could not assess color distribution"
             }
     
-    def _format_result(self, status, issues, passed_checks, failed_checks, warnings=None, image_info=None):
+    def _format_result(self, status, issues, passed_checks, failed_checks, warnings=None, image_info=None, extra=None):
         """
         Format validation results as pure JSON for downstream agent consumption.
         CRITICAL: Returns ONLY JSON - no prose, no headers.
@@ -327,6 +539,8 @@ class ValidateImageTool(BaseTool):
         
         if status == "retry":
             recommendation = "Generate new image with corrections"
+        elif status == "fail":
+            recommendation = "Do not export; report the failure"
         elif status == "pass_with_warnings":
             recommendation = "Image is acceptable but could be improved"
         else:
@@ -340,7 +554,8 @@ class ValidateImageTool(BaseTool):
             "issues": issues,
             "warnings": warnings,
             "image_info": image_info,
-            "recommendation": recommendation
+            "recommendation": recommendation,
+            **(extra or {})
         }
         
         return json.dumps(result, indent=2)
@@ -352,6 +567,7 @@ if __name__ == "__main__":
     print("To test this tool, run:")
     print("tool = ValidateImageTool(")
     print("    image_url='https://example.com/image.png',")
-    print("    expected_aspect_ratio='16:9'")
+    print("    expected_aspect_ratio='16:9',")
+    print("    request_id='0f8c2d4e6a1b3c5d7e9f0a2b4c6d8e1f'")
     print(")")
     print("print(tool.run())")
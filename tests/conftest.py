@@ -0,0 +1,14 @@
+"""
+Shared test setup: the repository root on sys.path, and every store's default
+location under a scratch state directory (modules read their paths on import).
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+os.environ["ATHAR_STATE_DIR"] = tempfile.mkdtemp(prefix="athar-tests-")
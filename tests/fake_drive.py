@@ -0,0 +1,125 @@
+"""
+In-memory stand-in for the parts of the Drive v3 files API the delivery code
+queries: files().list with appProperties / parents / name / mimeType / trashed
+clauses, files().get / create / update / delete and permissions().list.
+"""
+
+from __future__ import annotations
+
+import itertools
+import re
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+_PROPERTY_RE = re.compile(r"appProperties has \{ key='([^']*)' and value='([^']*)' \}")
+_PARENT_RE = re.compile(r"'([^']*)' in parents")
+_FIELD_RE = re.compile(r"\b(name|mimeType) = '([^']*)'")
+
+
+class _Request:
+    def __init__(self, result):
+        self._result = result
+
+    def execute(self):
+        if isinstance(self._result, Exception):
+            raise self._result
+        return self._result
+
+
+def not_found(file_id: str) -> HttpError:
+    return HttpError(httplib2.Response({"status": 404}), f"File not found: {file_id}".encode())
+
+
+class FakeFiles:
+    def __init__(self, drive: "FakeDrive"):
+        self.drive = drive
+
+    def list(self, q: str = "", fields: str = "", pageSize: int = 100, **kwargs):
+        self.drive.queries.append(q)
+        wanted = dict(_PROPERTY_RE.findall(q))
+        parents = set(_PARENT_RE.findall(q))
+        fields_wanted = dict(_FIELD_RE.findall(q))
+        matches = [
+            {"id": file_id, "name": item["name"]}
+            for file_id, item in self.drive.files.items()
+            if all(item["appProperties"].get(key) == value for key, value in wanted.items())
+            and parents <= set(item["parents"])
+            and all(item.get(key) == value for key, value in fields_wanted.items())
+            and not ("trashed = false" in q and item["trashed"])
+        ]
+        return _Request({"files": matches[:pageSize]})
+
+    def get(self, fileId: str, fields: str = "", **kwargs):
+        self.drive.gets.append(fileId)
+        item = self.drive.files.get(fileId)
+        if item is None:
+            return _Request(not_found(fileId))
+        return _Request({"id": fileId, "name": item["name"], "trashed": item["trashed"]})
+
+    def create(self, body: dict, media_body=None, fields: str = "", **kwargs):
+        missing = [parent for parent in body.get("parents", []) if not self.drive.exists(parent)]
+        if missing:
+            return _Request(not_found(missing[0]))
+        file_id = body.get("id") or f"id{next(self.drive.ids)}"
+        self.drive.files[file_id] = {
+            "name": body["name"],
+            "parents": list(body.get("parents", [])),
+            "appProperties": dict(body.get("appProperties", {})),
+            "mimeType": body.get("mimeType", ""),
+            "trashed": False,
+        }
+        return _Request({"id": file_id, "name": body["name"], "parents": list(body.get("parents", []))})
+
+    def update(self, fileId: str, body: dict, addParents: str = "", removeParents: str = "", **kwargs):
+        if addParents and not self.drive.exists(addParents):
+            return _Request(not_found(addParents))
+        item = self.drive.files[fileId]
+        item["name"] = body.get("name", item["name"])
+        item["parents"] = [p for p in item["parents"] if p != removeParents] + [addParents]
+        return _Request({"id": fileId, "name": item["name"], "parents": item["parents"]})
+
+    def delete(self, fileId: str, **kwargs):
+        self.drive.files.pop(fileId, None)
+        return _Request({})
+
+
+class FakePermissions:
+    def list(self, fileId: str, fields: str = "", **kwargs):
+        return _Request({"permissions": []})
+
+
+class FakeDrive:
+    """Drive service double holding {file_id: {name, parents, appProperties, trashed}}."""
+
+    def __init__(self, roots: tuple[str, ...] = ()):
+        # Folders that exist without being listed in files (the export roots).
+        self.roots = set(roots)
+        self.ids = itertools.count(1)
+        self.files: dict[str, dict] = {}
+        self.queries: list[str] = []
+        self.gets: list[str] = []
+
+    def add(self, file_id: str, parent: str, properties: dict, name: str = "image.png", trashed: bool = False) -> None:
+        self.files[file_id] = {
+            "name": name, "parents": [parent], "appProperties": properties, "mimeType": "", "trashed": trashed,
+        }
+
+    def exists(self, file_id: str) -> bool:
+        return file_id in self.roots or file_id in self.files
+
+    def service(self) -> "FakeService":
+        return FakeService(self)
+
+
+class FakeService:
+    """What get_drive_service() returns, backed by a FakeDrive."""
+
+    def __init__(self, drive: FakeDrive):
+        self.drive = drive
+
+    def files(self) -> FakeFiles:
+        return FakeFiles(self.drive)
+
+    def permissions(self) -> FakePermissions:
+        return FakePermissions()
@@ -0,0 +1,51 @@
+"""Artifact IDs keep each payload's own lineage."""
+
+import pytest
+
+from workflow.artifacts import IMAGE_RESULT, PROMPT_PACKAGE, ArtifactStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ArtifactStore(str(tmp_path / "artifacts.sqlite3"))
+
+
+def test_same_payload_and_parent_share_an_id(store):
+    package = store.put(PROMPT_PACKAGE, {"prompt": "desert at dusk"})
+    assert store.put(PROMPT_PACKAGE, {"prompt": "desert at dusk"}) == package
+    image = store.put(IMAGE_RESULT, {"image_url": "https://x/1.png"}, parent_id=package)
+    assert store.put(IMAGE_RESULT, {"image_url": "https://x/1.png"}, parent_id=package) == image
+
+
+def test_repeated_payload_under_another_parent_keeps_its_lineage(store):
+    first_package = store.put(PROMPT_PACKAGE, {"prompt": "desert at dusk", "seed": 1})
+    second_package = store.put(PROMPT_PACKAGE, {"prompt": "desert at dusk", "seed": 2})
+    payload = {"image_url": "https://x/cached.png"}
+
+    first = store.put(IMAGE_RESULT, payload, parent_id=first_package)
+    second = store.put(IMAGE_RESULT, payload, parent_id=second_package)
+
+    assert first != second
+    assert store.root(first) == first_package
+    assert store.root(second) == second_package
+
+
+def test_savings_follow_the_artifacts_own_parent(store):
+    first_package = store.put(PROMPT_PACKAGE, {"prompt": "a" * 400})
+    second_package = store.put(PROMPT_PACKAGE, {"prompt": "b" * 400})
+    payload = {"image_url": "https://x/cached.png"}
+    store.put(IMAGE_RESULT, payload, parent_id=first_package)
+    second = store.put(IMAGE_RESULT, payload, parent_id=second_package)
+    store.resolve(first_package)
+    store.resolve(second_package)
+    store.resolve(second_package)
+
+    assert store.pipeline_savings(second)["references"] == 2
+
+
+def test_retry_chain_roots_at_the_prompt_package(store):
+    package = store.put(PROMPT_PACKAGE, {"prompt": "desert"})
+    image = store.put(IMAGE_RESULT, {"image_url": "https://x/1.png"}, parent_id=package)
+    repaired = store.put(IMAGE_RESULT, {"image_url": "https://x/1-fixed.png"}, parent_id=image)
+
+    assert store.root(repaired) == package
@@ -0,0 +1,82 @@
+"""Content-hash dedupe: Drive queries stay inside the export root."""
+
+import pytest
+
+from delivery import dedupe
+from delivery.dedupe import HASH_PROPERTY, ROOT_PROPERTY, ContentIndex, find_existing, hash_properties
+
+from .fake_drive import FakeDrive
+
+SHA = "a" * 64
+
+
+@pytest.fixture
+def drive(monkeypatch):
+    drive = FakeDrive()
+    monkeypatch.setattr(dedupe, "get_drive_service", drive.service)
+    return drive
+
+
+@pytest.fixture
+def index(tmp_path):
+    return ContentIndex(str(tmp_path / "content_index.sqlite3"))
+
+
+def test_upload_stamp_names_the_root():
+    assert hash_properties(SHA, "root-a") == {HASH_PROPERTY: SHA, ROOT_PROPERTY: "root-a"}
+    assert hash_properties(SHA) == {HASH_PROPERTY: SHA}
+
+
+def test_sharded_lookup_finds_files_in_the_roots_sub_folders(drive, index):
+    drive.add("mine", "root-a-shard-2026-10", hash_properties(SHA, "root-a"))
+
+    existing = find_existing(SHA, "root-a", index, any_parent=True)
+
+    assert existing.file_id == "mine"
+    assert existing.source == "drive_query"
+
+
+def test_sharded_lookup_ignores_the_same_content_under_another_root(drive, index):
+    drive.add("customer-file", "customer-folder", hash_properties(SHA, "root-b"))
+    drive.add("unstamped", "somewhere-else", hash_properties(SHA))
+
+    assert find_existing(SHA, "root-a", index, any_parent=True) is None
+    assert index.lookup(SHA, "root-a") is None
+
+
+def test_flat_lookup_stays_in_the_folder(drive, index):
+    drive.add("elsewhere", "folder-b", hash_properties(SHA, "folder-b"))
+    assert find_existing(SHA, "folder-a", index) is None
+
+    drive.add("here", "folder-a", hash_properties(SHA))
+    assert find_existing(SHA, "folder-a", index).file_id == "here"
+
+
+def test_index_hit_is_confirmed_with_drive(drive, index):
+    drive.add("live", "folder-a", hash_properties(SHA, "folder-a"))
+    index.record_file(SHA, "folder-a", "live", "image.png", 10)
+
+    assert find_existing(SHA, "folder-a", index).source == "local_index"
+    assert drive.gets == ["live"]
+
+
+@pytest.mark.parametrize("gone", ["trashed", "deleted"])
+def test_index_hit_for_a_gone_file_is_forgotten(drive, index, gone):
+    if gone == "trashed":
+        drive.add("old", "folder-a", hash_properties(SHA, "folder-a"), trashed=True)
+    index.record_file(SHA, "folder-a", "old", "image.png", 10)
+    index.record_derivatives(SHA, "folder-a", [{"name": "web", "file_id": "old-web"}])
+
+    assert find_existing(SHA, "folder-a", index) is None
+    assert index.lookup(SHA, "folder-a") is None
+    assert index.derivatives(SHA, "folder-a") == []
+
+
+def test_index_hit_is_kept_when_drive_cannot_be_asked(monkeypatch, index):
+    def unavailable():
+        raise RuntimeError("no credentials")
+
+    monkeypatch.setattr(dedupe, "get_drive_service", unavailable)
+    index.record_file(SHA, "folder-a", "live", "image.png", 10)
+
+    assert find_existing(SHA, "folder-a", index).file_id == "live"
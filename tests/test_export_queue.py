@@ -0,0 +1,208 @@
+"""ExportJobStore claims and recovery across connections sharing one queue file."""
+
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from delivery.export_queue import JOB_QUEUED, JOB_UPLOADED, JOB_UPLOADING, ExportJob, ExportJobStore, process_owner
+
+
+def make_job(number: int) -> ExportJob:
+    return ExportJob(
+        file_id=f"file-{number}",
+        image_url=f"https://example.com/{number}.png",
+        filename=f"{number}.png",
+        folder_id="folder",
+        created_at=time.time() + number / 1000,
+    )
+
+
+def dead_owner() -> str:
+    child = subprocess.Popen([sys.executable, "-c", "pass"])
+    child.wait()
+    return f"{socket.gethostname()}:{child.pid}"
+
+
+def test_second_connection_cannot_claim_a_claimed_job(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    first = ExportJobStore(path, owner="host-a:1")
+    second = ExportJobStore(path, owner="host-b:2")
+    first.insert(make_job(1))
+
+    claimed = first.claim_next(time.time())
+
+    assert claimed.file_id == "file-1"
+    assert claimed.owner == "host-a:1"
+    assert claimed.attempts == 1
+    assert second.claim_next(time.time()) is None
+
+
+def test_concurrent_claimers_take_each_job_once(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    stores = [ExportJobStore(path, owner=f"host-{index}:{index}") for index in range(4)]
+    for number in range(200):
+        stores[0].insert(make_job(number))
+    claims: list[str] = []
+    claims_lock = threading.Lock()
+
+    def drain(store: ExportJobStore) -> None:
+        while (job := store.claim_next(time.time())) is not None:
+            with claims_lock:
+                claims.append(job.file_id)
+
+    threads = [threading.Thread(target=drain, args=(store,)) for store in stores for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claims) == sorted(f"file-{number}" for number in range(200))
+
+
+def test_requeue_leaves_live_owners_jobs_alone(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    live = ExportJobStore(path, owner=process_owner())
+    live.insert(make_job(1))
+    live.claim_next(time.time())
+
+    restarted = ExportJobStore(path, owner="host-b:2")
+
+    assert restarted.requeue_interrupted() == 0
+    assert restarted.get("file-1").status == JOB_UPLOADING
+    assert restarted.claim_next(time.time()) is None
+
+
+def test_requeue_takes_back_jobs_of_dead_owners(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    crashed = ExportJobStore(path, owner=dead_owner())
+    crashed.insert(make_job(1))
+    crashed.claim_next(time.time())
+
+    restarted = ExportJobStore(path, owner=process_owner())
+
+    assert restarted.requeue_interrupted() == 1
+    job = restarted.get("file-1")
+    assert job.status == JOB_QUEUED
+    assert job.owner == ""
+    assert restarted.claim_next(time.time()).owner == process_owner()
+
+
+def test_expired_lease_is_reclaimed_and_renewal_keeps_it(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    remote = ExportJobStore(path, owner="other-host:1", lease_seconds=30)
+    remote.insert(make_job(1))
+    remote.insert(make_job(2))
+    remote.claim_next(time.time())
+    local = ExportJobStore(path, owner="host-b:2", lease_seconds=30)
+    # Owners on another host cannot be checked, so only the lease decides.
+    assert local.requeue_interrupted() == 0
+    assert local.claim_next(time.time()).file_id == "file-2"
+
+    later = time.time() + 60
+    remote.renew_leases(later - 10)
+    local.renew_leases(later - 10)
+    assert local.claim_next(later) is None
+
+    reclaimed = local.claim_next(later + 30)
+    assert reclaimed.file_id == "file-1"
+    assert reclaimed.owner == "host-b:2"
+    assert reclaimed.attempts == 2
+
+
+def test_upload_job_reads_the_submitters_download_from_the_blob_store(monkeypatch):
+    from delivery import export_queue
+    from delivery.blob_store import keep_local_copy
+
+    uploaded = {}
+
+    class FakeUpload:
+        def __init__(self, image_url, filename, folder_id, source_file=None, app_properties=None, **kwargs):
+            uploaded["bytes"] = source_file.read()
+            uploaded["properties"] = app_properties
+
+        def run(self):
+            return {"id": "reserved-1", "name": "dunes.png"}
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("the job downloaded the image again")
+
+    monkeypatch.setattr(export_queue, "StreamingDriveUpload", FakeUpload)
+    monkeypatch.setattr(export_queue.requests, "get", no_network)
+    data = b"spooled source image"
+    job = make_job(1)
+    job.optimize = False
+    job.source_sha256 = keep_local_copy(data)
+
+    assert export_queue.upload_job(job)["id"] == "reserved-1"
+    assert uploaded["bytes"] == data
+    assert uploaded["properties"]["athar_sha256"] == job.source_sha256
+
+
+def test_upload_job_records_the_size_of_the_optimized_upload(monkeypatch):
+    from delivery import export_queue
+    from delivery.blob_store import keep_local_copy
+    from delivery.dedupe import ContentIndex
+    from delivery.transcode import TranscodeResult
+
+    recorded = {}
+
+    class FakeUpload:
+        def __init__(self, image_url, filename, folder_id, source_file=None, **kwargs):
+            recorded["uploaded"] = source_file.read()
+
+        def run(self):
+            return {"id": "reserved-1", "name": "dunes.webp"}
+
+    def record_file(self, sha256, folder_id, file_id, name, size, blob_sha256=""):
+        recorded["size"] = size
+
+    optimized = TranscodeResult(data=b"smaller", format="webp", bytes_in=20, quality=80)
+    monkeypatch.setattr(export_queue, "StreamingDriveUpload", FakeUpload)
+    monkeypatch.setattr(export_queue, "optimize_image", lambda data, filename: optimized)
+    monkeypatch.setattr(ContentIndex, "record_file", record_file)
+    job = make_job(1)
+    job.source_sha256 = keep_local_copy(b"spooled source image")
+
+    export_queue.upload_job(job)
+
+    assert recorded["uploaded"] == b"smaller"
+    assert recorded["size"] == len(b"smaller")
+
+
+def test_queue_metrics_follow_claims_and_finished_jobs(tmp_path, monkeypatch):
+    from delivery import export_queue
+    from monitoring import metrics
+
+    def histogram_count(outcome):
+        samples = {tuple(labels): value for labels, value in metrics.EXPORT_JOB_SECONDS.samples()}
+        return sum(samples.get((outcome,), {"counts": []})["counts"])
+
+    def gauge(metric):
+        return dict((tuple(labels), value) for labels, value in metric.samples())[()]
+
+    store = ExportJobStore(str(tmp_path / "queue.sqlite3"))
+    queue = export_queue.ExportQueue(store=store, workers=1, max_attempts=1)
+    for number in (1, 2):
+        store.insert(make_job(number))
+    queue._update_metrics()
+    assert gauge(metrics.EXPORT_QUEUE_DEPTH) == 2
+    assert gauge(metrics.EXPORT_QUEUE_OLDEST_JOB_AGE) >= 0
+
+    uploaded, failed = histogram_count(JOB_UPLOADED), histogram_count("failed")
+    monkeypatch.setattr(export_queue, "ensure_public", lambda file_id, folder_id: True)
+    monkeypatch.setattr(export_queue, "upload_job", lambda job: {"id": job.file_id, "name": job.filename})
+    queue._process(store.claim_next(time.time()))
+
+    def broken_upload(job):
+        raise RuntimeError("network down")
+
+    monkeypatch.setattr(export_queue, "upload_job", broken_upload)
+    queue._process(store.claim_next(time.time()))
+    queue._update_metrics()
+
+    assert histogram_count(JOB_UPLOADED) == uploaded + 1
+    assert histogram_count("failed") == failed + 1
+    assert gauge(metrics.EXPORT_QUEUE_DEPTH) == 0
+    assert gauge(metrics.EXPORT_QUEUE_OLDEST_JOB_AGE) == 0
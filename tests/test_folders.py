@@ -0,0 +1,69 @@
+"""Sharded export folders: a cached folder deleted in Drive is re-created on the next upload."""
+
+import pytest
+
+from delivery import drive_export, folders
+from delivery.folders import DriveFolderResolver, FolderCache, in_live_folder
+
+from .fake_drive import FakeDrive, not_found
+
+
+@pytest.fixture
+def drive(monkeypatch):
+    drive = FakeDrive(roots=("root",))
+    monkeypatch.setattr(folders, "get_drive_service", drive.service)
+    monkeypatch.setattr(drive_export, "get_drive_service", drive.service)
+    drive_export._folder_public_cache.clear()
+    return drive
+
+
+@pytest.fixture
+def resolver(monkeypatch, tmp_path):
+    resolver = DriveFolderResolver(FolderCache(str(tmp_path / "folders.sqlite3")))
+    monkeypatch.setattr(folders, "_resolver", resolver)
+    return resolver
+
+
+def test_upload_into_a_deleted_shard_recreates_it(drive, resolver):
+    stale = resolver.resolve("root", "2026/10/19")
+    year = resolver.resolve("root", "2026")
+    del drive.files[year]
+    del drive.files[resolver.resolve("root", "2026/10")]
+    del drive.files[stale]
+
+    info = drive_export.upload_bytes(b"image", "dunes.png", stale)
+
+    fresh = resolver.resolve("root", "2026/10/19")
+    assert fresh != stale
+    assert info["parents"] == [fresh]
+    assert drive.files[fresh]["parents"] == [resolver.resolve("root", "2026/10")]
+    assert resolver.cache.find(stale) is None
+
+
+def test_later_uploads_go_straight_to_the_replacement(drive, resolver):
+    stale = resolver.resolve("root", "2026")
+    del drive.files[stale]
+    drive_export.upload_bytes(b"one", "one.png", stale)
+    calls = []
+
+    in_live_folder(stale, calls.append)
+
+    assert calls == [resolver.resolve("root", "2026")]
+
+
+def test_other_not_found_errors_are_not_retried(drive, resolver):
+    folder = resolver.resolve("root", "2026")
+    calls = []
+
+    def fails(parent_id):
+        calls.append(parent_id)
+        raise not_found("some-file")
+
+    with pytest.raises(Exception):
+        in_live_folder(folder, fails)
+    assert calls == [folder]
+
+
+def test_unknown_folders_are_not_resolved(drive, resolver):
+    with pytest.raises(Exception):
+        drive_export.upload_bytes(b"image", "dunes.png", "never-cached")
@@ -0,0 +1,82 @@
+"""GET /images/<sha256> serves blobs without touching the filesystem on the event loop."""
+
+import threading
+
+import anyio
+import pytest
+from fastapi import FastAPI
+
+from delivery import http
+from delivery.blob_store import BlobStore
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 8
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    store = BlobStore(str(tmp_path / "blobs"))
+    monkeypatch.setattr(http, "get_blob_store", lambda: store)
+    application = FastAPI()
+    application.include_router(http.router)
+    application.state.sha256 = store.put(PNG)
+    return application
+
+
+def _request(app, path, headers=(), extensions=None):
+    """Run one request through the ASGI app; returns (status, headers, body, messages)."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers],
+        "server": ("test", 80), "client": ("test", 1234), "extensions": extensions or {},
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    anyio.run(app, scope, receive, send)
+    start = messages[0]
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return start["status"], {k.decode(): v.decode() for k, v in start["headers"]}, body, messages
+
+
+def test_serves_the_blob_with_its_etag_and_type(app):
+    status, headers, body, _ = _request(app, f"/images/{app.state.sha256}")
+    assert status == 200
+    assert body == PNG
+    assert headers["etag"] == f'"{app.state.sha256}"'
+    assert headers["content-type"] == "image/png"
+
+
+def test_ranges_and_conditional_requests(app):
+    path = f"/images/{app.state.sha256}"
+    status, headers, body, _ = _request(app, path, [("Range", "bytes=8-15")])
+    assert (status, body, headers["content-range"]) == (206, PNG[8:16], f"bytes 8-15/{len(PNG)}")
+    assert _request(app, path, [("If-None-Match", f'"{app.state.sha256}"')])[0] == 304
+    assert _request(app, path, [("Range", f"bytes={len(PNG)}-")])[0] == 416
+
+
+def test_missing_blobs_are_404(app):
+    assert _request(app, "/images/" + "0" * 64)[0] == 404
+    assert _request(app, "/images/not-a-hash")[0] == 404
+
+
+def test_blob_lookup_runs_off_the_event_loop(app, monkeypatch):
+    loop_thread = threading.get_ident()
+    threads = []
+    lookup = http._blob_info
+    monkeypatch.setattr(http, "_blob_info", lambda sha256: threads.append(threading.get_ident()) or lookup(sha256))
+
+    assert _request(app, f"/images/{app.state.sha256}")[0] == 200
+    assert threads and loop_thread not in threads
+
+
+def test_pathsend_is_used_only_when_the_server_offers_it(app):
+    _, _, _, messages = _request(app, f"/images/{app.state.sha256}", extensions={"http.response.pathsend": {}})
+    assert messages[1]["type"] == "http.response.pathsend"
+    _, _, _, messages = _request(app, f"/images/{app.state.sha256}")
+    assert {message["type"] for message in messages[1:]} == {"http.response.body"}
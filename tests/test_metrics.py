@@ -0,0 +1,62 @@
+"""Worker snapshots merge across processes, including a dead worker whose pid is reused."""
+
+import json
+import os
+
+import anyio
+
+from monitoring import metrics
+from monitoring.http import InFlightMiddleware
+
+
+def make_registry(directory):
+    registry = metrics.Registry(directory=str(directory))
+    counter = metrics.Counter("test_total", "test", registry=registry)
+    gauge = metrics.Gauge("test_in_flight", "test", registry=registry)
+    return registry, counter, gauge
+
+
+def write_dead_incarnation(directory, started_at, total, in_flight):
+    # An earlier process with this process's pid: its totals stay, its gauges do not.
+    snapshot = {
+        "pid": os.getpid(),
+        "started_at": started_at,
+        "metrics": {
+            "athar_test_total": {"type": "counter", "mode": "", "samples": [[[], total]]},
+            "athar_test_in_flight": {"type": "gauge", "mode": "sum", "samples": [[[], in_flight]]},
+        },
+    }
+    with open(os.path.join(directory, f"{os.getpid()}-{int(started_at * 1000)}.json"), "w") as handle:
+        json.dump(snapshot, handle)
+
+
+def test_a_reused_pid_keeps_the_dead_workers_totals(tmp_path):
+    registry, counter, gauge = make_registry(tmp_path)
+    write_dead_incarnation(tmp_path, registry.started_at - 60, total=5, in_flight=3)
+    counter.inc(2)
+    gauge.inc()
+
+    merged = registry.collect()
+
+    assert merged["athar_test_total"][()] == 7
+    assert merged["athar_test_in_flight"][()] == 1
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_in_flight_middleware_counts_only_agency_requests(monkeypatch):
+    gauge = metrics.Gauge("test_requests_in_flight", "test", labels=("mode",), registry=metrics.Registry())
+    monkeypatch.setattr("monitoring.http.PIPELINES_IN_FLIGHT", gauge)
+    seen = []
+
+    async def app(scope, receive, send):
+        seen.append({tuple(key): value for key, value in gauge.samples()})
+
+    middleware = InFlightMiddleware(app, path_prefix="/my-agency/get_response")
+
+    async def call(path):
+        await middleware({"type": "http", "path": path}, None, None)
+
+    anyio.run(call, "/my-agency/get_response_stream")
+    anyio.run(call, "/metrics")
+
+    assert seen == [{("agency",): 1}, {("agency",): 0}]
@@ -0,0 +1,43 @@
+"""A stage that raises fails the pipeline run instead of escaping it."""
+
+import pytest
+
+pytest.importorskip("agency_swarm")
+
+from monitoring import accounting
+from workflow import pipeline
+from workflow.pipeline import BRIEF, FAILED, PipelineEngine
+
+
+def test_a_raising_stage_fails_the_run_and_closes_its_cost_record(monkeypatch):
+    closed = []
+    close_request = accounting.close_request
+
+    def record_close(status, **kwargs):
+        closed.append(status)
+        return close_request(status, **kwargs)
+
+    def broken_brief(run, envelope):
+        raise ValueError("brief tool crashed")
+
+    monkeypatch.setattr(pipeline, "close_request", record_close)
+    engine = PipelineEngine()
+    monkeypatch.setitem(engine._handlers, BRIEF, broken_brief)
+
+    run = engine.run("A lone lighthouse on a stormy coast at night.")
+
+    assert run.state == FAILED
+    assert run.error == {"type": "ValueError", "message": "brief tool crashed", "stage": BRIEF}
+    assert closed == ["failed"]
+    assert run.cost["status"] == "failed"
+
+
+def test_an_illegal_transition_fails_the_run(monkeypatch):
+    engine = PipelineEngine()
+    monkeypatch.setitem(engine._handlers, BRIEF, lambda run, envelope: ("delivered", {}))
+
+    run = engine.run("A lone lighthouse on a stormy coast at night.")
+
+    assert run.state == FAILED
+    assert run.error["type"] == "RuntimeError"
+    assert run.error["stage"] == BRIEF
@@ -0,0 +1,44 @@
+"""Generated template renderers match the line-by-line layout."""
+
+import pytest
+
+from workflow.prompt_templates import COMPOSITIONS, Brief, PromptTemplate, get_template, render, render_variants
+
+
+def _expected(brief, palette, composition):
+    lines = ["A cinematic minimalistic artwork inspired by Athar."]
+    lines += [f"Theme: {brief.theme}."] if brief.theme else []
+    lines += [f"Mood: {brief.mood}."] if brief.mood else []
+    lines += [f"Palette: {palette}."] if palette else []
+    lines += [f"Visual Metaphor: {brief.visual_elements}."] if brief.visual_elements else []
+    lines += [COMPOSITIONS[composition]]
+    lines += [f"Tone: {brief.tone}."] if brief.tone else []
+    lines += ["Avoid: messy textures, chaotic shapes, distorted Arabic text.", f"--ar {brief.aspect_ratio}", "--style cinematic-premium"]
+    lines += [f"Additional: {brief.custom_instructions}"] if brief.custom_instructions else []
+    return "\n".join(lines)
+
+
+@pytest.mark.parametrize("brief", [
+    Brief("solitude", "calm", "golden light", "lone figure", "poetic", "4:5", "small figure"),
+    Brief("solitude", "", "", aspect_ratio="1:1"),
+    Brief("{theme} with braces", "calm", "a 'quoted' palette\\n", tone='"tone"'),
+])
+def test_renders_the_athar_layout(brief):
+    assert render(brief)["prompt"] == _expected(brief, brief.palette, "classic")
+    for variant in render_variants(brief, 8):
+        assert variant["prompt"] == _expected(brief, variant["palette"], variant["composition"])
+
+
+def test_first_variant_is_the_single_render():
+    brief = Brief("family", "warm", "lantern light")
+    assert render_variants(brief, 4, "athar_typography")[0] == render(brief, "athar_typography")
+    assert render_variants(brief, 1, "athar_minimal") == [render(brief, "athar_minimal")]
+
+
+def test_compile_rejects_unknown_fields_and_gated_first_lines():
+    with pytest.raises(ValueError, match="unknown fields: lighting"):
+        PromptTemplate.compile("bad", [(None, "Athar."), (None, "Light: {lighting}.")])
+    with pytest.raises(ValueError, match="ungated"):
+        PromptTemplate.compile("bad", [("theme", "Theme: {theme}.")])
+    with pytest.raises(ValueError, match="Unknown prompt template"):
+        get_template("missing")
@@ -0,0 +1,59 @@
+"""Resumable upload session files are removed after the upload and swept once expired."""
+
+import os
+import time
+
+import pytest
+
+from delivery import resumable
+from delivery.resumable import ResumableSessionStore, ResumableUploadError, StreamingDriveUpload, UploadSession
+
+
+def make_upload(store, monkeypatch, put_chunk):
+    upload = StreamingDriveUpload("https://example.com/dunes.png", "dunes.png", "folder", store=store)
+    store.save(UploadSession(key=upload.key, session_uri="https://upload.example.com/session", offset=0))
+    monkeypatch.setattr(upload, "_query_offset", lambda session: (0, None))
+    monkeypatch.setattr(upload, "_open_source", lambda offset: iter([b"image bytes"]))
+    monkeypatch.setattr(upload, "_put_chunk", put_chunk)
+    return upload
+
+
+def test_completed_upload_removes_its_session_file(tmp_path, monkeypatch):
+    store = ResumableSessionStore(str(tmp_path))
+    upload = make_upload(store, monkeypatch, lambda session, data, total: (len(data), {"id": "file-1"}))
+
+    assert upload.run() == {"id": "file-1"}
+    assert store.load(upload.key) is None
+
+
+def test_failed_upload_removes_its_session_file(tmp_path, monkeypatch):
+    store = ResumableSessionStore(str(tmp_path))
+
+    def put_chunk(session, data, total):
+        raise ResumableUploadError("Drive acknowledged unexpected offset 99")
+
+    upload = make_upload(store, monkeypatch, put_chunk)
+
+    with pytest.raises(ResumableUploadError):
+        upload.run()
+    assert store.load(upload.key) is None
+
+
+def test_sweep_removes_only_expired_session_files(tmp_path):
+    store = ResumableSessionStore(str(tmp_path))
+    for key in ("stale", "fresh"):
+        store.save(UploadSession(key=key, session_uri=f"https://upload.example.com/{key}"))
+    interrupted = tmp_path / "crashed.json.tmp"
+    interrupted.write_text("{")
+    week_ago = time.time() - resumable.UPLOAD_SESSION_SECONDS - 60
+    for path in (tmp_path / "stale.json", interrupted):
+        os.utime(path, (week_ago, week_ago))
+
+    assert store.sweep() == 2
+    assert store.load("stale") is None
+    assert store.load("fresh") is not None
+    assert not interrupted.exists()
+
+
+def test_sweep_of_a_missing_directory_removes_nothing(tmp_path):
+    assert ResumableSessionStore(str(tmp_path / "missing")).sweep() == 0
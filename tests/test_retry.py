@@ -0,0 +1,114 @@
+"""The QA retry budget is keyed by the run's request ID, carried in the image handoff."""
+
+import threading
+
+import pytest
+
+from monitoring import accounting
+from monitoring.tracing import span
+from workflow.contracts import ImageResult
+from workflow.retry import REGENERATE, STOP, RetryBudget, RetryController, RetryLedger
+
+FAILED = {"status": "retry", "failed_checks": ["Image quality"], "issues": ["blurry"]}
+
+
+@pytest.fixture
+def controller(tmp_path):
+    return RetryController(RetryBudget(max_attempts=2), RetryLedger(str(tmp_path / "retry.sqlite3")))
+
+
+def _judge(controller, request_id, attempt):
+    image = {"image_url": f"https://x/{attempt}.png", "task_id": f"task-{attempt}"}
+    return controller.next_action(request_id, image, FAILED)
+
+
+def test_attempts_of_one_run_share_its_budget(controller):
+    assert _judge(controller, "run-1", 1).action == REGENERATE
+    assert _judge(controller, "run-1", 2).action == STOP
+
+
+def test_a_later_run_of_the_same_brief_starts_with_a_fresh_budget(controller):
+    _judge(controller, "run-1", 1)
+    assert _judge(controller, "run-1", 2).action == STOP
+
+    # Same image, same prompt package: only the request ID differs
+    assert _judge(controller, "run-2", 1).action == REGENERATE
+    assert controller.summary("run-2")["budget"]["attempts_left"] == 1
+
+
+def test_workers_judging_one_request_keep_every_attempt(tmp_path):
+    path = str(tmp_path / "retry.sqlite3")
+    # One controller and ledger connection per worker, as in separate processes
+    workers = [RetryController(RetryBudget(max_attempts=100), RetryLedger(path)) for _ in range(4)]
+
+    def judge(worker, number):
+        for attempt in range(10):
+            _judge(worker, "run-1", f"{number}-{attempt}")
+
+    threads = [threading.Thread(target=judge, args=(worker, number)) for number, worker in enumerate(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    attempts = workers[0].summary("run-1")["attempts"]
+    assert len(attempts) == 40
+    assert [attempt["attempt"] for attempt in attempts] == list(range(1, 41))
+    assert attempts[-1]["credits_spent"] == 40 * workers[0].budget.credits_per_image
+
+
+def test_image_results_without_a_request_still_validate():
+    fields = {"image_url": "https://x/1.png", "all_image_urls": ["https://x/1.png"], "seed": "1", "prompt_used": "p", "aspect_ratio": "1:1"}
+    assert ImageResult(**fields).request_id == ""
+    assert ImageResult(request_id="run-1", **fields).request_id == "run-1"
+
+
+def test_current_request_id_follows_the_opened_request():
+    assert accounting.current_request_id() == ""
+    with span("test.request") as active:
+        assert accounting.current_request_id() == active.trace_id
+        accounting.open_request("run-7")
+        assert accounting.current_request_id() == "run-7"
+        accounting.close_request("failed")
+
+
+def test_qa_reports_a_repaired_image_when_the_ledger_fails_on_the_next_verdict(controller, monkeypatch):
+    pytest.importorskip("agency_swarm")
+    import json
+    import random
+    import sqlite3
+    from io import BytesIO
+
+    from PIL import Image
+
+    from delivery.blob_store import blob_url, keep_local_copy
+    from qa_agent.tools import ValidateImageTool as tool_module
+
+    # Sharp enough to pass the quality check, 7% too wide for 1:1: a local crop fixes it
+    noise = random.Random(1)
+    image = Image.new("L", (1100, 1024))
+    image.putdata([noise.randrange(256) for _ in range(1100 * 1024)])
+    buffer = BytesIO()
+    image.convert("RGB").save(buffer, format="PNG")
+    image_url = blob_url(keep_local_copy(buffer.getvalue()))
+
+    update = controller.ledger.update
+    verdicts = []
+
+    def failing_update(request_id, change):
+        verdicts.append(request_id)
+        if len(verdicts) > 1:
+            raise sqlite3.OperationalError("database is locked")
+        return update(request_id, change)
+
+    monkeypatch.setattr(controller.ledger, "update", failing_update)
+    monkeypatch.setattr(tool_module, "get_retry_controller", lambda: controller)
+    validate = tool_module.ValidateImageTool(
+        image_url=image_url, expected_aspect_ratio="1:1", request_id="run-1", speculative_export=False
+    )
+
+    result = json.loads(validate.run())
+
+    assert result["status"] == "pass"
+    assert result["image_url"] != image_url
+    assert "retry" not in result
@@ -0,0 +1,101 @@
+"""Speculative exports defer CPU work to QA's verdict and never leave staged objects behind."""
+
+import time
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from delivery import speculative
+from delivery.speculative import (
+    SpeculationUnavailable,
+    SpeculativeExport,
+    StagingLedger,
+    get_staging_ledger,
+    reap_speculations,
+)
+from delivery.storage import LocalBackend
+
+
+def _png(color):
+    buffer = BytesIO()
+    Image.new("RGB", (64, 48), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def local(tmp_path, monkeypatch):
+    backend = LocalBackend(root=str(tmp_path / "exports"))
+    images = {"https://kie/red.png": _png("red"), "https://kie/blue.png": _png("blue")}
+    monkeypatch.setattr(speculative, "download_image", images.__getitem__)
+    monkeypatch.setattr(speculative, "get_backend", lambda name="": backend)
+    monkeypatch.setattr(speculative, "_ledger", StagingLedger(str(tmp_path / "staging.sqlite3")))
+    return backend
+
+
+def _files(backend):
+    return sorted(path.relative_to(backend.root).as_posix() for path in backend.root.rglob("*") if path.is_file())
+
+
+def test_deferred_staging_waits_for_the_verdict(local):
+    speculation = SpeculativeExport(local, "https://kie/red.png", "exports", overlap=False).start()
+
+    assert speculation.image_bytes() == _png("red")
+    time.sleep(0.05)
+    assert _files(local) == []
+
+    speculation.accept()
+    export = speculation.commit("athar_0001.png")
+
+    assert export.stored.name.startswith("athar_0001")
+    assert all("_staging" not in path for path in _files(local))
+    assert get_staging_ledger().staged_before(time.time() + 1) == []
+
+
+def test_discard_before_the_verdict_uploads_nothing(local):
+    speculation = SpeculativeExport(local, "https://kie/blue.png", "discarded", overlap=False).start()
+    speculation.image_bytes()
+    speculation.discard()
+
+    assert _files(local) == []
+    with pytest.raises(SpeculationUnavailable):
+        speculation.commit("athar_0002.png")
+
+
+def test_reaper_discards_unclaimed_speculations(local, monkeypatch):
+    monkeypatch.setattr(speculative, "_reaper", object())
+    speculation = speculative.speculate("https://kie/red.png", local, "unclaimed")
+    speculation.accept()
+    speculation._future.result()
+    assert any("_staging" in path for path in _files(local))
+
+    assert reap_speculations(ttl_seconds=0)["expired"] == 1
+    time.sleep(0.2)
+
+    assert speculative.claim_speculation("https://kie/red.png") is None
+    assert _files(local) == []
+
+
+def test_reaper_deletes_orphaned_staged_objects(local):
+    # Staged by a process that died before it could move or delete it
+    orphan = local.put(b"orphan", "abc-image.png", "exports/_staging")
+    recent = local.put(b"recent", "def-image.png", "exports/_staging")
+    get_staging_ledger().add([orphan], staged_at=time.time() - 3600)
+    get_staging_ledger().add([recent])
+
+    assert reap_speculations(ttl_seconds=900)["orphans_deleted"] == 1
+
+    assert _files(local) == [recent.object_id]
+    assert [row[1] for row in get_staging_ledger().staged_before(time.time() + 1)] == [recent.object_id]
+
+
+def test_commit_before_staging_uploads_straight_into_place(local, monkeypatch):
+    moves = []
+    monkeypatch.setattr(local, "move", lambda *args, **kwargs: moves.append(args))
+    speculation = SpeculativeExport(local, "https://kie/blue.png", "direct", overlap=False).start()
+
+    export = speculation.commit("athar_0003.png", "2026/10")
+
+    assert moves == []
+    assert export.stored.object_id.startswith("direct/2026/10/")
+    assert all("_staging" not in path for path in _files(local))
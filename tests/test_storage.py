@@ -0,0 +1,114 @@
+"""Object keys of the path-addressed storage backends never collide across contents."""
+
+import pytest
+
+from delivery import dedupe, storage
+from delivery.dedupe import hash_properties, sha256_hex
+from delivery.storage import DriveBackend, LocalBackend, S3Backend, export_bytes, export_urls
+
+from .fake_drive import FakeDrive
+
+
+class FakeS3Client:
+    """The S3Client calls S3Backend makes, against a dict."""
+
+    def __init__(self):
+        self.objects: dict[str, bytes] = {}
+
+    def put_object(self, key, data, content_type, metadata=None):
+        self.objects[key] = data
+        return key
+
+    def copy_object(self, source_key, key, content_type, metadata=None):
+        self.objects[key] = self.objects[source_key]
+
+    def delete_object(self, key):
+        self.objects.pop(key, None)
+
+    def download_url(self, key):
+        return f"https://bucket.example.com/{key}"
+
+
+@pytest.fixture
+def local(tmp_path):
+    return LocalBackend(root=str(tmp_path / "exports"), base_url="https://cdn.example.com")
+
+
+def test_local_same_filename_different_bytes_get_different_objects(local):
+    first = local.put(b"first image", "dunes.png", "2026/10")
+    second = local.put(b"second image", "dunes.png", "2026/10")
+
+    assert first.object_id != second.object_id
+    assert (local.root / first.object_id).read_bytes() == b"first image"
+    assert (local.root / second.object_id).read_bytes() == b"second image"
+    assert first.name == second.name == "dunes.png"
+
+
+def test_local_same_bytes_reuse_the_object(local):
+    assert local.put(b"same", "a.png", "t").object_id == local.put(b"same", "a.png", "t").object_id
+
+
+def test_local_move_keeps_the_content_directory(local):
+    staged = local.put(b"staged image", "staging.png", "_staging")
+    other = local.put(b"other image", "final.png", "delivered")
+
+    moved = local.move(staged, "_staging", "delivered", "final.png")
+
+    assert moved.object_id != other.object_id
+    assert (local.root / moved.object_id).read_bytes() == b"staged image"
+    assert (local.root / other.object_id).read_bytes() == b"other image"
+
+
+def test_s3_keys_are_content_unique_and_survive_moves():
+    client = FakeS3Client()
+    backend = S3Backend(client=client, prefix="athar/")
+
+    first = backend.put(b"first image", "dunes.png", "2026/10")
+    second = backend.put(b"second image", "dunes.png", "2026/10")
+    moved = backend.move(backend.put(b"third image", "stage.png", "_staging"), "_staging", "2026/10", "dunes.png")
+
+    assert len({first.object_id, second.object_id, moved.object_id}) == 3
+    assert first.object_id.startswith("athar/2026/10/") and first.object_id.endswith("/dunes.png")
+    assert client.objects[first.object_id] == b"first image"
+    assert client.objects[moved.object_id] == b"third image"
+
+
+def test_dedupe_hit_still_serves_its_own_bytes_after_a_name_reuse(local):
+    first = export_bytes(local, b"first image", "dunes.png", "root", optimize=False, derivatives=False)
+    export_bytes(local, b"second image", "dunes.png", "root", optimize=False, derivatives=False)
+
+    again = export_bytes(local, b"first image", "dunes.png", "root", optimize=False, derivatives=False)
+
+    assert again.deduplicated
+    assert again.stored.object_id == first.stored.object_id
+    assert (local.root / again.stored.object_id).read_bytes() == b"first image"
+    assert sha256_hex(b"first image")[:16] in again.stored.object_id
+
+
+def test_drive_export_dedupes_against_a_file_only_drive_knows_about(monkeypatch):
+    drive = FakeDrive()
+    monkeypatch.setattr(dedupe, "get_drive_service", drive.service)
+    data = b"image filed under an older shard"
+    drive.add("earlier", "root-shard-2026-10", hash_properties(sha256_hex(data), "root"))
+
+    outcome = export_bytes(DriveBackend(), data, "dunes.png", "root", shard="2026/10/19/dunes")
+
+    assert outcome.deduplicated
+    assert outcome.stored.object_id == "earlier"
+
+
+def test_repeated_source_url_is_answered_without_downloading(local, monkeypatch):
+    data = b"image behind a source url"
+    monkeypatch.setattr(storage, "download_image", lambda url: data)
+    items = [("https://img.example.com/dunes.png", "dunes.png")]
+    [first] = export_urls(local, items, "root", optimize=False, derivatives=False)
+
+    def download_again(url):
+        raise AssertionError("downloaded a source URL exported before")
+
+    monkeypatch.setattr(storage, "download_image", download_again)
+    [again] = export_urls(local, items, "root", optimize=False, derivatives=False)
+
+    assert again.deduplicated
+    assert again.stored.object_id == first.stored.object_id
+    assert again.bytes_saved == 2 * len(data)
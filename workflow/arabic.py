@@ -0,0 +1,107 @@
+"""
+Arabic text normalization and light stemming for brief extraction.
+
+Athar excerpts are often Arabic, written with or without diacritics, with
+tatweel for emphasis, and with spelling variants of alef, yaa and taa marbuta.
+normalize_arabic() folds all of these to one form, and light_stem() strips the
+common clitic prefixes (wa-, al-, bi-/ka-/fa-/li- + al-) and suffixes (plural,
+dual, feminine and pronoun endings) in the style of the Light10 stemmer, so
+"بالصحراءِ" and "الصحراء" both become "صحراء".
+
+workflow.lexicon applies the same functions to lexicon keywords at compile
+time and to input tokens at match time, so Arabic keywords are written in any
+natural form in lexicon.json.
+"""
+
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+
+TATWEEL = "ـ"
+
+# Harakat, tanween, shadda, sukun, superscript alef and Quranic annotation marks.
+_MARKS = [*range(0x064B, 0x0660), 0x0670, *range(0x06D6, 0x06EE), ord(TATWEEL)]
+
+_LETTER_VARIANTS = {
+    "أ": "ا",
+    "إ": "ا",
+    "آ": "ا",
+    "ٱ": "ا",
+    "ى": "ي",
+    "ئ": "ي",
+    "ؤ": "و",
+    "ة": "ه",
+}
+
+# str.translate tables: marks are deleted, letter variants folded.
+MARKS_TABLE: dict[int, None] = {codepoint: None for codepoint in _MARKS}
+NORMALIZATION_TABLE: dict[int, str | None] = {
+    **MARKS_TABLE,
+    **{ord(variant): base for variant, base in _LETTER_VARIANTS.items()},
+}
+
+# Checked in order; the first match is stripped if a long enough stem remains.
+_PREFIXES = ("وال", "بال", "كال", "فال", "لل", "ال")
+_SUFFIXES = ("ها", "ان", "ات", "ون", "ين", "يه", "ه", "ي", "ا")
+_MIN_STEM = 2
+
+_ARABIC_LETTER_RE = re.compile("[ء-ي]")
+
+ARABIC_STOPWORDS = frozenset(
+    word.translate(NORMALIZATION_TABLE)
+    for word in (
+        "في", "من", "على", "إلى", "عن", "مع", "هذا", "هذه", "ذلك", "تلك", "التي", "الذي",
+        "الذين", "كان", "كانت", "يكون", "أن", "إن", "ما", "لا", "لم", "لن", "قد", "ثم", "أو",
+        "بين", "كل", "عند", "حتى", "هو", "هي", "هم", "نحن", "أنا", "أنت", "كما", "بعد", "قبل",
+        "منذ", "إذا", "ليس", "لكن", "فيه", "فيها", "عليه", "عليها", "منها", "لها", "له", "وقد",
+        "وهو", "وهي", "التى", "ولا", "أي", "غير", "عبر", "حول", "أمام", "خلف", "تحت", "فوق",
+    )
+)
+
+
+def has_arabic(text: str) -> bool:
+    return _ARABIC_LETTER_RE.search(text) is not None
+
+
+def strip_marks(text: str) -> str:
+    """Remove diacritics and tatweel, keeping letters as written."""
+    return text.translate(MARKS_TABLE)
+
+
+def normalize_arabic(text: str) -> str:
+    """Remove diacritics and tatweel and fold alef/yaa/waw/taa marbuta variants."""
+    return text.translate(NORMALIZATION_TABLE)
+
+
+def is_arabic_word(token: str) -> bool:
+    return "ء" <= token[0] <= "ي"
+
+
+@lru_cache(maxsize=65536)
+def light_stem(word: str, strip_waw: bool = True) -> str:
+    """
+    Light stem of a normalized Arabic word: one leading "و" (the conjunction,
+    unless strip_waw is False), one article prefix and one suffix are removed
+    while at least two letters remain.
+    """
+    if strip_waw and len(word) > 3 and word.startswith("و"):
+        word = word[1:]
+    for prefix in _PREFIXES:
+        if word.startswith(prefix) and len(word) - len(prefix) >= _MIN_STEM:
+            word = word[len(prefix):]
+            break
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= _MIN_STEM:
+            word = word[: -len(suffix)]
+            break
+    return word
+
+
+def stem_forms(word: str) -> set[str]:
+    """
+    Stems a lexicon keyword may take in input. A keyword that starts with "و"
+    as part of the word ("وحيد") loses it as if it were the conjunction when it
+    stands alone, but keeps it after the article ("الوحيد"), so both are indexed.
+    """
+    return {light_stem(word), light_stem(word, strip_waw=False)}
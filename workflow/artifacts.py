@@ -0,0 +1,252 @@
+"""
+Stage artifact store, so handoffs can pass payloads by reference.
+
+The prompt package (full prompt, negative prompt, variants) and the image
+result (URLs, seed, prompt used) used to be copied verbatim into every handoff
+message and every tool call that needed them, and stayed in each downstream
+agent's context for all of its turns; QA -> NB retries repeated them again.
+
+Tools now store what they produce and return an artifact ID next to it. Agents
+hand off the ID (envelopes carry "artifact_id" instead of the payload), and
+tools that take an ID resolve it locally. validate_payload() resolves the ID
+too, so contracts are enforced on the stored payload exactly as if it had been
+inlined.
+
+IDs are content-addressed ("prompt_package-<16 hex>") over the payload and the
+artifact it derives from, so storing the same payload twice under the same
+parent yields the same ID, and a repeated payload with another parent (a
+repeated brief's image) gets its own ID and keeps its own lineage.
+
+Every resolution records the tokens the reference saved (payload tokens minus
+ID tokens); an image result records the prompt package it was generated from,
+so savings can be totalled per pipeline.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.getenv("ATHAR_STATE_DIR", ".athar")
+ARTIFACT_STORE_PATH = os.getenv("ARTIFACT_STORE_PATH", os.path.join(STATE_DIR, "artifacts.sqlite3"))
+ARTIFACT_TTL_SECONDS = int(os.getenv("ARTIFACT_TTL_SECONDS", str(7 * 24 * 3600)))
+
+PROMPT_PACKAGE = "prompt_package"
+IMAGE_RESULT = "image_result"
+ARTIFACT_KINDS = (PROMPT_PACKAGE, IMAGE_RESULT)
+
+
+class ArtifactNotFoundError(LookupError):
+    """Raised when an artifact ID is unknown, expired or of another kind."""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count of a text (about four characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def _canonical(payload: Mapping) -> str:
+    return json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+def artifact_digest(text: str, parent_id: str = "") -> str:
+    """ID digest of a canonical payload stored under parent_id (parentless IDs hash the payload alone)."""
+    digest = hashlib.sha256(text.encode("utf-8"))
+    if parent_id:
+        digest.update(b"\0" + parent_id.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class ArtifactStore:
+    """
+    SQLite-backed store of stage artifacts with per-artifact reference counters.
+    """
+
+    def __init__(self, path: str = ARTIFACT_STORE_PATH, ttl_seconds: int = ARTIFACT_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS artifacts (id TEXT PRIMARY KEY, kind TEXT NOT NULL,"
+                " payload TEXT NOT NULL, tokens INTEGER NOT NULL, parent_id TEXT NOT NULL DEFAULT '',"
+                " references_count INTEGER NOT NULL DEFAULT 0, tokens_saved INTEGER NOT NULL DEFAULT 0,"
+                " created_at REAL NOT NULL)"
+            )
+            self._conn.execute("DELETE FROM artifacts WHERE created_at < ?", (time.time() - ttl_seconds,))
+
+    def put(self, kind: str, payload: Mapping, parent_id: str = "") -> str:
+        """Store a payload and return its artifact ID (the same ID for the same payload and parent)."""
+        if kind not in ARTIFACT_KINDS:
+            raise ValueError(f"Unknown artifact kind '{kind}' (expected one of {', '.join(ARTIFACT_KINDS)})")
+        text = _canonical(payload)
+        artifact_id = f"{kind}-{artifact_digest(text, parent_id)}"
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO artifacts (id, kind, payload, tokens, parent_id, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (artifact_id, kind, text, estimate_tokens(text), parent_id, time.time()),
+            )
+        return artifact_id
+
+    def get(self, artifact_id: str, kind: str = "") -> dict:
+        """
+        Raises:
+            ArtifactNotFoundError: If the ID is unknown, expired or not of the given kind.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT kind, payload FROM artifacts WHERE id = ?", (artifact_id,)).fetchone()
+        if row is None or (kind and row[0] != kind):
+            expected = f" {kind}" if kind else ""
+            raise ArtifactNotFoundError(f"Unknown{expected} artifact '{artifact_id}'")
+        return json.loads(row[1])
+
+    def resolve(self, artifact_id: str, kind: str = "") -> dict:
+        """
+        Return a referenced payload and record the tokens the reference saved.
+
+        Raises:
+            ArtifactNotFoundError: If the ID is unknown, expired or not of the given kind.
+        """
+        payload = self.get(artifact_id, kind)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE artifacts SET references_count = references_count + 1,"
+                " tokens_saved = tokens_saved + MAX(0, tokens - ?) WHERE id = ?",
+                (estimate_tokens(artifact_id), artifact_id),
+            )
+        return payload
+
+    def root(self, artifact_id: str) -> str:
+        """The oldest stored ancestor of an artifact (the artifact itself without a parent)."""
+        seen = set()
+        with self._lock:
+            while artifact_id not in seen:
+                seen.add(artifact_id)
+                row = self._conn.execute("SELECT parent_id FROM artifacts WHERE id = ?", (artifact_id,)).fetchone()
+                if row is None or not row[0]:
+                    break
+                artifact_id = row[0]
+        return artifact_id
+
+    def pipeline_savings(self, *artifact_ids: str) -> dict:
+        """
+        References and tokens saved over the given artifacts and the artifacts
+        they derive from, each counted once (variants share their prompt package).
+        """
+        references = tokens_saved = 0
+        seen = set()
+        with self._lock:
+            for artifact_id in artifact_ids:
+                while artifact_id and artifact_id not in seen:
+                    seen.add(artifact_id)
+                    row = self._conn.execute(
+                        "SELECT references_count, tokens_saved, parent_id FROM artifacts WHERE id = ?", (artifact_id,)
+                    ).fetchone()
+                    if row is None:
+                        break
+                    references += row[0]
+                    tokens_saved += row[1]
+                    artifact_id = row[2]
+        return {"references": references, "tokens_saved": tokens_saved}
+
+    def savings(self) -> dict:
+        """Totals over every stored artifact."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(references_count), 0), COALESCE(SUM(tokens_saved), 0) FROM artifacts"
+            ).fetchone()
+        return {"artifacts": row[0], "references": row[1], "tokens_saved": row[2]}
+
+
+_store: Optional[ArtifactStore] = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store() -> ArtifactStore:
+    """Return the process-wide artifact store (created on first use)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ArtifactStore()
+    return _store
+
+
+def store_artifact(kind: str, payload: Mapping, parent_id: str = "") -> Optional[str]:
+    """
+    Store a tool's output and return its artifact ID.
+    Best effort: returns None (the payload is then handed off inline) if the store fails.
+    """
+    try:
+        return get_artifact_store().put(kind, payload, parent_id)
+    except (sqlite3.Error, OSError) as exc:
+        logger.warning("Could not store %s artifact | error=%s", kind, exc)
+        return None
+
+
+def resolve_artifact(artifact_id: str, kind: str) -> dict:
+    """
+    Resolve an artifact ID passed to a tool or carried by a handoff.
+
+    Raises:
+        ArtifactNotFoundError: If the ID is unknown, expired, of another kind or the store is unavailable.
+    """
+    try:
+        return get_artifact_store().resolve(artifact_id, kind)
+    except (sqlite3.Error, OSError) as exc:
+        raise ArtifactNotFoundError(f"Artifact store unavailable: {exc}") from exc
+
+
+def artifact_root(artifact_id: str) -> str:
+    """Best-effort ArtifactStore.root (the ID itself if the store is unavailable)."""
+    try:
+        return get_artifact_store().root(artifact_id)
+    except (sqlite3.Error, OSError) as exc:
+        logger.warning("Could not read artifact lineage | error=%s", exc)
+        return artifact_id
+
+
+def handoff_savings(*artifact_ids: str) -> dict:
+    """Best-effort ArtifactStore.pipeline_savings (zeros if the store is unavailable)."""
+    try:
+        return get_artifact_store().pipeline_savings(*artifact_ids)
+    except (sqlite3.Error, OSError) as exc:
+        logger.warning("Could not read handoff savings | error=%s", exc)
+        return {"references": 0, "tokens_saved": 0}
+
+
+def pipeline_report(artifact_id: str) -> dict:
+    """
+    The referenced image result's generation details (image URL, seed, aspect
+    ratio, prompt used) and the tokens saved by passing its pipeline's
+    artifacts by reference. Best effort: empty if the artifact is unavailable.
+    """
+    try:
+        store = get_artifact_store()
+        image_result = store.get(artifact_id, IMAGE_RESULT)
+        savings = store.pipeline_savings(artifact_id)
+    except (ArtifactNotFoundError, sqlite3.Error, OSError) as exc:
+        logger.warning("Could not read pipeline artifact %s | error=%s", artifact_id, exc)
+        return {}
+    return {
+        "image_url": image_result.get("image_url", ""),
+        "seed": image_result.get("seed", ""),
+        "aspect_ratio": image_result.get("aspect_ratio", ""),
+        "prompt_used": image_result.get("prompt_used", ""),
+        "handoff_references": savings["references"],
+        "handoff_tokens_saved": savings["tokens_saved"],
+    }
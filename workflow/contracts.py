@@ -3,14 +3,22 @@ Pydantic schemas that define the JSON contracts passed between agents.
 
 These contracts are enforced at runtime by the StructuredSendMessage tool to make
 sure every hand-off is strict JSON and contains the fields downstream agents need.
+
+The prompt and image envelopes may carry an "artifact_id" (see
+workflow.artifacts) instead of their payload; validate_payload() resolves it
+and validates the stored payload like an inline one.
 """
 
 from __future__ import annotations
 
-import json
-from typing import Dict, Tuple, Type
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, Literal, Optional, Tuple, Type
+
+from pydantic import BaseModel, Field, ValidationError, model_validator
 
-from pydantic import BaseModel, Field, Literal, model_validator
+from .artifacts import IMAGE_RESULT, PROMPT_PACKAGE, ArtifactNotFoundError, resolve_artifact
 
 
 class ErrorInfo(BaseModel):
@@ -57,6 +65,15 @@ class BriefEnvelope(BaseModel):
         return values
 
 
+class PromptVariant(BaseModel):
+    """One palette/composition permutation of a prompt, for fan-out generation."""
+
+    prompt: str
+    negative_prompt: str
+    palette: str
+    composition: str
+
+
 class PromptPackage(BaseModel):
     prompt: str
     negative_prompt: str
@@ -65,25 +82,42 @@ class PromptPackage(BaseModel):
     quality: str
     theme: str
     palette: str
+    template: str = "athar"
+    composition: str = "classic"
+    variants: list[PromptVariant] = Field(default_factory=list)
 
 
 class PromptEnvelope(BaseModel):
     agent: Literal["art_direction_agent"]
     status: Literal["ok", "error"]
     prompt_package: PromptPackage | None = None
+    artifact_id: str | None = Field(None, description="Stored prompt package, in place of prompt_package")
     handoff: HandoffInfo | None = None
     error: ErrorInfo | None = None
 
     @model_validator(mode="after")
     def _check_payload(cls, values: "PromptEnvelope") -> "PromptEnvelope":
-        if values.status == "ok" and not values.prompt_package:
-            raise ValueError("prompt_package is required when status='ok'")
+        if values.status == "ok" and not (values.prompt_package or values.artifact_id):
+            raise ValueError("prompt_package or artifact_id is required when status='ok'")
         if values.status == "error" and not values.error:
             raise ValueError("error block is required when status='error'")
         return values
 
 
+class ReuseCandidate(BaseModel):
+    """A previously delivered image whose brief resembles the current one."""
+
+    similarity: float
+    image_url: str = ""
+    file_id: str | None = None
+    view_url: str | None = None
+    download_url: str | None = None
+    local_url: str | None = None
+    prompt_used: str = ""
+
+
 class ImageResult(BaseModel):
+    request_id: str = Field("", description="ID of the user request (run) the image was generated for; keys QA's retry budget")
     task_id: str | None = None
     image_url: str
     all_image_urls: list[str]
@@ -99,13 +133,15 @@ class ImageEnvelope(BaseModel):
     agent: Literal["nb_image_agent"]
     status: Literal["ok", "error"]
     image_result: ImageResult | None = None
+    artifact_id: str | None = Field(None, description="Stored image result, in place of image_result")
+    reuse_candidates: list[ReuseCandidate] = Field(default_factory=list)
     handoff: HandoffInfo | None = None
     error: ErrorInfo | None = None
 
     @model_validator(mode="after")
     def _check_payload(cls, values: "ImageEnvelope") -> "ImageEnvelope":
-        if values.status == "ok" and not values.image_result:
-            raise ValueError("image_result is required when status='ok'")
+        if values.status == "ok" and not (values.image_result or values.artifact_id):
+            raise ValueError("image_result or artifact_id is required when status='ok'")
         if values.status == "error" and not values.error:
             raise ValueError("error block is required when status='error'")
         return values
@@ -126,6 +162,7 @@ class QAEnvelope(BaseModel):
     agent: Literal["qa_agent"]
     status: Literal["pass", "pass_with_warnings", "retry", "error"]
     validation: ValidationDetail | None = None
+    image_artifact_id: str | None = Field(None, description="Stored image result the decision is about")
     handoff: HandoffInfo | None = None
     error: ErrorInfo | None = None
 
@@ -138,17 +175,47 @@ class QAEnvelope(BaseModel):
         return values
 
 
+class DerivativeLink(BaseModel):
+    """A smaller rendition exported alongside the full-size image."""
+
+    name: str = Field(..., description="Size label, e.g. 'web' or 'thumb'")
+    format: str
+    max_edge: int
+    width: int | None = None
+    height: int | None = None
+    file_id: str
+    view_url: str
+    download_url: str
+
+
 class DeliveryPackage(BaseModel):
     theme: str
     prompt_used: str
     image_url: str
-    gdrive_view_url: str
-    gdrive_download_url: str
+    storage_backend: Literal["gdrive", "local", "s3"] = "gdrive"
+    view_url: str | None = None
+    download_url: str | None = None
+    gdrive_view_url: str | None = None
+    gdrive_download_url: str | None = None
+    local_url: str | None = None
     seed: str
     aspect_ratio: str
     filename: str
     file_id: str
     validation_status: Literal["pass", "pass_with_warnings"]
+    upload_status: Literal["uploaded", "pending"] = "uploaded"
+    derivatives: list[DerivativeLink] = Field(default_factory=list)
+
+    @model_validator(mode="after")
+    def _check_urls(cls, values: "DeliveryPackage") -> "DeliveryPackage":
+        # view_url/download_url are the backend-agnostic fields; Drive deliveries
+        # may still send only the gdrive_* pair.
+        if values.storage_backend == "gdrive":
+            values.view_url = values.view_url or values.gdrive_view_url
+            values.download_url = values.download_url or values.gdrive_download_url
+        if not values.view_url or not values.download_url:
+            raise ValueError("view_url and download_url are required")
+        return values
 
 
 class DeliveryEnvelope(BaseModel):
@@ -176,7 +243,63 @@ HANDOFF_SCHEMAS: Dict[Tuple[str, str], Type[BaseModel]] = {
 }
 
 
-def validate_payload(sender: str, recipient: str, raw_payload: str) -> None:
+# The envelope of the handoff being delivered. StructuredSendMessage sets it
+# around the recipient's turn, so anything running downstream can read the
+# validated object instead of parsing the message again.
+_current_handoff: ContextVar[Optional[BaseModel]] = ContextVar("current_handoff", default=None)
+
+
+def current_handoff() -> Optional[BaseModel]:
+    """The validated envelope of the handoff currently being delivered, if any."""
+    return _current_handoff.get()
+
+
+@contextmanager
+def delivering_handoff(envelope: Optional[BaseModel]) -> Iterator[None]:
+    """Make envelope the current handoff for the duration of the block."""
+    token = _current_handoff.set(envelope)
+    try:
+        yield
+    finally:
+        _current_handoff.reset(token)
+
+
+# Envelopes whose payload may be passed by reference: (payload field, model, artifact kind).
+_REFERENCE_FIELDS: Dict[Type[BaseModel], Tuple[str, Type[BaseModel], str]] = {
+    PromptEnvelope: ("prompt_package", PromptPackage, PROMPT_PACKAGE),
+    ImageEnvelope: ("image_result", ImageResult, IMAGE_RESULT),
+}
+
+
+def _resolve_reference(envelope: BaseModel) -> None:
+    """Fill a by-reference envelope's payload from the artifact store."""
+    reference = _REFERENCE_FIELDS.get(type(envelope))
+    if reference is None:
+        return
+    field_name, model, kind = reference
+    artifact_id = getattr(envelope, "artifact_id", None)
+    if not artifact_id or getattr(envelope, field_name) is not None:
+        return
+    try:
+        payload = resolve_artifact(artifact_id, kind)
+    except ArtifactNotFoundError as exc:
+        raise ValueError(str(exc)) from exc
+    setattr(envelope, field_name, model.model_validate(payload))
+
+
+@lru_cache(maxsize=None)
+def handoff_validator(sender: str, recipient: str) -> Optional[Callable[[str], BaseModel]]:
+    """
+    The JSON validator for a handoff pair, or None when the pair is not
+    validated. Validates straight from the JSON text (no intermediate dict).
+    """
+    schema = HANDOFF_SCHEMAS.get((sender, recipient))
+    if schema is None:
+        return None
+    return schema.__pydantic_validator__.validate_json
+
+
+def validate_payload(sender: str, recipient: str, raw_payload: str) -> Optional[BaseModel]:
     """
     Validate a JSON payload for a specific agent handoff.
 
@@ -185,17 +308,24 @@ def validate_payload(sender: str, recipient: str, raw_payload: str) -> None:
         recipient: Name of the receiving agent.
         raw_payload: Raw JSON text that should match the schema.
 
+    Returns:
+        The validated envelope (with a by-reference payload resolved), or None
+        if the pair is not validated.
+
     Raises:
-        ValueError: If the payload is not JSON or does not match the schema.
+        ValueError: If the payload is not JSON, does not match the schema or
+            references an unknown artifact.
     """
-    schema = HANDOFF_SCHEMAS.get((sender, recipient))
-    if schema is None:
+    validator = handoff_validator(sender, recipient)
+    if validator is None:
         # Some communications (e.g., QA back to user) are not validated.
-        return
+        return None
 
     try:
-        parsed = json.loads(raw_payload)
-    except json.JSONDecodeError as exc:
-        raise ValueError(f"Payload is not valid JSON: {exc}") from exc
-
-    schema.model_validate(parsed)
+        envelope = validator(raw_payload)
+    except ValidationError as exc:
+        if any(error["type"] == "json_invalid" for error in exc.errors()):
+            raise ValueError(f"Payload is not valid JSON: {exc.errors()[0]['ctx']['error']}") from exc
+        raise
+    _resolve_reference(envelope)
+    return envelope
@@ -0,0 +1,47 @@
+"""
+HTTP route running the deterministic pipeline (see workflow.pipeline).
+
+agency.create_app() mounts ``router`` next to the agency endpoints:
+``POST /pipeline`` takes a request as it would be sent to the Brief Agent and
+returns the run (status, delivery or error, stage timings, LLM calls and
+tokens) once it is delivered or has failed. Like the agency endpoints, it requires ``Authorization: Bearer
+$APP_TOKEN`` when APP_TOKEN is set.
+"""
+
+from __future__ import annotations
+
+import os
+import secrets
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+
+from .pipeline import DELIVERED, get_pipeline_engine
+
+router = APIRouter(tags=["pipeline"])
+
+
+class PipelineRequest(BaseModel):
+    user_input: str = Field(..., min_length=1, description="The request or Athar excerpt")
+    aspect_ratio: str = Field("", description="Overrides the aspect ratio read from the request")
+    theme: str = Field("", description="Two or three words naming the export folder's theme")
+
+
+def _check_token(authorization: str | None) -> None:
+    token = os.getenv("APP_TOKEN")
+    if token and not secrets.compare_digest(authorization or "", f"Bearer {token}"):
+        raise HTTPException(status_code=401, detail="Invalid or missing bearer token")
+
+
+@router.post("/pipeline")
+async def run_pipeline(request: PipelineRequest, authorization: str | None = Header(None)) -> JSONResponse:
+    """
+    Run the pipeline to delivery. Answers 200 with the delivery, or 502 with
+    the error when a stage failed.
+    """
+    _check_token(authorization)
+    # Stages block on KIE polling and uploads for minutes; keep them off the event loop.
+    run = await run_in_threadpool(get_pipeline_engine().run, request.user_input, request.aspect_ratio, request.theme)
+    return JSONResponse(run.to_dict(), status_code=200 if run.state == DELIVERED else 502)
@@ -0,0 +1,242 @@
+"""
+Compiled keyword lexicon for deterministic brief extraction.
+
+All brief lexicons (theme, mood, tone, palette, visual elements) live in one
+JSON file and are compiled into a single index keyed by word n-grams, so an
+input is matched against every keyword of every category at once instead of
+one substring scan per keyword.
+
+Matching works on words rather than characters: the input is split into word
+tokens with str.translate + str.split, and its distinct n-grams (one per keyword length, usually
+just 1 and 3) are intersected with the index. Every step runs in C, and matches
+respect word boundaries by construction ("sand" does not match "thousand").
+Common inflections of every keyword are precomputed at compile time ("dune"
+also matches "dunes", "contemplate" matches "contemplates").
+
+Arabic keywords live under "translations" -> "ar" with the same categories and
+(English) labels, so Arabic excerpts resolve to the same brief. Arabic tokens
+are normalized and light-stemmed (workflow.arabic) on both sides: diacritics
+and tatweel are dropped during tokenization, and keyword stems are precomputed.
+
+The lexicon file is BRIEF_LEXICON_PATH (default: lexicon.json next to this
+module). get_lexicon() re-checks its modification time at most every
+BRIEF_LEXICON_RELOAD_SECONDS and recompiles it when it changed, so the lexicon
+can be edited without restarting the agency.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from itertools import product
+from typing import Optional
+
+from .arabic import NORMALIZATION_TABLE, has_arabic, is_arabic_word, light_stem, stem_forms
+
+logger = logging.getLogger(__name__)
+
+BRIEF_LEXICON_PATH = os.getenv(
+    "BRIEF_LEXICON_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "lexicon.json")
+)
+BRIEF_LEXICON_RELOAD_SECONDS = float(os.getenv("BRIEF_LEXICON_RELOAD_SECONDS", "2"))
+
+# Word endings accepted after a keyword's last word.
+INFLECTION_SUFFIXES = ("s", "es", "d", "ed", "ing")
+
+
+
+class _SeparatorTable(dict):
+    """
+    str.translate table, filled lazily: Arabic diacritics and tatweel are
+    deleted, Arabic letter variants folded, and every other non-word character
+    mapped to a space.
+    """
+
+    def __missing__(self, codepoint: int) -> Optional[str]:
+        if codepoint in NORMALIZATION_TABLE:
+            value = NORMALIZATION_TABLE[codepoint]
+        else:
+            char = chr(codepoint)
+            value = char if char.isalnum() or char == "_" else " "
+        self[codepoint] = value
+        return value
+
+
+_SEPARATORS = _SeparatorTable()
+
+
+def normalize_text(text: str) -> str:
+    """Text as the matcher sees it (keywords go through the same function)."""
+    return text.lower()
+
+
+def tokenize(text: str, stem: bool = True) -> list[str]:
+    """Normalized word tokens of text, with Arabic words light-stemmed unless stem is False."""
+    tokens = normalize_text(text).translate(_SEPARATORS).split()
+    if stem and not text.isascii() and has_arabic(text):
+        # Stem each distinct word once; map() keeps the per-token substitution in C.
+        stems = {token: light_stem(token) for token in set(tokens) if is_arabic_word(token)}
+        tokens = list(map(stems.get, tokens, tokens))
+    return tokens
+
+
+def inflections(word: str) -> list[str]:
+    """The word and its common inflected forms."""
+    forms = [word]
+    if not word.isascii():
+        return forms
+    for suffix in INFLECTION_SUFFIXES:
+        if suffix == "d" and not word.endswith("e"):
+            continue
+        forms.append(word + suffix)
+    return forms
+
+
+@dataclass
+class LexiconMatches:
+    """Labels found per category, in lexicon order, plus the matched keywords."""
+
+    labels: dict[str, list[str]] = field(default_factory=dict)
+    keywords: list[str] = field(default_factory=list)
+
+    def get(self, category: str) -> list[str]:
+        return self.labels.get(category, [])
+
+
+class Lexicon:
+    """
+    Category -> label -> keywords, compiled into one n-gram index.
+
+    Args:
+        categories: {"theme": {"solitude": ["solitude", "alone", ...], ...}, ...}
+    """
+
+    def __init__(
+        self,
+        categories: dict[str, dict[str, list[str]]],
+        version: int = 1,
+        translations: Optional[dict[str, dict[str, dict[str, list[str]]]]] = None,
+    ):
+        self.categories = categories
+        self.version = version
+        self.translations = translations or {}
+        # Label order per category, used to rank matches like the lexicon file does.
+        self._rank = {
+            category: {label: rank for rank, label in enumerate(labels)} for category, labels in categories.items()
+        }
+        # n -> {gram: [(category, label, keyword)]}; unigrams are keyed by the bare word.
+        self._index: dict[int, dict] = {}
+        # n -> first words of the n-word keywords, to skip n-grams that cannot match.
+        self._heads: dict[int, set[str]] = {}
+        for lexicon in (categories, *self.translations.values()):
+            for category, labels in lexicon.items():
+                for label, keywords in labels.items():
+                    if label not in self._rank.get(category, {}):
+                        raise ValueError(f"Translated label {category}/{label} is not in the lexicon")
+                    for keyword in keywords:
+                        self._add(category, label, keyword)
+
+    def _add(self, category: str, label: str, keyword: str) -> None:
+        tokens = tokenize(keyword, stem=False)
+        if not tokens:
+            return
+        forms = []
+        for position, token in enumerate(tokens):
+            if is_arabic_word(token):
+                forms.append(stem_forms(token))
+            elif position == len(tokens) - 1:
+                forms.append(inflections(token))
+            else:
+                forms.append([token])
+        grams = self._index.setdefault(len(tokens), {})
+        heads = self._heads.setdefault(len(tokens), set())
+        payload = (category, label, " ".join(tokens))
+        for gram in product(*forms):
+            heads.add(gram[0])
+            grams.setdefault(gram[0] if len(gram) == 1 else gram, []).append(payload)
+
+    @classmethod
+    def from_file(cls, path: str) -> "Lexicon":
+        with open(path, encoding="utf-8") as handle:
+            data = json.load(handle)
+        return cls(data["categories"], data.get("version", 1), data.get("translations"))
+
+    def match(self, text: str) -> LexiconMatches:
+        """Find every keyword of every category in text."""
+        tokens = tokenize(text)
+        found: dict[str, set[str]] = {}
+        keywords: set[str] = set()
+        words = set(tokens)
+        for length, grams in self._index.items():
+            if length == 1:
+                present = words
+            elif self._heads[length].isdisjoint(words):
+                continue
+            else:
+                present = set(zip(*(tokens[i:] for i in range(length))))
+            for gram in present & grams.keys():
+                for category, label, keyword in grams[gram]:
+                    found.setdefault(category, set()).add(label)
+                    keywords.add(keyword)
+        labels = {
+            category: sorted(matched, key=self._rank[category].__getitem__) for category, matched in found.items()
+        }
+        return LexiconMatches(labels=labels, keywords=sorted(keywords))
+
+
+class _ReloadingLexicon:
+    """Holds the compiled lexicon and swaps in a new one when the file changes."""
+
+    def __init__(self, path: str, interval: float):
+        self.path = path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._mtime = os.path.getmtime(path)
+        self._checked_at = time.monotonic()
+        self.lexicon = Lexicon.from_file(path)
+
+    def get(self) -> Lexicon:
+        now = time.monotonic()
+        if now - self._checked_at < self.interval:
+            return self.lexicon
+        with self._lock:
+            if now - self._checked_at >= self.interval:
+                self._checked_at = now
+                self._maybe_reload()
+        return self.lexicon
+
+    def _maybe_reload(self) -> None:
+        try:
+            mtime = os.path.getmtime(self.path)
+            if mtime == self._mtime:
+                return
+            lexicon = Lexicon.from_file(self.path)
+        except (OSError, ValueError, KeyError) as exc:
+            # Keep serving the last good lexicon while the file is being edited.
+            logger.warning("Lexicon reload failed; keeping previous version | path=%s | error=%s", self.path, exc)
+            return
+        self._mtime = mtime
+        self.lexicon = lexicon
+        logger.info("Lexicon reloaded | path=%s | version=%s", self.path, lexicon.version)
+
+
+_reloading: Optional[_ReloadingLexicon] = None
+_reloading_lock = threading.Lock()
+
+
+def get_lexicon() -> Lexicon:
+    """Return the compiled lexicon, reloading it if the file changed."""
+    global _reloading
+    if _reloading is None:
+        with _reloading_lock:
+            if _reloading is None:
+                _reloading = _ReloadingLexicon(BRIEF_LEXICON_PATH, BRIEF_LEXICON_RELOAD_SECONDS)
+    return _reloading.get()
+
+
+# Compile at import so the first brief does not pay for it.
+get_lexicon()
@@ -0,0 +1,548 @@
+"""
+Deterministic pipeline engine: the agency's stage graph without LLM relay turns.
+
+In the agency, five LLM agents pass JSON between tools that are themselves
+deterministic (ExtractBriefTool, GeneratePromptTool, KieNanoBananaTool,
+ValidateImageTool, GDriveUploadTool), at two or more model turns per stage.
+PipelineEngine runs the same stages as an explicit state machine:
+
+    brief -> art_direction -> generation -> qa -> export -> delivered
+                                  ^          |
+                                  +- retry --+          (any stage -> failed)
+
+Every transition builds the envelope the stage's agent would have sent and
+validates it with validate_payload() against HANDOFF_SCHEMAS (the final
+delivery against DeliveryEnvelope), so both modes honour the same contracts.
+Payloads are handed over inline: there is no LLM context to spare.
+
+An LLM (PipelineJudge) is consulted only where the agency relies on judgment:
+
+- ambiguous briefs: the lexicons matched no theme, so ExtractBriefTool fell
+  back to its default; the judge reads the text and fills in the brief;
+- QA retries: the judge rewrites the prompt to address the failed checks.
+
+Without OPENAI_API_KEY (or with PIPELINE_JUDGE_MODEL empty) the engine stays
+fully deterministic: ambiguous briefs keep the extracted defaults and retries
+regenerate the same prompt with a new seed. QA's retry controller
+(workflow.retry) repairs or swaps images where it can and bounds the loop by
+the run's attempt, time and credit budget. Each run reports its stage timings,
+its QA attempts and the LLM calls and tokens it spent.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from openai import OpenAI, OpenAIError
+from pydantic import BaseModel, ValidationError
+
+from art_direction_agent.tools.GeneratePromptTool import GeneratePromptTool
+from brief_agent.tools.ExtractBriefTool import ExtractBriefTool
+from export_agent.tools.GDriveUploadTool import GDriveUploadTool
+from monitoring import emit_event
+from monitoring.accounting import close_request, open_request, record_llm
+from monitoring.metrics import HANDOFF_VALIDATION_FAILURES, PIPELINES_IN_FLIGHT
+from monitoring.tracing import span
+from nb_image_agent.tools.KieNanoBananaTool import KieNanoBananaTool
+from qa_agent.tools.ValidateImageTool import ValidateImageTool
+
+from .contracts import DeliveryEnvelope, ImageEnvelope, ImageResult, PromptEnvelope, PromptPackage, validate_payload
+from .retry import get_retry_controller
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_JUDGE_MODEL = os.getenv("PIPELINE_JUDGE_MODEL", "gpt-5.1")
+
+BRIEF = "brief"
+ART_DIRECTION = "art_direction"
+GENERATION = "generation"
+QA = "qa"
+EXPORT = "export"
+DELIVERED = "delivered"
+FAILED = "failed"
+
+# The agent whose tool each stage runs (and in whose name its envelope is sent).
+STAGE_AGENTS = {
+    BRIEF: "brief_agent",
+    ART_DIRECTION: "art_direction_agent",
+    GENERATION: "nb_image_agent",
+    QA: "qa_agent",
+    EXPORT: "export_agent",
+}
+
+# Legal transitions; the agency's communication flows plus the terminal states.
+TRANSITIONS = {
+    BRIEF: (ART_DIRECTION, FAILED),
+    ART_DIRECTION: (GENERATION, FAILED),
+    GENERATION: (QA, FAILED),
+    QA: (EXPORT, GENERATION, FAILED),
+    EXPORT: (DELIVERED, FAILED),
+}
+
+DEFAULT_ASPECT_RATIO = "4:5"
+DEFAULT_STYLE = "cinematic-premium"
+
+# ExtractBriefTool's themes when no theme keyword matched.
+FALLBACK_THEMES = ("abstract narrative", "minimalist expression")
+
+BRIEF_FIELDS = ("theme", "mood", "tone", "palette", "visual_elements")
+
+_ASPECT_RATIO_RE = re.compile(r"\b(1:1|16:9|9:16|4:3|3:4|4:5|21:9|9:21)\b")
+_ASPECT_RATIO_WORDS = (
+    (re.compile(r"\bsquare\b", re.IGNORECASE), "1:1"),
+    (re.compile(r"\b(?:story|stories|reel|vertical)\b", re.IGNORECASE), "9:16"),
+    (re.compile(r"\b(?:widescreen|landscape|banner)\b", re.IGNORECASE), "16:9"),
+    (re.compile(r"\bportrait\b", re.IGNORECASE), "4:5"),
+)
+
+BRIEF_JUDGE_INSTRUCTIONS = (
+    "You complete creative briefs for Athar imagery: minimalist, cinematic, poetic and contemplative. "
+    "The keyword extractor found no theme in the user's text. Read the text and the extracted brief, and "
+    "return a JSON object with the keys theme, mood, tone, palette and visual_elements: short, "
+    "comma-separated English phrases that keep the user's intent. Return the JSON object only."
+)
+
+PROMPT_JUDGE_INSTRUCTIONS = (
+    "You revise image generation prompts after a failed quality check. Given the prompt, the negative "
+    "prompt and the QA result (failed checks and issues), return a JSON object with the keys prompt and "
+    "negative_prompt, changed only as far as needed to fix the failed checks. Keep the subject, the style "
+    "and the trailing parameters such as --ar. Return the JSON object only."
+)
+
+
+def aspect_ratio_from_text(text: str) -> str:
+    """The aspect ratio a request asks for ("16:9", or words like "square"), or ""."""
+    match = _ASPECT_RATIO_RE.search(text)
+    if match:
+        return match.group(1)
+    for pattern, aspect_ratio in _ASPECT_RATIO_WORDS:
+        if pattern.search(text):
+            return aspect_ratio
+    return ""
+
+
+class PipelineJudge:
+    """
+    The LLM consulted where the pipeline needs judgment.
+
+    Each call returns (answer, usage). The answer is None when the model fails
+    or answers off-contract; the engine then keeps its deterministic result.
+    """
+
+    def __init__(self, model: str = PIPELINE_JUDGE_MODEL, client: Optional[OpenAI] = None):
+        self.model = model
+        self._client = client or OpenAI()
+
+    def refine_brief(self, user_input: str, brief: dict) -> tuple[Optional[dict], dict]:
+        """Brief fields (theme, mood, tone, palette, visual_elements) for an ambiguous request."""
+        answer, usage = self._ask(BRIEF_JUDGE_INSTRUCTIONS, {"user_input": user_input, "extracted_brief": brief})
+        fields = {
+            key: answer[key].strip()
+            for key in BRIEF_FIELDS
+            if answer and isinstance(answer.get(key), str) and answer[key].strip()
+        }
+        return fields or None, usage
+
+    def rewrite_prompt(self, prompt: str, negative_prompt: str, validation: dict) -> tuple[Optional[dict], dict]:
+        """A revised prompt and negative prompt addressing QA's failed checks."""
+        answer, usage = self._ask(
+            PROMPT_JUDGE_INSTRUCTIONS,
+            {
+                "prompt": prompt,
+                "negative_prompt": negative_prompt,
+                "failed_checks": validation.get("failed_checks", []),
+                "issues": validation.get("issues", []),
+            },
+        )
+        if not answer or not isinstance(answer.get("prompt"), str) or not answer["prompt"].strip():
+            return None, usage
+        revised_negative = answer.get("negative_prompt")
+        return {
+            "prompt": answer["prompt"].strip(),
+            "negative_prompt": revised_negative.strip() if isinstance(revised_negative, str) else negative_prompt,
+        }, usage
+
+    def _ask(self, instructions: str, payload: dict) -> tuple[Optional[dict], dict]:
+        usage = {"calls": 1, "input_tokens": 0, "output_tokens": 0, "seconds": 0.0}
+        start = time.perf_counter()
+        answer = None
+        with span(f"llm {self.model}", **{"llm.model": self.model}) as llm_span:
+            try:
+                response = self._client.responses.create(
+                    model=self.model,
+                    instructions=instructions,
+                    input=json.dumps(payload, ensure_ascii=False),
+                    reasoning={"effort": "low"},
+                    text={"format": {"type": "json_object"}},
+                )
+                if response.usage:
+                    usage["input_tokens"] = response.usage.input_tokens
+                    usage["output_tokens"] = response.usage.output_tokens
+                answer = json.loads(response.output_text)
+            except (OpenAIError, ValueError) as exc:
+                logger.warning("Pipeline judge call failed | model=%s | error=%s", self.model, exc)
+                llm_span.set_error(str(exc))
+            llm_span.set_attributes(**{
+                "llm.input_tokens": usage["input_tokens"],
+                "llm.output_tokens": usage["output_tokens"],
+            })
+        usage["seconds"] = round(time.perf_counter() - start, 3)
+        return answer if isinstance(answer, dict) else None, usage
+
+
+@dataclass
+class PipelineRun:
+    """State and accounting of one pipeline run."""
+
+    user_input: str
+    aspect_ratio: str
+    theme: str = ""
+    state: str = BRIEF
+    # Key of the run's retry budget (workflow.retry).
+    request_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    # Image generations, the first one included.
+    generations: int = 0
+    # QA attempts as recorded by the retry controller: image, verdict, action.
+    attempts: list[dict] = field(default_factory=list)
+    # {"stage", "next", "seconds"} per executed stage, in order.
+    stages: list[dict] = field(default_factory=list)
+    # Stages where the judge was consulted ("brief", "retry").
+    judged: list[str] = field(default_factory=list)
+    llm_calls: int = 0
+    llm_input_tokens: int = 0
+    llm_output_tokens: int = 0
+    llm_seconds: float = 0.0
+    seconds: float = 0.0
+    # The DeliveryPackage, or the failed stage's error block.
+    delivery: Optional[dict] = None
+    error: Optional[dict] = None
+    # Resources and estimated USD the run used (monitoring.accounting).
+    cost: Optional[dict] = None
+    # Working state: the prompt package being generated and the last image.
+    package: Optional[PromptPackage] = field(default=None, repr=False)
+    image: Optional[ImageResult] = field(default=None, repr=False)
+    image_artifact_id: str = field(default="", repr=False)
+
+    def record_llm(self, usage: dict) -> None:
+        self.llm_calls += usage["calls"]
+        self.llm_input_tokens += usage["input_tokens"]
+        self.llm_output_tokens += usage["output_tokens"]
+        self.llm_seconds = round(self.llm_seconds + usage["seconds"], 3)
+        record_llm("pipeline_judge", usage["calls"], usage["input_tokens"], usage["output_tokens"])
+
+    def to_dict(self) -> dict:
+        data = {key: value for key, value in vars(self).items() if key not in ("state", "package", "image", "image_artifact_id")}
+        return {"status": self.state, **data}
+
+
+def _error(stage: str, error_type: str, details: str) -> dict:
+    """The error envelope a stage's agent would have returned."""
+    return {"agent": STAGE_AGENTS[stage], "status": "error", "error": {"type": error_type, "details": details}}
+
+
+class PipelineEngine:
+    """
+    Runs the brief -> art direction -> generation -> QA -> export stage graph
+    directly, validating every handoff against the agency's contracts.
+
+    Args:
+        judge: LLM consulted for ambiguous briefs and retry rewrites; None keeps
+            the pipeline fully deterministic. Retries are bounded by the retry
+            controller's per-request budget (workflow.retry).
+        export_backend: Storage backend for GDriveUploadTool ("" uses EXPORT_BACKEND).
+    """
+
+    def __init__(
+        self,
+        judge: Optional[PipelineJudge] = None,
+        export_backend: str = "",
+    ):
+        self.judge = judge
+        self.export_backend = export_backend
+        self._handlers: dict[str, Callable[[PipelineRun, Optional[BaseModel]], tuple[str, dict]]] = {
+            BRIEF: self._brief,
+            ART_DIRECTION: self._art_direction,
+            GENERATION: self._generation,
+            QA: self._qa,
+            EXPORT: self._export,
+        }
+
+    def run(self, user_input: str, aspect_ratio: str = "", theme: str = "") -> PipelineRun:
+        """
+        Take a request from the user's text to a delivered image (or a failure).
+        A stage that raises fails the run: run.error names the exception and the
+        stage, and the cost record is closed either way.
+
+        Args:
+            user_input: The request or Athar excerpt, as sent to the Brief Agent.
+            aspect_ratio: Overrides the ratio read from the text (default 4:5).
+            theme: Two or three words for the export folder (default: the brief's theme).
+        """
+        run = PipelineRun(
+            user_input=user_input,
+            aspect_ratio=aspect_ratio or aspect_ratio_from_text(user_input) or DEFAULT_ASPECT_RATIO,
+            theme=theme,
+        )
+        start = time.perf_counter()
+        get_retry_controller().begin(run.request_id)
+        envelope: Optional[BaseModel] = None
+        with PIPELINES_IN_FLIGHT.track_inprogress(mode="pipeline"), span("pipeline.run", **{"pipeline.request_id": run.request_id}) as run_span:
+            open_request(run.request_id, theme=run.theme, aspect_ratio=run.aspect_ratio)
+            stage = run.state
+            try:
+                while run.state not in (DELIVERED, FAILED):
+                    stage = run.state
+                    stage_start = time.perf_counter()
+                    with span(f"stage {stage}", **{"pipeline.stage": stage}) as stage_span:
+                        next_state, payload = self._handlers[stage](run, envelope)
+                        if next_state not in TRANSITIONS[stage]:
+                            raise RuntimeError(f"Illegal pipeline transition {stage} -> {next_state}")
+                        next_state, envelope = self._hand_off(run, stage, next_state, payload)
+                        stage_span.set_attribute("pipeline.next", next_state)
+                    run.stages.append({"stage": stage, "next": next_state, "seconds": round(time.perf_counter() - stage_start, 3)})
+                    emit_event("pipeline_stage", **run.stages[-1])
+                    run.state = next_state
+            except Exception as exc:
+                # A stage that raises fails the run like one that reports an error.
+                logger.exception("Pipeline stage raised | stage=%s", stage)
+                run.state = FAILED
+                run.error = {"type": type(exc).__name__, "message": str(exc), "stage": stage}
+            finally:
+                run.seconds = round(time.perf_counter() - start, 3)
+                run.cost = close_request(
+                    run.state if run.state == DELIVERED else FAILED, theme=run.theme, aspect_ratio=run.aspect_ratio
+                )
+            run_span.set_attributes(**{
+                "pipeline.status": run.state,
+                "pipeline.generations": run.generations,
+                "pipeline.qa_attempts": len(run.attempts),
+                "pipeline.llm_calls": run.llm_calls,
+            })
+            if run.error:
+                run_span.set_error(run.error["type"])
+
+            if run.state == DELIVERED:
+                emit_event(
+                    "pipeline_delivered",
+                    seconds=run.seconds,
+                    generations=run.generations,
+                    qa_attempts=len(run.attempts),
+                    llm_calls=run.llm_calls,
+                    judged=run.judged,
+                    cost=run.cost,
+                )
+            else:
+                emit_event(
+                    "pipeline_failed",
+                    level="error",
+                    stage=stage,
+                    error_type=run.error["type"],
+                    seconds=run.seconds,
+                    llm_calls=run.llm_calls,
+                    cost=run.cost,
+                )
+        return run
+
+    def _hand_off(self, run: PipelineRun, stage: str, next_state: str, payload: dict) -> tuple[str, Optional[BaseModel]]:
+        """Validate a stage's envelope; returns the state actually entered and the envelope."""
+        if next_state == FAILED:
+            run.error = payload["error"]
+            return FAILED, None
+        message = json.dumps(payload)
+        try:
+            with span("handoff.validate", **{"handoff.payload_bytes": len(message.encode("utf-8"))}):
+                if next_state == DELIVERED:
+                    envelope = DeliveryEnvelope.model_validate_json(message)
+                    run.delivery = envelope.delivery.model_dump(mode="json")
+                    return DELIVERED, envelope
+                return next_state, validate_payload(STAGE_AGENTS[stage], STAGE_AGENTS[next_state], message)
+        except (ValidationError, ValueError) as exc:
+            logger.error("Pipeline handoff violates its contract | stage=%s | error=%s", stage, exc)
+            HANDOFF_VALIDATION_FAILURES.inc(sender=STAGE_AGENTS[stage], recipient=STAGE_AGENTS.get(next_state, next_state))
+            run.error = {"type": "contract_violation", "details": f"{stage} -> {next_state}: {exc}"}
+            return FAILED, None
+
+    # -- stages -------------------------------------------------------------------------
+
+    def _brief(self, run: PipelineRun, _envelope) -> tuple[str, dict]:
+        brief = json.loads(ExtractBriefTool(user_input=run.user_input).run())
+        if brief["theme"] in FALLBACK_THEMES and self.judge:
+            fields, usage = self.judge.refine_brief(run.user_input, brief)
+            run.record_llm(usage)
+            run.judged.append(BRIEF)
+            if fields:
+                brief.update(fields)
+        brief.update(aspect_ratio=run.aspect_ratio, style=DEFAULT_STYLE)
+        return ART_DIRECTION, {
+            "agent": "brief_agent",
+            "status": "ok",
+            "brief": brief,
+            "handoff": {"target_agent": "art_direction_agent", "action": "send_brief"},
+        }
+
+    def _art_direction(self, run: PipelineRun, envelope) -> tuple[str, dict]:
+        brief = envelope.brief
+        if not run.theme:
+            run.theme = brief.theme.split(",")[0].strip()
+        output = json.loads(
+            GeneratePromptTool(
+                theme=brief.theme,
+                mood=brief.mood,
+                palette=brief.palette,
+                visual_elements=brief.visual_elements,
+                tone=brief.tone,
+                aspect_ratio=brief.aspect_ratio,
+                custom_instructions=brief.custom_instructions,
+            ).run()
+        )
+        if "error" in output:
+            return FAILED, _error(ART_DIRECTION, "invalid_input", output["error"])
+        output.pop("artifact_id", None)
+        return GENERATION, {
+            "agent": "art_direction_agent",
+            "status": "ok",
+            "prompt_package": output,
+            "handoff": {"target_agent": "nb_image_agent", "action": "generate_image"},
+        }
+
+    def _generation(self, run: PipelineRun, envelope) -> tuple[str, dict]:
+        if isinstance(envelope, PromptEnvelope):
+            run.package = envelope.prompt_package
+        elif self.judge:
+            # QA asked for a retry: let the judge address the failed checks
+            fields, usage = self.judge.rewrite_prompt(
+                run.package.prompt, run.package.negative_prompt, envelope.validation.model_dump()
+            )
+            run.record_llm(usage)
+            run.judged.append("retry")
+            if fields:
+                run.package = run.package.model_copy(update=fields)
+        package = run.package
+
+        run.generations += 1
+        result = json.loads(
+            KieNanoBananaTool(
+                prompt=package.prompt,
+                negative_prompt=package.negative_prompt,
+                aspect_ratio=package.aspect_ratio,
+                request_id=run.request_id,
+            ).run()
+        )
+        if not result.get("success"):
+            return FAILED, _error(GENERATION, "generation_failed", result.get("error", "Image generation failed"))
+        run.image_artifact_id = result.get("artifact_id", "")
+        return QA, {
+            "agent": "nb_image_agent",
+            "status": "ok",
+            "image_result": {
+                "request_id": run.request_id,
+                "task_id": result.get("task_id"),
+                "image_url": result["image_url"],
+                "all_image_urls": result["all_image_urls"],
+                "seed": str(result["seed"]),
+                "prompt_used": result["prompt_used"],
+                "aspect_ratio": result["aspect_ratio"],
+                "style": DEFAULT_STYLE,
+                "poll_duration_seconds": result.get("poll_duration_seconds"),
+                "attempts": result.get("attempts"),
+            },
+            "handoff": {"target_agent": "qa_agent", "action": "validate_image"},
+        }
+
+    def _qa(self, run: PipelineRun, envelope: ImageEnvelope) -> tuple[str, dict]:
+        run.image = envelope.image_result
+        validation = json.loads(
+            ValidateImageTool(
+                image_url=run.image.image_url,
+                expected_aspect_ratio=run.image.aspect_ratio,
+                image_artifact_id=run.image_artifact_id,
+                request_id=run.request_id,
+            ).run()
+        )
+        retry = validation.get("retry", {})
+        run.attempts = retry.get("attempts", run.attempts)
+        # QA may have passed a local repair or another image of the generation
+        if validation.get("image_url"):
+            run.image = run.image.model_copy(update={"image_url": validation["image_url"]})
+        status = validation["status"]
+        if status == "fail":
+            if retry.get("error"):
+                return FAILED, _error(QA, retry["error"]["type"], retry["error"]["details"])
+            return FAILED, _error(QA, "validation_failed", "; ".join(validation["issues"]))
+        if status == "retry":
+            target, action = GENERATION, "regenerate"
+        else:
+            target, action = EXPORT, "export"
+        return target, {
+            "agent": "qa_agent",
+            "status": status,
+            "validation": validation,
+            "handoff": {"target_agent": STAGE_AGENTS[target], "action": action},
+        }
+
+    def _export(self, run: PipelineRun, envelope) -> tuple[str, dict]:
+        image = run.image
+        seed = re.sub(r"\W", "", image.seed)
+        filename = f"athar_{time.strftime('%Y%m%d_%H%M%S')}{f'_seed_{seed}' if seed else ''}.png"
+        upload = json.loads(
+            GDriveUploadTool(
+                image_url=image.image_url,
+                filename=filename,
+                theme=run.theme,
+                backend=self.export_backend,
+                prompt_used=image.prompt_used,
+            ).run()
+        )
+        if not upload.get("success"):
+            return FAILED, _error(EXPORT, "upload_failed", upload.get("error", "Upload failed"))
+        return DELIVERED, {
+            "agent": "export_agent",
+            "status": "delivered",
+            "delivery": {
+                "theme": run.theme,
+                "prompt_used": image.prompt_used,
+                "image_url": image.image_url,
+                "storage_backend": upload.get("backend", "gdrive"),
+                "view_url": upload.get("view_url"),
+                "download_url": upload.get("download_url"),
+                "gdrive_view_url": upload.get("gdrive_view_url"),
+                "gdrive_download_url": upload.get("gdrive_download_url"),
+                "local_url": upload.get("local_url"),
+                "seed": image.seed,
+                "aspect_ratio": image.aspect_ratio,
+                "filename": upload["filename"],
+                "file_id": upload["file_id"],
+                "validation_status": envelope.status,
+                "upload_status": upload.get("upload_status", "uploaded"),
+                "derivatives": upload.get("derivatives", []),
+            },
+        }
+
+
+_engine: Optional[PipelineEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_pipeline_judge() -> Optional[PipelineJudge]:
+    """The judge for PIPELINE_JUDGE_MODEL, or None without OPENAI_API_KEY or a model."""
+    if not PIPELINE_JUDGE_MODEL or not os.getenv("OPENAI_API_KEY"):
+        return None
+    return PipelineJudge(PIPELINE_JUDGE_MODEL)
+
+
+def get_pipeline_engine() -> PipelineEngine:
+    """Return the process-wide pipeline engine (created on first use)."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = PipelineEngine(judge=get_pipeline_judge())
+    return _engine
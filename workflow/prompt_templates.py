@@ -0,0 +1,266 @@
+"""
+Precompiled prompt templates for the Art Direction Agent.
+
+A template is a list of lines, each optionally gated on a brief field (the line
+is dropped when that field is empty). Templates are validated and compiled at
+import, and the negative prompt and composition blocks are joined once: each
+template becomes one generated function that returns the whole prompt from
+the brief's fields (an f-string per line, a conditional per gated line), so a
+render, and each further variant, is a single call with no format-string
+parsing or per-call setup.
+
+render_variants() expands one brief into N prompt packages for fan-out
+generation by permuting the palette (the brief's own palette first, then the
+Athar house palettes) with composition presets. The first variant is always
+the brief as given with the "classic" composition, i.e. exactly what a single
+render() returns.
+"""
+
+from __future__ import annotations
+
+import string
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Optional
+
+DEFAULT_TEMPLATE = "athar"
+DEFAULT_COMPOSITION = "classic"
+STYLE = "cinematic-premium"
+QUALITY = "premium"
+
+NEGATIVE_PROMPT = ", ".join([
+    # Quality issues
+    "messy textures",
+    "chaotic shapes",
+    "low quality",
+    "blurry",
+    "pixelated",
+    "distorted",
+    # Text issues
+    "distorted Arabic text",
+    "illegible text",
+    "wrong font",
+    "text artifacts",
+    # Style issues
+    "oversaturated",
+    "harsh lighting",
+    "neon colors",
+    "artificial",
+    # Composition issues
+    "cluttered",
+    "busy composition",
+    "multiple subjects",
+    "distracting elements",
+    # Technical issues
+    "watermark",
+    "signature",
+    "frame",
+    "border",
+    "text overlay",
+])
+
+COMPOSITIONS: dict[str, str] = {
+    name: "\n".join(["Composition:", *(f"  {line}" for line in lines)])
+    for name, lines in {
+        "classic": [
+            "Soft foreground subject with gentle depth.",
+            "Background atmospheric texture with paper grain and cinematic lighting.",
+        ],
+        "negative_space": [
+            "Small subject placed low in the frame, surrounded by generous negative space.",
+            "Quiet gradient background with subtle paper grain.",
+        ],
+        "low_horizon": [
+            "Low horizon line with the sky filling two thirds of the frame.",
+            "Distant subject for scale, soft atmospheric haze.",
+        ],
+        "backlit_silhouette": [
+            "Subject in silhouette against a luminous backlight.",
+            "Long soft shadows toward the viewer, cinematic depth.",
+        ],
+        "symmetry": [
+            "Centered, symmetrical framing through an arch or doorway.",
+            "Layered depth from foreground frame to distant light.",
+        ],
+    }.items()
+}
+
+# Athar house palettes used to vary a brief's palette, in preference order.
+ATHAR_PALETTES = (
+    "warm earth tones, soft golden light",
+    "golden light, amber haze",
+    "muted pastels, pale dawn light",
+    "deep shadows, single warm light source",
+    "sunset tones, dusk and twilight",
+    "cool blues, indigo night",
+)
+
+_TEMPLATE_LINES: dict[str, list[tuple[Optional[str], str]]] = {
+    "athar": [
+        (None, "A cinematic minimalistic artwork inspired by Athar."),
+        ("theme", "Theme: {theme}."),
+        ("mood", "Mood: {mood}."),
+        ("palette", "Palette: {palette}."),
+        ("visual_elements", "Visual Metaphor: {visual_elements}."),
+        (None, "{composition}"),
+        ("tone", "Tone: {tone}."),
+        (None, "Avoid: messy textures, chaotic shapes, distorted Arabic text."),
+        (None, "--ar {aspect_ratio}"),
+        (None, "--style {style}"),
+        ("custom_instructions", "Additional: {custom_instructions}"),
+    ],
+    "athar_minimal": [
+        (None, "A cinematic minimalistic artwork inspired by Athar."),
+        ("theme", "Theme: {theme}."),
+        ("palette", "Palette: {palette}."),
+        (None, "{composition}"),
+        (None, "--ar {aspect_ratio}"),
+        (None, "--style {style}"),
+        ("custom_instructions", "Additional: {custom_instructions}"),
+    ],
+    "athar_typography": [
+        (None, "A cinematic minimalistic artwork inspired by Athar, designed as a backdrop for Arabic calligraphy."),
+        ("theme", "Theme: {theme}."),
+        ("mood", "Mood: {mood}."),
+        ("palette", "Palette: {palette}."),
+        ("visual_elements", "Visual Metaphor: {visual_elements}."),
+        (None, "{composition}"),
+        (None, "Leave calm, uncluttered negative space in the upper third for a text overlay; render no text."),
+        ("tone", "Tone: {tone}."),
+        (None, "Avoid: messy textures, chaotic shapes, distorted Arabic text."),
+        (None, "--ar {aspect_ratio}"),
+        (None, "--style {style}"),
+        ("custom_instructions", "Additional: {custom_instructions}"),
+    ],
+}
+
+# Renderer arguments, in order.
+_FIELDS = (
+    "theme", "mood", "palette", "visual_elements", "tone", "aspect_ratio", "custom_instructions", "composition", "style",
+)
+
+
+def _line_fields(line: str) -> set[str]:
+    fields = set()
+    for _, name, spec, conversion in string.Formatter().parse(line):
+        if spec or conversion:
+            raise ValueError(f"Format specs are not supported in prompt templates: {line!r}")
+        if name is not None:
+            fields.add(name)
+    return fields
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """
+    A named template: (gate field or None, line format string) per line.
+
+    compile() turns the lines into one generated function of the _FIELDS that
+    returns the joined prompt: each line is an f-string (its format string,
+    which only names known fields) and each gated line a conditional
+    expression, so a render costs one call and no format-string parsing.
+    """
+
+    name: str
+    segments: tuple[tuple[Optional[str], str], ...]
+    renderer: Callable[..., str] = field(compare=False, repr=False)
+
+    @classmethod
+    def compile(cls, name: str, lines: list[tuple[Optional[str], str]]) -> "PromptTemplate":
+        if not lines or lines[0][0] is not None:
+            raise ValueError(f"Template '{name}' must start with an ungated line")
+        for gate, line in lines:
+            unknown = (_line_fields(line) | ({gate} if gate else set())) - set(_FIELDS)
+            if unknown:
+                raise ValueError(f"Template '{name}' uses unknown fields: {', '.join(sorted(unknown))}")
+        parts = []
+        for index, (gate, line) in enumerate(lines):
+            text = "f" + repr(line if index == 0 else "\n" + line)
+            parts.append(f"({text} if {gate} else '')" if gate else text)
+        source = f"def render({', '.join(_FIELDS)}):\n    return ''.join(({', '.join(parts)},))\n"
+        namespace: dict = {}
+        exec(compile(source, f"<prompt template {name}>", "exec"), namespace)
+        return cls(name, tuple(lines), namespace["render"])
+
+
+TEMPLATES: dict[str, PromptTemplate] = {
+    name: PromptTemplate.compile(name, lines) for name, lines in _TEMPLATE_LINES.items()
+}
+
+
+def get_template(name: str = "") -> PromptTemplate:
+    """
+    Raises:
+        ValueError: If the template name is unknown.
+    """
+    name = name or DEFAULT_TEMPLATE
+    if name not in TEMPLATES:
+        raise ValueError(f"Unknown prompt template '{name}' (expected one of {', '.join(TEMPLATES)})")
+    return TEMPLATES[name]
+
+
+@dataclass
+class Brief:
+    """The brief fields a template renders."""
+
+    theme: str
+    mood: str
+    palette: str
+    visual_elements: str = ""
+    tone: str = ""
+    aspect_ratio: str = "16:9"
+    custom_instructions: str = ""
+
+    def prompt(self, template: PromptTemplate, palette: str, composition: str) -> str:
+        """The template rendered for this brief with the given palette and composition preset."""
+        return template.renderer(
+            self.theme, self.mood, palette, self.visual_elements, self.tone, self.aspect_ratio,
+            self.custom_instructions, COMPOSITIONS[composition], STYLE,
+        )
+
+
+def _package(brief: Brief, template: PromptTemplate, prompt: str, palette: str, composition: str) -> dict:
+    return {
+        "prompt": prompt,
+        "negative_prompt": NEGATIVE_PROMPT,
+        "aspect_ratio": brief.aspect_ratio,
+        "style": STYLE,
+        "quality": QUALITY,
+        "theme": brief.theme,
+        "palette": palette,
+        "template": template.name,
+        "composition": composition,
+    }
+
+
+def render(brief: Brief, template: str = "", composition: str = DEFAULT_COMPOSITION) -> dict:
+    """Render one prompt package (PromptPackage fields plus template/composition)."""
+    compiled = get_template(template)
+    return _package(brief, compiled, brief.prompt(compiled, brief.palette, composition), brief.palette, composition)
+
+
+@lru_cache(maxsize=None)
+def _permutation_order(palettes: int, compositions: int) -> tuple[tuple[int, int], ...]:
+    """
+    Every (palette, composition) index pair, ordered so consecutive variants
+    differ in both: pass k pairs palette i with composition (i + k) mod compositions.
+    """
+    return tuple(
+        (index, (index + shift) % compositions) for shift in range(compositions) for index in range(palettes)
+    )
+
+
+_COMPOSITION_NAMES = tuple(COMPOSITIONS)
+
+
+def render_variants(brief: Brief, count: int, template: str = "") -> list[dict]:
+    """Expand a brief into up to count distinct prompt packages, the brief as given first."""
+    compiled = get_template(template)
+    if count == 1:
+        return [render(brief, template)]
+    palettes = [brief.palette] + [palette for palette in ATHAR_PALETTES if palette != brief.palette]
+    variants = []
+    for palette_index, composition_index in _permutation_order(len(palettes), len(_COMPOSITION_NAMES))[:count]:
+        palette, composition = palettes[palette_index], _COMPOSITION_NAMES[composition_index]
+        variants.append(_package(brief, compiled, brief.prompt(compiled, palette, composition), palette, composition))
+    return variants
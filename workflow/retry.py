@@ -0,0 +1,379 @@
+"""
+Bounded retries for the QA -> generation loop.
+
+QA used to answer every failed check with "retry", and the loop back to the NB
+Image Agent was bounded only by the agents' patience (the pipeline engine
+allowed a fixed number of regenerations and ignored time and credits). A
+regeneration costs a KIE task (credits and about a minute) even when the image
+only needed a crop, or when the same task returned a second candidate that
+was never looked at.
+
+RetryController decides what follows each QA verdict of a request:
+
+- repair: only "Aspect ratio" and/or "Resolution" failed and a centered crop
+  (losing at most RETRY_MAX_CROP of either side) plus an upscale of at most
+  RETRY_MAX_UPSCALE fixes them; QA repairs the image locally and re-validates;
+- alternate: the generation returned another image (all_image_urls) that QA
+  has not judged yet;
+- regenerate: a new KIE task, if it fits the request's budget;
+- stop: the budget is spent; QA fails the request with a structured
+  "retry_budget_exhausted" error instead of handing back another retry.
+
+A request's budget is RETRY_MAX_ATTEMPTS judged images, RETRY_BUDGET_SECONDS
+of wall-clock time since it started (a regeneration is only started if its
+expected duration still fits) and RETRY_BUDGET_CREDITS of KIE credits
+(KIE_CREDITS_PER_IMAGE per generated image). Every attempt (image, verdict,
+failed checks, action, elapsed time, credits) is recorded in a SQLite ledger
+keyed by request ID, so QA calls of the same request share one budget across
+agent turns and processes: each verdict reads, updates and writes its
+request's record in one BEGIN IMMEDIATE transaction, so concurrent workers
+never lose each other's attempts.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from io import BytesIO
+from typing import Callable, Iterable, Optional
+
+from PIL import Image
+
+from monitoring import emit_event
+from monitoring.accounting import KIE_CREDITS_PER_IMAGE
+
+from .artifacts import STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BUDGET_SECONDS = float(os.getenv("RETRY_BUDGET_SECONDS", "900"))
+RETRY_BUDGET_CREDITS = float(os.getenv("RETRY_BUDGET_CREDITS", "72"))
+# Expected generation time until the request has measured one of its own.
+RETRY_GENERATION_SECONDS = float(os.getenv("RETRY_GENERATION_SECONDS", "60"))
+RETRY_MAX_CROP = float(os.getenv("RETRY_MAX_CROP", "0.15"))
+RETRY_MAX_UPSCALE = float(os.getenv("RETRY_MAX_UPSCALE", "1.5"))
+RETRY_LEDGER_PATH = os.getenv("RETRY_LEDGER_PATH", os.path.join(STATE_DIR, "retry_ledger.sqlite3"))
+RETRY_LEDGER_TTL_SECONDS = int(os.getenv("RETRY_LEDGER_TTL_SECONDS", str(7 * 24 * 3600)))
+
+ACCEPT = "accept"
+REPAIR = "repair"
+ALTERNATE = "alternate"
+REGENERATE = "regenerate"
+STOP = "stop"
+
+# Checks a local crop and resize can fix; anything else needs another image.
+REPAIRABLE_CHECKS = frozenset({"Aspect ratio", "Resolution"})
+
+PASSING_STATUSES = ("pass", "pass_with_warnings")
+
+
+@dataclass
+class RetryBudget:
+    max_attempts: int = RETRY_MAX_ATTEMPTS
+    max_seconds: float = RETRY_BUDGET_SECONDS
+    max_credits: float = RETRY_BUDGET_CREDITS
+    credits_per_image: float = KIE_CREDITS_PER_IMAGE
+
+
+@dataclass
+class RetryDecision:
+    """What follows a QA verdict. image_url is the alternate to judge; error is set on stop."""
+
+    action: str
+    reason: str
+    image_url: str = ""
+    error: Optional[dict] = None
+
+
+@dataclass
+class RetryRecord:
+    """One request's attempts and spend."""
+
+    request_id: str
+    started_at: float
+    # One entry per judged image, in order.
+    attempts: list[dict] = field(default_factory=list)
+    # Generations paid for, by task ID: {"images", "seconds"}.
+    generations: dict[str, dict] = field(default_factory=dict)
+
+    @property
+    def elapsed(self) -> float:
+        return max(0.0, time.time() - self.started_at)
+
+    @property
+    def tried_urls(self) -> set[str]:
+        return {attempt["image_url"] for attempt in self.attempts}
+
+    def credits(self, budget: RetryBudget) -> float:
+        return sum(generation["images"] for generation in self.generations.values()) * budget.credits_per_image
+
+    def generation_seconds(self) -> float:
+        """Expected duration of another generation: the mean of this request's, else the default."""
+        measured = [generation["seconds"] for generation in self.generations.values() if generation["seconds"]]
+        return sum(measured) / len(measured) if measured else RETRY_GENERATION_SECONDS
+
+    def generation_images(self) -> int:
+        """Images another generation would produce (and be charged for)."""
+        if not self.generations:
+            return 1
+        return list(self.generations.values())[-1]["images"]
+
+
+class RetryLedger:
+    """SQLite-backed RetryRecords keyed by request ID."""
+
+    def __init__(self, path: str = RETRY_LEDGER_PATH, ttl_seconds: int = RETRY_LEDGER_TTL_SECONDS):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS retries (request_id TEXT PRIMARY KEY, started_at REAL NOT NULL,"
+                " record TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute("DELETE FROM retries WHERE updated_at < ?", (time.time() - ttl_seconds,))
+
+    def load(self, request_id: str) -> Optional[RetryRecord]:
+        with self._lock:
+            row = self._conn.execute("SELECT record FROM retries WHERE request_id = ?", (request_id,)).fetchone()
+        return RetryRecord(**json.loads(row[0])) if row else None
+
+    def update(self, request_id: str, change: Callable[[Optional[RetryRecord]], RetryRecord]) -> RetryRecord:
+        """
+        Load the request's record (None if there is none yet), pass it to
+        change and save what it returns, all in one write transaction: other
+        processes updating the same ledger wait instead of overwriting it.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT record FROM retries WHERE request_id = ?", (request_id,)).fetchone()
+                record = change(RetryRecord(**json.loads(row[0])) if row else None)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO retries (request_id, started_at, record, updated_at) VALUES (?, ?, ?, ?)",
+                    (record.request_id, record.started_at, json.dumps(asdict(record)), time.time()),
+                )
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+        return record
+
+
+class RetryController:
+    """
+    Picks the action after each QA verdict and keeps every request within its budget.
+
+    Args:
+        budget: Attempt, time and credit limits per request.
+        ledger: Where attempts are recorded.
+    """
+
+    def __init__(self, budget: Optional[RetryBudget] = None, ledger: Optional[RetryLedger] = None):
+        self.budget = budget or RetryBudget()
+        self.ledger = ledger or RetryLedger()
+
+    def begin(self, request_id: str, started_at: Optional[float] = None) -> RetryRecord:
+        """Start a request's clock (defaults to now) unless it is already running."""
+        return self.ledger.update(
+            request_id, lambda record: record or RetryRecord(request_id=request_id, started_at=started_at or time.time())
+        )
+
+    def next_action(
+        self,
+        request_id: str,
+        image: dict,
+        validation: dict,
+        candidates: Iterable[str] = (),
+        repairable: bool = False,
+    ) -> RetryDecision:
+        """
+        Record a QA verdict and decide what follows it.
+
+        Args:
+            request_id: Key of the request's budget.
+            image: The judged image: image_url, plus the task_id of the generation
+                it came from (repairs and alternates share it), the images that
+                task produced and its generation_seconds, when known.
+            validation: ValidateImageTool's result (status, failed_checks, issues).
+            candidates: Other images QA could judge instead of regenerating.
+            repairable: Whether a local repair can fix the failed checks.
+        """
+        decision = None
+
+        def judge(record: Optional[RetryRecord]) -> RetryRecord:
+            nonlocal decision
+            if record is None:
+                # The request's first verdict: its clock started when the image was requested.
+                record = RetryRecord(request_id=request_id, started_at=time.time() - (image.get("generation_seconds") or 0))
+            task_id = image.get("task_id") or image["image_url"]
+            if task_id not in record.generations:
+                record.generations[task_id] = {
+                    "images": image.get("images") or 1,
+                    "seconds": image.get("generation_seconds") or 0,
+                }
+
+            if validation["status"] in PASSING_STATUSES:
+                decision = RetryDecision(ACCEPT, f"QA {validation['status']}")
+            else:
+                decision = self._decide(record, validation, candidates, repairable)
+            record.attempts.append({
+                "attempt": len(record.attempts) + 1,
+                "image_url": image["image_url"],
+                "task_id": image.get("task_id"),
+                "status": validation["status"],
+                "failed_checks": validation.get("failed_checks", []),
+                "action": decision.action,
+                "reason": decision.reason,
+                "elapsed_seconds": round(record.elapsed, 3),
+                "credits_spent": record.credits(self.budget),
+            })
+            return record
+
+        record = self.ledger.update(request_id, judge)
+
+        emit_event(
+            "qa_retry_decision",
+            level="warning" if decision.action == STOP else "info",
+            request_id=request_id,
+            attempt=len(record.attempts),
+            action=decision.action,
+            reason=decision.reason,
+            failed_checks=validation.get("failed_checks", []),
+            elapsed_seconds=round(record.elapsed, 3),
+            credits_spent=record.credits(self.budget),
+        )
+        return decision
+
+    def summary(self, request_id: str) -> dict:
+        """The request's attempts and what is left of its budget."""
+        record = self.ledger.load(request_id)
+        if record is None:
+            return {"attempts": [], "budget": {}}
+        credits = record.credits(self.budget)
+        return {
+            "attempts": record.attempts,
+            "budget": {
+                "attempts_left": max(0, self.budget.max_attempts - len(record.attempts)),
+                "seconds_left": round(max(0.0, self.budget.max_seconds - record.elapsed), 1),
+                "credits_spent": credits,
+                "credits_left": max(0.0, self.budget.max_credits - credits),
+            },
+        }
+
+    def _decide(
+        self, record: RetryRecord, validation: dict, candidates: Iterable[str], repairable: bool
+    ) -> RetryDecision:
+        budget = self.budget
+        failed = set(validation.get("failed_checks", []))
+        attempts = len(record.attempts) + 1
+        if attempts >= budget.max_attempts:
+            return self._stop(f"{attempts} of {budget.max_attempts} attempts used", validation)
+        if record.elapsed >= budget.max_seconds:
+            return self._stop(f"{record.elapsed:.0f}s of the {budget.max_seconds:g}s budget used", validation)
+
+        # A repaired image is not repaired again.
+        repaired = bool(record.attempts) and record.attempts[-1]["action"] == REPAIR
+        if repairable and failed and failed <= REPAIRABLE_CHECKS and not repaired:
+            return RetryDecision(REPAIR, f"{', '.join(sorted(failed))} fixable by a local crop and resize")
+        tried = record.tried_urls
+        untried = [url for url in candidates if url and url not in tried]
+        if untried:
+            return RetryDecision(ALTERNATE, "Another image of the same generation is untried", image_url=untried[0])
+
+        credits = record.credits(budget)
+        cost = record.generation_images() * budget.credits_per_image
+        if credits + cost > budget.max_credits:
+            return self._stop(
+                f"a new generation ({cost:g} credits) would exceed the {budget.max_credits:g}-credit budget"
+                f" ({credits:g} spent)",
+                validation,
+            )
+        expected = record.generation_seconds()
+        if record.elapsed + expected > budget.max_seconds:
+            return self._stop(
+                f"a new generation (~{expected:.0f}s) would overrun the {budget.max_seconds:g}s budget"
+                f" ({record.elapsed:.0f}s used)",
+                validation,
+            )
+        return RetryDecision(REGENERATE, f"{', '.join(sorted(failed)) or 'QA'} failed; no repair or alternate left")
+
+    @staticmethod
+    def _stop(reason: str, validation: dict) -> RetryDecision:
+        issues = "; ".join(validation.get("issues", []))
+        return RetryDecision(
+            STOP,
+            reason,
+            error={
+                "type": "retry_budget_exhausted",
+                "details": f"Retry budget exhausted: {reason}" + (f". Last issues: {issues}" if issues else ""),
+            },
+        )
+
+
+def parse_aspect_ratio(aspect_ratio: str) -> Optional[float]:
+    """Width / height of a "W:H" ratio, or None if it cannot be parsed."""
+    try:
+        width, height = (float(part) for part in aspect_ratio.split(":"))
+        return width / height
+    except ValueError:
+        return None
+
+
+def plan_repair(
+    size: tuple[int, int], aspect_ratio: str, min_width: int, min_height: int
+) -> Optional[tuple[tuple[int, int, int, int], tuple[int, int]]]:
+    """
+    The centered crop box and final size that give an image of the given size
+    the expected ratio and minimum resolution, or None if that would crop more
+    than RETRY_MAX_CROP of a side or upscale more than RETRY_MAX_UPSCALE.
+    """
+    ratio = parse_aspect_ratio(aspect_ratio)
+    width, height = size
+    if not ratio or not width or not height:
+        return None
+    crop_width, crop_height = (round(height * ratio), height) if width / height > ratio else (width, round(width / ratio))
+    if 1 - crop_width / width > RETRY_MAX_CROP or 1 - crop_height / height > RETRY_MAX_CROP:
+        return None
+    scale = max(1.0, min_width / crop_width, min_height / crop_height)
+    if scale > RETRY_MAX_UPSCALE:
+        return None
+    left, top = (width - crop_width) // 2, (height - crop_height) // 2
+    box = (left, top, left + crop_width, top + crop_height)
+    return box, (math.ceil(crop_width * scale), math.ceil(crop_height * scale))
+
+
+def repair_image(image: Image.Image, plan: tuple[tuple[int, int, int, int], tuple[int, int]]) -> bytes:
+    """Apply a plan_repair() plan and return the result as PNG."""
+    box, target = plan
+    repaired = image.crop(box)
+    if repaired.size != target:
+        repaired = repaired.resize(target, Image.LANCZOS)
+    buffer = BytesIO()
+    repaired.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+_controller: Optional[RetryController] = None
+_controller_lock = threading.Lock()
+
+
+def get_retry_controller() -> RetryController:
+    """Return the process-wide retry controller (created on first use)."""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = RetryController()
+    return _controller
@@ -0,0 +1,334 @@
+"""
+Similarity index over delivered images, for reuse before generation.
+
+Many requests differ only in wording from earlier ones ("desert solitude at
+sunset" vs "solitude in the desert, sunset"). Every delivery is recorded with
+the brief it was generated from (theme, mood, palette, visual elements, parsed
+from the prompt when only the prompt is known). Before calling KIE, the NB
+Image Agent looks the new brief up and offers deliveries above a similarity
+threshold as instant candidates.
+
+Features of a brief are its normalized word tokens (workflow.lexicon.tokenize,
+so Arabic is normalized and stemmed too) without stopwords, plus the lexicon
+labels the brief matches ("theme:solitude"), so synonyms and translations of
+the same idea overlap. Similarity is the Jaccard index of two feature sets.
+
+Lookups use MinHash with locality-sensitive hashing: each entry's signature
+(REUSE_MINHASH_PERMUTATIONS minimums of independent 32-bit hashes, taken from
+keyed BLAKE2b digests and cached per feature, since briefs share most of their
+vocabulary) is cut into REUSE_LSH_BANDS bands, and every band is stored as one
+integer key in a SQLite table clustered on that key. A query fetches the entries
+sharing at least one band key (a handful of B-tree seeks, independent of index
+size), keeps the REUSE_MAX_CANDIDATES sharing the most bands and ranks only
+those by exact Jaccard similarity.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable, Mapping, Optional
+
+from .arabic import ARABIC_STOPWORDS, light_stem
+from .lexicon import get_lexicon, tokenize
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.getenv("ATHAR_STATE_DIR", ".athar")
+REUSE_INDEX_PATH = os.getenv("REUSE_INDEX_PATH", os.path.join(STATE_DIR, "reuse_index.sqlite3"))
+REUSE_SIMILARITY_THRESHOLD = float(os.getenv("REUSE_SIMILARITY_THRESHOLD", "0.6"))
+REUSE_MINHASH_PERMUTATIONS = int(os.getenv("REUSE_MINHASH_PERMUTATIONS", "64"))
+REUSE_LSH_BANDS = int(os.getenv("REUSE_LSH_BANDS", "16"))
+# Upper bound on candidates ranked per query (those sharing the most bands are
+# kept), so briefs built from common words cannot make a lookup scan a large
+# part of the index.
+REUSE_MAX_CANDIDATES = int(os.getenv("REUSE_MAX_CANDIDATES", "200"))
+
+BRIEF_FIELDS = ("theme", "mood", "palette", "visual_elements")
+
+# Prompt lines the templates in workflow.prompt_templates emit for each field.
+_PROMPT_LINES = {
+    "theme": "Theme:",
+    "mood": "Mood:",
+    "palette": "Palette:",
+    "visual_elements": "Visual Metaphor:",
+}
+_ASPECT_RE = re.compile(r"--ar\s+(\d+:\d+)")
+
+STOPWORDS = frozenset(
+    {
+        "the", "a", "an", "and", "or", "but", "in", "on", "at", "to", "for", "of", "with", "by", "from",
+        "as", "is", "was", "are", "be", "into", "over", "under", "its", "their", "this", "that",
+        "image", "artwork", "style", "scene",
+    }
+    | {light_stem(word) for word in ARABIC_STOPWORDS}
+)
+
+# Features whose per-permutation hashes are kept in memory.
+_FEATURE_CACHE_SIZE = 1 << 18
+# 32-bit hash values per 64-byte BLAKE2b digest.
+_HASHES_PER_DIGEST = 16
+
+
+def brief_from_prompt(prompt: str) -> dict[str, str]:
+    """Recover the brief fields (and aspect ratio) from a rendered Athar prompt."""
+    brief: dict[str, str] = {}
+    for line in prompt.splitlines():
+        line = line.strip()
+        for field_name, prefix in _PROMPT_LINES.items():
+            if line.startswith(prefix) and field_name not in brief:
+                brief[field_name] = line[len(prefix):].strip().rstrip(".")
+    match = _ASPECT_RE.search(prompt)
+    if match:
+        brief["aspect_ratio"] = match.group(1)
+    return brief
+
+
+def brief_features(brief: Mapping[str, str]) -> frozenset[str]:
+    """Normalized tokens and lexicon labels of a brief's theme, mood, palette and visual elements."""
+    text = " ".join(brief.get(field_name) or "" for field_name in BRIEF_FIELDS)
+    features = {token for token in tokenize(text) if len(token) > 1 and token not in STOPWORDS}
+    matches = get_lexicon().match(text)
+    features.update(f"{category}:{label}" for category, labels in matches.labels.items() for label in labels)
+    return frozenset(features)
+
+
+def jaccard(first: frozenset[str], second: frozenset[str]) -> float:
+    if not first and not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+class MinHasher:
+    """
+    MinHash signatures and LSH band keys. Permutation i hashes a feature to the
+    i-th 32-bit word of BLAKE2b digests keyed by a per-hasher salt, so a
+    feature's hashes for all permutations come from a few C-level digest calls.
+    """
+
+    def __init__(self, permutations: int = REUSE_MINHASH_PERMUTATIONS, bands: int = REUSE_LSH_BANDS, seed: int = 1):
+        if permutations % bands:
+            raise ValueError(f"{permutations} permutations cannot be split into {bands} equal bands")
+        self.permutations = permutations
+        self.bands = bands
+        self.rows = permutations // bands
+        digests = -(-permutations // _HASHES_PER_DIGEST)
+        self._digest_bases = [
+            hashlib.blake2b(digest_size=64, salt=seed.to_bytes(8, "little"), person=b"minhash%d" % index)
+            for index in range(digests)
+        ]
+        self._band_bases = [
+            hashlib.blake2b(digest_size=8, salt=seed.to_bytes(8, "little"), person=b"band%d" % band)
+            for band in range(bands)
+        ]
+        self._unpack = struct.Struct(f"<{digests * _HASHES_PER_DIGEST}I").unpack
+        self._pack = struct.Struct(f"<{permutations}I").pack
+        self._feature_hashes = lru_cache(maxsize=_FEATURE_CACHE_SIZE)(self._hash_feature)
+
+    def _hash_feature(self, feature: str) -> tuple[int, ...]:
+        data = feature.encode("utf-8")
+        digests = []
+        for base in self._digest_bases:
+            digest = base.copy()
+            digest.update(data)
+            digests.append(digest.digest())
+        return self._unpack(b"".join(digests))[: self.permutations]
+
+    def signature(self, features: Iterable[str]) -> tuple[int, ...]:
+        columns = [self._feature_hashes(feature) for feature in features]
+        if not columns:
+            return (0xFFFFFFFF,) * self.permutations
+        return tuple(map(min, zip(*columns)))
+
+    def band_keys(self, signature: tuple[int, ...]) -> list[int]:
+        """One signed 64-bit key per band (keyed by the band index, so bands never collide)."""
+        packed = self._pack(*signature)
+        width = self.rows * 4
+        keys = []
+        for band, base in enumerate(self._band_bases):
+            digest = base.copy()
+            digest.update(packed[band * width:(band + 1) * width])
+            keys.append(int.from_bytes(digest.digest(), "little", signed=True))
+        return keys
+
+
+@dataclass
+class ReuseCandidate:
+    """A delivered image whose brief resembles the query."""
+
+    similarity: float
+    delivery: dict
+    brief: dict
+    recorded_at: float
+
+    def to_dict(self) -> dict:
+        return {
+            "similarity": round(self.similarity, 3),
+            "recorded_at": self.recorded_at,
+            "brief": self.brief,
+            **self.delivery,
+        }
+
+
+class ReuseIndex:
+    """
+    SQLite-backed MinHash/LSH index of delivered images keyed by their brief.
+    """
+
+    def __init__(self, path: str = REUSE_INDEX_PATH, hasher: Optional[MinHasher] = None):
+        self.path = path
+        self.hasher = hasher or MinHasher()
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries (id INTEGER PRIMARY KEY, image_key TEXT NOT NULL UNIQUE,"
+                " aspect_ratio TEXT NOT NULL, features TEXT NOT NULL, brief TEXT NOT NULL,"
+                " delivery TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS bands (key INTEGER NOT NULL, entry_id INTEGER NOT NULL,"
+                " PRIMARY KEY (key, entry_id)) WITHOUT ROWID"
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    @staticmethod
+    def image_key(delivery: Mapping) -> str:
+        """Identity of a delivered image: its local copy, storage file ID or URL."""
+        return str(delivery.get("local_url") or delivery.get("file_id") or delivery.get("image_url") or "")
+
+    def _row(self, brief: Mapping[str, str], delivery: Mapping, features: frozenset[str]) -> tuple:
+        stored_brief = {field_name: brief.get(field_name) or "" for field_name in BRIEF_FIELDS}
+        return (
+            self.image_key(delivery),
+            brief.get("aspect_ratio") or delivery.get("aspect_ratio") or "",
+            "\x1f".join(sorted(features)),
+            json.dumps(stored_brief, ensure_ascii=False),
+            json.dumps(dict(delivery), ensure_ascii=False),
+            time.time(),
+        )
+
+    def add(self, brief: Mapping[str, str], delivery: Mapping) -> bool:
+        """Record a delivered image. Returns False if it has no identity, no features or is known."""
+        return self.add_many([(brief, delivery)]) == 1
+
+    def add_many(self, records: Iterable[tuple[Mapping[str, str], Mapping]]) -> int:
+        """Record several deliveries in one transaction; returns how many were new."""
+        prepared = []
+        for brief, delivery in records:
+            features = brief_features(brief)
+            if not features or not self.image_key(delivery):
+                continue
+            keys = self.hasher.band_keys(self.hasher.signature(features))
+            prepared.append((self._row(brief, delivery, features), keys))
+        added = 0
+        with self._lock, self._conn:
+            for row, keys in prepared:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO entries (image_key, aspect_ratio, features, brief, delivery, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    row,
+                )
+                if cursor.rowcount:
+                    entry_id = cursor.lastrowid
+                    self._conn.executemany(
+                        "INSERT OR IGNORE INTO bands (key, entry_id) VALUES (?, ?)", [(key, entry_id) for key in keys]
+                    )
+                    added += 1
+        return added
+
+    def query(
+        self,
+        brief: Mapping[str, str],
+        threshold: float = REUSE_SIMILARITY_THRESHOLD,
+        limit: int = 3,
+        aspect_ratio: str = "",
+    ) -> list[ReuseCandidate]:
+        """Deliveries whose brief has Jaccard similarity >= threshold, most similar first."""
+        features = brief_features(brief)
+        if not features:
+            return []
+        keys = self.hasher.band_keys(self.hasher.signature(features))
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            entry_ids = [
+                row[0]
+                for row in self._conn.execute(
+                    f"SELECT entry_id FROM bands WHERE key IN ({placeholders})"
+                    " GROUP BY entry_id ORDER BY COUNT(*) DESC LIMIT ?",
+                    (*keys, REUSE_MAX_CANDIDATES),
+                )
+            ]
+            if not entry_ids:
+                return []
+            # Rank on the stored features alone; the JSON columns are read for the winners only.
+            scored = []
+            for entry_id, stored_aspect, stored_features in self._conn.execute(
+                f"SELECT id, aspect_ratio, features FROM entries WHERE id IN ({','.join('?' * len(entry_ids))})",
+                entry_ids,
+            ):
+                if aspect_ratio and stored_aspect and stored_aspect != aspect_ratio:
+                    continue
+                similarity = jaccard(features, frozenset(stored_features.split("\x1f")))
+                if similarity >= threshold:
+                    scored.append((similarity, entry_id))
+            scored.sort(reverse=True)
+            scored = scored[:limit]
+            rows = {
+                entry_id: row
+                for entry_id, *row in self._conn.execute(
+                    f"SELECT id, brief, delivery, created_at FROM entries WHERE id IN ({','.join('?' * len(scored))})",
+                    [entry_id for _, entry_id in scored],
+                )
+            }
+
+        candidates = []
+        for similarity, entry_id in scored:
+            stored_brief, delivery, created_at = rows[entry_id]
+            candidates.append(ReuseCandidate(similarity, json.loads(delivery), json.loads(stored_brief), created_at))
+        return candidates
+
+
+_index: Optional[ReuseIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_reuse_index() -> ReuseIndex:
+    """Return the process-wide reuse index (created on first use)."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ReuseIndex()
+    return _index
+
+
+def remember_delivery(prompt: str, delivery: Mapping, theme: str = "") -> bool:
+    """
+    Record a delivered image under the brief its prompt was rendered from.
+    Best effort: an index failure never fails the export that called it.
+    """
+    brief = brief_from_prompt(prompt)
+    if theme and not brief.get("theme"):
+        brief["theme"] = theme
+    try:
+        return get_reuse_index().add(brief, {**delivery, "prompt_used": prompt})
+    except (sqlite3.Error, OSError) as exc:
+        logger.warning("Could not record delivery for reuse | error=%s", exc)
+        return False
@@ -10,7 +10,10 @@ from typing import Any
 
 from agency_swarm.tools.send_message import SendMessage
 
-from .contracts import validate_payload
+from monitoring.metrics import HANDOFF_VALIDATION_FAILURES
+from monitoring.tracing import span
+
+from .contracts import delivering_handoff, validate_payload
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +22,21 @@ class StructuredSendMessage(SendMessage):
     """
     Subclass of the default SendMessage tool that validates the message payload
     before forwarding it to the recipient agent.
+
+    The message is validated straight from its JSON text, once, with a cached
+    validator per agent pair, and the validated envelope is exposed to the
+    recipient's turn through workflow.contracts.current_handoff().
+
+    The base SendMessage still receives the arguments as the original JSON
+    text: it is an Agents SDK FunctionTool, whose on_invoke_tool(context,
+    arguments_json_string) contract takes a string and parses it internally,
+    with no entry point for pre-parsed arguments. The text is forwarded as is
+    (re-serializing the parsed dict would add work), so the outer arguments are
+    decoded twice: here, to find the recipient and the message, and in the
+    base class. The message itself is validated once.
+
+    Each handoff is a span of the request's trace (monitoring.tracing) covering
+    the validation and the recipient's turn, so its tools nest below it.
     """
 
     async def on_invoke_tool(self, wrapper, arguments_json_string: str) -> str:  # type: ignore[override]
@@ -38,23 +56,36 @@ class StructuredSendMessage(SendMessage):
         recipient = str(args.get("recipient_agent", "")).lower()
         message_content = args.get("message", "")
 
-        if sender and recipient and message_content:
-            try:
-                validate_payload(sender, recipient, message_content)
-            except ValueError as exc:
-                logger.error(
-                    "JSON handoff validation failed | sender=%s | recipient=%s | error=%s",
-                    sender,
-                    recipient,
-                    exc,
-                )
-                return json.dumps(
-                    {
-                        "error": "schema_validation_failed",
-                        "agent": sender,
-                        "target_agent": recipient,
-                        "details": str(exc),
-                    }
-                )
-
-        return await super().on_invoke_tool(wrapper, arguments_json_string)
+        attributes = {
+            "handoff.sender": sender,
+            "handoff.recipient": recipient,
+            "handoff.payload_bytes": len(str(message_content).encode("utf-8")),
+        }
+        with span(f"handoff {sender} -> {recipient}", **attributes) as handoff:
+            envelope = None
+            if sender and recipient and message_content:
+                try:
+                    with span("handoff.validate"):
+                        envelope = validate_payload(sender, recipient, message_content)
+                except ValueError as exc:
+                    logger.error(
+                        "JSON handoff validation failed | sender=%s | recipient=%s | error=%s",
+                        sender,
+                        recipient,
+                        exc,
+                    )
+                    handoff.set_error("schema_validation_failed")
+                    HANDOFF_VALIDATION_FAILURES.inc(sender=sender, recipient=recipient)
+                    return json.dumps(
+                        {
+                            "error": "schema_validation_failed",
+                            "agent": sender,
+                            "target_agent": recipient,
+                            "details": str(exc),
+                        }
+                    )
+
+            # The recipient's turn reads the validated envelope via current_handoff();
+            # the base tool only accepts the JSON text (see the class docstring).
+            with delivering_handoff(envelope):
+                return await super().on_invoke_tool(wrapper, arguments_json_string)
@@ -0,0 +1,44 @@
+"""
+Agent lifecycle hooks that charge each LLM response to the request's cost record.
+
+The agency's agents make their model calls inside the Agents SDK, out of reach
+of the tools; the SDK reports every response's usage to the agent's hooks, and
+UsageHooks records it with monitoring.accounting.record_llm() under the
+agent's name. create_agency() attaches it to the five agents.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Any
+
+from agents import AgentHooks
+
+from monitoring.accounting import record_llm
+
+logger = logging.getLogger(__name__)
+
+
+class UsageHooks(AgentHooks):
+    """Records the requests and tokens of every LLM response an agent receives."""
+
+    async def on_llm_end(self, context: Any, agent: Any, response: Any) -> None:
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        try:
+            record_llm(
+                getattr(agent, "name", "agent").lower().replace(" ", "_"),
+                calls=usage.requests or 1,
+                input_tokens=usage.input_tokens or 0,
+                output_tokens=usage.output_tokens or 0,
+            )
+        except Exception as exc:  # Accounting must never fail the agent's turn.
+            logger.warning("Failed to record LLM usage | agent=%s error=%s", getattr(agent, "name", ""), exc)
+
+
+def attach_usage_hooks(*agents: Any) -> None:
+    """Give each agent UsageHooks unless it already has hooks of its own."""
+    for agent in agents:
+        if getattr(agent, "hooks", None) is None:
+            agent.hooks = UsageHooks()